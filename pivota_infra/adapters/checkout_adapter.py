@@ -8,6 +8,7 @@ from decimal import Decimal
 import httpx
 from adapters.psp_adapter import PSPAdapter, PaymentIntent
 from config.settings import settings
+from utils.http_client import get_http_client
 
 
 class CheckoutAdapter(PSPAdapter):
@@ -24,7 +25,8 @@ class CheckoutAdapter(PSPAdapter):
         self,
         amount: Decimal,
         currency: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Tuple[bool, Optional[PaymentIntent], Optional[str]]:
         """Create a Checkout.com payment session"""
         try:
@@ -38,6 +40,8 @@ class CheckoutAdapter(PSPAdapter):
                 "Authorization": self.api_key,
                 "Content-Type": "application/json"
             }
+            if idempotency_key:
+                headers["Cko-Idempotency-Key"] = idempotency_key
             print(f"   Auth: {self.api_key[:15]}...")
             
             print(f"   Payload: amount={int(amount * 100)}, currency={currency.upper()}")
@@ -64,10 +68,10 @@ class CheckoutAdapter(PSPAdapter):
                 
                 print(f"   Using processing_channel_id: {payload['processing_channel_id']}")
                 try:
-                    async with httpx.AsyncClient() as client:
-                        resp = await client.post(
-                            f"{self.base_url}/payment-sessions", json=payload, headers=headers, timeout=15.0
-                        )
+                    client = get_http_client("checkout")
+                    resp = await client.post(
+                        f"{self.base_url}/payment-sessions", json=payload, headers=headers, timeout=15.0
+                    )
                     print(f"   Response: {resp.status_code}")
                     print(f"   Response Body: {resp.text[:500]}")
                     
@@ -147,32 +151,32 @@ class CheckoutAdapter(PSPAdapter):
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient() as client:
-                # Get payment details
-                response = await client.get(
-                    f"{self.base_url}/payments/{payment_intent_id}",
-                    headers=headers,
-                    timeout=10.0
-                )
+            client = get_http_client("checkout")
+            # Get payment details
+            response = await client.get(
+                f"{self.base_url}/payments/{payment_intent_id}",
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                status = data.get("status", "pending").lower()
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get("status", "pending").lower()
-                    
-                    # Checkout status mapping
-                    status_map = {
-                        "authorized": "succeeded",
-                        "captured": "succeeded",
-                        "card_verified": "succeeded",
-                        "declined": "failed",
-                        "expired": "failed",
-                        "canceled": "cancelled",
-                        "pending": "processing"
-                    }
-                    
-                    return True, status_map.get(status, status), None
-                else:
-                    return False, "failed", f"Checkout API error: {response.status_code}"
+                # Checkout status mapping
+                status_map = {
+                    "authorized": "succeeded",
+                    "captured": "succeeded",
+                    "card_verified": "succeeded",
+                    "declined": "failed",
+                    "expired": "failed",
+                    "canceled": "cancelled",
+                    "pending": "processing"
+                }
+                
+                return True, status_map.get(status, status), None
+            else:
+                return False, "failed", f"Checkout API error: {response.status_code}"
                     
         except Exception as e:
             return False, "failed", str(e)
@@ -187,31 +191,31 @@ class CheckoutAdapter(PSPAdapter):
                 "Authorization": self.api_key
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/payments/{payment_intent_id}",
-                    headers=headers,
-                    timeout=10.0
-                )
+            client = get_http_client("checkout")
+            response = await client.get(
+                f"{self.base_url}/payments/{payment_intent_id}",
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                status = data.get("status", "pending").lower()
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get("status", "pending").lower()
-                    
-                    # Map to standard statuses
-                    status_map = {
-                        "authorized": "succeeded",
-                        "captured": "succeeded",
-                        "card_verified": "succeeded",
-                        "declined": "failed",
-                        "expired": "failed",
-                        "canceled": "cancelled",
-                        "pending": "processing"
-                    }
-                    
-                    return True, status_map.get(status, status), None
-                else:
-                    return False, "unknown", f"Checkout API error: {response.status_code}"
+                # Map to standard statuses
+                status_map = {
+                    "authorized": "succeeded",
+                    "captured": "succeeded",
+                    "card_verified": "succeeded",
+                    "declined": "failed",
+                    "expired": "failed",
+                    "canceled": "cancelled",
+                    "pending": "processing"
+                }
+                
+                return True, status_map.get(status, status), None
+            else:
+                return False, "unknown", f"Checkout API error: {response.status_code}"
                     
         except Exception as e:
             return False, "unknown", str(e)
@@ -239,20 +243,20 @@ class CheckoutAdapter(PSPAdapter):
             if reason:
                 payload["metadata"] = {"reason": reason}
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/payments/{payment_intent_id}/refunds",
-                    json=payload,
-                    headers=headers,
-                    timeout=10.0
-                )
-                
-                if response.status_code in [200, 201, 202]:
-                    data = response.json()
-                    return True, data.get("action_id") or data.get("id"), None
-                else:
-                    error_data = response.json() if response.text else {}
-                    return False, None, f"Checkout refund error: {response.status_code} - {error_data.get('error_type', response.text)}"
+            client = get_http_client("checkout")
+            response = await client.post(
+                f"{self.base_url}/payments/{payment_intent_id}/refunds",
+                json=payload,
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code in [200, 201, 202]:
+                data = response.json()
+                return True, data.get("action_id") or data.get("id"), None
+            else:
+                error_data = response.json() if response.text else {}
+                return False, None, f"Checkout refund error: {response.status_code} - {error_data.get('error_type', response.text)}"
                     
         except Exception as e:
             return False, None, str(e)
@@ -264,20 +268,20 @@ class CheckoutAdapter(PSPAdapter):
                 "Authorization": self.api_key
             }
             
-            async with httpx.AsyncClient() as client:
-                # Use a lightweight endpoint to test connection
-                response = await client.get(
-                    f"{self.base_url}/instruments",
-                    headers=headers,
-                    timeout=5.0
-                )
-                
-                if response.status_code in [200, 401, 403]:
-                    # 401/403 means API responded (key format valid, just not authorized for this endpoint)
-                    # For sandbox keys, this is expected
-                    return True, "Connection OK - Checkout.com API reachable"
-                else:
-                    return False, f"Unexpected response: {response.status_code}"
+            client = get_http_client("checkout")
+            # Use a lightweight endpoint to test connection
+            response = await client.get(
+                f"{self.base_url}/instruments",
+                headers=headers,
+                timeout=5.0
+            )
+            
+            if response.status_code in [200, 401, 403]:
+                # 401/403 means API responded (key format valid, just not authorized for this endpoint)
+                # For sandbox keys, this is expected
+                return True, "Connection OK - Checkout.com API reachable"
+            else:
+                return False, f"Unexpected response: {response.status_code}"
                     
         except httpx.TimeoutException:
             return False, "Connection timeout"
@@ -3,14 +3,16 @@ Multi-PSP Orchestrator
 Handles payment routing with primary/backup PSP strategy for higher success rates
 """
 
+import time
 from typing import Dict, Any, Optional, Tuple, List
 from decimal import Decimal
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from adapters.psp_adapter import PSPAdapter, get_psp_adapter, PaymentIntent
-from db.merchant_onboarding import get_merchant_onboarding
-from db.database import database
+from utils.merchant_context import get_merchant_context
+from utils.psp_health import classify_psp_error, get_psp_health
+from db.psp_attempts import get_psp_performance_stats
 from utils.logger import logger
 
 
@@ -31,8 +33,8 @@ class MultiPSPOrchestrator:
     Features:
     - Automatic failover from primary to backup PSPs
     - Smart routing based on transaction amount, currency, region
-    - Success rate tracking per PSP
-    - Automatic PSP selection optimization
+    - Success rate / latency tracking per PSP (utils/psp_health, psp_attempts)
+    - Chain ranked by live PSP health; PSPs behind an open circuit breaker are skipped
     """
     
     def __init__(self, merchant_id: str):
@@ -40,26 +42,26 @@ class MultiPSPOrchestrator:
         self.psp_configs: List[PSPConfig] = []
         
     async def load_psp_configs(self):
-        """Load all PSP configurations for this merchant"""
-        merchant = await get_merchant_onboarding(self.merchant_id)
-        if not merchant:
+        """Load all PSP configurations for this merchant (from the cached MerchantContext)"""
+        ctx = await get_merchant_context(self.merchant_id)
+        if not ctx:
             raise ValueError(f"Merchant {self.merchant_id} not found")
+        merchant = ctx.merchant
+        self.psp_configs = []
         
-        # Primary PSP
-        if merchant.get("psp_connected"):
-            primary_key = merchant.get("psp_sandbox_key") or merchant.get("psp_key")
-            if primary_key:
-                self.psp_configs.append(PSPConfig(
-                    psp_type=merchant.get("psp_type", "stripe"),
-                    api_key=primary_key,
-                    priority=1,
-                    is_active=True,
-                    merchant_account=merchant.get("adyen_merchant_account")
-                ))
+        # Primary PSP first, then other connected providers as backups
+        for priority, cred in enumerate(ctx.psp_chain(), start=1):
+            self.psp_configs.append(PSPConfig(
+                psp_type=cred.provider,
+                api_key=cred.api_key,
+                priority=priority,
+                is_active=True,
+                merchant_account=merchant.get("adyen_merchant_account") or cred.account_id
+            ))
         
         # Backup PSPs (from merchant settings)
         backup_psps = merchant.get("backup_psps", [])
-        for i, backup in enumerate(backup_psps, start=2):
+        for i, backup in enumerate(backup_psps, start=len(self.psp_configs) + 1):
             if backup.get("is_active"):
                 self.psp_configs.append(PSPConfig(
                     psp_type=backup["psp_type"],
@@ -78,11 +80,15 @@ class MultiPSPOrchestrator:
         self,
         amount: Decimal,
         currency: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Tuple[bool, Optional[PaymentIntent], Optional[str], str]:
         """
         Create payment intent with automatic PSP failover
         
+        idempotency_key is forwarded to each PSP (suffixed with the PSP type), so a
+        retried request reuses the intent a PSP already created instead of charging twice.
+        
         Returns: (success, payment_intent, error, psp_used)
         """
         await self.load_psp_configs()
@@ -90,10 +96,26 @@ class MultiPSPOrchestrator:
         if not self.psp_configs:
             return False, None, "No PSP configured for merchant", "none"
         
-        # Try each PSP in priority order
-        for config in self.psp_configs:
+        # Rank the configured chain by live health; PSPs behind an open breaker are skipped
+        health = get_psp_health()
+        ranked = health.rank_psps(
+            list(dict.fromkeys(c.psp_type for c in self.psp_configs)), self.merchant_id, currency
+        )
+        chain = sorted(
+            (c for c in self.psp_configs if c.psp_type in ranked),
+            key=lambda c: ranked.index(c.psp_type)
+        )
+        all_open = not any(health.available(psp, self.merchant_id) for psp in ranked)
+        order_id = metadata.get("order_id")
+        last_error = None
+        
+        for attempt, config in enumerate(chain, start=1):
+            if not health.acquire(config.psp_type, self.merchant_id, force=all_open):
+                # Another request holds the half-open probe
+                continue
+            started = time.monotonic()
             try:
-                logger.info(f"Attempting payment with {config.psp_type} (priority {config.priority})")
+                logger.info(f"Attempting payment with {config.psp_type} (priority {config.priority}, attempt {attempt})")
                 
                 # Get PSP adapter
                 psp_adapter = get_psp_adapter(
@@ -110,44 +132,37 @@ class MultiPSPOrchestrator:
                         **metadata,
                         "psp_priority": config.priority,
                         "psp_type": config.psp_type
-                    }
+                    },
+                    idempotency_key=f"{idempotency_key}:{config.psp_type}" if idempotency_key else None
                 )
-                
-                if success:
-                    logger.info(f"Payment intent created successfully with {config.psp_type}")
-                    
-                    # Log success for analytics
-                    await self._log_psp_attempt(
-                        psp_type=config.psp_type,
-                        success=True,
-                        priority=config.priority,
-                        amount=amount,
-                        currency=currency
-                    )
-                    
-                    return True, payment_intent, None, config.psp_type
-                else:
-                    logger.warning(f"{config.psp_type} failed: {error}")
-                    
-                    # Log failure
-                    await self._log_psp_attempt(
-                        psp_type=config.psp_type,
-                        success=False,
-                        priority=config.priority,
-                        amount=amount,
-                        currency=currency,
-                        error=error
-                    )
-                    
-                    # Continue to next PSP
-                    continue
-                    
+                error_code = None if success else (psp_adapter.last_error_code or "unknown")
             except Exception as e:
                 logger.error(f"Exception with {config.psp_type}: {e}")
-                continue
+                success, payment_intent, error = False, None, str(e)
+                error_code = classify_psp_error(e)
+            
+            await self._log_psp_attempt(
+                psp_type=config.psp_type,
+                success=success,
+                priority=attempt,
+                amount=amount,
+                currency=currency,
+                response_time_ms=(time.monotonic() - started) * 1000,
+                order_id=order_id,
+                error_code=error_code,
+                error=error
+            )
+            
+            if success:
+                logger.info(f"Payment intent created successfully with {config.psp_type}")
+                return True, payment_intent, None, config.psp_type
+            
+            # Continue to next PSP
+            logger.warning(f"{config.psp_type} failed: {error}")
+            last_error = error
         
-        # All PSPs failed
-        return False, None, "All PSPs failed", "none"
+        # All PSPs failed (or were skipped)
+        return False, None, f"All PSPs failed: {last_error}" if last_error else "All PSPs failed", "none"
     
     async def _log_psp_attempt(
         self,
@@ -156,25 +171,25 @@ class MultiPSPOrchestrator:
         priority: int,
         amount: Decimal,
         currency: str,
+        response_time_ms: Optional[float] = None,
+        order_id: Optional[str] = None,
+        error_code: Optional[str] = None,
         error: Optional[str] = None
     ):
-        """Log PSP attempt for analytics"""
+        """Record the attempt: feeds routing windows / breakers and queues a psp_attempts row"""
         try:
-            # TODO: Create psp_attempts table for tracking
-            log_entry = {
-                "merchant_id": self.merchant_id,
-                "psp_type": psp_type,
-                "success": success,
-                "priority": priority,
-                "amount": float(amount),
-                "currency": currency,
-                "error": error,
-                "timestamp": datetime.now()
-            }
-            
-            # This helps merchants see which PSP performs best
-            logger.info(f"PSP attempt logged: {log_entry}")
-            
+            get_psp_health().record(
+                psp_type,
+                self.merchant_id,
+                currency,
+                success,
+                response_time_ms,
+                priority=priority,
+                amount=amount,
+                order_id=order_id,
+                error_code=error_code,
+                error=error
+            )
         except Exception as e:
             logger.error(f"Failed to log PSP attempt: {e}")
     
@@ -184,17 +199,24 @@ class MultiPSPOrchestrator:
         
         Returns success rates, avg response times, etc. for each PSP
         """
-        # TODO: Query psp_attempts table
+        rows = await get_psp_performance_stats(datetime.utcnow() - timedelta(days=days), self.merchant_id)
+        psps = [
+            {
+                "name": row["psp_type"],
+                "success_rate": round(row["successes"] * 100.0 / row["attempts"], 2) if row["attempts"] else 0.0,
+                "avg_response_time_ms": round(float(row["avg_response_time_ms"] or 0)),
+                "p95_response_time_ms": round(float(row["p95_response_time_ms"] or 0)),
+                "total_attempts": row["attempts"]
+            }
+            for row in rows
+        ]
+        total = sum(row["attempts"] for row in rows)
+        successes = sum(row["successes"] for row in rows)
         return {
-            "primary_psp": {
-                "name": "stripe",
-                "success_rate": 98.5,
-                "avg_response_time_ms": 450,
-                "total_attempts": 1250
-            },
-            "backup_psps": [],
-            "overall_success_rate": 98.5,
-            "failover_count": 0
+            "primary_psp": psps[0] if psps else None,
+            "backup_psps": psps[1:],
+            "overall_success_rate": round(successes * 100.0 / total, 2) if total else 0.0,
+            "failover_count": sum(row["failover_successes"] for row in rows)
         }
 
 
@@ -4,15 +4,91 @@ Product Platform Adapters
 Pivota 的核心价值层
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+import asyncio
+import re
+import time
 import httpx
 import logging
 
 from models.standard_product import StandardProduct, StandardProductVariant, ProductStatus
+from utils.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+SHOPIFY_API_VERSION = "2024-07"
+SHOPIFY_MAX_PAGE_SIZE = 250
+
+_LINK_RE = re.compile(r'<([^>]+)>\s*;\s*rel="?([a-z]+)"?')
+
+
+def parse_next_page_info(link_header: Optional[str]) -> Optional[str]:
+    """从 Shopify Link header 中解析 rel="next" 的 page_info 游标"""
+    if not link_header:
+        return None
+    for url, rel in _LINK_RE.findall(link_header):
+        if rel == "next":
+            values = parse_qs(urlparse(url).query).get("page_info")
+            return values[0] if values else None
+    return None
+
+
+class ShopifyLeakyBucket:
+    """
+    Shopify REST 漏桶限流
+    按 X-Shopify-Shop-Api-Call-Limit（如 "32/40"）同步桶水位，
+    接近上限时按漏出速率（标准店 2 次/秒）等待
+    """
+    
+    def __init__(self, capacity: int = 40, leak_rate: float = 2.0, headroom: int = 4):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self._level = 0.0
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+    
+    def _drain(self) -> None:
+        now = time.monotonic()
+        self._level = max(0.0, self._level - (now - self._updated) * self.leak_rate)
+        self._updated = now
+    
+    async def acquire(self) -> None:
+        """在发请求前调用：桶快满时等待漏出"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._drain()
+            overflow = self._level + 1 - (self.capacity - self.headroom)
+            if overflow > 0:
+                await asyncio.sleep(overflow / self.leak_rate)
+                self._drain()
+            self._level += 1
+    
+    def update(self, response: httpx.Response) -> None:
+        """用响应头校准桶水位；429 时按 Retry-After 视为桶满"""
+        header = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if header and "/" in header:
+            try:
+                used, capacity = (int(x) for x in header.split("/", 1))
+                self.capacity = capacity
+                self._level = float(used)
+                self._updated = time.monotonic()
+            except ValueError:
+                pass
+        if response.status_code == 429:
+            self._level = float(self.capacity)
+            self._updated = time.monotonic()
+    
+    @staticmethod
+    def retry_after(response: httpx.Response) -> float:
+        try:
+            return float(response.headers.get("Retry-After", 2.0))
+        except ValueError:
+            return 2.0
+
 
 class ShopifyProductAdapter:
     """Shopify 产品适配器：Shopify API → StandardProduct"""
@@ -31,16 +107,16 @@ class ShopifyProductAdapter:
         Returns:
             (products, next_page_token, error_message)
         """
-        url = f"https://{shop_domain}/admin/api/2024-07/products.json"
-        params = {"limit": min(limit, 250)}
+        url = f"https://{shop_domain}/admin/api/{SHOPIFY_API_VERSION}/products.json"
+        params = {"limit": min(limit, SHOPIFY_MAX_PAGE_SIZE)}
         if page_info:
             params["page_info"] = page_info
         
         headers = {"X-Shopify-Access-Token": access_token}
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, headers=headers, params=params)
+            client = get_http_client("shopify")
+            response = await client.get(url, headers=headers, params=params)
             
             if response.status_code != 200:
                 error_msg = f"Shopify API error: {response.status_code} - {response.text[:200]}"
@@ -56,12 +132,8 @@ class ShopifyProductAdapter:
                 for sp in shopify_products
             ]
             
-            # 提取分页信息（Shopify 使用 Link header）
-            next_page_token = None
-            link_header = response.headers.get("Link", "")
-            if "rel=\"next\"" in link_header:
-                # 简化实现：暂不解析 Link header
-                next_page_token = "has_next"
+            # 提取分页信息（Shopify 使用 Link header 的 page_info 游标）
+            next_page_token = parse_next_page_info(response.headers.get("Link"))
             
             logger.info(f"✅ Fetched {len(standard_products)} products from Shopify for merchant {merchant_id}")
             return standard_products, next_page_token, None
@@ -71,6 +143,58 @@ class ShopifyProductAdapter:
             logger.error(error_msg)
             return [], None, error_msg
     
+    @staticmethod
+    async def iter_product_pages(
+        shop_domain: str,
+        access_token: str,
+        page_size: int = SHOPIFY_MAX_PAGE_SIZE,
+        page_info: Optional[str] = None,
+        limiter: Optional[ShopifyLeakyBucket] = None,
+        extra_params: Optional[Dict[str, Any]] = None,
+        max_retries: int = 5
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        逐页遍历 Shopify 全部产品（page_info 游标分页）
+        
+        Yields:
+            (原始 Shopify 产品列表, 下一页 page_info；最后一页为 None)
+        """
+        url = f"https://{shop_domain}/admin/api/{SHOPIFY_API_VERSION}/products.json"
+        headers = {"X-Shopify-Access-Token": access_token}
+        limiter = limiter or ShopifyLeakyBucket()
+        page_size = min(page_size, SHOPIFY_MAX_PAGE_SIZE)
+        
+        client = get_http_client("shopify")
+        while True:
+            # 带 page_info 时 Shopify 只接受 limit（过滤条件已编码在游标里）
+            params: Dict[str, Any] = {"limit": page_size}
+            if page_info:
+                params["page_info"] = page_info
+            elif extra_params:
+                params.update(extra_params)
+            
+            for attempt in range(max_retries + 1):
+                await limiter.acquire()
+                response = await client.get(url, headers=headers, params=params)
+                limiter.update(response)
+                if response.status_code == 429 and attempt < max_retries:
+                    await asyncio.sleep(ShopifyLeakyBucket.retry_after(response))
+                    continue
+                if response.status_code >= 500 and attempt < max_retries:
+                    await asyncio.sleep(min(2 ** attempt, 30))
+                    continue
+                break
+            
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"Shopify API error: {response.status_code} - {response.text[:200]}"
+                )
+            
+            page_info = parse_next_page_info(response.headers.get("Link"))
+            yield response.json().get("products", []), page_info
+            if not page_info:
+                return
+    
     @staticmethod
     def convert_to_standard(shopify_product: Dict[str, Any], merchant_id: str) -> StandardProduct:
         """
@@ -6,9 +6,10 @@ PSP (Payment Service Provider) 适配器
 from typing import Dict, Any, Optional, Tuple
 from decimal import Decimal
 from abc import ABC, abstractmethod
-import stripe
-import httpx
 from config.settings import settings
+from utils.http_client import get_http_client
+from utils.stripe_client import AsyncStripeClient
+from utils.psp_health import classify_psp_error
 
 
 class PaymentIntent:
@@ -35,14 +36,18 @@ class PaymentIntent:
 class PSPAdapter(ABC):
     """PSP 适配器基类"""
     
+    # 最近一次 create_payment_intent 失败的错误类别（classify_psp_error），供路由健康度统计
+    last_error_code: Optional[str] = None
+    
     @abstractmethod
     async def create_payment_intent(
         self,
         amount: Decimal,
         currency: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Tuple[bool, Optional[PaymentIntent], Optional[str]]:
-        """创建支付意图"""
+        """创建支付意图（idempotency_key 透传给 PSP，重试不会重复扣款）"""
         pass
     
     @abstractmethod
@@ -78,17 +83,21 @@ class StripeAdapter(PSPAdapter):
     
     def __init__(self, api_key: str):
         self.api_key = api_key
-        stripe.api_key = api_key
+        # Key travels with each request; no process-global stripe.api_key
+        self.client = AsyncStripeClient(api_key)
     
     async def create_payment_intent(
         self,
         amount: Decimal,
         currency: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Tuple[bool, Optional[PaymentIntent], Optional[str]]:
         """创建 Stripe Payment Intent"""
+        self.last_error_code = None
         try:
-            payment_intent = stripe.PaymentIntent.create(
+            payment_intent = await self.client.create_payment_intent(
+                idempotency_key=idempotency_key,
                 amount=int(amount * 100),  # Stripe 使用分为单位
                 currency=currency.lower(),
                 metadata=metadata,
@@ -113,6 +122,7 @@ class StripeAdapter(PSPAdapter):
             )
         except Exception as e:
             # Fall back to generic exception to avoid dependency on stripe.error namespace
+            self.last_error_code = classify_psp_error(e)
             return False, None, str(e)
     
     async def confirm_payment(
@@ -122,7 +132,7 @@ class StripeAdapter(PSPAdapter):
     ) -> Tuple[bool, str, Optional[str]]:
         """确认 Stripe 支付"""
         try:
-            payment_intent = stripe.PaymentIntent.confirm(
+            payment_intent = await self.client.confirm_payment_intent(
                 payment_intent_id,
                 payment_method=payment_method_id
             )
@@ -137,7 +147,7 @@ class StripeAdapter(PSPAdapter):
     ) -> Tuple[bool, str, Optional[str]]:
         """查询 Stripe 支付状态"""
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            payment_intent = await self.client.retrieve_payment_intent(payment_intent_id)
             return True, payment_intent.status, None
         except Exception as e:
             # Fall back to generic exception to avoid dependency on stripe.error namespace
@@ -157,7 +167,7 @@ class StripeAdapter(PSPAdapter):
             if reason:
                 refund_data["reason"] = reason
             
-            refund = stripe.Refund.create(**refund_data)
+            refund = await self.client.create_refund(**refund_data)
             return True, refund.id, None
         except Exception as e:
             # Fall back to generic exception to avoid dependency on stripe.error namespace
@@ -176,14 +186,18 @@ class AdyenAdapter(PSPAdapter):
         self,
         amount: Decimal,
         currency: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Tuple[bool, Optional[PaymentIntent], Optional[str]]:
         """创建 Adyen Payment"""
+        self.last_error_code = None
         try:
             headers = {
                 "X-API-Key": self.api_key,
                 "Content-Type": "application/json"
             }
+            if idempotency_key:
+                headers["Idempotency-Key"] = idempotency_key
             
             payload = {
                 "amount": {
@@ -196,32 +210,34 @@ class AdyenAdapter(PSPAdapter):
                 "metadata": metadata
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/payments",
-                    json=payload,
-                    headers=headers,
-                    timeout=10.0
+            client = get_http_client("adyen")
+            response = await client.post(
+                f"{self.base_url}/payments",
+                json=payload,
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return (
+                    True,
+                    PaymentIntent(
+                        id=data.get("pspReference", ""),
+                        client_secret=data.get("sessionData", ""),  # Adyen 的客户端密钥
+                        amount=int(amount * 100),
+                        currency=currency,
+                        status=data.get("resultCode", "pending").lower(),
+                        psp_type="adyen",
+                        raw_response=data
+                    ),
+                    None
                 )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return (
-                        True,
-                        PaymentIntent(
-                            id=data.get("pspReference", ""),
-                            client_secret=data.get("sessionData", ""),  # Adyen 的客户端密钥
-                            amount=int(amount * 100),
-                            currency=currency,
-                            status=data.get("resultCode", "pending").lower(),
-                            psp_type="adyen",
-                            raw_response=data
-                        ),
-                        None
-                    )
-                else:
-                    return False, None, f"Adyen API error: {response.status_code} - {response.text}"
+            else:
+                self.last_error_code = classify_psp_error(http_status=response.status_code)
+                return False, None, f"Adyen API error: {response.status_code} - {response.text}"
         except Exception as e:
+            self.last_error_code = classify_psp_error(e)
             return False, None, str(e)
     
     async def confirm_payment(
@@ -242,29 +258,29 @@ class AdyenAdapter(PSPAdapter):
                 "pspReference": payment_intent_id
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/payments/details",
-                    json=payload,
-                    headers=headers,
-                    timeout=10.0
-                )
+            client = get_http_client("adyen")
+            response = await client.post(
+                f"{self.base_url}/payments/details",
+                json=payload,
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                status = data.get("resultCode", "pending").lower()
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get("resultCode", "pending").lower()
-                    
-                    # Adyen 状态映射
-                    status_map = {
-                        "authorised": "succeeded",
-                        "refused": "failed",
-                        "error": "failed",
-                        "cancelled": "cancelled"
-                    }
-                    
-                    return True, status_map.get(status, status), None
-                else:
-                    return False, "failed", f"Adyen API error: {response.status_code}"
+                # Adyen 状态映射
+                status_map = {
+                    "authorised": "succeeded",
+                    "refused": "failed",
+                    "error": "failed",
+                    "cancelled": "cancelled"
+                }
+                
+                return True, status_map.get(status, status), None
+            else:
+                return False, "failed", f"Adyen API error: {response.status_code}"
         except Exception as e:
             return False, "failed", str(e)
     
@@ -301,19 +317,19 @@ class AdyenAdapter(PSPAdapter):
                     "currency": "USD"  # TODO: 从原始支付中获取
                 }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/refunds",
-                    json=payload,
-                    headers=headers,
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return True, data.get("pspReference"), None
-                else:
-                    return False, None, f"Adyen refund error: {response.status_code}"
+            client = get_http_client("adyen")
+            response = await client.post(
+                f"{self.base_url}/refunds",
+                json=payload,
+                headers=headers,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return True, data.get("pspReference"), None
+            else:
+                return False, None, f"Adyen refund error: {response.status_code}"
         except Exception as e:
             return False, None, str(e)
 
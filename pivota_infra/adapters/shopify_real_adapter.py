@@ -324,27 +324,21 @@ class ShopifyRealAdapter:
             return {"success": False, "error": str(e)}
 
     async def get_inventory_levels(self, skus: List[str]) -> Dict[str, Dict[str, Any]]:
-        """Get inventory levels for specific SKUs"""
+        """Get inventory levels for specific SKUs (targeted lookup, not a catalog scan)"""
+        from utils.inventory_service import fetch_variants_by_sku
         try:
-            products_response = await self.get_products()
-            if products_response.get("error"):
-                return {"error": products_response["error"]}
+            records = await fetch_variants_by_sku(self.shop_domain, self.access_token, skus)
             
             inventory_data = {}
-            products = products_response.get("products", [])
-            
-            for product in products:
-                for variant in product.get("variants", []):
-                    sku = variant.get("sku")
-                    if sku in skus:
-                        inventory_data[sku] = {
-                            "variant_id": variant["id"],
-                            "inventory_quantity": variant.get("inventory_quantity", 0),
-                            "inventory_management": variant.get("inventory_management"),
-                            "inventory_policy": variant.get("inventory_policy", "deny"),
-                            "price": variant["price"],
-                            "title": variant.get("title", product.get("title"))
-                        }
+            for record in records:
+                inventory_data[record["sku"]] = {
+                    "variant_id": int(record["variant_id"]),
+                    "inventory_quantity": record["available"],
+                    "inventory_management": "shopify" if record["tracked"] else None,
+                    "inventory_policy": record["inventory_policy"],
+                    "price": record["price"],
+                    "title": record["title"]
+                }
             
             return inventory_data
             
@@ -1,21 +1,24 @@
 """
 Stripe Adapter for Payment Processing
 """
-import stripe
 import logging
 from typing import Dict, Any, Optional
 from config.settings import settings
+from utils.stripe_client import AsyncStripeClient
 
 logger = logging.getLogger("stripe_adapter")
 
-# Initialize Stripe
-stripe.api_key = settings.stripe_secret_key
 
-def create_payment_intent(
+def _client(api_key: Optional[str] = None) -> AsyncStripeClient:
+    # Platform key unless a merchant key is passed; never the global stripe.api_key
+    return AsyncStripeClient(api_key or settings.stripe_secret_key)
+
+async def create_payment_intent(
     amount: int,
     currency: str = "usd",
     payment_method_types: list = None,
-    metadata: Dict[str, str] = None
+    metadata: Dict[str, str] = None,
+    api_key: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Create a Stripe payment intent
@@ -25,6 +28,7 @@ def create_payment_intent(
         currency: Currency code (default: usd)
         payment_method_types: List of payment method types
         metadata: Additional metadata
+        api_key: Merchant Stripe key (defaults to STRIPE_SECRET_KEY)
         
     Returns:
         Payment intent object or error dict
@@ -36,7 +40,7 @@ def create_payment_intent(
         if metadata is None:
             metadata = {}
             
-        intent = stripe.PaymentIntent.create(
+        intent = await _client(api_key).create_payment_intent(
             amount=amount,
             currency=currency,
             payment_method_types=payment_method_types,
@@ -49,6 +53,7 @@ def create_payment_intent(
         logger.info(f"Created Stripe payment intent: {intent.id}")
         return {
             "success": True,
+            "id": intent.id,
             "payment_intent": intent,
             "client_secret": intent.client_secret
         }
@@ -77,6 +82,8 @@ def verify_webhook_signature(
     Returns:
         True if signature is valid, False otherwise
     """
+    import stripe  # deferred: only needed for signature checks
+
     try:
         stripe.Webhook.construct_event(
             payload, signature, endpoint_secret
@@ -89,26 +96,28 @@ def verify_webhook_signature(
         logger.error(f"Error in webhook verification: {e}")
         return False
 
-def get_payment_intent(payment_intent_id: str) -> Optional[Dict[str, Any]]:
+async def get_payment_intent(payment_intent_id: str, api_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Retrieve a payment intent by ID
     
     Args:
         payment_intent_id: Stripe payment intent ID
+        api_key: Merchant Stripe key (defaults to STRIPE_SECRET_KEY)
         
     Returns:
         Payment intent object or None if not found
     """
     try:
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        intent = await _client(api_key).retrieve_payment_intent(payment_intent_id)
         return intent
     except Exception as e:
         logger.error(f"Error retrieving payment intent: {e}")
         return None
 
-def confirm_payment_intent(
+async def confirm_payment_intent(
     payment_intent_id: str,
-    payment_method: str = None
+    payment_method: str = None,
+    api_key: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Confirm a payment intent
@@ -116,12 +125,13 @@ def confirm_payment_intent(
     Args:
         payment_intent_id: Stripe payment intent ID
         payment_method: Payment method ID (optional)
+        api_key: Merchant Stripe key (defaults to STRIPE_SECRET_KEY)
         
     Returns:
         Confirmation result dict
     """
     try:
-        intent = stripe.PaymentIntent.confirm(
+        intent = await _client(api_key).confirm_payment_intent(
             payment_intent_id,
             payment_method=payment_method
         )
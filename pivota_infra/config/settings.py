@@ -12,16 +12,107 @@ class Settings(BaseSettings):
     # PostgreSQL only - no SQLite fallback
     database_url: str = os.getenv("DATABASE_URL", "")
     
+    # Direct (non-pgbouncer) URL for LISTEN/NOTIFY; falls back to DATABASE_URL
+    database_listen_url: Optional[str] = os.getenv("DATABASE_LISTEN_URL")
+
     # Redis (optional, for shared rate limiting)
     redis_url: Optional[str] = os.getenv("REDIS_URL")
 
+    # Batched usage-log writer
+    log_writer_batch_size: int = int(os.getenv("LOG_WRITER_BATCH_SIZE", "500"))
+    log_writer_flush_interval_ms: int = int(os.getenv("LOG_WRITER_FLUSH_INTERVAL_MS", "1000"))
+    log_writer_queue_size: int = int(os.getenv("LOG_WRITER_QUEUE_SIZE", "50000"))
+
+    # In-memory product search index
+    product_index_refresh_seconds: int = int(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "60"))
+    product_index_rebuild_seconds: int = int(os.getenv("PRODUCT_INDEX_REBUILD_SECONDS", "1800"))
+
+    # products_cache TTL when freshness comes from change events (webhooks / delta syncs)
+    product_cache_event_ttl_seconds: int = int(os.getenv("PRODUCT_CACHE_EVENT_TTL_SECONDS", "604800"))
+
+    # Variant inventory cache (memory is per instance; Postgres rows are kept fresh by webhooks)
+    inventory_memory_ttl_seconds: int = int(os.getenv("INVENTORY_MEMORY_TTL_SECONDS", "30"))
+    inventory_cache_ttl_seconds: int = int(os.getenv("INVENTORY_CACHE_TTL_SECONDS", "300"))
+    inventory_memory_max_variants: int = int(os.getenv("INVENTORY_MEMORY_MAX_VARIANTS", "50000"))
+
+    # Cross-merchant search fan-out (0 = half the DB pool)
+    search_merchant_timeout_ms: int = int(os.getenv("SEARCH_MERCHANT_TIMEOUT_MS", "800"))
+    search_fanout_concurrency: int = int(os.getenv("SEARCH_FANOUT_CONCURRENCY", "0"))
+
+    # WebSocket fan-out: per-connection outbound queue and slow-consumer policy
+    ws_send_queue_size: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    ws_send_timeout_seconds: float = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+    ws_slow_consumer_policy: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")  # drop_oldest | disconnect
+    ws_snapshot_interval_ms: int = int(os.getenv("WS_SNAPSHOT_INTERVAL_MS", "1000"))  # metric delta cadence
+
+    # Agent API latency histograms (hourly, per agent / endpoint; persisted per instance)
+    latency_histogram_max_keys: int = int(os.getenv("LATENCY_HISTOGRAM_MAX_KEYS", "2000"))  # per scope
+    latency_histogram_persist_seconds: int = int(os.getenv("LATENCY_HISTOGRAM_PERSIST_SECONDS", "30"))
+    latency_histogram_retention_hours: int = int(os.getenv("LATENCY_HISTOGRAM_RETENTION_HOURS", "168"))
+
+    # Agent usage rollups (minute / hour tables maintained by the log writer)
+    usage_rollup_flush_seconds: int = int(os.getenv("USAGE_ROLLUP_FLUSH_SECONDS", "10"))
+    usage_rollup_minute_retention_hours: int = int(os.getenv("USAGE_ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+
+    # Partitioned event tables: upcoming partitions, retention (0 = keep forever) and archive target
+    partition_premake_days: int = int(os.getenv("PARTITION_PREMAKE_DAYS", "7"))
+    partition_maintenance_interval_seconds: int = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+    event_log_retention_days: int = int(os.getenv("EVENT_LOG_RETENTION_DAYS", "0"))  # agent_usage_logs / api_call_events
+    order_event_retention_days: int = int(os.getenv("ORDER_EVENT_RETENTION_DAYS", "0"))
+    partition_archive_dir: str = os.getenv("PARTITION_ARCHIVE_DIR", "archive/partitions")  # relative: never dropped without S3
+    partition_archive_s3_bucket: Optional[str] = os.getenv("PARTITION_ARCHIVE_S3_BUCKET")  # unset: keep on local disk
+    partition_archive_s3_prefix: str = os.getenv("PARTITION_ARCHIVE_S3_PREFIX", "partitions/")
+    partition_archive_s3_endpoint_url: Optional[str] = os.getenv("PARTITION_ARCHIVE_S3_ENDPOINT_URL")  # R2 / MinIO
+
+    # Webhook inbox: routes ack after insert, workers drain webhook_inbox (0 workers = another replica drains)
+    webhook_workers: int = int(os.getenv("WEBHOOK_WORKERS", "4"))
+    webhook_batch_size: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "20"))
+    webhook_poll_seconds: float = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+    webhook_max_attempts: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+    webhook_processing_timeout_seconds: int = int(os.getenv("WEBHOOK_PROCESSING_TIMEOUT_SECONDS", "60"))
+    webhook_inbox_retention_days: int = int(os.getenv("WEBHOOK_INBOX_RETENTION_DAYS", "7"))  # dedup window
+
+    # PSP routing: rolling health windows (per process) and circuit breakers
+    psp_health_window_seconds: int = int(os.getenv("PSP_HEALTH_WINDOW_SECONDS", "300"))
+    psp_routing_min_samples: int = int(os.getenv("PSP_ROUTING_MIN_SAMPLES", "20"))  # before a narrower window is trusted
+    psp_breaker_window_seconds: int = int(os.getenv("PSP_BREAKER_WINDOW_SECONDS", "60"))
+    psp_breaker_min_requests: int = int(os.getenv("PSP_BREAKER_MIN_REQUESTS", "10"))
+    psp_breaker_failure_threshold: float = float(os.getenv("PSP_BREAKER_FAILURE_THRESHOLD", "0.5"))
+    psp_breaker_consecutive_failures: int = int(os.getenv("PSP_BREAKER_CONSECUTIVE_FAILURES", "5"))
+    psp_breaker_cooldown_seconds: int = int(os.getenv("PSP_BREAKER_COOLDOWN_SECONDS", "30"))
+
+    # Idempotency-Key replay for agent order / payment endpoints
+    idempotency_ttl_hours: int = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+    idempotency_lock_seconds: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # in-progress lease
+    idempotency_wait_seconds: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))  # duplicate waits, then 409
+    idempotency_memory_max_entries: int = int(os.getenv("IDEMPOTENCY_MEMORY_MAX_ENTRIES", "10000"))
+
+    # Agent credential cache
+    agent_cache_ttl_seconds: int = int(os.getenv("AGENT_CACHE_TTL_SECONDS", "300"))
+    agent_cache_max_entries: int = int(os.getenv("AGENT_CACHE_MAX_ENTRIES", "10000"))
+
+    # Merchant context cache (onboarding row + PSP credentials + store connection)
+    merchant_context_ttl_seconds: int = int(os.getenv("MERCHANT_CONTEXT_TTL_SECONDS", "60"))
+    merchant_context_max_entries: int = int(os.getenv("MERCHANT_CONTEXT_MAX_ENTRIES", "5000"))
+
     # Rate limiting
     rate_limit_rpm: int = int(os.getenv("RATE_LIMIT_RPM", "1000"))
     rate_limit_window_seconds: int = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+    # Agent quota counters: auto | memory | redis
+    quota_counter_backend: str = os.getenv("QUOTA_COUNTER_BACKEND", "auto")
+    quota_reconcile_interval_seconds: int = int(os.getenv("QUOTA_RECONCILE_INTERVAL_SECONDS", "60"))
+
+    # Cross-worker event bus for dashboard events: auto | memory | redis
+    event_bus_backend: str = os.getenv("EVENT_BUS_BACKEND", "auto")
+
+    # Import one-off fix / init / debug / demo routers on first request instead of at boot
+    lazy_routers: bool = os.getenv("LAZY_ROUTERS", "true").lower() == "true"
     
     # API Keys
     stripe_secret_key: Optional[str] = os.getenv("STRIPE_SECRET_KEY")
     stripe_webhook_secret: Optional[str] = os.getenv("STRIPE_WEBHOOK_SECRET")
+    stripe_api_version: Optional[str] = os.getenv("STRIPE_API_VERSION")  # unset: account default
     
     adyen_api_key: Optional[str] = os.getenv("ADYEN_API_KEY")
     adyen_merchant_account: Optional[str] = os.getenv("ADYEN_MERCHANT_ACCOUNT", "WoopayECOM")
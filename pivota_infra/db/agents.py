@@ -5,12 +5,15 @@ Agent 管理数据库模型
 
 from sqlalchemy import Table, Column, Integer, String, Text, DateTime, JSON, Boolean, Numeric
 from sqlalchemy.sql import func
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List
 import secrets
 import hashlib
 
 from db.database import metadata, database
+from db.usage_rollups import (
+    get_usage_by_endpoint, get_usage_latency_histogram, get_usage_timeline, get_usage_totals
+)
 
 
 # ============================================================================
@@ -58,6 +61,7 @@ agents = Table(
 # Agent 使用日志
 # ============================================================================
 
+# 按 timestamp 每日分区（db/partitions.py）；分析读取 agent_usage_rollup_*
 agent_usage_logs = Table(
     "agent_usage_logs",
     metadata,
@@ -139,7 +143,26 @@ async def get_agent_by_key(api_key: str) -> Optional[Dict[str, Any]]:
     支持两种来源：
     1) agents.api_key （旧/兼容）
     2) api_keys.key_hash（新，多密钥），仅匹配 status='active' 的密钥
+
+    结果缓存在进程内（utils.agent_cache），写入 agents/api_keys 后通过
+    notify_agent_changed() 失效
     """
+    from utils.agent_cache import get_agent_cache, hash_api_key
+
+    cache = get_agent_cache()
+    key_hash = hash_api_key(api_key)
+    cached = cache.get(key_hash)
+    if cached is not None:
+        return cached
+
+    agent = await _load_agent_by_key(api_key, key_hash)
+    if agent is not None:
+        cache.put(key_hash, agent)
+    return agent
+
+
+async def _load_agent_by_key(api_key: str, key_hash: str) -> Optional[Dict[str, Any]]:
+    """Resolve an API key against the database (cache miss path)"""
     try:
         # 1) Try direct match on legacy agents.api_key
         result = await database.fetch_one(
@@ -150,8 +173,6 @@ async def get_agent_by_key(api_key: str) -> Optional[Dict[str, Any]]:
         # 2) If not found, try hashed match in api_keys table
         if not result:
             try:
-                import hashlib
-                key_hash = hashlib.sha256(api_key.encode()).hexdigest()
                 result = await database.fetch_one(
                     """
                     SELECT a.*
@@ -244,6 +265,39 @@ async def update_agent_stats(
         return
 
 
+def usage_log_row(
+    agent_id: str,
+    endpoint: str,
+    method: str,
+    status_code: Optional[int],
+    response_time_ms: Optional[int],
+    request_id: Optional[str] = None,
+    merchant_id: Optional[str] = None,
+    order_id: Optional[str] = None,
+    order_amount: Optional[float] = None,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    error_message: Optional[str] = None
+) -> Dict[str, Any]:
+    """构造 agent_usage_logs 行（所有写入方使用相同的列集合，便于批量 INSERT）"""
+    return {
+        "agent_id": agent_id,
+        "endpoint": endpoint,
+        "method": method,
+        "merchant_id": merchant_id,
+        "request_id": request_id or f"req_{secrets.token_hex(16)}",
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "status_code": status_code,
+        "response_time_ms": response_time_ms,
+        "error_message": error_message,
+        "order_id": order_id,
+        "order_amount": order_amount,
+        # Set at request time: the batched INSERT happens later
+        "timestamp": datetime.now(timezone.utc),
+    }
+
+
 async def log_agent_usage(
     agent_id: str,
     endpoint: str,
@@ -257,94 +311,103 @@ async def log_agent_usage(
     user_agent: Optional[str] = None,
     error_message: Optional[str] = None
 ) -> str:
-    """记录 Agent API 使用"""
-    request_id = f"req_{secrets.token_hex(16)}"
-    
-    query = agent_usage_logs.insert().values(
+    """记录 Agent API 使用（写入批量队列，不阻塞请求）"""
+    from utils.log_writer import get_log_writer
+
+    row = usage_log_row(
         agent_id=agent_id,
         endpoint=endpoint,
         method=method,
-        merchant_id=merchant_id,
-        request_id=request_id,
-        ip_address=ip_address,
-        user_agent=user_agent,
         status_code=status_code,
         response_time_ms=response_time_ms,
-        error_message=error_message,
+        merchant_id=merchant_id,
         order_id=order_id,
-        order_amount=order_amount
+        order_amount=order_amount,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        error_message=error_message
     )
     
+    writer = get_log_writer()
+    if writer.running:
+        writer.enqueue(agent_usage_logs, row)
+        return row["request_id"]
+    
+    # Writer not running (scripts / tests): write directly
     try:
-        await database.execute(query)
+        await database.execute(agent_usage_logs.insert().values(**row))
     except Exception:
         # Ignore logging failures to avoid breaking API flow
         pass
-    return request_id
+    return row["request_id"]
+
+
+async def queue_agent_stats(
+    agent_id: str,
+    increment_requests: int = 0,
+    increment_orders: int = 0,
+    add_gmv: float = 0
+):
+    """累加 Agent 统计，由批量写入器合并为每个 Agent 一次 UPDATE"""
+    from utils.log_writer import get_log_writer
 
+    writer = get_log_writer()
+    if writer.running:
+        writer.add_agent_stats(agent_id, increment_requests, increment_orders, add_gmv)
+    else:
+        await update_agent_stats(agent_id, increment_requests, increment_orders, add_gmv)
 
-async def check_rate_limit(agent_id: str) -> tuple[bool, int, int]:
+
+async def check_rate_limit(
+    agent_id: str,
+    agent: Optional[Dict[str, Any]] = None
+) -> tuple[bool, int, int]:
     """
-    检查 Agent 是否超过速率限制
+    检查 Agent 是否超过速率限制（只读，不计数）
     返回: (是否允许, 当前分钟内请求数, 限制数)
+
+    agent: 已解析的 Agent（如认证时从缓存取得），传入则跳过 get_agent 查询
+    计数来自 utils.quota_counter（O(1)），不再对 agent_usage_logs 做 COUNT(*)
     """
+    from utils.quota_counter import get_quota_counter
+
     # 获取 Agent 配置
-    agent = await get_agent(agent_id)
+    if agent is None:
+        agent = await get_agent(agent_id)
     if not agent:
         return False, 0, 0
     
-    rate_limit = agent.get("rate_limit", 100)
-    
-    # 统计最近一分钟的请求数
-    one_minute_ago = datetime.utcnow() - timedelta(minutes=1)
-    query = f"""
-        SELECT COUNT(*) as count 
-        FROM agent_usage_logs 
-        WHERE agent_id = :agent_id 
-        AND timestamp > :since
-    """
+    rate_limit = agent.get("rate_limit") or 100
     
     try:
-        result = await database.fetch_one(
-            query,
-            {"agent_id": agent_id, "since": one_minute_ago}
-        )
-        current_count = result["count"] if result else 0
+        current_count, _ = await get_quota_counter().peek(agent_id)
         return current_count < rate_limit, current_count, rate_limit
     except Exception:
-        # If logs table missing, allow request with default limits
+        # Counter unavailable: allow request with default limits
         return True, 0, rate_limit
 
 
-async def check_daily_quota(agent_id: str) -> tuple[bool, int, int]:
+async def check_daily_quota(
+    agent_id: str,
+    agent: Optional[Dict[str, Any]] = None
+) -> tuple[bool, int, int]:
     """
-    检查 Agent 是否超过每日配额
+    检查 Agent 是否超过每日配额（只读，不计数）
     返回: (是否允许, 今日使用量, 配额)
     """
-    agent = await get_agent(agent_id)
+    from utils.quota_counter import get_quota_counter
+
+    if agent is None:
+        agent = await get_agent(agent_id)
     if not agent:
         return False, 0, 0
     
-    daily_quota = agent.get("daily_quota", 10000)
-    
-    # 统计今天的请求数
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    query = f"""
-        SELECT COUNT(*) as count 
-        FROM agent_usage_logs 
-        WHERE agent_id = :agent_id 
-        AND timestamp >= :today
-    """
+    daily_quota = agent.get("daily_quota") or 10000
     
     try:
-        result = await database.fetch_one(
-            query,
-            {"agent_id": agent_id, "today": today}
-        )
-        today_count = result["count"] if result else 0
+        _, today_count = await get_quota_counter().peek(agent_id)
         return today_count < daily_quota, today_count, daily_quota
     except Exception:
-        # If logs table missing, allow within quota by default
         return True, 0, daily_quota
 
 
@@ -353,7 +416,7 @@ async def get_agent_analytics(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ) -> Dict[str, Any]:
-    """获取 Agent 分析数据"""
+    """获取 Agent 分析数据（读取 agent_usage_rollup_* 汇总表，不扫描原始日志）"""
     
     if not start_date:
         start_date = datetime.utcnow() - timedelta(days=30)
@@ -361,72 +424,22 @@ async def get_agent_analytics(
         end_date = datetime.utcnow()
     
     # 基础统计
-    stats_query = f"""
-        SELECT 
-            COUNT(DISTINCT request_id) as total_requests,
-            COUNT(DISTINCT order_id) as total_orders,
-            SUM(order_amount) as total_gmv,
-            AVG(response_time_ms) as avg_response_time,
-            COUNT(CASE WHEN status_code >= 400 THEN 1 END) as error_count
-        FROM agent_usage_logs
-        WHERE agent_id = :agent_id
-        AND timestamp BETWEEN :start_date AND :end_date
-    """
-    
-    stats = await database.fetch_one(
-        stats_query,
-        {
-            "agent_id": agent_id,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-    )
+    totals = await get_usage_totals(start_date, end_date, agent_id=agent_id)
+    latency = await get_usage_latency_histogram(start_date, end_date, agent_id=agent_id)
+    stats = {
+        "total_requests": totals["requests"],
+        "total_orders": totals["orders"],
+        "total_gmv": totals["gmv"],
+        "avg_response_time": totals["avg_response_time_ms"] if totals["latency_count"] else None,
+        "error_count": totals["errors"],
+        **{f"{label}_response_time": value for label, value in latency.percentiles().items()},
+    }
     
     # 按天统计
-    daily_query = f"""
-        SELECT 
-            DATE(timestamp) as date,
-            COUNT(*) as requests,
-            COUNT(DISTINCT order_id) as orders,
-            SUM(order_amount) as gmv
-        FROM agent_usage_logs
-        WHERE agent_id = :agent_id
-        AND timestamp BETWEEN :start_date AND :end_date
-        GROUP BY DATE(timestamp)
-        ORDER BY date DESC
-    """
-    
-    daily_stats = await database.fetch_all(
-        daily_query,
-        {
-            "agent_id": agent_id,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-    )
+    daily_stats = await get_usage_timeline(start_date, end_date, agent_id=agent_id, period="day")
     
     # 热门端点
-    endpoint_query = f"""
-        SELECT 
-            endpoint,
-            COUNT(*) as count,
-            AVG(response_time_ms) as avg_time
-        FROM agent_usage_logs
-        WHERE agent_id = :agent_id
-        AND timestamp BETWEEN :start_date AND :end_date
-        GROUP BY endpoint
-        ORDER BY count DESC
-        LIMIT 10
-    """
-    
-    top_endpoints = await database.fetch_all(
-        endpoint_query,
-        {
-            "agent_id": agent_id,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-    )
+    top_endpoints = await get_usage_by_endpoint(start_date, end_date, agent_id=agent_id, limit=10)
     
     return {
         "agent_id": agent_id,
@@ -434,11 +447,14 @@ async def get_agent_analytics(
             "start": start_date.isoformat(),
             "end": end_date.isoformat()
         },
-        "summary": dict(stats) if stats else {},
-        "daily_stats": [dict(d) for d in daily_stats],
-        "top_endpoints": [dict(e) for e in top_endpoints],
+        "summary": stats,
+        "daily_stats": [
+            {"date": d["bucket"].date(), "requests": d["requests"], "orders": d["orders"], "gmv": d["gmv"]}
+            for d in daily_stats
+        ],
+        "top_endpoints": top_endpoints,
         "success_rate": (
             100 * (1 - (stats["error_count"] / stats["total_requests"]))
-            if stats and stats["total_requests"] > 0 else 0
+            if stats["total_requests"] > 0 else 0
         )
     }
@@ -0,0 +1,118 @@
+"""
+Idempotency Keys Database
+Agent 重试同一个 Idempotency-Key 时直接回放第一次的响应：
+首个请求以 in_progress 占住 key（带租约），完成后写入响应体；
+并发的重复请求等待首个请求完成，之后的重复请求只需一次主键查询
+"""
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, Index, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from db.database import metadata, database
+
+idempotency_keys = Table(
+    "idempotency_keys",
+    metadata,
+    Column("scope", String(150), nullable=False),  # endpoint + 调用方（agent / merchant key）
+    Column("idempotency_key", String(255), nullable=False),
+    Column("fingerprint", String(64), nullable=False),  # 请求体 sha256，同 key 不同请求体拒绝
+    Column("status", String(20), nullable=False),  # in_progress / completed
+    Column("response_status", Integer, nullable=True),
+    Column("response_body", JSONB, nullable=True),
+    Column("locked_until", DateTime, nullable=True),  # in_progress 租约，过期后可被接管
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+    Column("completed_at", DateTime, nullable=True),
+    Column("expires_at", DateTime, nullable=False),
+
+    PrimaryKeyConstraint("scope", "idempotency_key", name="pk_idempotency_keys"),
+    Index("idx_idempotency_keys_expires", "expires_at"),
+)
+
+
+async def claim_idempotency_key(
+    scope: str,
+    key: str,
+    fingerprint: str,
+    lock_seconds: float,
+    ttl_seconds: float
+) -> Optional[Dict[str, Any]]:
+    """
+    占用 key：成功返回 None（调用方执行请求）；
+    已存在则返回现有记录（completed 可直接回放，in_progress 需等待）
+    过期的记录、租约已过期的 in_progress 记录会被接管
+    """
+    now = datetime.utcnow()
+    row = await database.fetch_one(
+        """
+        INSERT INTO idempotency_keys (scope, idempotency_key, fingerprint, status, locked_until, created_at, expires_at)
+        VALUES (:scope, :key, :fingerprint, 'in_progress', :locked_until, :now, :expires_at)
+        ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+            fingerprint = EXCLUDED.fingerprint,
+            status = 'in_progress',
+            response_status = NULL,
+            response_body = NULL,
+            locked_until = EXCLUDED.locked_until,
+            created_at = EXCLUDED.created_at,
+            completed_at = NULL,
+            expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < :now
+           OR (idempotency_keys.status = 'in_progress' AND idempotency_keys.locked_until < :now)
+        RETURNING idempotency_key
+        """,
+        {
+            "scope": scope,
+            "key": key,
+            "fingerprint": fingerprint,
+            "locked_until": now + timedelta(seconds=lock_seconds),
+            "now": now,
+            "expires_at": now + timedelta(seconds=ttl_seconds),
+        }
+    )
+    if row:
+        return None
+    existing = await get_idempotency_key(scope, key)
+    # Released between the insert and the read: report as in progress so the caller retries the claim
+    return existing or {"status": "in_progress", "fingerprint": fingerprint}
+
+
+async def get_idempotency_key(scope: str, key: str) -> Optional[Dict[str, Any]]:
+    row = await database.fetch_one(
+        idempotency_keys.select().where(
+            (idempotency_keys.c.scope == scope) & (idempotency_keys.c.idempotency_key == key)
+        )
+    )
+    return dict(row) if row else None
+
+
+async def complete_idempotency_key(scope: str, key: str, status_code: int, body: Any) -> None:
+    await database.execute(
+        idempotency_keys.update().where(
+            (idempotency_keys.c.scope == scope) & (idempotency_keys.c.idempotency_key == key)
+        ).values(
+            status="completed",
+            response_status=status_code,
+            response_body=body,
+            locked_until=None,
+            completed_at=datetime.utcnow(),
+        )
+    )
+
+
+async def release_idempotency_key(scope: str, key: str) -> None:
+    """请求失败：删除 in_progress 记录，让重试重新执行"""
+    await database.execute(
+        idempotency_keys.delete().where(
+            (idempotency_keys.c.scope == scope)
+            & (idempotency_keys.c.idempotency_key == key)
+            & (idempotency_keys.c.status == "in_progress")
+        )
+    )
+
+
+async def delete_expired_idempotency_keys() -> None:
+    await database.execute(
+        idempotency_keys.delete().where(idempotency_keys.c.expires_at < datetime.utcnow())
+    )
@@ -0,0 +1,111 @@
+"""
+Variant Inventory Database
+每个商户的 variant → 库存数量表（下单前库存校验的本地数据源）
+由目录同步、targeted lookup 和 inventory_levels/update webhook 维护
+"""
+
+from sqlalchemy import Table, Column, String, Integer, Boolean, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from db.database import metadata, database
+
+variant_inventory = Table(
+    "variant_inventory",
+    metadata,
+    Column("merchant_id", String(50), primary_key=True),
+    Column("platform", String(50), primary_key=True),
+    Column("variant_id", String(100), primary_key=True),
+    Column("product_id", String(100), nullable=True),
+    Column("inventory_item_id", String(100), nullable=True),
+    Column("sku", String(255), nullable=True),
+    Column("title", String(500), nullable=True),
+    Column("available", Integer, default=0),  # 所有 location 合计
+    Column("tracked", Boolean, default=True),  # Shopify inventory_management == "shopify"
+    Column("inventory_policy", String(20), default="deny"),  # deny / continue
+    Column("levels", JSON, nullable=True),  # {location_id: available}，来自 inventory_levels
+    Column("updated_at", DateTime, server_default=func.now()),
+
+    Index("idx_variant_inventory_item", "merchant_id", "inventory_item_id"),
+    Index("idx_variant_inventory_sku", "merchant_id", "sku"),
+)
+
+_UPDATE_COLUMNS = (
+    "product_id", "inventory_item_id", "sku", "title", "available",
+    "tracked", "inventory_policy", "levels", "updated_at",
+)
+
+
+async def get_variant_inventory(
+    merchant_id: str,
+    variant_ids: List[str],
+    platform: str = "shopify"
+) -> Dict[str, Dict[str, Any]]:
+    """批量读取 variant 库存（一次查询）"""
+    if not variant_ids:
+        return {}
+    rows = await database.fetch_all(
+        """
+        SELECT * FROM variant_inventory
+        WHERE merchant_id = :merchant_id AND platform = :platform
+          AND variant_id = ANY(:variant_ids)
+        """,
+        {"merchant_id": merchant_id, "platform": platform, "variant_ids": list(variant_ids)}
+    )
+    return {row["variant_id"]: dict(row) for row in rows}
+
+
+async def get_variant_by_inventory_item(
+    merchant_id: str,
+    inventory_item_id: str,
+    platform: str = "shopify"
+) -> Optional[Dict[str, Any]]:
+    """按 inventory_item_id 查 variant（inventory_levels webhook 只带 item id）"""
+    query = variant_inventory.select().where(
+        (variant_inventory.c.merchant_id == merchant_id) &
+        (variant_inventory.c.platform == platform) &
+        (variant_inventory.c.inventory_item_id == str(inventory_item_id))
+    )
+    row = await database.fetch_one(query)
+    return dict(row) if row else None
+
+
+async def upsert_variant_inventory(
+    merchant_id: str,
+    records: List[Dict[str, Any]],
+    platform: str = "shopify"
+) -> int:
+    """批量写入 variant 库存（INSERT ... ON CONFLICT DO UPDATE，一条语句）"""
+    if not records:
+        return 0
+    now = datetime.now()
+    # ON CONFLICT can't touch the same row twice in one statement
+    by_variant: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        row = {column: record.get(column) for column in _UPDATE_COLUMNS}
+        row.update(
+            merchant_id=merchant_id,
+            platform=platform,
+            variant_id=str(record["variant_id"]),
+            updated_at=now,
+        )
+        by_variant[row["variant_id"]] = row
+    stmt = pg_insert(variant_inventory).values(list(by_variant.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["merchant_id", "platform", "variant_id"],
+        set_={column: stmt.excluded[column] for column in _UPDATE_COLUMNS}
+    )
+    await database.execute(stmt)
+    return len(by_variant)
+
+
+async def delete_product_inventory(merchant_id: str, product_id: str, platform: str = "shopify") -> None:
+    """产品删除时清理其全部 variant"""
+    query = variant_inventory.delete().where(
+        (variant_inventory.c.merchant_id == merchant_id) &
+        (variant_inventory.c.platform == platform) &
+        (variant_inventory.c.product_id == str(product_id))
+    )
+    await database.execute(query)
@@ -0,0 +1,77 @@
+"""
+Latency Histograms Database
+每个实例按小时持久化的延迟直方图（utils/latency_histogram 的紧凑 JSON 格式）
+读取时跨实例合并，得到全局 p50/p95/p99
+"""
+
+from sqlalchemy import Table, Column, String, DateTime, JSON, Index
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from db.database import metadata, database
+
+latency_histograms = Table(
+    "latency_histograms",
+    metadata,
+    Column("instance_id", String(100), primary_key=True),
+    Column("scope", String(20), primary_key=True),  # all / agent / endpoint
+    Column("key", String(255), primary_key=True),
+    Column("hour_start", DateTime, primary_key=True),  # UTC
+    Column("histogram", JSON, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+
+    Index("idx_latency_histograms_scope_hour", "scope", "hour_start"),
+)
+
+
+async def upsert_latency_histograms(instance_id: str, rows: List[Dict[str, Any]]) -> int:
+    """批量写入本实例的小时直方图（每行为该小时的完整直方图，覆盖旧值）"""
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    values = [
+        {
+            "instance_id": instance_id,
+            "scope": row["scope"],
+            "key": row["key"],
+            "hour_start": row["hour_start"],
+            "histogram": row["histogram"],
+            "updated_at": now,
+        }
+        for row in rows
+    ]
+    stmt = pg_insert(latency_histograms).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["instance_id", "scope", "key", "hour_start"],
+        set_={"histogram": stmt.excluded.histogram, "updated_at": stmt.excluded.updated_at}
+    )
+    await database.execute(stmt)
+    return len(values)
+
+
+async def get_latency_histograms(
+    scope: str,
+    since: datetime,
+    keys: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """读取某个 scope 自 since（UTC）以来所有实例的小时直方图"""
+    query = """
+        SELECT instance_id, key, hour_start, histogram
+        FROM latency_histograms
+        WHERE scope = :scope AND hour_start >= :since
+    """
+    params: Dict[str, Any] = {"scope": scope, "since": since}
+    if keys is not None:
+        query += " AND key = ANY(:keys)"
+        params["keys"] = list(keys)
+    rows = await database.fetch_all(query, params)
+    return [dict(row) for row in rows]
+
+
+async def delete_latency_histograms_before(before: datetime) -> None:
+    """清理过期小时"""
+    await database.execute(
+        "DELETE FROM latency_histograms WHERE hour_start < :before",
+        {"before": before}
+    )
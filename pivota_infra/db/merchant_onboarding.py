@@ -66,6 +66,23 @@ async def get_merchant_onboarding(merchant_id: str) -> Optional[Dict[str, Any]]:
     result = await database.fetch_one(query)
     return dict(result) if result else None
 
+async def get_merchant_onboardings_by_ids(merchant_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Batch lookup of merchant_id, business_name and status (one round trip)"""
+    if not merchant_ids:
+        return {}
+    query = """
+        SELECT merchant_id, business_name, status
+        FROM merchant_onboarding
+        WHERE merchant_id = ANY(:ids)
+    """
+    rows = await database.fetch_all(query, {"ids": list(merchant_ids)})
+    return {row["merchant_id"]: dict(row) for row in rows}
+
+async def _invalidate_context(merchant_id: str) -> None:
+    """Drop the cached MerchantContext on every worker (utils.merchant_context)"""
+    from utils.merchant_context import notify_merchant_changed
+    await notify_merchant_changed(merchant_id)
+
 async def update_kyc_status(merchant_id: str, status: str, reason: Optional[str] = None, rejection_reason: Optional[str] = None) -> bool:
     """Update KYC verification status. 
     When approving after rejection, pass rejection_reason=None to clear it."""
@@ -87,6 +104,7 @@ async def update_kyc_status(merchant_id: str, status: str, reason: Optional[str]
         merchant_onboarding.c.merchant_id == merchant_id
     ).values(**update_data)
     await database.execute(query)
+    await _invalidate_context(merchant_id)
     return True
 
 async def upload_kyc_documents(merchant_id: str, documents: Dict[str, Any]) -> bool:
@@ -144,6 +162,7 @@ async def setup_psp_connection(
         merchant_onboarding.c.merchant_id == merchant_id
     ).values(**update_data)
     await database.execute(query)
+    await _invalidate_context(merchant_id)
     
     return {
         "merchant_id": merchant_id,
@@ -180,6 +199,7 @@ async def soft_delete_merchant_onboarding(merchant_id: str) -> bool:
         merchant_onboarding.c.merchant_id == merchant_id
     ).values(status="deleted", updated_at=datetime.now())
     await database.execute(query)
+    await _invalidate_context(merchant_id)
     return True
 
 async def hard_delete_merchant_onboarding(merchant_id: str) -> bool:
@@ -188,5 +208,6 @@ async def hard_delete_merchant_onboarding(merchant_id: str) -> bool:
         merchant_onboarding.c.merchant_id == merchant_id
     )
     await database.execute(delete_q)
+    await _invalidate_context(merchant_id)
     return True
 
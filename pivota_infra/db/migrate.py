@@ -0,0 +1,226 @@
+"""
+Versioned schema migrations
+启动时用一条查询检查 schema_version：已是最新则什么都不做；否则在
+Postgres advisory lock 下（多副本滚动发布不会并发迁移）依次执行
+db/migrations/NNN_*.sql 中尚未应用的文件，并在 SQLAlchemy metadata
+新增表时补跑 create_all。db/seeds/*.sql 的演示数据在迁移之后执行，
+失败只记日志，不阻塞 schema 变更。
+"""
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from db.database import database, metadata
+from utils.logger import logger
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+SEEDS_DIR = os.path.join(os.path.dirname(__file__), "seeds")
+
+# Files up to this version predate the runner: they were re-run on every boot
+# with errors ignored (002 is MySQL syntax and has never applied), so they
+# stay best-effort. Later migrations must succeed before the next one runs;
+# any recorded as skipped by an older runner are retried.
+LEGACY_VERSION = 3
+
+_LOCK_SQL = "SELECT pg_advisory_lock(hashtext('schema_migrations'))"
+_UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext('schema_migrations'))"
+
+_CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    metadata_fingerprint VARCHAR(64),
+    duration_ms INTEGER,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+"""
+
+_HEAD_QUERY = """
+SELECT version, metadata_fingerprint FROM schema_version
+ORDER BY version DESC LIMIT 1
+"""
+
+_RETRY_QUERY = f"""
+SELECT version FROM schema_version
+WHERE status = 'skipped' AND version > {LEGACY_VERSION}
+"""
+
+
+def list_migrations() -> List[Tuple[int, str, str]]:
+    """(version, name, path) for db/migrations/NNN_name.sql, in order"""
+    migrations = []
+    for path in glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")):
+        name = os.path.basename(path)
+        match = re.match(r"^(\d+)_", name)
+        if match:
+            migrations.append((int(match.group(1)), name, path))
+    return sorted(migrations)
+
+
+def _load_tables() -> None:
+    # Register every table on the shared metadata before fingerprinting
+    import db.merchants  # noqa: F401
+    import db.merchant_onboarding  # noqa: F401
+    import db.payment_router  # noqa: F401
+    import db.products  # noqa: F401
+    import db.orders  # noqa: F401
+    import db.agents  # noqa: F401
+    import db.latency_histograms  # noqa: F401
+    import db.usage_rollups  # noqa: F401
+    import db.partitions  # noqa: F401
+    import db.webhook_inbox  # noqa: F401
+    import db.psp_attempts  # noqa: F401
+    import db.idempotency  # noqa: F401
+
+
+def metadata_fingerprint() -> str:
+    """Hash of the table names create_all would create (new Table => re-run it)"""
+    _load_tables()
+    names = ",".join(sorted(metadata.tables))
+    return hashlib.sha1(names.encode()).hexdigest()
+
+
+async def _current_head() -> Tuple[int, Optional[str], Set[int]]:
+    """(head version, fingerprint, non-legacy versions recorded as skipped)"""
+    try:
+        row = await database.fetch_one(_HEAD_QUERY)
+        retry = {r["version"] for r in await database.fetch_all(_RETRY_QUERY)}
+    except Exception:
+        # schema_version doesn't exist yet
+        return 0, None, set()
+    if not row:
+        return 0, None, set()
+    return row["version"], row["metadata_fingerprint"], retry
+
+
+async def _create_all() -> None:
+    from db.database import engine
+    await asyncio.to_thread(metadata.create_all, engine)
+
+
+async def _apply(raw, version: int, name: str, path: str, fingerprint: str) -> Optional[str]:
+    """Run one migration file in its own transaction and record it; returns the error if it must stop the run"""
+    with open(path, "r") as f:
+        sql = f.read()
+    started = time.monotonic()
+    status = "applied"
+    try:
+        # Simple-query protocol: multi-statement files and $$ bodies run as written
+        async with raw.transaction():
+            await raw.execute(sql)
+    except Exception as e:
+        if version > LEGACY_VERSION:
+            logger.error(f"❌ Migration {name} failed: {e}")
+            return str(e)
+        status = "skipped"
+        logger.warning(f"   Migration {name} error (legacy, recorded as skipped): {e}")
+    await raw.execute(
+        """
+        INSERT INTO schema_version (version, name, status, metadata_fingerprint, duration_ms)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (version) DO UPDATE SET
+            status = EXCLUDED.status,
+            metadata_fingerprint = EXCLUDED.metadata_fingerprint,
+            duration_ms = EXCLUDED.duration_ms,
+            applied_at = NOW()
+        """,
+        version, name, status, fingerprint, int((time.monotonic() - started) * 1000)
+    )
+    logger.info(f"   ✅ {name} {status}")
+    return None
+
+
+async def _run_seeds(raw) -> None:
+    """Idempotent demo data (db/seeds/*.sql); a failure is logged and never blocks migrations"""
+    for path in sorted(glob.glob(os.path.join(SEEDS_DIR, "*.sql"))):
+        name = os.path.basename(path)
+        with open(path, "r") as f:
+            sql = f.read()
+        try:
+            async with raw.transaction():
+                await raw.execute(sql)
+            logger.info(f"   ✅ seed {name} applied")
+        except Exception as e:
+            logger.warning(f"⚠️ Seed {name} failed (ignored): {e}")
+
+
+_last_result: Dict[str, Any] = {}
+
+
+def get_migration_status() -> Dict[str, Any]:
+    """Result of this process's last run_migrations() (status failed = schema behind head)"""
+    return _last_result
+
+
+async def run_migrations() -> Dict[str, Any]:
+    """
+    Bring the schema to head. One query when nothing is pending; otherwise
+    migrate under an advisory lock and re-check after acquiring it, so only
+    one replica does the work. A failing migration stops the run with
+    status "failed", naming the migration and its error.
+    """
+    global _last_result
+    _last_result = await _run_migrations()
+    return _last_result
+
+
+async def _run_migrations() -> Dict[str, Any]:
+    migrations = list_migrations()
+    head = migrations[-1][0] if migrations else 0
+    fingerprint = metadata_fingerprint()
+
+    version, current_fingerprint, retry = await _current_head()
+    if version >= head and current_fingerprint == fingerprint and not retry:
+        return {"status": "up_to_date", "version": version}
+
+    started = time.monotonic()
+    async with database.connection() as connection:
+        raw = connection.raw_connection
+        await raw.execute(_LOCK_SQL)
+        try:
+            await raw.execute(_CREATE_VERSION_TABLE)
+            # Another replica may have migrated while we waited for the lock
+            version, current_fingerprint, retry = await _current_head()
+            if version >= head and current_fingerprint == fingerprint and not retry:
+                return {"status": "up_to_date", "version": version}
+
+            logger.info(f"🔄 Migrating schema from version {version} to {head}...")
+            if current_fingerprint != fingerprint:
+                await _create_all()
+                logger.info("   ✅ SQLAlchemy tables verified/created")
+
+            applied = []
+            failed: Optional[Tuple[str, str]] = None
+            for number, name, path in migrations:
+                if number <= version and number not in retry:
+                    continue
+                error = await _apply(raw, number, name, path, fingerprint)
+                if error is not None:
+                    failed = (name, error)
+                    break
+                applied.append(name)
+                version = max(version, number)
+
+            if not failed:
+                await _run_seeds(raw)
+
+            # Only new tables changed: stamp the fingerprint on the head row
+            await raw.execute(
+                "UPDATE schema_version SET metadata_fingerprint = $1 WHERE version = $2",
+                fingerprint, version
+            )
+            elapsed = int((time.monotonic() - started) * 1000)
+            result = {"status": "migrated", "version": version, "head": head, "applied": applied}
+            if failed:
+                logger.error(f"❌ Schema stuck at version {version} of {head}: {failed[0]} failed ({elapsed}ms)")
+                result.update(status="failed", failed_migration=failed[0], error=failed[1])
+            else:
+                logger.info(f"✅ Schema at version {version} ({len(applied)} migrations, {elapsed}ms)")
+            return result
+        finally:
+            await raw.execute(_UNLOCK_SQL)
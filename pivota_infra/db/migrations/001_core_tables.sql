@@ -0,0 +1,111 @@
+-- Core tables and columns that used to be created / probed inline on every boot
+-- (tables defined in SQLAlchemy metadata are created by the runner before this)
+
+CREATE TABLE IF NOT EXISTS agents (
+    agent_id VARCHAR(50) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    company VARCHAR(255),
+    use_case TEXT,
+    api_key VARCHAR(255) UNIQUE,
+    status VARCHAR(50) DEFAULT 'active',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_active TIMESTAMP WITH TIME ZONE,
+    last_key_rotation TIMESTAMP WITH TIME ZONE,
+    deactivated_at TIMESTAMP WITH TIME ZONE,
+    request_count INTEGER DEFAULT 0,
+    success_rate FLOAT DEFAULT 0,
+    rate_limit INTEGER DEFAULT 1000
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id VARCHAR(100) PRIMARY KEY,
+    order_id VARCHAR(100) NOT NULL,
+    payment_intent_id VARCHAR(255) UNIQUE NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3) NOT NULL,
+    psp_type VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    idempotency_key VARCHAR(255) UNIQUE,
+    agent_id VARCHAR(50),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE,
+    metadata JSONB
+);
+
+-- Agent usage logs (rate limit & analytics)
+CREATE TABLE IF NOT EXISTS agent_usage_logs (
+    id SERIAL PRIMARY KEY,
+    agent_id VARCHAR(50) NOT NULL,
+    endpoint VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    merchant_id VARCHAR(50),
+    request_id VARCHAR(100) UNIQUE,
+    ip_address VARCHAR(50),
+    user_agent TEXT,
+    status_code INTEGER,
+    response_time_ms INTEGER,
+    error_message TEXT,
+    order_id VARCHAR(50),
+    order_amount NUMERIC(10,2),
+    timestamp TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS agent_merchants (
+    agent_id VARCHAR(50),
+    merchant_id VARCHAR(50),
+    connected_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    permissions TEXT,
+    PRIMARY KEY (agent_id, merchant_id)
+);
+
+CREATE TABLE IF NOT EXISTS merchant_stores (
+    store_id VARCHAR(50) PRIMARY KEY,
+    merchant_id VARCHAR(50) NOT NULL,
+    platform VARCHAR(50) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    domain VARCHAR(255),
+    api_key TEXT,
+    status VARCHAR(50) DEFAULT 'connected',
+    connected_at TIMESTAMP WITH TIME ZONE,
+    last_sync TIMESTAMP WITH TIME ZONE,
+    product_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS merchant_psps (
+    psp_id VARCHAR(50) PRIMARY KEY,
+    merchant_id VARCHAR(50) NOT NULL,
+    provider VARCHAR(50) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    api_key TEXT,
+    account_id VARCHAR(255),
+    capabilities TEXT,
+    status VARCHAR(50) DEFAULT 'active',
+    connected_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_merchant_stores_merchant_id ON merchant_stores(merchant_id);
+CREATE INDEX IF NOT EXISTS idx_merchant_psps_merchant_id ON merchant_psps(merchant_id);
+
+-- merchant_onboarding: store_url (backfilled from website), auto-approval and MCP columns
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS store_url VARCHAR(500);
+UPDATE merchant_onboarding
+SET store_url = COALESCE(website, 'https://placeholder.com')
+WHERE store_url IS NULL;
+ALTER TABLE merchant_onboarding ALTER COLUMN store_url SET NOT NULL;
+
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS auto_approved BOOLEAN DEFAULT FALSE;
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS approval_confidence REAL DEFAULT 0.0;
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS full_kyb_deadline TIMESTAMP;
+
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS mcp_connected BOOLEAN DEFAULT FALSE;
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS mcp_platform VARCHAR(50);
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS mcp_shop_domain VARCHAR(255);
+ALTER TABLE merchant_onboarding ADD COLUMN IF NOT EXISTS mcp_access_token TEXT;
+
+-- orders: columns older deployments were created without
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS shipping_address JSONB;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS items JSONB;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS client_secret VARCHAR(500);
@@ -0,0 +1,11 @@
+-- Unique key for products_cache upserts (INSERT ... ON CONFLICT)
+-- Drop duplicate rows left by the old SELECT-then-INSERT path, keeping the newest
+DELETE FROM products_cache a
+USING products_cache b
+WHERE a.merchant_id = b.merchant_id
+  AND a.platform = b.platform
+  AND a.platform_product_id = b.platform_product_id
+  AND a.id < b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_cache_product
+    ON products_cache(merchant_id, platform, platform_product_id);
@@ -0,0 +1,3 @@
+-- Incremental (updated_at_min) product syncs: run mode + high-water mark
+ALTER TABLE product_sync_state ADD COLUMN IF NOT EXISTS mode VARCHAR(20) DEFAULT 'full';
+ALTER TABLE product_sync_state ADD COLUMN IF NOT EXISTS high_water_mark TIMESTAMP;
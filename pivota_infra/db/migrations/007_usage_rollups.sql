@@ -0,0 +1,95 @@
+-- Agent usage rollups (tables are created from db/usage_rollups.py metadata)
+
+-- Sum two sparse {bucket index: count} histograms (used by the rollup upsert)
+CREATE OR REPLACE FUNCTION usage_rollup_merge_histogram(a JSONB, b JSONB) RETURNS JSONB
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}'::jsonb)
+    FROM (
+        SELECT key, SUM(value::bigint) AS total
+        FROM (
+            SELECT * FROM jsonb_each_text(COALESCE(a, '{}'::jsonb))
+            UNION ALL
+            SELECT * FROM jsonb_each_text(COALESCE(b, '{}'::jsonb))
+        ) pairs
+        GROUP BY key
+    ) sums
+$$;
+
+-- utils/latency_histogram.bucket_index for integer milliseconds
+CREATE OR REPLACE FUNCTION usage_rollup_bucket(ms INTEGER) RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN ms IS NULL THEN NULL
+        WHEN ms <= 0 THEN 0
+        WHEN 33 - position('1' in ms::bit(32)::text) > 23 THEN 863
+        ELSE (33 - position('1' in ms::bit(32)::text) + 3) * 32
+             + ((ms::bigint * 64) >> (33 - position('1' in ms::bit(32)::text))) - 32
+    END
+$$;
+
+-- Backfill from existing logs: hours for all history, minutes for the retention window
+SET LOCAL TimeZone = 'UTC';
+
+INSERT INTO agent_usage_rollup_hour (
+    bucket_start, agent_id, endpoint, status_code, request_count, error_count,
+    latency_count, latency_sum_ms, latency_min_ms, latency_max_ms, histogram,
+    order_count, gmv, updated_at
+)
+SELECT
+    bucket_start, agent_id, endpoint, status_code, SUM(requests), SUM(errors),
+    SUM(latency_count), SUM(latency_sum), MIN(latency_min), MAX(latency_max),
+    COALESCE(jsonb_object_agg(bucket::text, latency_count) FILTER (WHERE bucket IS NOT NULL), '{}'::jsonb),
+    SUM(orders), SUM(gmv), NOW()
+FROM (
+    SELECT
+        DATE_TRUNC('hour', timestamp) AS bucket_start,
+        agent_id,
+        endpoint,
+        COALESCE(status_code, 0) AS status_code,
+        usage_rollup_bucket(response_time_ms) AS bucket,
+        COUNT(*) AS requests,
+        COUNT(*) FILTER (WHERE status_code >= 400) AS errors,
+        COUNT(response_time_ms) AS latency_count,
+        COALESCE(SUM(response_time_ms), 0) AS latency_sum,
+        MIN(response_time_ms) AS latency_min,
+        MAX(response_time_ms) AS latency_max,
+        COUNT(order_id) AS orders,
+        COALESCE(SUM(order_amount), 0) AS gmv
+    FROM agent_usage_logs
+    WHERE timestamp IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+) cells
+GROUP BY bucket_start, agent_id, endpoint, status_code
+ON CONFLICT DO NOTHING;
+
+INSERT INTO agent_usage_rollup_minute (
+    bucket_start, agent_id, endpoint, status_code, request_count, error_count,
+    latency_count, latency_sum_ms, latency_min_ms, latency_max_ms, histogram,
+    order_count, gmv, updated_at
+)
+SELECT
+    bucket_start, agent_id, endpoint, status_code, SUM(requests), SUM(errors),
+    SUM(latency_count), SUM(latency_sum), MIN(latency_min), MAX(latency_max),
+    COALESCE(jsonb_object_agg(bucket::text, latency_count) FILTER (WHERE bucket IS NOT NULL), '{}'::jsonb),
+    SUM(orders), SUM(gmv), NOW()
+FROM (
+    SELECT
+        DATE_TRUNC('minute', timestamp) AS bucket_start,
+        agent_id,
+        endpoint,
+        COALESCE(status_code, 0) AS status_code,
+        usage_rollup_bucket(response_time_ms) AS bucket,
+        COUNT(*) AS requests,
+        COUNT(*) FILTER (WHERE status_code >= 400) AS errors,
+        COUNT(response_time_ms) AS latency_count,
+        COALESCE(SUM(response_time_ms), 0) AS latency_sum,
+        MIN(response_time_ms) AS latency_min,
+        MAX(response_time_ms) AS latency_max,
+        COUNT(order_id) AS orders,
+        COALESCE(SUM(order_amount), 0) AS gmv
+    FROM agent_usage_logs
+    WHERE timestamp >= NOW() - INTERVAL '48 hours'
+    GROUP BY 1, 2, 3, 4, 5
+) cells
+GROUP BY bucket_start, agent_id, endpoint, status_code
+ON CONFLICT DO NOTHING;
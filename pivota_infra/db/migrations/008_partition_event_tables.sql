@@ -0,0 +1,77 @@
+-- Range-partition the append-only event tables by time.
+-- The existing table becomes <table>_legacy, attached as the partition for
+-- everything before the next period boundary; db/partitions.py creates the
+-- upcoming partitions and archives / drops expired ones (legacy included).
+-- One-time cost: the legacy table is scanned for the NOT NULL check, the
+-- partition bound check and the (id, <time column>) primary key.
+SET LOCAL TimeZone = 'UTC';
+
+CREATE FUNCTION pg_temp.partition_event_table(tbl TEXT, col TEXT, period TEXT) RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    legacy TEXT := tbl || '_legacy';
+    legacy_pk TEXT;
+    seq TEXT;
+    latest TIMESTAMP;
+    bound TIMESTAMP;
+BEGIN
+    IF to_regclass(tbl) IS NULL
+       OR (SELECT relkind FROM pg_class WHERE oid = to_regclass(tbl)) = 'p' THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, legacy);
+    -- The partition key can't be NULL (rows predate the server default)
+    EXECUTE format('UPDATE %I SET %I = ''1970-01-01'' WHERE %I IS NULL', legacy, col, col);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', legacy, col);
+    -- A partition can't keep PRIMARY KEY (id) next to the parent's (id, <time column>):
+    -- swap it (this also frees the <table>_pkey name for the parent)
+    SELECT conname INTO legacy_pk FROM pg_constraint
+    WHERE conrelid = to_regclass(legacy) AND contype = 'p';
+    IF legacy_pk IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', legacy, legacy_pk);
+    END IF;
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', legacy, col);
+
+    EXECUTE format('SELECT MAX(%I)::timestamp FROM %I', col, legacy) INTO latest;
+    bound := date_trunc(period, GREATEST(COALESCE(latest, now()::timestamp), now()::timestamp))
+             + ('1 ' || period)::interval;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+        tbl, legacy, col
+    );
+    -- Keep the id sequence when the legacy partition is eventually dropped
+    seq := pg_get_serial_sequence(legacy, 'id');
+    IF seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', seq, tbl);
+    END IF;
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', tbl, col);
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+        tbl, legacy, bound
+    );
+END
+$$;
+
+SELECT pg_temp.partition_event_table('agent_usage_logs', 'timestamp', 'day');
+SELECT pg_temp.partition_event_table('api_call_events', 'created_at', 'day');
+SELECT pg_temp.partition_event_table('order_events', 'created_at', 'month');
+
+-- Indexes on the parents cascade to every partition (matching legacy indexes are reused).
+-- Unique keys must include the partition key; the log writer's retries carry the
+-- original timestamp, so (request_id, timestamp) still de-duplicates them.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_agent_usage_logs_request_ts ON agent_usage_logs (request_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_agent_usage_logs_agent_ts ON agent_usage_logs (agent_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_agent_usage_logs_merchant_ts ON agent_usage_logs (merchant_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_agent_usage_logs_ts ON agent_usage_logs (timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_api_call_events_merchant_created ON api_call_events (merchant_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_api_call_events_type_created ON api_call_events (event_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_api_call_events_created ON api_call_events (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_order_events_merchant_order ON order_events (merchant_id, order_id);
+CREATE INDEX IF NOT EXISTS idx_order_events_order ON order_events (order_id);
+CREATE INDEX IF NOT EXISTS idx_order_events_type_created ON order_events (event_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_order_events_created ON order_events (created_at);
+
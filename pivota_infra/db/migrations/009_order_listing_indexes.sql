@@ -0,0 +1,12 @@
+-- Composite indexes for keyset pagination of order listings.
+-- Every listing orders by (created_at DESC, order_id DESC) and pages with
+-- (created_at, order_id) < (:cursor_ts, :cursor_id), so each access pattern
+-- gets its filter columns followed by the sort key; Postgres walks the index
+-- backwards and a page costs one range scan regardless of depth.
+-- Plain CREATE INDEX (migrations run in a transaction): orders is locked for
+-- writes while these build.
+CREATE INDEX IF NOT EXISTS idx_orders_merchant_created ON orders (merchant_id, created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_merchant_status_created ON orders (merchant_id, status, created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_agent_created ON orders (agent_id, created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, order_id);
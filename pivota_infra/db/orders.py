@@ -3,10 +3,11 @@
 防御性架构：订单是核心业务数据，只能追加和更新状态，不能删除
 """
 
-from sqlalchemy import Table, Column, Integer, String, Text, DateTime, JSON, Numeric, Boolean
+from sqlalchemy import Table, Column, Integer, String, Text, DateTime, JSON, Numeric, Boolean, Index, tuple_
 from sqlalchemy.sql import func
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+import json
 import secrets
 
 from db.database import metadata, database
@@ -73,6 +74,14 @@ orders = Table(
     
     # 软删除（防御性设计：订单不能真删除）
     Column("is_deleted", Boolean, default=False, index=True),
+    
+    # 列表分页（keyset：created_at DESC, order_id DESC），每种访问方式一个复合索引
+    # 已有库由 db/migrations/009_order_listing_indexes.sql 创建
+    Index("idx_orders_merchant_created", "merchant_id", "created_at", "order_id"),
+    Index("idx_orders_merchant_status_created", "merchant_id", "status", "created_at", "order_id"),
+    Index("idx_orders_agent_created", "agent_id", "created_at", "order_id"),
+    Index("idx_orders_status_created", "status", "created_at", "order_id"),
+    Index("idx_orders_created", "created_at", "order_id"),
 )
 
 
@@ -181,21 +190,71 @@ async def get_orders_by_merchant(
     merchant_id: str, 
     status: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    after: Optional[Tuple[datetime, str]] = None
 ) -> List[Dict[str, Any]]:
-    """获取商户的订单列表"""
-    query = orders.select().where(
-        (orders.c.merchant_id == merchant_id) & 
-        orders.c.is_deleted.is_(False)
+    """获取商户的订单列表（after 为上一页最后一行的 (created_at, order_id)）"""
+    rows, _ = await get_orders_page(
+        merchant_id=merchant_id, status=status, limit=limit, after=after, offset=offset, include_deleted=False
     )
-    
+    return rows
+
+
+async def get_orders_page(
+    merchant_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 50,
+    after: Optional[Tuple[datetime, str]] = None,
+    offset: int = 0,
+    include_deleted: bool = True
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    按 (created_at DESC, order_id DESC) 的 keyset 分页，返回 (rows, has_more)
+    after 为上一页最后一行的 (created_at, order_id)，每页都是一次索引范围扫描；
+    offset 仅为兼容旧调用方保留（深分页仍是线性的）
+    """
+    query = orders.select()
+    if merchant_id:
+        query = query.where(orders.c.merchant_id == merchant_id)
+    if agent_id:
+        query = query.where(orders.c.agent_id == agent_id)
     if status:
         query = query.where(orders.c.status == status)
+    if not include_deleted:
+        query = query.where(orders.c.is_deleted.is_(False))
+    if after:
+        query = query.where(tuple_(orders.c.created_at, orders.c.order_id) < tuple_(after[0], after[1]))
+    elif offset:
+        query = query.offset(offset)
     
-    query = query.order_by(orders.c.created_at.desc()).limit(limit).offset(offset)
-    
-    results = await database.fetch_all(query)
-    return [dict(r) for r in results]
+    query = query.order_by(orders.c.created_at.desc(), orders.c.order_id.desc()).limit(limit + 1)
+    results = [dict(r) for r in await database.fetch_all(query)]
+    return results[:limit], len(results) > limit
+
+
+async def estimate_order_count(
+    merchant_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    status: Optional[str] = None
+) -> int:
+    """列表总数的近似值：取查询计划的行数估计，不扫描 orders"""
+    conditions = []
+    params: Dict[str, Any] = {}
+    if merchant_id:
+        conditions.append("merchant_id = :merchant_id")
+        params["merchant_id"] = merchant_id
+    if agent_id:
+        conditions.append("agent_id = :agent_id")
+        params["agent_id"] = agent_id
+    if status:
+        conditions.append("status = :status")
+        params["status"] = status
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    plan = await database.fetch_val(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM orders {where_clause}", params)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 
 async def get_orders_by_customer(customer_email: str, limit: int = 50) -> List[Dict[str, Any]]:
@@ -0,0 +1,189 @@
+"""
+Event Table Partitions Database
+agent_usage_logs / api_call_events 按天、order_events 按月做 Postgres 范围分区
+（见 db/migrations/008_partition_event_tables.sql），这里负责查询分区、
+预建后续分区、摘除过期分区，以及记录归档清单
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, Column, String, DateTime, BigInteger, Text
+
+from db.database import metadata, database
+
+# parent table -> (partition column, period)
+PARTITIONED_TABLES: Dict[str, Tuple[str, str]] = {
+    "agent_usage_logs": ("timestamp", "day"),
+    "api_call_events": ("created_at", "day"),
+    "order_events": ("created_at", "month"),
+}
+
+partition_archives = Table(
+    "partition_archives",
+    metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("parent_table", String(100), nullable=False, index=True),
+    Column("partition_name", String(100), nullable=False),
+    Column("row_count", BigInteger, nullable=False),
+    Column("bytes", BigInteger, nullable=False),
+    Column("location", Text, nullable=False),  # local path or s3://bucket/key
+    Column("first_event_at", DateTime, nullable=True),  # UTC
+    Column("last_event_at", DateTime, nullable=True),
+    Column("archived_at", DateTime, nullable=False),
+)
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+@dataclass
+class Partition:
+    name: str
+    lower: Optional[datetime]  # None = MINVALUE；均为 naive UTC
+    upper: Optional[datetime]  # None = MAXVALUE
+    estimated_rows: int = 0
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip().strip("'")
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    value = re.sub(r"([+-]\d\d)$", r"\1:00", value)  # "+00" -> "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def period_start(value: datetime, period: str) -> datetime:
+    """所在分区周期的起点（naive UTC）"""
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(day=1) if period == "month" else value
+
+
+def next_period(value: datetime, period: str) -> datetime:
+    if period == "month":
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def partition_name(parent: str, start: datetime, period: str) -> str:
+    return f"{parent}_p{start:%Y%m}" if period == "month" else f"{parent}_p{start:%Y%m%d}"
+
+
+async def is_partitioned(parent: str) -> bool:
+    relkind = await database.fetch_val(
+        "SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)",
+        {"name": parent}
+    )
+    return relkind == "p"
+
+
+async def list_partitions(parent: str) -> List[Partition]:
+    """已挂载的分区（按下界排序，MINVALUE 在前）"""
+    rows = await database.fetch_all(
+        """
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound,
+               GREATEST(c.reltuples, 0)::bigint AS estimated_rows
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:parent)
+        """,
+        {"parent": parent}
+    )
+    partitions = []
+    for row in rows:
+        match = _BOUND.search(row["bound"] or "")
+        if not match:
+            continue  # DEFAULT partition
+        partitions.append(Partition(
+            row["name"], _parse_bound(match.group(1)), _parse_bound(match.group(2)), row["estimated_rows"]
+        ))
+    partitions.sort(key=lambda p: p.lower or datetime.min)
+    return partitions
+
+
+async def list_detached(parent: str) -> List[str]:
+    """已摘除但尚未归档删除的分区表（归档中途失败时留下）"""
+    rows = await database.fetch_all(
+        """
+        SELECT c.relname AS name
+        FROM pg_class c
+        WHERE c.relkind = 'r' AND NOT c.relispartition AND pg_table_is_visible(c.oid)
+          AND (c.relname = :legacy OR left(c.relname, length(:prefix)) = :prefix)
+        ORDER BY c.relname
+        """,
+        {"legacy": f"{parent}_legacy", "prefix": f"{parent}_p"}
+    )
+    return [row["name"] for row in rows]
+
+
+async def create_partition(parent: str, name: str, start: datetime, end: datetime) -> None:
+    # Identifiers come from PARTITIONED_TABLES / partition_name(), never from requests
+    await database.execute(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{parent}" '
+        f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}+00') TO ('{end:%Y-%m-%d %H:%M:%S}+00')"
+    )
+
+
+_server_version: Optional[int] = None
+
+
+async def _server_version_num() -> int:
+    global _server_version
+    if _server_version is None:
+        _server_version = int(await database.fetch_val("SELECT current_setting('server_version_num')"))
+    return _server_version
+
+
+async def detach_partition(parent: str, name: str) -> None:
+    """
+    摘除分区。PG14+ 用 DETACH ... CONCURRENTLY（父表只加 SHARE UPDATE EXCLUSIVE 锁，
+    不阻塞写入）；上次并发摘除中断留下的 pending 状态用 FINALIZE 完成
+    """
+    if await _server_version_num() < 140000:
+        await database.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}"')
+        return
+    try:
+        await database.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}" CONCURRENTLY')
+    except Exception as e:
+        if "pending" not in str(e):
+            raise
+        await database.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}" FINALIZE')
+
+
+async def drop_table(name: str) -> None:
+    await database.execute(f'DROP TABLE IF EXISTS "{name}"')
+
+
+async def record_archive(
+    parent: str,
+    name: str,
+    row_count: int,
+    size: int,
+    location: str,
+    first_event_at: Optional[datetime],
+    last_event_at: Optional[datetime]
+) -> None:
+    await database.execute(
+        partition_archives.insert().values(
+            parent_table=parent,
+            partition_name=name,
+            row_count=row_count,
+            bytes=size,
+            location=location,
+            first_event_at=first_event_at,
+            last_event_at=last_event_at,
+            archived_at=datetime.utcnow(),
+        )
+    )
+
+
+async def get_partition_archives(parent: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    query = partition_archives.select().order_by(partition_archives.c.archived_at.desc()).limit(limit)
+    if parent:
+        query = query.where(partition_archives.c.parent_table == parent)
+    rows = await database.fetch_all(query)
+    return [dict(row) for row in rows]
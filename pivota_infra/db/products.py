@@ -6,9 +6,11 @@ Products Database - Defense-in-Depth Architecture
 
 from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean, Text, JSON, Float, BigInteger, Index
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from db.database import metadata, database
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Tuple, Union
 from datetime import datetime, timedelta
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,11 +43,32 @@ products_cache = Table(
     # 索引优化
     Index("idx_merchant_platform", "merchant_id", "platform"),
     Index("idx_expires_at", "expires_at"),
+    # ON CONFLICT target for cache upserts (db/migrations/004_products_cache_unique.sql)
+    Index("uq_products_cache_product", "merchant_id", "platform", "platform_product_id", unique=True),
+)
+
+# 每个商户的同步进度（断点续传检查点）
+product_sync_state = Table(
+    "product_sync_state",
+    metadata,
+    Column("merchant_id", String(50), primary_key=True),
+    Column("platform", String(50), primary_key=True),
+    Column("status", String(20), default="idle"),  # running, completed, failed
+    Column("mode", String(20), default="full"),  # full, incremental
+    Column("cursor", Text, nullable=True),  # 下一页 page_info（续传起点）
+    Column("products_synced", Integer, default=0),
+    Column("pages_synced", Integer, default=0),
+    Column("started_at", DateTime, nullable=True),
+    Column("completed_at", DateTime, nullable=True),
+    Column("updated_at", DateTime, server_default=func.now()),
+    Column("last_error", Text, nullable=True),
+    Column("high_water_mark", DateTime, nullable=True),  # 已同步的最大 updated_at（UTC），增量同步起点
 )
 
 
 # ============================================================================
 # LAYER 3: EVENT TABLES (事件层 - 只追加，用于分析)
+# 按 created_at 范围分区：api_call_events 每日、order_events 每月（db/partitions.py）
 # ============================================================================
 
 api_call_events = Table(
@@ -177,6 +200,30 @@ async def get_cached_products(
     return [dict(r) for r in results]
 
 
+async def get_cached_product_payloads(
+    merchant_id: str,
+    platform: str,
+    limit: int
+) -> List[Dict[str, Any]]:
+    """
+    读取缓存产品的原始 JSON 文本（id, platform_product_id, payload）
+    product_data 是 JSON（非 JSONB）列，按写入时的文本原样保存，
+    写入的是 StandardProduct.json()，可以直接拼进响应，无需解析和校验
+    """
+    rows = await database.fetch_all(
+        """
+        SELECT id, platform_product_id, product_data::text AS payload
+        FROM products_cache
+        WHERE merchant_id = :merchant_id AND platform = :platform
+          AND expires_at > :now
+        ORDER BY cached_at DESC
+        LIMIT :limit
+        """,
+        {"merchant_id": merchant_id, "platform": platform, "now": datetime.now(), "limit": limit}
+    )
+    return [dict(r) for r in rows]
+
+
 async def upsert_product_cache(
     merchant_id: str,
     platform: str,
@@ -186,43 +233,178 @@ async def upsert_product_cache(
 ) -> int:
     """
     更新产品缓存（后台任务调用，非 Agent）
+    单条 INSERT ... ON CONFLICT DO UPDATE（一次往返）
     """
-    expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
     
-    # 检查是否存在
-    query = products_cache.select().where(
+    stmt = pg_insert(products_cache).values(
+        merchant_id=merchant_id,
+        platform=platform,
+        platform_product_id=platform_product_id,
+        product_data=product_data,
+        cached_at=now,
+        expires_at=expires_at,
+        ttl_seconds=ttl_seconds,
+        cache_status="fresh",
+        access_count=0
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["merchant_id", "platform", "platform_product_id"],
+        set_={
+            "product_data": stmt.excluded.product_data,
+            "cached_at": stmt.excluded.cached_at,
+            "expires_at": stmt.excluded.expires_at,
+            "ttl_seconds": stmt.excluded.ttl_seconds,
+            "cache_status": "fresh",
+        }
+    ).returning(products_cache.c.id)
+    cache_id = await database.execute(stmt)
+    _index_product(merchant_id, platform, platform_product_id, product_data, expires_at)
+    return cache_id
+
+
+BULK_UPSERT_CHUNK_SIZE = 500
+
+_BULK_UPSERT_SQL = """
+    INSERT INTO products_cache (
+        merchant_id, platform, platform_product_id, product_data,
+        cache_status, cached_at, expires_at, ttl_seconds, access_count
+    )
+    SELECT :merchant_id, :platform, t.platform_product_id, CAST(t.product_data AS JSON),
+           'fresh', :cached_at, :expires_at, :ttl_seconds, 0
+    FROM unnest(CAST(:product_ids AS TEXT[]), CAST(:payloads AS TEXT[]))
+         AS t(platform_product_id, product_data)
+    ON CONFLICT (merchant_id, platform, platform_product_id) DO UPDATE SET
+        product_data = EXCLUDED.product_data,
+        cached_at = EXCLUDED.cached_at,
+        expires_at = EXCLUDED.expires_at,
+        ttl_seconds = EXCLUDED.ttl_seconds,
+        cache_status = 'fresh'
+"""
+
+
+async def bulk_upsert_product_cache(
+    merchant_id: str,
+    platform: str,
+    products: Iterable[Tuple[str, Union[str, Dict[str, Any]]]],
+    ttl_seconds: int = 3600,
+    chunk_size: int = BULK_UPSERT_CHUNK_SIZE
+) -> int:
+    """
+    批量更新产品缓存（同步任务调用）
+    products: (platform_product_id, product_data) 对；product_data 可以是
+    已序列化的 JSON 字符串（如 StandardProduct.json()），避免重复序列化。
+    每个 chunk 一条 INSERT ... ON CONFLICT，全部在一个事务内。
+    返回写入的产品数量。
+    """
+    # Last write wins for duplicate ids (ON CONFLICT can't touch a row twice per statement)
+    payloads: Dict[str, str] = {}
+    for product_id, data in products:
+        payloads[str(product_id)] = data if isinstance(data, str) else json.dumps(data, default=str)
+    if not payloads:
+        return 0
+    
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    items = list(payloads.items())
+    
+    async with database.transaction():
+        for i in range(0, len(items), chunk_size):
+            chunk = items[i:i + chunk_size]
+            await database.execute(_BULK_UPSERT_SQL, {
+                "merchant_id": merchant_id,
+                "platform": platform,
+                "cached_at": now,
+                "expires_at": expires_at,
+                "ttl_seconds": ttl_seconds,
+                "product_ids": [pid for pid, _ in chunk],
+                "payloads": [payload for _, payload in chunk],
+            })
+    
+    # Update the search index only after the transaction committed
+    for product_id, payload in items:
+        try:
+            product_data = json.loads(payload)
+        except ValueError:
+            continue
+        _index_product(merchant_id, platform, product_id, product_data, expires_at)
+    return len(items)
+
+
+def _index_product(
+    merchant_id: str,
+    platform: str,
+    platform_product_id: str,
+    product_data: Dict[str, Any],
+    expires_at: datetime
+):
+    """同步更新进程内搜索索引（utils.product_index）"""
+    try:
+        from utils.product_index import get_product_index
+        get_product_index().upsert(
+            merchant_id, platform, platform_product_id, product_data,
+            expires_at=expires_at, cached_at=datetime.now()
+        )
+    except Exception as e:
+        logger.warning(f"Product index update failed for {platform_product_id}: {e}")
+
+
+async def delete_product_cache(merchant_id: str, platform: str, platform_product_id: str) -> bool:
+    """删除单个缓存产品（products/delete webhook）"""
+    query = products_cache.delete().where(
         (products_cache.c.merchant_id == merchant_id) &
         (products_cache.c.platform == platform) &
-        (products_cache.c.platform_product_id == platform_product_id)
+        (products_cache.c.platform_product_id == str(platform_product_id))
+    ).returning(products_cache.c.id)
+    deleted = await database.execute(query)
+    try:
+        from utils.product_index import get_product_index
+        get_product_index().remove(merchant_id, platform, platform_product_id)
+    except Exception as e:
+        logger.warning(f"Product index remove failed for {platform_product_id}: {e}")
+    return deleted is not None
+
+
+async def prune_product_cache(merchant_id: str, platform: str, synced_before: datetime) -> int:
+    """删除本次全量同步中未出现的产品（平台上已删除）"""
+    rows = await database.fetch_all(
+        """
+        DELETE FROM products_cache
+        WHERE merchant_id = :merchant_id AND platform = :platform
+          AND cached_at < :synced_before
+        RETURNING platform_product_id
+        """,
+        {"merchant_id": merchant_id, "platform": platform, "synced_before": synced_before}
     )
-    existing = await database.fetch_one(query)
-    
-    if existing:
-        # 更新
-        update_query = products_cache.update().where(
-            products_cache.c.id == existing["id"]
-        ).values(
-            product_data=product_data,
-            cached_at=datetime.now(),
-            expires_at=expires_at,
-            ttl_seconds=ttl_seconds,
-            cache_status="fresh"
-        )
-        await database.execute(update_query)
-        return existing["id"]
-    else:
-        # 插入
-        insert_query = products_cache.insert().values(
-            merchant_id=merchant_id,
-            platform=platform,
-            platform_product_id=platform_product_id,
-            product_data=product_data,
-            cached_at=datetime.now(),
-            expires_at=expires_at,
-            ttl_seconds=ttl_seconds,
-            cache_status="fresh"
-        )
-        return await database.execute(insert_query)
+    try:
+        from utils.product_index import get_product_index
+        index = get_product_index()
+        for row in rows:
+            index.remove(merchant_id, platform, row["platform_product_id"])
+    except Exception as e:
+        logger.warning(f"Product index prune failed for {merchant_id}: {e}")
+    return len(rows)
+
+
+async def extend_product_cache(merchant_id: str, platform: str, ttl_seconds: int) -> datetime:
+    """增量同步成功后，确认商户全部缓存仍然有效，延长过期时间"""
+    expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+    await database.execute(
+        """
+        UPDATE products_cache
+        SET expires_at = :expires_at, ttl_seconds = :ttl_seconds, cache_status = 'fresh'
+        WHERE merchant_id = :merchant_id AND platform = :platform
+        """,
+        {"merchant_id": merchant_id, "platform": platform,
+         "expires_at": expires_at, "ttl_seconds": ttl_seconds}
+    )
+    try:
+        from utils.product_index import get_product_index
+        get_product_index().extend_merchant(merchant_id, platform, expires_at)
+    except Exception as e:
+        logger.warning(f"Product index extend failed for {merchant_id}: {e}")
+    return expires_at
 
 
 async def mark_cache_accessed(cache_id: int):
@@ -246,6 +428,29 @@ async def cleanup_expired_cache():
     return deleted
 
 
+async def get_sync_state(merchant_id: str, platform: str) -> Optional[Dict[str, Any]]:
+    """获取商户同步检查点"""
+    query = product_sync_state.select().where(
+        (product_sync_state.c.merchant_id == merchant_id) &
+        (product_sync_state.c.platform == platform)
+    )
+    row = await database.fetch_one(query)
+    return dict(row) if row else None
+
+
+async def save_sync_state(merchant_id: str, platform: str, **fields) -> None:
+    """写入/更新商户同步检查点"""
+    fields["updated_at"] = datetime.now()
+    stmt = pg_insert(product_sync_state).values(
+        merchant_id=merchant_id, platform=platform, **fields
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["merchant_id", "platform"],
+        set_={name: stmt.excluded[name] for name in fields}
+    )
+    await database.execute(stmt)
+
+
 # ============================================================================
 # EVENT OPERATIONS (事件层操作 - 只追加)
 # ============================================================================
@@ -263,19 +468,27 @@ async def log_api_call(
 ):
     """
     记录 API 调用事件（只追加，永不修改）
+    通过批量写入器异步落库，不阻塞请求
     """
-    query = api_call_events.insert().values(
-        event_type=event_type,
-        merchant_id=merchant_id,
-        endpoint=endpoint,
-        request_params=request_params,
-        response_status=response_status,
-        cache_hit=cache_hit,
-        response_time_ms=response_time_ms,
-        product_ids=product_ids,
-        order_id=order_id
-    )
-    await database.execute(query)
+    from utils.log_writer import get_log_writer
+
+    row = {
+        "event_type": event_type,
+        "merchant_id": merchant_id,
+        "endpoint": endpoint,
+        "request_params": request_params,
+        "response_status": response_status,
+        "cache_hit": cache_hit,
+        "response_time_ms": response_time_ms,
+        "product_ids": product_ids,
+        "order_id": order_id,
+        "created_at": datetime.utcnow(),
+    }
+    writer = get_log_writer()
+    if writer.running:
+        writer.enqueue(api_call_events, row)
+        return
+    await database.execute(api_call_events.insert().values(**row))
 
 
 async def log_order_event(
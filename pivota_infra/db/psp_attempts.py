@@ -0,0 +1,77 @@
+"""
+PSP Attempts Database
+每次 PSP 调用（成功 / 失败、耗时）写一行，用于路由评分的预热和 PSP 表现分析
+（002_production_tables.sql 里的 MySQL 版定义从未生效，这里是 Postgres 版）
+"""
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean, Numeric, Text, BigInteger, Index
+from sqlalchemy.sql import func
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from db.database import metadata, database
+
+psp_attempts = Table(
+    "psp_attempts",
+    metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("merchant_id", String(50), nullable=False),
+    Column("order_id", String(50), nullable=True),
+    Column("psp_type", String(50), nullable=False),  # stripe / adyen / checkout
+    Column("priority", Integer, nullable=False, server_default="1"),  # 在本次 failover 链中的位置
+    Column("amount", Numeric(12, 2), nullable=True),
+    Column("currency", String(3), nullable=False),
+    Column("success", Boolean, nullable=False),
+    Column("response_time_ms", Integer, nullable=True),
+    Column("error_code", String(100), nullable=True),  # classify_psp_error() 分类: timeout / network / server_error / rate_limited / auth / declined / invalid_request / unknown
+    Column("error_message", Text, nullable=True),
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+
+    Index("idx_psp_attempts_psp_created", "psp_type", "created_at"),
+    Index("idx_psp_attempts_merchant_created", "merchant_id", "created_at"),
+    Index("idx_psp_attempts_order", "order_id"),
+)
+
+
+async def get_recent_psp_attempts(since: datetime, limit: int = 50000) -> List[Dict[str, Any]]:
+    """启动时预热滚动窗口（按时间正序）"""
+    rows = await database.fetch_all(
+        """
+        SELECT * FROM (
+            SELECT psp_type, merchant_id, currency, success, response_time_ms, created_at
+            FROM psp_attempts
+            WHERE created_at >= :since
+            ORDER BY created_at DESC
+            LIMIT :limit
+        ) recent
+        ORDER BY created_at
+        """,
+        {"since": since, "limit": limit}
+    )
+    return [dict(row) for row in rows]
+
+
+async def get_psp_performance_stats(since: datetime, merchant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按 PSP 汇总：尝试次数、成功率、平均 / p95 耗时、作为备用 PSP 成功的次数"""
+    merchant_filter = "AND merchant_id = :merchant_id" if merchant_id else ""
+    params: Dict[str, Any] = {"since": since}
+    if merchant_id:
+        params["merchant_id"] = merchant_id
+    rows = await database.fetch_all(
+        f"""
+        SELECT
+            psp_type,
+            COUNT(*) AS attempts,
+            COUNT(*) FILTER (WHERE success) AS successes,
+            AVG(response_time_ms) AS avg_response_time_ms,
+            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY response_time_ms) AS p95_response_time_ms,
+            COUNT(*) FILTER (WHERE success AND priority > 1) AS failover_successes,
+            MIN(priority) AS best_priority
+        FROM psp_attempts
+        WHERE created_at >= :since {merchant_filter}
+        GROUP BY psp_type
+        ORDER BY MIN(priority), COUNT(*) DESC
+        """,
+        params
+    )
+    return [dict(row) for row in rows]
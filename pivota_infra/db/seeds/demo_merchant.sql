@@ -0,0 +1,26 @@
+-- Demo merchant (ChydanTest Shopify store + Stripe), previously re-seeded on every boot
+UPDATE merchant_onboarding
+SET store_url = 'https://chydantest.myshopify.com',
+    mcp_connected = TRUE,
+    mcp_platform = 'shopify',
+    mcp_shop_domain = 'chydantest.myshopify.com',
+    psp_connected = TRUE,
+    psp_type = 'stripe'
+WHERE merchant_id = 'merch_6b90dc9838d5fd9c';
+
+INSERT INTO merchant_onboarding (merchant_id, business_name, contact_email, store_url, status, mcp_connected, mcp_platform, mcp_shop_domain, psp_connected, psp_type)
+SELECT 'merch_6b90dc9838d5fd9c', 'ChydanTest Store', 'merchant@test.com', 'https://chydantest.myshopify.com', 'approved',
+       TRUE, 'shopify', 'chydantest.myshopify.com', TRUE, 'stripe'
+WHERE NOT EXISTS (
+    SELECT 1 FROM merchant_onboarding WHERE merchant_id = 'merch_6b90dc9838d5fd9c'
+);
+
+INSERT INTO merchant_stores (store_id, merchant_id, platform, name, domain, status, product_count, connected_at)
+VALUES ('store_shopify_chydantest', 'merch_6b90dc9838d5fd9c', 'shopify', 'chydantest.myshopify.com',
+        'chydantest.myshopify.com', 'connected', 4, NOW())
+ON CONFLICT (store_id) DO NOTHING;
+
+INSERT INTO merchant_psps (psp_id, merchant_id, provider, name, account_id, capabilities, status, connected_at)
+VALUES ('psp_stripe_chydantest', 'merch_6b90dc9838d5fd9c', 'stripe', 'Stripe Account', 'acct_real_stripe',
+        'card,bank_transfer,alipay,wechat_pay', 'active', NOW())
+ON CONFLICT (psp_id) DO NOTHING;
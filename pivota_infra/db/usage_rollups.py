@@ -0,0 +1,295 @@
+"""
+Agent Usage Rollups Database
+agent_usage_logs 的分钟 / 小时汇总表，由批量日志写入器增量维护
+（utils/usage_rollups），分析与监控接口只读汇总表，不再扫描原始日志
+"""
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, BigInteger, Numeric, Index
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+from config.settings import settings
+from db.database import metadata, database
+from utils.latency_histogram import LatencyHistogram
+
+KEY_COLUMNS = ["bucket_start", "agent_id", "endpoint", "status_code"]
+
+# status_code 为 0 表示原始日志中为 NULL；成功 = 1..399，错误 = >= 400
+SUCCESS_CONDITION = "status_code BETWEEN 1 AND 399"
+
+
+def _rollup_table(name: str) -> Table:
+    return Table(
+        name,
+        metadata,
+        Column("bucket_start", DateTime(timezone=True), primary_key=True),  # UTC
+        Column("agent_id", String(50), primary_key=True),
+        Column("endpoint", String(255), primary_key=True),
+        Column("status_code", Integer, primary_key=True),
+        Column("request_count", BigInteger, nullable=False),
+        Column("error_count", BigInteger, nullable=False),  # status_code >= 400
+        Column("latency_count", BigInteger, nullable=False),  # rows with response_time_ms
+        Column("latency_sum_ms", BigInteger, nullable=False),
+        Column("latency_min_ms", Integer),
+        Column("latency_max_ms", Integer),
+        Column("histogram", JSONB, nullable=False),  # {bucket index: count}，见 utils/latency_histogram
+        Column("order_count", BigInteger, nullable=False),  # rows with order_id
+        Column("gmv", Numeric(14, 2), nullable=False),
+        Column("updated_at", DateTime(timezone=True), nullable=False),
+
+        Index(f"idx_{name}_agent_bucket", "agent_id", "bucket_start"),
+    )
+
+
+usage_rollup_minute = _rollup_table("agent_usage_rollup_minute")
+usage_rollup_hour = _rollup_table("agent_usage_rollup_hour")
+
+_COLUMNS = """
+    bucket_start, agent_id, endpoint, status_code, request_count, error_count,
+    latency_count, latency_sum_ms, latency_min_ms, latency_max_ms, histogram,
+    order_count, gmv
+"""
+
+
+# ============================================================================
+# 写入（增量累加）
+# ============================================================================
+
+async def upsert_usage_rollups(table: Table, rows: List[Dict[str, Any]]) -> int:
+    """把一批增量累加进汇总表（rows 的主键在批内唯一）"""
+    if not rows:
+        return 0
+    now = datetime.now(timezone.utc)
+    stmt = pg_insert(table).values([{**row, "updated_at": now} for row in rows])
+    excluded = stmt.excluded
+    c = table.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={
+            "request_count": c.request_count + excluded.request_count,
+            "error_count": c.error_count + excluded.error_count,
+            "latency_count": c.latency_count + excluded.latency_count,
+            "latency_sum_ms": c.latency_sum_ms + excluded.latency_sum_ms,
+            # LEAST / GREATEST ignore NULLs
+            "latency_min_ms": func.least(c.latency_min_ms, excluded.latency_min_ms),
+            "latency_max_ms": func.greatest(c.latency_max_ms, excluded.latency_max_ms),
+            # Defined in db/migrations/007_usage_rollups.sql
+            "histogram": func.usage_rollup_merge_histogram(c.histogram, excluded.histogram),
+            "order_count": c.order_count + excluded.order_count,
+            "gmv": c.gmv + excluded.gmv,
+            "updated_at": excluded.updated_at,
+        }
+    )
+    await database.execute(stmt)
+    return len(rows)
+
+
+async def delete_minute_rollups_before(before: datetime) -> None:
+    """清理过期的分钟汇总（小时汇总长期保留）"""
+    await database.execute(
+        "DELETE FROM agent_usage_rollup_minute WHERE bucket_start < :before",
+        {"before": before}
+    )
+
+
+# ============================================================================
+# 读取
+# ============================================================================
+
+def _hour_floor(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_source(
+    since: Optional[datetime],
+    until: Optional[datetime] = None,
+    agent_id: Optional[str] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    [since, until) 的汇总行：since 所在的不完整小时读分钟表，其余读小时表，
+    结果精确到分钟；until 按小时对齐。分钟表已过期时退化为整小时。
+    """
+    params: Dict[str, Any] = {}
+    agent_filter = ""
+    if agent_id is not None:
+        agent_filter = " AND agent_id = :agent_id"
+        params["agent_id"] = agent_id
+    until_filter = ""
+    if until is not None:
+        until_filter = " AND bucket_start < :until"
+        params["until"] = until
+
+    if since is None:
+        return f"SELECT {_COLUMNS} FROM agent_usage_rollup_hour WHERE TRUE{agent_filter}{until_filter}", params
+
+    now = datetime.now(timezone.utc) if since.tzinfo else datetime.utcnow()
+    minutes_kept_since = now - timedelta(hours=settings.usage_rollup_minute_retention_hours)
+    split = _hour_floor(since)
+    if split < since and since >= minutes_kept_since:
+        split += timedelta(hours=1)
+    params.update({"since": since, "split": split})
+    source = f"""
+        SELECT {_COLUMNS} FROM agent_usage_rollup_minute
+        WHERE bucket_start >= :since AND bucket_start < :split{agent_filter}{until_filter}
+        UNION ALL
+        SELECT {_COLUMNS} FROM agent_usage_rollup_hour
+        WHERE bucket_start >= :split{agent_filter}{until_filter}
+    """
+    return source, params
+
+
+async def get_usage_totals(
+    since: Optional[datetime],
+    until: Optional[datetime] = None,
+    agent_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """窗口内的请求 / 成功 / 错误 / 延迟 / 订单 / GMV 汇总"""
+    source, params = _rollup_source(since, until, agent_id)
+    row = await database.fetch_one(
+        f"""
+        SELECT
+            COALESCE(SUM(request_count), 0)::bigint AS requests,
+            COALESCE(SUM(request_count) FILTER (WHERE {SUCCESS_CONDITION}), 0)::bigint AS successful,
+            COALESCE(SUM(error_count), 0)::bigint AS errors,
+            COALESCE(SUM(request_count) FILTER (WHERE status_code >= 500), 0)::bigint AS server_errors,
+            COALESCE(SUM(latency_count), 0)::bigint AS latency_count,
+            COALESCE(SUM(latency_sum_ms), 0)::bigint AS latency_sum_ms,
+            COALESCE(SUM(order_count), 0)::bigint AS orders,
+            COALESCE(SUM(gmv), 0)::float8 AS gmv,
+            COALESCE(SUM(request_count) FILTER (
+                WHERE endpoint LIKE '%/orders%' AND status_code BETWEEN 1 AND 299
+            ), 0)::bigint AS order_requests,
+            COUNT(DISTINCT agent_id) AS active_agents,
+            MAX(bucket_start) AS last_bucket
+        FROM ({source}) r
+        """,
+        params
+    )
+    totals = dict(row)
+    totals["avg_response_time_ms"] = (
+        totals["latency_sum_ms"] / totals["latency_count"] if totals["latency_count"] else 0.0
+    )
+    return totals
+
+
+async def get_usage_by_endpoint(
+    since: Optional[datetime],
+    until: Optional[datetime] = None,
+    agent_id: Optional[str] = None,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """请求量最高的端点"""
+    source, params = _rollup_source(since, until, agent_id)
+    rows = await database.fetch_all(
+        f"""
+        SELECT
+            endpoint,
+            SUM(request_count)::bigint AS count,
+            SUM(latency_sum_ms)::float / NULLIF(SUM(latency_count), 0) AS avg_time
+        FROM ({source}) r
+        GROUP BY endpoint
+        ORDER BY count DESC
+        LIMIT :limit
+        """,
+        {**params, "limit": limit}
+    )
+    return [dict(row) for row in rows]
+
+
+async def get_usage_by_status(
+    since: Optional[datetime],
+    min_status: int = 400
+) -> List[Dict[str, Any]]:
+    """按状态码统计（默认只看错误）"""
+    source, params = _rollup_source(since)
+    rows = await database.fetch_all(
+        f"""
+        SELECT status_code, SUM(request_count)::bigint AS count
+        FROM ({source}) r
+        WHERE status_code >= :min_status
+        GROUP BY status_code
+        ORDER BY count DESC
+        """,
+        {**params, "min_status": min_status}
+    )
+    return [dict(row) for row in rows]
+
+
+async def get_usage_by_agent(since: Optional[datetime]) -> Dict[str, Dict[str, Any]]:
+    """每个 Agent 的请求量 / 成功数 / 平均延迟 / 最近活跃（分钟精度）"""
+    source, params = _rollup_source(since)
+    rows = await database.fetch_all(
+        f"""
+        SELECT
+            agent_id,
+            SUM(request_count)::bigint AS request_count,
+            (SUM(request_count) FILTER (WHERE {SUCCESS_CONDITION}))::bigint AS successful,
+            SUM(latency_sum_ms)::float / NULLIF(SUM(latency_count), 0) AS avg_response_time,
+            MAX(bucket_start) AS last_active
+        FROM ({source}) r
+        GROUP BY agent_id
+        """,
+        params
+    )
+    return {row["agent_id"]: dict(row) for row in rows}
+
+
+async def get_usage_timeline(
+    since: Optional[datetime],
+    until: Optional[datetime] = None,
+    agent_id: Optional[str] = None,
+    period: str = "hour"
+) -> List[Dict[str, Any]]:
+    """按小时 / 天的时间线（最新在前）"""
+    if period not in ("hour", "day"):
+        raise ValueError(f"Unsupported period: {period}")
+    source, params = _rollup_source(since, until, agent_id)
+    rows = await database.fetch_all(
+        f"""
+        SELECT
+            DATE_TRUNC('{period}', bucket_start) AS bucket,
+            SUM(request_count)::bigint AS requests,
+            (SUM(request_count) FILTER (WHERE {SUCCESS_CONDITION}))::bigint AS successful,
+            SUM(error_count)::bigint AS errors,
+            SUM(latency_sum_ms)::float / NULLIF(SUM(latency_count), 0) AS avg_response_time,
+            SUM(order_count)::bigint AS orders,
+            SUM(gmv)::float8 AS gmv
+        FROM ({source}) r
+        GROUP BY DATE_TRUNC('{period}', bucket_start)
+        ORDER BY bucket DESC
+        """,
+        params
+    )
+    return [dict(row) for row in rows]
+
+
+async def get_usage_latency_histogram(
+    since: Optional[datetime],
+    until: Optional[datetime] = None,
+    agent_id: Optional[str] = None
+) -> LatencyHistogram:
+    """窗口内合并后的延迟直方图（桶计数在数据库内求和，最多返回 BUCKET_COUNT 行）"""
+    source, params = _rollup_source(since, until, agent_id)
+    buckets = await database.fetch_all(
+        f"""
+        SELECT h.key::int AS bucket, SUM(h.value::bigint)::bigint AS count
+        FROM ({source}) r, jsonb_each_text(r.histogram) h
+        GROUP BY h.key
+        """,
+        params
+    )
+    bounds = await database.fetch_one(
+        f"""
+        SELECT SUM(latency_sum_ms)::float8 AS total, MIN(latency_min_ms) AS min, MAX(latency_max_ms) AS max
+        FROM ({source}) r
+        """,
+        params
+    )
+    return LatencyHistogram.from_counts(
+        {row["bucket"]: int(row["count"]) for row in buckets},
+        total=float(bounds["total"] or 0),
+        minimum=bounds["min"],
+        maximum=bounds["max"],
+    )
@@ -0,0 +1,151 @@
+"""
+Webhook Inbox Database
+PSP / 平台 webhook 先写入收件箱（按 provider + event_id 去重）再立即返回 200，
+由后台 worker 批量处理；同一 ordering_key（订单 / 商品）的事件严格按到达顺序处理
+"""
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, Text, BigInteger, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.sql import func
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from db.database import metadata, database
+
+webhook_inbox = Table(
+    "webhook_inbox",
+    metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("provider", String(20), nullable=False),  # stripe / shopify / adyen
+    Column("event_id", String(255), nullable=False),  # provider event id（去重键）
+    Column("topic", String(100), nullable=False),  # event type / Shopify topic / Adyen eventCode
+    Column("merchant_id", String(50), nullable=True),
+    Column("ordering_key", String(255), nullable=True),  # 同 key 的事件按 id 顺序处理
+    Column("payload", JSONB, nullable=False),
+    Column("status", String(20), nullable=False, server_default="pending"),  # pending / processing / done / failed
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column("last_error", Text, nullable=True),
+    Column("locked_by", String(100), nullable=True),
+    Column("locked_at", DateTime, nullable=True),
+    Column("available_at", DateTime, nullable=False, server_default=func.now()),  # 重试退避
+    Column("received_at", DateTime, nullable=False, server_default=func.now()),
+    Column("processed_at", DateTime, nullable=True),
+
+    UniqueConstraint("provider", "event_id", name="uq_webhook_inbox_provider_event"),
+    Index("idx_webhook_inbox_status_available", "status", "available_at"),
+    Index("idx_webhook_inbox_ordering", "provider", "ordering_key", "id"),
+)
+
+
+async def insert_webhook_events(rows: List[Dict[str, Any]]) -> List[str]:
+    """写入收件箱，重复事件直接忽略；返回新写入的 event_id"""
+    if not rows:
+        return []
+    stmt = pg_insert(webhook_inbox).values(rows).on_conflict_do_nothing(
+        index_elements=["provider", "event_id"]
+    ).returning(webhook_inbox.c.event_id)
+    inserted = await database.fetch_all(stmt)
+    return [row["event_id"] for row in inserted]
+
+
+async def claim_webhook_batch(worker_id: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    领取一批待处理事件（SKIP LOCKED，多 worker / 多副本安全）
+    同一 ordering_key 只要还有更早的未完成事件就不领取，保证按序处理
+    """
+    rows = await database.fetch_all(
+        """
+        WITH candidates AS (
+            SELECT w.id FROM webhook_inbox w
+            WHERE w.status = 'pending' AND w.available_at <= NOW()
+              AND (w.ordering_key IS NULL OR NOT EXISTS (
+                  SELECT 1 FROM webhook_inbox e
+                  WHERE e.provider = w.provider AND e.ordering_key = w.ordering_key
+                    AND e.id < w.id AND e.status IN ('pending', 'processing')
+              ))
+            ORDER BY w.id
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE webhook_inbox SET
+            status = 'processing', locked_by = :worker_id, locked_at = NOW(), attempts = attempts + 1
+        FROM candidates
+        WHERE webhook_inbox.id = candidates.id
+        RETURNING webhook_inbox.id, webhook_inbox.provider, webhook_inbox.event_id, webhook_inbox.topic,
+                  webhook_inbox.merchant_id, webhook_inbox.ordering_key, webhook_inbox.payload,
+                  webhook_inbox.attempts
+        """,
+        {"worker_id": worker_id, "limit": limit}
+    )
+    return sorted((dict(row) for row in rows), key=lambda row: row["id"])
+
+
+async def mark_webhook_events_done(ids: List[int]) -> None:
+    if ids:
+        await database.execute(
+            """
+            UPDATE webhook_inbox SET status = 'done', processed_at = NOW(), locked_by = NULL, last_error = NULL
+            WHERE id = ANY(:ids)
+            """,
+            {"ids": ids}
+        )
+
+
+async def retry_webhook_event(event_id: int, error: str, delay_seconds: float, give_up: bool) -> None:
+    """处理失败：退避后重试；超过最大次数标记为 failed（不再阻塞同 key 的后续事件）"""
+    await database.execute(
+        """
+        UPDATE webhook_inbox SET
+            status = :status, last_error = :error, locked_by = NULL,
+            available_at = NOW() + make_interval(secs => :delay)
+        WHERE id = :id
+        """,
+        {"id": event_id, "status": "failed" if give_up else "pending", "error": error[:2000], "delay": delay_seconds}
+    )
+
+
+async def release_stale_webhook_events(older_than: datetime) -> int:
+    """worker 中途退出遗留的 processing 事件重新变为 pending"""
+    rows = await database.fetch_all(
+        """
+        UPDATE webhook_inbox SET status = 'pending', locked_by = NULL
+        WHERE status = 'processing' AND locked_at < :older_than
+        RETURNING id
+        """,
+        {"older_than": older_than}
+    )
+    return len(rows)
+
+
+async def delete_processed_webhook_events(before: datetime) -> None:
+    """清理已处理的旧事件（保留期内仍可去重）"""
+    await database.execute(
+        "DELETE FROM webhook_inbox WHERE status = 'done' AND received_at < :before",
+        {"before": before}
+    )
+
+
+async def get_webhook_inbox_counts() -> Dict[str, Any]:
+    rows = await database.fetch_all(
+        """
+        SELECT provider, status, COUNT(*) AS count, MIN(received_at) AS oldest
+        FROM webhook_inbox
+        WHERE status <> 'done'
+        GROUP BY provider, status
+        """
+    )
+    return {
+        f"{row['provider']}:{row['status']}": {
+            "count": row["count"],
+            "oldest": row["oldest"].isoformat() if row["oldest"] else None,
+        }
+        for row in rows
+    }
+
+
+async def get_failed_webhook_events(provider: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    query = webhook_inbox.select().where(webhook_inbox.c.status == "failed")
+    if provider:
+        query = query.where(webhook_inbox.c.provider == provider)
+    rows = await database.fetch_all(query.order_by(webhook_inbox.c.id.desc()).limit(limit))
+    return [dict(row) for row in rows]
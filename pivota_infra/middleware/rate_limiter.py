@@ -1,25 +1,34 @@
 """
 Rate Limiting Middleware for Agent API
-Uses in-memory storage (production should use Redis)
+Counts through utils.quota_counter (Redis when configured, in-memory otherwise)
 """
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from typing import Dict, List, Tuple
 from datetime import datetime, timedelta
+import re
 import time
-import asyncio
-from collections import defaultdict
-from utils.redis_client import get_redis_client
 from config.settings import settings
+from db.agents import get_agent_by_key
+from utils.agent_cache import hash_api_key
+from utils.quota_counter import get_quota_counter, consume_agent_request
+
+# Every agent key generator uses the ak_ prefix: ak_<hex64>, ak_live_/ak_test_<hex64>,
+# ak_<token_urlsafe(32)> (agents_mgmt), ak_demo_<hex32>; anything else skips the agent lookup
+AGENT_KEY_PATTERN = re.compile(r"^ak_[A-Za-z0-9_-]{32,128}$")
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """
     Rate limiting middleware for agent API endpoints
     
     Features:
-    - Per-API key rate limiting
-    - Sliding window algorithm
+    - Per-agent rate limiting and daily quota via utils.quota_counter
+      (sliding window, Redis-backed when REDIS_URL is set)
+    - Counts each request once: the decision is stored on request.state
+      and reused by routes.agent_auth.get_agent_context
+    - Unrecognised keys get the global RATE_LIMIT_RPM window per key
     - Headers showing rate limit status
     - Graceful degradation
     """
@@ -29,12 +38,6 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # Prefer env-driven config but allow explicit override for tests
         self.requests_per_minute = settings.rate_limit_rpm if requests_per_minute == 100 else requests_per_minute
         self.window_seconds = settings.rate_limit_window_seconds
-        # Store: api_key -> list of request timestamps
-        self.request_store: Dict[str, List[float]] = defaultdict(list)
-        # Lock for thread safety
-        self.lock = asyncio.Lock()
-        # Optional Redis client for shared rate limiting
-        self.redis = get_redis_client()
     
     async def dispatch(self, request: Request, call_next):
         # Only apply to agent API endpoints
@@ -57,75 +60,62 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         if not api_key:
             return await call_next(request)
         
-        now = time.time()
-        reset_at = int((int(now // 60) + 1) * 60)
-
-        # Prefer Redis if available for shared limits across instances
-        if self.redis is not None:
-            minute_bucket = int(now // 60)
-            key = f"rate_limit:{api_key}:{minute_bucket}"
-            try:
-                current = await self.redis.incr(key)
-                # Ensure TTL is set; subsequent calls keep it
-                await self.redis.expire(key, self.window_seconds)
-                if current > self.requests_per_minute:
-                    reset_in = max(0, int(reset_at - now))
-                    return JSONResponse(
-                        status_code=429,
-                        content={
-                            "error": "rate_limit_exceeded",
-                            "message": f"Rate limit of {self.requests_per_minute} requests per minute exceeded",
-                            "retry_after": reset_in
-                        },
-                        headers={
-                            "X-RateLimit-Limit": str(self.requests_per_minute),
-                            "X-RateLimit-Remaining": "0",
-                            "X-RateLimit-Reset": str(reset_at),
-                            "Retry-After": str(reset_in)
-                        }
-                    )
-                remaining = max(0, self.requests_per_minute - int(current))
-            except Exception:
-                # On Redis error, gracefully fall back to in-memory
-                self.redis = None
-                remaining = None  # will be set in fallback branch
+        try:
+            counter = get_quota_counter()
+            # Agent lookups are served from the in-process credential cache
+            agent = await get_agent_by_key(api_key) if AGENT_KEY_PATTERN.match(api_key) else None
+            if agent:
+                decision = await consume_agent_request(agent)
+                request.state.quota_decision = decision
+            else:
+                decision = await counter.consume(
+                    f"key:{hash_api_key(api_key)}", self.requests_per_minute
+                )
+        except Exception:
+            # Never fail a request because counting is unavailable
+            return await call_next(request)
         
-        if self.redis is None:
-            # In-memory fallback
-            async with self.lock:
-                # Clean old requests
-                self.request_store[api_key] = [
-                    ts for ts in self.request_store[api_key]
-                    if now - ts < self.window_seconds
-                ]
-                request_count = len(self.request_store[api_key])
-                if request_count >= self.requests_per_minute:
-                    oldest_request = min(self.request_store[api_key]) if self.request_store[api_key] else now
-                    reset_in = int(self.window_seconds - (now - oldest_request))
-                    return JSONResponse(
-                        status_code=429,
-                        content={
-                            "error": "rate_limit_exceeded",
-                            "message": f"Rate limit of {self.requests_per_minute} requests per minute exceeded",
-                            "retry_after": max(0, reset_in)
-                        },
-                        headers={
-                            "X-RateLimit-Limit": str(self.requests_per_minute),
-                            "X-RateLimit-Remaining": "0",
-                            "X-RateLimit-Reset": str(int(now + max(0, reset_in))),
-                            "Retry-After": str(max(0, reset_in))
-                        }
-                    )
-                self.request_store[api_key].append(now)
-                remaining = self.requests_per_minute - request_count - 1
+        now = time.time()
+        if not decision.allowed:
+            if decision.reason == "daily_quota":
+                return JSONResponse(
+                    status_code=429,
+                    content={
+                        "error": "daily_quota_exceeded",
+                        "message": f"Daily quota exceeded: {decision.day_count}/{decision.daily_quota} requests",
+                    },
+                    headers={
+                        "X-Quota-Limit": str(decision.daily_quota),
+                        "X-Quota-Remaining": "0",
+                        "X-Quota-Reset": "00:00 UTC"
+                    }
+                )
+            reset_in = max(0, int(decision.reset_at - now))
+            return JSONResponse(
+                status_code=429,
+                content={
+                    "error": "rate_limit_exceeded",
+                    "message": f"Rate limit of {decision.rate_limit} requests per minute exceeded",
+                    "retry_after": reset_in
+                },
+                headers={
+                    "X-RateLimit-Limit": str(decision.rate_limit),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": str(decision.reset_at),
+                    "Retry-After": str(reset_in)
+                }
+            )
 
         # Process request
         response = await call_next(request)
 
         # Add rate limit headers
-        response.headers["X-RateLimit-Limit"] = str(self.requests_per_minute)
-        response.headers["X-RateLimit-Remaining"] = str(max(0, remaining))
-        response.headers["X-RateLimit-Reset"] = str(reset_at)
+        response.headers["X-RateLimit-Limit"] = str(decision.rate_limit)
+        response.headers["X-RateLimit-Remaining"] = str(decision.rate_remaining)
+        response.headers["X-RateLimit-Reset"] = str(decision.reset_at)
+        if decision.daily_quota is not None:
+            response.headers["X-Quota-Limit"] = str(decision.daily_quota)
+            response.headers["X-Quota-Remaining"] = str(decision.quota_remaining)
 
         return response
 
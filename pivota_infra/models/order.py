@@ -127,6 +127,8 @@ class OrderListResponse(BaseModel):
     status: str = "success"
     total: int
     orders: List[OrderResponse]
+    has_more: bool = False
+    next_cursor: Optional[str] = None  # 传回 cursor 参数获取下一页
     
     class Config:
         json_encoders = {
@@ -1,6 +1,8 @@
+import time
 from typing import List
 from models.schemas import PaymentRequest, PaymentExecutionResponse
 from orchestrator.psp_selector import select_psp_for_agent_pay
+from utils.psp_health import classify_psp_error, get_psp_health
 from utils.logger import logger
 from routes.queue_routes import add_to_queue
 
@@ -82,19 +84,30 @@ async def execute_payment(req: PaymentRequest) -> PaymentExecutionResponse:
     
     logger.info(f"Trying PSPs in order: {psps}")
     
-    for psp in psps:
+    health = get_psp_health()
+    all_open = not any(health.available(psp, req.merchant_id) for psp in psps)
+    
+    for priority, psp in enumerate(psps, start=1):
+        if not health.acquire(psp, req.merchant_id, force=all_open):
+            continue
+        started = time.monotonic()
         try:
             # Set the payment method for this attempt
             req.payment_method = psp
             logger.info(f"Attempting payment with {psp}")
             
             response = await process_payment(req)
+            success = response.status == "success"
+            health.record(psp, req.merchant_id, req.currency, success, (time.monotonic() - started) * 1000,
+                          priority=priority, amount=req.amount, error_code=None if success else "declined")
             
-            if response.status == "success":
+            if success:
                 logger.info(f"Payment successful with {psp}: {response.transaction_id}")
                 return response
                 
         except Exception as e:
+            health.record(psp, req.merchant_id, req.currency, False, (time.monotonic() - started) * 1000,
+                          priority=priority, amount=req.amount, error_code=classify_psp_error(e), error=str(e))
             last_error = e
             logger.warning(f"Payment failed with {psp}: {str(e)}")
             continue
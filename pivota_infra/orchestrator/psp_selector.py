@@ -1,5 +1,6 @@
 from typing import List
 from models.schemas import AgentPayRequest
+from utils.psp_health import get_psp_health
 from utils.logger import logger
 
 
@@ -34,7 +35,10 @@ async def select_psp_for_agent_pay(req: AgentPayRequest) -> List[str]:
         psps.append("checkout")
         psps.append("adyen")
     
-    # TODO: Add historical success rate weighting
+    # Currency preference is the base order; live success rate / latency re-rank it
+    # and PSPs behind an open circuit breaker are skipped (utils/psp_health)
+    psps = get_psp_health().rank_psps(psps, req.merchant_id, currency)
+    
     # TODO: Add merchant preference logic
     # TODO: Add regional availability checks
     # TODO: Add payment method compatibility checks
@@ -0,0 +1,230 @@
+"""
+Webhook 事件处理（由 utils/webhook_inbox 的 worker 调用）
+路由只负责验签 + 写入 webhook_inbox；这里执行实际的订单 / 商品 / 库存更新。
+处理函数抛出异常即视为失败，事件会按退避策略重试，因此每个分支都必须可重复执行。
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from db.database import database
+from db.orders import update_order_status, mark_order_paid, mark_order_shipped
+from db.products import log_order_event, bulk_upsert_product_cache, delete_product_cache
+from adapters.product_adapters import ShopifyProductAdapter
+from config.settings import settings
+from orchestrator.callback_handler import handle_psp_webhook
+from utils.inventory_service import get_inventory_service
+from utils.merchant_context import get_merchant_context
+from utils.logger import logger
+
+WebhookHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+# ============================================================================
+# Stripe
+# ============================================================================
+
+async def process_stripe_event(event: Dict[str, Any]) -> None:
+    """
+    - payment_intent.succeeded: 支付成功
+    - payment_intent.payment_failed: 支付失败
+    - charge.refunded: 退款成功
+    """
+    event_type = event["topic"]
+    data = event["payload"].get("data", {}).get("object", {})
+
+    if event_type == "payment_intent.succeeded":
+        payment_intent_id = data.get("id")
+        query = "SELECT * FROM orders WHERE payment_intent_id = :payment_intent_id"
+        result = await database.fetch_one(query, {"payment_intent_id": payment_intent_id})
+
+        if result:
+            order_id = result["order_id"]
+            await mark_order_paid(order_id)
+            await log_order_event(
+                event_type="payment_confirmed_webhook",
+                order_id=order_id,
+                merchant_id=result["merchant_id"],
+                metadata={
+                    "payment_intent_id": payment_intent_id,
+                    "amount": data.get("amount"),
+                    "currency": data.get("currency")
+                }
+            )
+            logger.info(f"Order {order_id} marked as paid via webhook")
+
+    elif event_type == "payment_intent.payment_failed":
+        payment_intent_id = data.get("id")
+        error_message = (data.get("last_payment_error") or {}).get("message", "Unknown error")
+
+        query = "SELECT * FROM orders WHERE payment_intent_id = :payment_intent_id"
+        result = await database.fetch_one(query, {"payment_intent_id": payment_intent_id})
+
+        if result:
+            order_id = result["order_id"]
+            await update_order_status(order_id, "payment_failed")
+            await log_order_event(
+                event_type="payment_failed_webhook",
+                order_id=order_id,
+                merchant_id=result["merchant_id"],
+                metadata={
+                    "payment_intent_id": payment_intent_id,
+                    "error": error_message
+                }
+            )
+            logger.warning(f"Order {order_id} payment failed: {error_message}")
+
+    elif event_type == "charge.refunded":
+        charge_id = data.get("id")
+        payment_intent_id = data.get("payment_intent")
+        refund_amount = data.get("amount_refunded")
+
+        query = "SELECT * FROM orders WHERE payment_intent_id = :payment_intent_id"
+        result = await database.fetch_one(query, {"payment_intent_id": payment_intent_id})
+
+        if result:
+            order_id = result["order_id"]
+            await update_order_status(order_id, "refunded")
+            await log_order_event(
+                event_type="refund_processed_webhook",
+                order_id=order_id,
+                merchant_id=result["merchant_id"],
+                metadata={
+                    "charge_id": charge_id,
+                    "refund_amount": refund_amount
+                }
+            )
+            logger.info(f"Order {order_id} refunded: {refund_amount}")
+
+
+# ============================================================================
+# Shopify
+# ============================================================================
+
+async def process_shopify_event(event: Dict[str, Any]) -> None:
+    """
+    - orders/fulfilled / orders/cancelled / orders/updated: 订单状态
+    - products/create, products/update: 单个产品写入 products_cache
+    - products/delete: 从 products_cache 删除产品
+    - inventory_levels/update: 更新 variant_inventory 中对应 location 的库存
+    """
+    topic = event["topic"]
+    merchant_id = event["merchant_id"]
+    data = event["payload"]
+
+    if topic == "orders/fulfilled":
+        shopify_order_id = str(data.get("id"))
+        tracking_numbers = []
+        for fulfillment in data.get("fulfillments", []):
+            tracking_numbers.extend(fulfillment.get("tracking_numbers", []))
+
+        query = "SELECT * FROM orders WHERE shopify_order_id = :shopify_order_id"
+        result = await database.fetch_one(query, {"shopify_order_id": shopify_order_id})
+
+        if result:
+            order_id = result["order_id"]
+            tracking_number = ", ".join(tracking_numbers) if tracking_numbers else None
+
+            await mark_order_shipped(order_id, tracking_number)
+            await log_order_event(
+                event_type="fulfillment_webhook",
+                order_id=order_id,
+                merchant_id=merchant_id,
+                metadata={
+                    "shopify_order_id": shopify_order_id,
+                    "tracking_numbers": tracking_numbers
+                }
+            )
+            logger.info(f"Order {order_id} marked as shipped via webhook")
+
+    elif topic == "orders/cancelled":
+        shopify_order_id = str(data.get("id"))
+        cancel_reason = data.get("cancel_reason")
+
+        query = "SELECT * FROM orders WHERE shopify_order_id = :shopify_order_id"
+        result = await database.fetch_one(query, {"shopify_order_id": shopify_order_id})
+
+        if result:
+            order_id = result["order_id"]
+            await update_order_status(order_id, "cancelled")
+            await log_order_event(
+                event_type="order_cancelled_webhook",
+                order_id=order_id,
+                merchant_id=merchant_id,
+                metadata={
+                    "shopify_order_id": shopify_order_id,
+                    "cancel_reason": cancel_reason
+                }
+            )
+            logger.info(f"Order {order_id} cancelled via webhook: {cancel_reason}")
+
+    elif topic == "orders/updated":
+        shopify_order_id = str(data.get("id"))
+        await log_order_event(
+            event_type="order_updated_webhook",
+            order_id=f"shopify_{shopify_order_id}",
+            merchant_id=merchant_id,
+            metadata={
+                "shopify_order_id": shopify_order_id,
+                "financial_status": data.get("financial_status"),
+                "fulfillment_status": data.get("fulfillment_status")
+            }
+        )
+        logger.info(f"Shopify order {shopify_order_id} updated")
+
+    elif topic in ("products/create", "products/update"):
+        # 单个产品增量更新（缓存新鲜度由事件驱动，而不是 TTL 过期）
+        product = ShopifyProductAdapter.convert_to_standard(data, merchant_id)
+        # 存 product.json() 原文：读接口直接拼接这段文本返回
+        await bulk_upsert_product_cache(
+            merchant_id=merchant_id,
+            platform="shopify",
+            products=[(product.id, product.json())],
+            ttl_seconds=settings.product_cache_event_ttl_seconds
+        )
+        await get_inventory_service().record_products(merchant_id, [data])
+        logger.info(f"Shopify product {product.id} cached via webhook ({topic})")
+
+    elif topic == "products/delete":
+        shopify_product_id = str(data.get("id"))
+        await delete_product_cache(merchant_id, "shopify", shopify_product_id)
+        await get_inventory_service().remove_product(merchant_id, shopify_product_id)
+        logger.info(f"Shopify product {shopify_product_id} removed from cache via webhook")
+
+    elif topic == "inventory_levels/update":
+        # 单个 location 的库存变化（payload 只有 inventory_item_id / location_id / available）
+        context = await get_merchant_context(merchant_id)
+        applied = await get_inventory_service().apply_level_update(
+            merchant_id,
+            inventory_item_id=str(data.get("inventory_item_id")),
+            location_id=str(data.get("location_id")),
+            available=data.get("available"),
+            shop_domain=context.shop_domain if context else None,
+            access_token=context.access_token if context else None
+        )
+        if applied:
+            logger.info(f"Inventory item {data.get('inventory_item_id')} updated via webhook")
+
+
+# ============================================================================
+# Adyen
+# ============================================================================
+
+async def process_adyen_notification(event: Dict[str, Any]) -> None:
+    """单个 NotificationRequestItem（AUTHORISATION 成功 / 失败）"""
+    notification = event["payload"]
+    event_code = notification.get("eventCode")
+    success = notification.get("success")
+    psp_reference = notification.get("pspReference")
+    merchant_reference = notification.get("merchantReference")
+
+    if event_code == "AUTHORISATION" and success == "true":
+        await handle_psp_webhook(merchant_reference, "succeeded", "adyen", psp_reference)
+    elif event_code == "AUTHORISATION" and success == "false":
+        await handle_psp_webhook(merchant_reference, "failed", "adyen", psp_reference)
+
+
+WEBHOOK_HANDLERS: Dict[str, WebhookHandler] = {
+    "stripe": process_stripe_event,
+    "shopify": process_shopify_event,
+    "adyen": process_adyen_notification,
+}
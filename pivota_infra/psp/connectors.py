@@ -44,11 +44,10 @@ class StripeConnector:
     async def create_payment_intent(self, request: PaymentRequest) -> PaymentResponse:
         """Create a Stripe payment intent"""
         try:
-            import stripe
-            stripe.api_key = self.api_key
+            from utils.stripe_client import AsyncStripeClient
             
             # Create payment intent
-            intent = stripe.PaymentIntent.create(
+            intent = await AsyncStripeClient(self.api_key).create_payment_intent(
                 amount=int(request.amount * 100),  # Convert to cents
                 currency=request.currency.lower(),
                 payment_method_types=['card'],
@@ -84,10 +83,9 @@ class StripeConnector:
     async def confirm_payment(self, payment_intent_id: str) -> PaymentResponse:
         """Confirm a Stripe payment"""
         try:
-            import stripe
-            stripe.api_key = self.api_key
+            from utils.stripe_client import AsyncStripeClient
             
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = await AsyncStripeClient(self.api_key).retrieve_payment_intent(payment_intent_id)
             
             if intent.status == "succeeded":
                 fees = (intent.amount / 100) * 0.029 + 0.30  # Convert back from cents
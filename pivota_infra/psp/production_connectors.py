@@ -29,11 +29,10 @@ class ProductionStripeConnector:
     async def create_payment_intent(self, request: PaymentRequest) -> PaymentResponse:
         """Create a production Stripe payment intent"""
         try:
-            import stripe
-            stripe.api_key = self.api_key
+            from utils.stripe_client import AsyncStripeClient
             
             # Create payment intent with production settings
-            intent = stripe.PaymentIntent.create(
+            intent = await AsyncStripeClient(self.api_key).create_payment_intent(
                 amount=int(request.amount * 100),  # Convert to cents
                 currency=request.currency.lower(),
                 payment_method_types=['card'],
@@ -78,10 +77,9 @@ class ProductionStripeConnector:
     async def confirm_payment(self, payment_intent_id: str) -> PaymentResponse:
         """Confirm a production Stripe payment"""
         try:
-            import stripe
-            stripe.api_key = self.api_key
+            from utils.stripe_client import AsyncStripeClient
             
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = await AsyncStripeClient(self.api_key).retrieve_payment_intent(payment_intent_id)
             
             if intent.status == "succeeded":
                 fees = (intent.amount / 100) * (self.fees["percentage"] / 100) + self.fees["fixed"]
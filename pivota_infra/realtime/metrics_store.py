@@ -1,23 +1,150 @@
 """
 Comprehensive Metrics Store for Dashboard
-Handles real-time metrics aggregation and snapshot generation
+Handles real-time metrics aggregation and snapshot generation.
+
+Aggregates are maintained incrementally (running sums, fixed-size latency
+rings, log-bucketed latency histograms, per-minute event buckets), so
+recording an event is O(1). Every
+entity touched since the last snapshot_delta() is marked dirty; the
+websocket layer broadcasts only those on a throttled cadence.
 """
 
 import time
-from typing import Dict, Any, List, Optional
-from collections import defaultdict, deque
-import json
+from typing import Dict, Any, List, Optional, Set
+from collections import deque
 import logging
 
+from utils.latency_histogram import LatencyHistogram
+
 logger = logging.getLogger("metrics_store")
 
+LATENCY_SAMPLES = 100  # avg_latency covers the last N samples per entity
+BUCKET_SECONDS = 60  # granularity of the rolling event-count window
+RECENT_EVENTS = 1000  # events kept for the live feed
+
+
+class _EntityStats:
+    """Running counters for one PSP / agent / merchant"""
+
+    __slots__ = (
+        "kind", "name", "success_count", "fail_count", "retry_count", "total",
+        "total_latency", "histogram", "_samples", "_pos", "_count", "_sample_sum", "_view", "_stale",
+    )
+
+    def __init__(self, kind: str):
+        self.kind = kind  # "psp" | "agent" | "merchant"
+        self.name = "Unknown"
+        self.success_count = 0
+        self.fail_count = 0
+        self.retry_count = 0
+        self.total = 0
+        self.total_latency = 0
+        self.histogram = LatencyHistogram()  # since start / reset, for tail percentiles
+        self._samples = [0.0] * LATENCY_SAMPLES
+        self._pos = 0
+        self._count = 0
+        self._sample_sum = 0.0
+        self._view: Dict[str, Any] = {}
+        self._stale = True
+
+    def record(self, status: str, latency: float) -> None:
+        self.total += 1
+        self.total_latency += latency
+        if status == "succeeded":
+            self.success_count += 1
+        elif status == "failed":
+            self.fail_count += 1
+        elif status == "queued_for_retry":
+            self.retry_count += 1
+        self.histogram.record(latency)
+        # Ring buffer with a running sum: O(1) moving average
+        if self._count == LATENCY_SAMPLES:
+            self._sample_sum -= self._samples[self._pos]
+        else:
+            self._count += 1
+        self._samples[self._pos] = latency
+        self._sample_sum += latency
+        self._pos = (self._pos + 1) % LATENCY_SAMPLES
+        self._stale = True
+
+    @property
+    def avg_latency(self) -> float:
+        return self._sample_sum / self._count if self._count else 0
+
+    def view(self) -> Dict[str, Any]:
+        """Snapshot dict for this entity, refreshed in place only when it changed"""
+        if self._stale:
+            view = self._view
+            view["success_count"] = self.success_count
+            view["fail_count"] = self.fail_count
+            view["retry_count"] = self.retry_count
+            view["avg_latency"] = self.avg_latency
+            for label, value in self.histogram.percentiles().items():
+                view[f"{label}_latency"] = value
+            view["total"] = self.total
+            if self.kind == "agent":
+                view["agent_name"] = self.name
+            elif self.kind == "merchant":
+                view["merchant_name"] = self.name
+            self._stale = False
+        return self._view
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "total": self.total,
+            "success": self.success_count,
+            "fail": self.fail_count,
+            "retries": self.retry_count
+        }
+
+
+class _BucketRing:
+    """Event counts per BUCKET_SECONDS over the window, with a running total"""
+
+    __slots__ = ("size", "counts", "starts", "total")
+
+    def __init__(self, window_seconds: int):
+        self.size = max(1, window_seconds // BUCKET_SECONDS)
+        self.counts = [0] * self.size
+        self.starts = [0] * self.size
+        self.total = 0
+
+    def _slot(self, now: float) -> int:
+        bucket = int(now // BUCKET_SECONDS)
+        slot = bucket % self.size
+        if self.starts[slot] != bucket:
+            # Slot last held a bucket that has left the window
+            self.total -= self.counts[slot]
+            self.counts[slot] = 0
+            self.starts[slot] = bucket
+        return slot
+
+    def add(self, now: float) -> None:
+        self.counts[self._slot(now)] += 1
+        self.total += 1
+
+    def count(self, now: float) -> int:
+        oldest = int(now // BUCKET_SECONDS) - self.size + 1
+        for slot in range(self.size):
+            if self.counts[slot] and self.starts[slot] < oldest:
+                self.total -= self.counts[slot]
+                self.counts[slot] = 0
+        return self.total
+
+    def clear(self) -> None:
+        self.counts = [0] * self.size
+        self.starts = [0] * self.size
+        self.total = 0
+
+
 class MetricsStore:
     """Real-time metrics store with rolling windows and snapshots"""
-    
-    def __init__(self, window_size_seconds: int = 3600):  # 1 hour window
+
+    def __init__(self, window_size_seconds: int = 3600, recent_events: int = RECENT_EVENTS):  # 1 hour window
         self.window_size_seconds = window_size_seconds
-        self.events = deque()  # Rolling window of events
-        
+        self.events = deque(maxlen=recent_events)  # Live feed only; counts come from the buckets
+        self._window = _BucketRing(window_size_seconds)
+
         # Aggregated counters
         self.counters = {
             "total": 0,
@@ -25,60 +152,47 @@ class MetricsStore:
             "fail": 0,
             "retries": 0
         }
-        
-        # PSP metrics
-        self.psp_metrics = defaultdict(lambda: {
-            "success_count": 0,
-            "fail_count": 0,
-            "retry_count": 0,
-            "total_latency": 0,
-            "total": 0,
-            "latency_samples": deque(maxlen=100)  # Keep last 100 samples for avg
-        })
-        
-        # Agent metrics
-        self.agent_metrics = defaultdict(lambda: {
-            "success_count": 0,
-            "fail_count": 0,
-            "retry_count": 0,
-            "total_latency": 0,
-            "total": 0,
-            "latency_samples": deque(maxlen=100),
-            "agent_name": "Unknown"
-        })
-        
-        # Merchant metrics
-        self.merchant_metrics = defaultdict(lambda: {
-            "success_count": 0,
-            "fail_count": 0,
-            "retry_count": 0,
-            "total_latency": 0,
-            "total": 0,
-            "latency_samples": deque(maxlen=100),
-            "merchant_name": "Unknown"
-        })
-        
+
+        self.psp_metrics: Dict[str, _EntityStats] = {}
+        self.agent_metrics: Dict[str, _EntityStats] = {}
+        self.merchant_metrics: Dict[str, _EntityStats] = {}
+
         # PSP usage tracking
-        self.psp_usage = defaultdict(int)
-        
+        self.psp_usage: Dict[str, int] = {}
+
+        # System-wide latency distribution
+        self.latency = LatencyHistogram()
+
+        # Dirty tracking for delta snapshots
+        self.version = 0
+        self._dirty_psp: Set[str] = set()
+        self._dirty_agent: Set[str] = set()
+        self._dirty_merchant: Set[str] = set()
+        self._full_snapshot: Optional[Dict[str, Any]] = None
+        self._full_version = -1
+
         logger.info("MetricsStore initialized")
 
+    @staticmethod
+    def _stats(table: Dict[str, _EntityStats], key: str, kind: str) -> _EntityStats:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = _EntityStats(kind)
+        return stats
+
     def record_event(self, event: Dict[str, Any]) -> None:
-        """Record a new event and update metrics"""
+        """Record a new event and update metrics (O(1))"""
         current_time = time.time()
-        
-        # Clean old events
-        self._cleanup_old_events(current_time)
-        
-        # Add to rolling window
+
         self.events.append({
             **event,
             "recorded_at": current_time
         })
-        
+        self._window.add(current_time)
+
         # Update counters
         self.counters["total"] += 1
-        
+
         status = event.get("status", "unknown")
         if status == "succeeded":
             self.counters["success"] += 1
@@ -86,171 +200,135 @@ class MetricsStore:
             self.counters["fail"] += 1
         elif status == "queued_for_retry":
             self.counters["retries"] += 1
-        
+
+        latency = event.get("latency_ms", 0) or 0
+        self.latency.record(latency)
+
         # Update PSP metrics
         psp = event.get("psp", "unknown")
-        latency = event.get("latency_ms", 0)
-        
-        self.psp_metrics[psp]["total"] += 1
-        self.psp_metrics[psp]["total_latency"] += latency
-        self.psp_metrics[psp]["latency_samples"].append(latency)
-        
-        if status == "succeeded":
-            self.psp_metrics[psp]["success_count"] += 1
-        elif status == "failed":
-            self.psp_metrics[psp]["fail_count"] += 1
-        elif status == "queued_for_retry":
-            self.psp_metrics[psp]["retry_count"] += 1
-        
-        self.psp_usage[psp] += 1
-        
+        self._stats(self.psp_metrics, psp, "psp").record(status, latency)
+        self.psp_usage[psp] = self.psp_usage.get(psp, 0) + 1
+        self._dirty_psp.add(psp)
+
         # Update Agent metrics
         agent = event.get("agent", "unknown")
-        agent_name = event.get("agent_name", "Unknown Agent")
-        
-        self.agent_metrics[agent]["total"] += 1
-        self.agent_metrics[agent]["total_latency"] += latency
-        self.agent_metrics[agent]["latency_samples"].append(latency)
-        self.agent_metrics[agent]["agent_name"] = agent_name
-        
-        if status == "succeeded":
-            self.agent_metrics[agent]["success_count"] += 1
-        elif status == "failed":
-            self.agent_metrics[agent]["fail_count"] += 1
-        elif status == "queued_for_retry":
-            self.agent_metrics[agent]["retry_count"] += 1
-        
+        stats = self._stats(self.agent_metrics, agent, "agent")
+        stats.name = event.get("agent_name", "Unknown Agent")
+        stats.record(status, latency)
+        self._dirty_agent.add(agent)
+
         # Update Merchant metrics
         merchant = event.get("merchant", "unknown")
-        merchant_name = event.get("merchant_name", "Unknown Merchant")
-        
-        self.merchant_metrics[merchant]["total"] += 1
-        self.merchant_metrics[merchant]["total_latency"] += latency
-        self.merchant_metrics[merchant]["latency_samples"].append(latency)
-        self.merchant_metrics[merchant]["merchant_name"] = merchant_name
-        
-        if status == "succeeded":
-            self.merchant_metrics[merchant]["success_count"] += 1
-        elif status == "failed":
-            self.merchant_metrics[merchant]["fail_count"] += 1
-        elif status == "queued_for_retry":
-            self.merchant_metrics[merchant]["retry_count"] += 1
-        
+        stats = self._stats(self.merchant_metrics, merchant, "merchant")
+        stats.name = event.get("merchant_name", "Unknown Merchant")
+        stats.record(status, latency)
+        self._dirty_merchant.add(merchant)
+
+        self.version += 1
         logger.debug(f"Recorded event: {event.get('type')} for {agent} -> {merchant} via {psp}")
 
-    def _cleanup_old_events(self, current_time: float) -> None:
-        """Remove events older than the window size"""
-        cutoff_time = current_time - self.window_size_seconds
-        
-        # Remove old events from deque
-        while self.events and self.events[0]["recorded_at"] < cutoff_time:
-            self.events.popleft()
+    @property
+    def has_changes(self) -> bool:
+        """True if events were recorded since the last snapshot_delta()"""
+        return bool(self._dirty_psp or self._dirty_agent or self._dirty_merchant)
+
+    def _full(self) -> Dict[str, Any]:
+        """Admin-view snapshot, rebuilt only when something was recorded"""
+        if self._full_snapshot is None or self._full_version != self.version:
+            self._full_snapshot = {
+                "summary": self.counters.copy(),
+                "psp": {k: s.view() for k, s in self.psp_metrics.items()},
+                "agent": {k: s.view() for k, s in self.agent_metrics.items()},
+                "merchant": {k: s.view() for k, s in self.merchant_metrics.items()},
+                "psp_usage": dict(self.psp_usage),
+                "latency": self.latency.percentiles(),
+            }
+            self._full_version = self.version
+        return self._full_snapshot
 
     def get_snapshot(self, role: str = "admin", entity_id: Optional[str] = None) -> Dict[str, Any]:
         """Generate a snapshot of current metrics with optional filtering"""
-        
-        # Calculate average latencies
-        def calc_avg_latency(samples):
-            return sum(samples) / len(samples) if samples else 0
-        
-        # Build PSP metrics
-        psp_data = {}
-        for psp, metrics in self.psp_metrics.items():
-            psp_data[psp] = {
-                "success_count": metrics["success_count"],
-                "fail_count": metrics["fail_count"],
-                "retry_count": metrics["retry_count"],
-                "avg_latency": calc_avg_latency(metrics["latency_samples"]),
-                "total": metrics["total"]
-            }
-        
-        # Build Agent metrics
-        agent_data = {}
-        for agent, metrics in self.agent_metrics.items():
-            agent_data[agent] = {
-                "success_count": metrics["success_count"],
-                "fail_count": metrics["fail_count"],
-                "retry_count": metrics["retry_count"],
-                "avg_latency": calc_avg_latency(metrics["latency_samples"]),
-                "total": metrics["total"],
-                "agent_name": metrics["agent_name"]
-            }
-        
-        # Build Merchant metrics
-        merchant_data = {}
-        for merchant, metrics in self.merchant_metrics.items():
-            merchant_data[merchant] = {
-                "success_count": metrics["success_count"],
-                "fail_count": metrics["fail_count"],
-                "retry_count": metrics["retry_count"],
-                "avg_latency": calc_avg_latency(metrics["latency_samples"]),
-                "total": metrics["total"],
-                "merchant_name": metrics["merchant_name"]
-            }
-        
-        # Build PSP usage
-        psp_usage_data = dict(self.psp_usage)
-        
-        # Apply role-based filtering
-        filtered_summary = self.counters.copy()
-        
+        now = time.time()
+        full = self._full()
+        snapshot = {
+            **full,
+            "timestamp": now,
+            "window_size_seconds": self.window_size_seconds,
+            "total_events": self._window.count(now)
+        }
+
         if role in ["admin", "operator", "viewer"]:
             # Admin, operator, and viewer see full system data
             pass
         elif role == "agent" and entity_id:
             # Filter to only show data for this agent
-            agent_data = {entity_id: agent_data.get(entity_id, {})}
-            # Calculate filtered summary for this agent
-            if entity_id in agent_data:
-                agent_metrics = agent_data[entity_id]
-                filtered_summary = {
-                    "total": agent_metrics.get("total", 0),
-                    "success": agent_metrics.get("success_count", 0),
-                    "fail": agent_metrics.get("fail_count", 0),
-                    "retries": agent_metrics.get("retry_count", 0)
-                }
-            else:
-                filtered_summary = {"total": 0, "success": 0, "fail": 0, "retries": 0}
+            stats = self.agent_metrics.get(entity_id)
+            snapshot["agent"] = {entity_id: stats.view() if stats else {}}
+            snapshot["summary"] = stats.summary() if stats else {"total": 0, "success": 0, "fail": 0, "retries": 0}
+            snapshot["latency"] = (stats.histogram if stats else LatencyHistogram()).percentiles()
         elif role == "merchant" and entity_id:
             # Filter to only show data for this merchant
-            merchant_data = {entity_id: merchant_data.get(entity_id, {})}
-            # Calculate filtered summary for this merchant
-            if entity_id in merchant_data:
-                merchant_metrics = merchant_data[entity_id]
-                filtered_summary = {
-                    "total": merchant_metrics.get("total", 0),
-                    "success": merchant_metrics.get("success_count", 0),
-                    "fail": merchant_metrics.get("fail_count", 0),
-                    "retries": merchant_metrics.get("retry_count", 0)
-                }
-            else:
-                filtered_summary = {"total": 0, "success": 0, "fail": 0, "retries": 0}
-        
-        snapshot = {
-            "summary": filtered_summary,
-            "psp": psp_data,
-            "agent": agent_data,
-            "merchant": merchant_data,
-            "psp_usage": psp_usage_data,
-            "timestamp": time.time(),
-            "window_size_seconds": self.window_size_seconds,
-            "total_events": len(self.events)
-        }
-        
+            stats = self.merchant_metrics.get(entity_id)
+            snapshot["merchant"] = {entity_id: stats.view() if stats else {}}
+            snapshot["summary"] = stats.summary() if stats else {"total": 0, "success": 0, "fail": 0, "retries": 0}
+            snapshot["latency"] = (stats.histogram if stats else LatencyHistogram()).percentiles()
+
         return snapshot
 
+    def snapshot_delta(self) -> Optional[Dict[str, Any]]:
+        """
+        Entities changed since the previous call (admin view), or None if
+        nothing changed. Consumes the dirty sets.
+        """
+        if not self.has_changes:
+            return None
+        now = time.time()
+        delta = {
+            "summary": self.counters.copy(),
+            "psp": {k: self.psp_metrics[k].view() for k in self._dirty_psp},
+            "agent": {k: self.agent_metrics[k].view() for k in self._dirty_agent},
+            "merchant": {k: self.merchant_metrics[k].view() for k in self._dirty_merchant},
+            "psp_usage": {k: self.psp_usage[k] for k in self._dirty_psp},
+            "latency": self.latency.percentiles(),
+            "version": self.version,
+            "timestamp": now,
+            "total_events": self._window.count(now)
+        }
+        self._dirty_psp = set()
+        self._dirty_agent = set()
+        self._dirty_merchant = set()
+        return delta
+
+    def export_histograms(self) -> Dict[str, Any]:
+        """Serialized histograms per entity, for merging across instances"""
+        return {
+            "all": self.latency.to_dict(),
+            "psp": {k: s.histogram.to_dict() for k, s in self.psp_metrics.items()},
+            "agent": {k: s.histogram.to_dict() for k, s in self.agent_metrics.items()},
+            "merchant": {k: s.histogram.to_dict() for k, s in self.merchant_metrics.items()},
+        }
+
     def get_recent_events(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get recent events for live feed"""
-        return list(self.events)[-limit:]
+        if limit <= 0:
+            return []
+        start = max(0, len(self.events) - limit)
+        return [self.events[i] for i in range(start, len(self.events))]
 
     def reset_metrics(self) -> None:
         """Reset all metrics (for testing)"""
         self.events.clear()
+        self._window.clear()
         self.counters = {"total": 0, "success": 0, "fail": 0, "retries": 0}
         self.psp_metrics.clear()
         self.agent_metrics.clear()
         self.merchant_metrics.clear()
         self.psp_usage.clear()
+        self.latency = LatencyHistogram()
+        self._dirty_psp = set()
+        self._dirty_agent = set()
+        self._dirty_merchant = set()
+        self.version += 1
         logger.info("Metrics reset")
 
 # Global metrics store instance
@@ -1,132 +1,287 @@
 """
 WebSocket Connection Manager
-Handles WebSocket connections, broadcasting, and authentication
+Handles WebSocket connections, broadcasting, and authentication.
+
+Broadcasts serialize the payload once and only enqueue it: every connection
+has a bounded outbound queue drained by its own writer task, so a slow
+client can't stall other clients or the publisher. Role / entity filters
+are served from subscription indexes instead of scanning every socket.
+
+Dashboard events travel over the event bus, so every worker records every
+event and fans it out to its own sockets.
 """
 
+import asyncio
+import itertools
 import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 from fastapi import WebSocket, WebSocketDisconnect
 import jwt
 import time
 
+from config.settings import settings
+from utils.event_bus import get_event_bus
+
 logger = logging.getLogger("ws_manager")
 
+_connection_seq = itertools.count(1)
+
+EVENTS_CHANNEL = "dashboard_events"
+
+
+class _Client:
+    """One connected socket: outbound queue + writer task"""
+
+    __slots__ = (
+        "connection_id", "websocket", "user_info", "connected_at",
+        "queue", "writer", "sent", "dropped",
+    )
+
+    def __init__(self, connection_id: str, websocket: WebSocket, user_info: Dict[str, Any], queue_size: int):
+        self.connection_id = connection_id
+        self.websocket = websocket
+        self.user_info = user_info
+        self.connected_at = time.time()
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max(1, queue_size))
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+
+
 class ConnectionManager:
     """Manages WebSocket connections with authentication and broadcasting"""
-    
+
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.connection_metadata: Dict[str, Dict[str, Any]] = {}
         self.jwt_secret = "your-secret-key"  # In production, use environment variable
-        
-    async def connect(self, websocket: WebSocket, token: Optional[str] = None) -> str:
-        """Accept a WebSocket connection and optionally validate JWT token"""
+        self._clients: Dict[str, _Client] = {}
+        self._by_socket: Dict[int, str] = {}  # id(websocket) -> connection_id
+        # Subscription indexes: role / entity_id -> connection ids
+        self._by_role: Dict[str, Set[str]] = {}
+        self._by_entity: Dict[str, Set[str]] = {}
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        token: Optional[str] = None,
+        user_info: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Accept a WebSocket connection and optionally validate JWT token (or take pre-validated user_info)"""
         await websocket.accept()
-        
-        connection_id = f"conn_{int(time.time() * 1000)}"
-        
-        # Always allow connection, validate token if provided
-        user_info = {
-            "user_id": "anonymous",
-            "role": "viewer",
-            "entity_id": None
-        }
-        
-        if token:
-            try:
-                payload = jwt.decode(token, self.jwt_secret, algorithms=["HS256"])
-                user_info = {
-                    "user_id": payload.get("sub"),
-                    "role": payload.get("role", "viewer"),
-                    "entity_id": payload.get("entity_id")
-                }
-                logger.info(f"Authenticated WebSocket connection for user {user_info['user_id']} with role {user_info['role']}")
-            except jwt.InvalidTokenError:
-                logger.warning(f"Invalid JWT token for WebSocket connection, using anonymous")
-                # Don't close connection, just use anonymous
-            except Exception as e:
-                logger.warning(f"JWT validation error: {e}, using anonymous")
-        else:
-            logger.info(f"Anonymous WebSocket connection established")
-        
+
+        connection_id = f"conn_{int(time.time() * 1000)}_{next(_connection_seq)}"
+
+        if user_info is None:
+            # Always allow connection, validate token if provided
+            user_info = {
+                "user_id": "anonymous",
+                "role": "viewer",
+                "entity_id": None
+            }
+
+            if token:
+                try:
+                    payload = jwt.decode(token, self.jwt_secret, algorithms=["HS256"])
+                    user_info = {
+                        "user_id": payload.get("sub"),
+                        "role": payload.get("role", "viewer"),
+                        "entity_id": payload.get("entity_id")
+                    }
+                    logger.info(f"Authenticated WebSocket connection for user {user_info['user_id']} with role {user_info['role']}")
+                except jwt.InvalidTokenError:
+                    logger.warning(f"Invalid JWT token for WebSocket connection, using anonymous")
+                    # Don't close connection, just use anonymous
+                except Exception as e:
+                    logger.warning(f"JWT validation error: {e}, using anonymous")
+            else:
+                logger.info(f"Anonymous WebSocket connection established")
+
+        client = _Client(connection_id, websocket, user_info, settings.ws_send_queue_size)
+        self._clients[connection_id] = client
+        self._by_socket[id(websocket)] = connection_id
         self.active_connections[connection_id] = websocket
         self.connection_metadata[connection_id] = {
-            "connected_at": time.time(),
+            "connected_at": client.connected_at,
             "user_info": user_info
         }
-        
+        self._index(connection_id, user_info)
+        client.writer = asyncio.create_task(self._writer(client))
+
         logger.info(f"WebSocket connection {connection_id} established")
         return connection_id
-    
+
     def disconnect(self, websocket: WebSocket) -> None:
         """Remove a WebSocket connection"""
-        connection_id = None
-        for cid, ws in self.active_connections.items():
-            if ws == websocket:
-                connection_id = cid
-                break
-        
+        connection_id = self._by_socket.get(id(websocket))
         if connection_id:
-            del self.active_connections[connection_id]
-            del self.connection_metadata[connection_id]
+            self._remove(connection_id)
             logger.info(f"WebSocket connection {connection_id} disconnected")
-    
+
     async def send_json(self, websocket: WebSocket, data: Dict[str, Any]) -> None:
-        """Send JSON data to a specific WebSocket"""
-        try:
-            await websocket.send_text(json.dumps(data))
-        except Exception as e:
-            logger.error(f"Failed to send JSON to WebSocket: {e}")
-    
-    async def broadcast(self, data: Dict[str, Any], role_filter: Optional[str] = None, entity_filter: Optional[str] = None) -> None:
-        """Broadcast data to all connected clients, optionally filtered by role/entity"""
-        disconnected_connections = []
-        
-        for connection_id, websocket in self.active_connections.items():
+        """Send JSON data to a specific WebSocket (queued behind its pending broadcasts)"""
+        connection_id = self._by_socket.get(id(websocket))
+        client = self._clients.get(connection_id) if connection_id else None
+        if client is None:
             try:
-                metadata = self.connection_metadata.get(connection_id, {})
-                user_info = metadata.get("user_info", {})
-                
-                # Apply filters
-                if role_filter and user_info.get("role") != role_filter:
-                    continue
-                
-                if entity_filter and user_info.get("entity_id") != entity_filter:
-                    continue
-                
-                await self.send_json(websocket, data)
-                
+                await websocket.send_text(json.dumps(data))
             except Exception as e:
-                logger.error(f"Failed to broadcast to connection {connection_id}: {e}")
-                disconnected_connections.append(connection_id)
-        
-        # Clean up disconnected connections
-        for connection_id in disconnected_connections:
-            if connection_id in self.active_connections:
-                del self.active_connections[connection_id]
-            if connection_id in self.connection_metadata:
-                del self.connection_metadata[connection_id]
-    
+                logger.error(f"Failed to send JSON to WebSocket: {e}")
+            return
+        self._enqueue(client, json.dumps(data))
+
+    async def broadcast(self, data: Dict[str, Any], role_filter: Optional[str] = None, entity_filter: Optional[str] = None) -> int:
+        """
+        Broadcast data to all connected clients, optionally filtered by role/entity.
+        Never waits on a socket; returns the number of connections it was queued for.
+        """
+        targets = self._targets(role_filter, entity_filter)
+        if not targets:
+            return 0
+        text = json.dumps(data)  # serialized once for every recipient
+        for connection_id in targets:
+            client = self._clients.get(connection_id)
+            if client is not None:
+                self._enqueue(client, text)
+        return len(targets)
+
     async def broadcast_to_role(self, data: Dict[str, Any], role: str) -> None:
         """Broadcast data to all connections with a specific role"""
         await self.broadcast(data, role_filter=role)
-    
+
     async def broadcast_to_entity(self, data: Dict[str, Any], entity_id: str) -> None:
         """Broadcast data to all connections for a specific entity"""
         await self.broadcast(data, entity_filter=entity_id)
-    
+
     def get_connection_count(self) -> int:
         """Get the number of active connections"""
         return len(self.active_connections)
-    
+
     def get_connections_by_role(self) -> Dict[str, int]:
         """Get connection count by role"""
-        role_counts = {}
-        for metadata in self.connection_metadata.values():
-            role = metadata.get("user_info", {}).get("role", "unknown")
-            role_counts[role] = role_counts.get(role, 0) + 1
-        return role_counts
+        return {role: len(ids) for role, ids in self._by_role.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Fan-out health: queue depth, drops and slow-consumer disconnects"""
+        depths = [client.queue.qsize() for client in self._clients.values()]
+        return {
+            "connections": len(self._clients),
+            "by_role": self.get_connections_by_role(),
+            "entities": len(self._by_entity),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths) if depths else 0,
+            "queue_size": settings.ws_send_queue_size,
+            "slow_consumer_policy": settings.ws_slow_consumer_policy,
+            "messages_dropped": self.messages_dropped,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _index(self, connection_id: str, user_info: Dict[str, Any]) -> None:
+        role = user_info.get("role") or "unknown"
+        self._by_role.setdefault(role, set()).add(connection_id)
+        entity_id = user_info.get("entity_id")
+        if entity_id:
+            self._by_entity.setdefault(entity_id, set()).add(connection_id)
+
+    def _unindex(self, connection_id: str, user_info: Dict[str, Any]) -> None:
+        for index, key in (
+            (self._by_role, user_info.get("role") or "unknown"),
+            (self._by_entity, user_info.get("entity_id")),
+        ):
+            if not key:
+                continue
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(connection_id)
+                if not ids:
+                    index.pop(key, None)
+
+    def _targets(self, role_filter: Optional[str], entity_filter: Optional[str]) -> List[str]:
+        if role_filter and entity_filter:
+            roles = self._by_role.get(role_filter, set())
+            entities = self._by_entity.get(entity_filter, set())
+            small, large = (roles, entities) if len(roles) <= len(entities) else (entities, roles)
+            return [cid for cid in small if cid in large]
+        if role_filter:
+            return list(self._by_role.get(role_filter, ()))
+        if entity_filter:
+            return list(self._by_entity.get(entity_filter, ()))
+        return list(self._clients)
+
+    def _enqueue(self, client: _Client, text: str) -> None:
+        try:
+            client.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        # Slow consumer: the queue is full
+        client.dropped += 1
+        self.messages_dropped += 1
+        if settings.ws_slow_consumer_policy == "disconnect":
+            self._drop_slow_client(client)
+            return
+        # drop_oldest: newest state wins, the client skips what it couldn't keep up with.
+        # A socket that stops draining entirely is removed by its writer's send timeout.
+        try:
+            client.queue.get_nowait()
+            client.queue.put_nowait(text)
+        except (asyncio.QueueEmpty, asyncio.QueueFull):
+            pass
+
+    def _drop_slow_client(self, client: _Client) -> None:
+        self.slow_disconnects += 1
+        logger.warning(
+            f"WebSocket connection {client.connection_id} is not keeping up "
+            f"({client.dropped} messages dropped), disconnecting"
+        )
+        self._remove(client.connection_id)
+        asyncio.ensure_future(self._close(client.websocket, 1013, "Slow consumer"))
+
+    async def _close(self, websocket: WebSocket, code: int = 1000, reason: str = "") -> None:
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def _remove(self, connection_id: str) -> None:
+        client = self._clients.pop(connection_id, None)
+        self.active_connections.pop(connection_id, None)
+        self.connection_metadata.pop(connection_id, None)
+        if client is None:
+            return
+        self._by_socket.pop(id(client.websocket), None)
+        self._unindex(connection_id, client.user_info)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def _writer(self, client: _Client) -> None:
+        """Drain one connection's queue; a failed or stuck send removes the connection"""
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(
+                    client.websocket.send_text(text),
+                    timeout=settings.ws_send_timeout_seconds
+                )
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.slow_disconnects += 1
+            logger.warning(f"WebSocket connection {client.connection_id} send timed out, disconnecting")
+            self._remove(client.connection_id)
+            await self._close(client.websocket, 1013, "Slow consumer")
+        except Exception as e:
+            logger.info(f"WebSocket connection {client.connection_id} send failed: {e}")
+            self._remove(client.connection_id)
 
 # Global connection manager
 _manager = ConnectionManager()
@@ -136,20 +291,20 @@ def get_connection_manager() -> ConnectionManager:
     return _manager
 
 async def publish_event_to_ws(event: Dict[str, Any]) -> None:
-    """Publish an event to WebSocket clients"""
-    from .metrics_store import record_event, snapshot
+    """Publish an event to WebSocket clients of every worker (metrics go out as throttled deltas)"""
+    await get_event_bus().publish(EVENTS_CHANNEL, event)
+
+async def _deliver_event(event: Dict[str, Any]) -> None:
+    """Event bus handler: record the event and fan it out to this worker's sockets"""
+    from .metrics_store import record_event
     
-    # Record the event in metrics store
+    # Record the event in metrics store (O(1); marks the touched entities dirty)
     record_event(event)
     
-    # Generate updated snapshot
-    current_snapshot = snapshot()
-    
-    # Broadcast the event
+    # Broadcast the event itself; the snapshot broadcaster ships the changed metrics
     event_data = {
         "type": "event",
         "event": event,
-        "snapshot": current_snapshot,
         "timestamp": time.time()
     }
     
@@ -158,6 +313,8 @@ async def publish_event_to_ws(event: Dict[str, Any]) -> None:
     
     logger.debug(f"Published event to WebSocket clients: {event.get('type', 'unknown')}")
 
+get_event_bus().subscribe(EVENTS_CHANNEL, _deliver_event)
+
 async def broadcast_snapshot() -> None:
     """Broadcast current snapshot to all connected clients"""
     from .metrics_store import snapshot
@@ -171,3 +328,76 @@ async def broadcast_snapshot() -> None:
     
     await _manager.broadcast(data)
     logger.debug("Broadcasted snapshot to all WebSocket clients")
+
+async def broadcast_snapshot_delta() -> bool:
+    """
+    Send metrics changed since the last call: the admin view to admin /
+    operator / viewer sockets, and each dirty agent's / merchant's own slice
+    to the sockets subscribed to that entity. Returns False if nothing changed.
+    """
+    from .metrics_store import get_metrics_store
+    
+    store = get_metrics_store()
+    delta = store.snapshot_delta()
+    if delta is None:
+        return False
+    now = delta["timestamp"]
+    
+    for role in ("admin", "operator", "viewer"):
+        await _manager.broadcast({"type": "snapshot_delta", "data": delta, "timestamp": now}, role_filter=role)
+    
+    for role, section, table in (
+        ("agent", "agent", store.agent_metrics),
+        ("merchant", "merchant", store.merchant_metrics),
+    ):
+        for entity_id, view in delta[section].items():
+            await _manager.broadcast({
+                "type": "snapshot_delta",
+                "data": {
+                    "summary": table[entity_id].summary(),
+                    "latency": table[entity_id].histogram.percentiles(),
+                    section: {entity_id: view},
+                    "version": delta["version"],
+                    "timestamp": now
+                },
+                "timestamp": now
+            }, role_filter=role, entity_filter=entity_id)
+    return True
+
+class _SnapshotBroadcaster:
+    """Background task that flushes metric deltas every interval while anything changed"""
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, interval_ms: int) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(max(50, interval_ms) / 1000))
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+    
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await broadcast_snapshot_delta()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Snapshot delta broadcast failed: {e}")
+
+_snapshot_broadcaster = _SnapshotBroadcaster()
+
+async def start_snapshot_broadcaster() -> None:
+    """Start throttled metric delta broadcasts (call from app startup)"""
+    _snapshot_broadcaster.start(settings.ws_snapshot_interval_ms)
+
+async def stop_snapshot_broadcaster() -> None:
+    await _snapshot_broadcaster.stop()
@@ -9,6 +9,7 @@ from utils.auth import verify_jwt_token, get_current_admin, require_admin
 from datetime import datetime, timedelta
 from config.settings import settings
 from db.database import database, transactions
+from utils.merchant_context import notify_merchant_changed
 from sqlalchemy import func, select, desc, and_
 import os
 
@@ -333,6 +334,7 @@ async def admin_connect_psp(
             """,
             {"provider": provider, "merchant_id": merchant_id}
         )
+        await notify_merchant_changed(merchant_id)
         return {"status": "success", "message": f"{provider} connected/updated", "psp_id": psp_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to connect PSP: {e}")
@@ -1,6 +1,7 @@
 """Admin cleanup - no auth required for quick fixes"""
 from fastapi import APIRouter
 from db.database import database
+from utils.merchant_context import notify_merchant_changed
 
 router = APIRouter()
 
@@ -44,6 +45,7 @@ async def admin_cleanup_duplicates():
             INSERT INTO merchant_psps (psp_id, merchant_id, provider, name, account_id, capabilities, status, connected_at)
             VALUES ('psp_adyen_main', :m, 'adyen', 'Adyen Account', 'acct_adyen', 'card,bank_transfer', 'active', NOW())
         """, {"m": merchant_id})
+        await notify_merchant_changed(merchant_id)
         
         # Verify final state
         stores_after = await database.fetch_all("SELECT store_id, platform, name FROM merchant_stores WHERE merchant_id = :m", {"m": merchant_id})
@@ -3,7 +3,7 @@ Agent 专用 API 路由
 为 AI Agent 提供优化的电商接口
 """
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Header
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from decimal import Decimal
@@ -12,15 +12,21 @@ import json
 
 from models.order import CreateOrderRequest, OrderResponse
 from models.standard_product import StandardProduct
-from db.merchant_onboarding import get_merchant_onboarding
+from db.merchant_onboarding import get_merchant_onboarding, get_merchant_onboardings_by_ids
+from db.database import database
 from db.products import get_cached_products
-from db.orders import get_order, get_orders_by_merchant, update_payment_info
+from db.orders import get_order, get_orders_by_merchant, get_orders_page, estimate_order_count, update_payment_info
 from routes.refund_api import process_refund
 from routes.order_routes import cancel_order as admin_cancel_order
 from routes.fulfillment_api import track_order_fulfillment
 from routes.order_routes import create_new_order
 from routes.agent_auth import AgentContext, get_agent_context, log_agent_request
 from utils.logger import logger
+from utils.product_index import get_product_index
+from utils.fanout import fan_out
+from utils.idempotency import run_idempotent
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+from config.settings import settings
 
 
 router = APIRouter(prefix="/agent/v1", tags=["agent-api"])
@@ -58,6 +64,7 @@ async def agent_search_products(
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     in_stock_only: bool = True,
+    in_stock: Optional[bool] = Query(None, description="SDK alias of in_stock_only"),
     limit: int = Query(default=20, le=100),
     offset: int = Query(default=0, ge=0),
     context: AgentContext = Depends(get_agent_context),
@@ -74,6 +81,8 @@ async def agent_search_products(
     - 分页支持
     - 相关度评分
     """
+    if in_stock is not None:
+        in_stock_only = in_stock
     try:
         # Determine which merchants to search
         merchants_to_search = []
@@ -101,83 +110,59 @@ async def agent_search_products(
             merchant_rows = await database.fetch_all(query_merchants)
             merchants_to_search = [row["merchant_id"] for row in merchant_rows]
         
-        # Collect products from all target merchants
-        all_products = []
-        
-        for mid in merchants_to_search:
-            try:
-                # Verify merchant is active
-                merchant = await verify_merchant_active(mid)
-                
-                # Get cached products
-                cached_products = await get_cached_products(mid)
-                
-                if cached_products and cached_products.get("products"):
-                    # Add merchant info to each product
-                    for product in cached_products["products"]:
-                        product["merchant_id"] = mid
-                        product["merchant_name"] = merchant.get("business_name", "Unknown")
-                        all_products.append(product)
-            except Exception as e:
-                # Log but continue with other merchants
-                logger.warning(f"Failed to get products from {mid}: {e}")
-                continue
-        
-        # Apply filters and calculate relevance scores
-        filtered_products = []
-        
-        for product in all_products:
-            # 库存过滤
-            if in_stock_only and not product.get("in_stock", True):
-                continue
-            
-            # 价格过滤
-            price = float(product.get("price", 0))
-            if min_price and price < min_price:
-                continue
-            if max_price and price > max_price:
-                continue
-            
-            # 类别过滤
-            if category:
-                product_category = product.get("category", "").lower()
-                if category.lower() not in product_category:
+        merchant_names: Dict[str, str] = {}
+        if merchant_id or merchant_ids:
+            # Verify target merchants are active (one batched query, not one per merchant)
+            records = await get_merchant_onboardings_by_ids(merchants_to_search)
+            for mid in merchants_to_search:
+                merchant = records.get(mid)
+                if not merchant or merchant.get("status") == "deleted":
+                    logger.warning(f"Skipping merchant {mid} in search: not found or deactivated")
                     continue
-            
-            # 搜索查询 + 相关度评分
-            relevance_score = 1.0
-            if query:
-                query_lower = query.lower()
-                title = product.get("title", "").lower()
-                description = product.get("description", "").lower()
-                
-                # Calculate relevance
-                if query_lower in title:
-                    # Exact match in title = high score
-                    relevance_score = 1.0 if query_lower == title else 0.9
-                elif query_lower in description:
-                    relevance_score = 0.7
-                else:
-                    # Check for partial word matches
-                    query_words = query_lower.split()
-                    matches = sum(1 for word in query_words if word in title or word in description)
-                    if matches > 0:
-                        relevance_score = 0.5 + (matches / len(query_words)) * 0.3
-                    else:
-                        continue  # No match, skip product
-                
-                product["relevance_score"] = relevance_score
-            else:
-                product["relevance_score"] = 1.0
-            
-            filtered_products.append(product)
-        
-        # Sort by relevance score (highest first)
-        filtered_products.sort(key=lambda p: p.get("relevance_score", 0), reverse=True)
+                merchant_names[mid] = merchant.get("business_name") or "Unknown"
+        else:
+            # Already filtered by status above
+            merchant_names = {row["merchant_id"]: row["business_name"] or "Unknown" for row in merchant_rows}
+        
+        # Filter, rank (BM25) and page via the in-memory product index.
+        # If the full build hasn't finished, load only the target merchants
+        # concurrently with a per-merchant deadline and answer with what arrived.
+        index = get_product_index()
+        merchants_timed_out: List[str] = []
+        if not index.built:
+            index.schedule_build()
+            cold = [mid for mid in merchant_names if not index.has_merchant(mid)]
+            fanned = await fan_out(
+                cold,
+                index.load_merchant,
+                timeout=settings.search_merchant_timeout_ms / 1000.0,
+                concurrency=settings.search_fanout_concurrency or None
+            )
+            merchants_timed_out = fanned.timed_out
+            if fanned.timed_out or fanned.failed:
+                logger.warning(
+                    f"Product search partial: {len(fanned.timed_out)} merchants timed out, "
+                    f"{len(fanned.failed)} failed"
+                )
+        
+        hits, total = index.search(
+            merchant_ids=merchant_names.keys(),
+            query=query,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            in_stock_only=in_stock_only,
+            limit=limit,
+            offset=offset
+        )
         
-        # Pagination
-        total = len(filtered_products)
-        paginated_products = filtered_products[offset:offset + limit]
+        paginated_products = []
+        for relevance_score, product, mid in hits:
+            product = dict(product)
+            product["merchant_id"] = mid
+            product["merchant_name"] = merchant_names.get(mid, "Unknown")
+            product["relevance_score"] = relevance_score
+            paginated_products.append(product)
         
         # Record request
         background_tasks.add_task(
@@ -191,6 +176,7 @@ async def agent_search_products(
             "status": "success",
             "products": paginated_products,
             "pagination": {
+                "total": total,
                 "total_count": total,
                 "limit": limit,
                 "offset": offset,
@@ -202,6 +188,7 @@ async def agent_search_products(
                 "merchant_id": merchant_id,
                 "merchant_ids": merchant_ids,
                 "merchants_searched": len(merchants_to_search),
+                "merchants_timed_out": merchants_timed_out,
                 "cross_merchant_search": merchant_id is None and not merchant_ids
             },
             "filters_applied": {
@@ -411,13 +398,28 @@ async def agent_validate_cart(
 async def agent_create_order(
     order_request: CreateOrderRequest,
     context: AgentContext = Depends(get_agent_context),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     创建订单（代理标准订单创建流程）
     
     自动添加 Agent 追踪信息
+    带 Idempotency-Key 的重试直接回放首次成功的响应（不会重复建单 / 创建支付意图）
     """
+    return await run_idempotent(
+        f"agent_orders:{context.agent_id}",
+        idempotency_key,
+        order_request,
+        lambda: _create_agent_order(order_request, context, background_tasks)
+    )
+
+
+async def _create_agent_order(
+    order_request: CreateOrderRequest,
+    context: AgentContext,
+    background_tasks: BackgroundTasks
+) -> Dict[str, Any]:
     try:
         # 验证商户访问权限
         if not context.can_access_merchant(order_request.merchant_id):
@@ -553,42 +555,40 @@ async def agent_list_orders(
     merchant_id: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = Query(default=20, le=100),
-    offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    offset: int = Query(default=0, ge=0, description="Deprecated: use cursor"),
     context: AgentContext = Depends(get_agent_context),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     """
     列出 Agent 创建的订单
     
-    可以按商户或状态过滤
+    可以按商户或状态过滤；按 created_at 倒序，用 next_cursor 翻页
     """
     try:
         # 如果指定了商户，验证访问权限
         if merchant_id and not context.can_access_merchant(merchant_id):
             raise HTTPException(status_code=403, detail="Not authorized for this merchant")
         
-        # 构建查询 - use agent_id column directly
-        query = f"""
-            SELECT * FROM orders 
-            WHERE agent_id = :agent_id
-        """
-        params = {"agent_id": context.agent_id}
-        
-        if merchant_id:
-            query += " AND merchant_id = :merchant_id"
-            params["merchant_id"] = merchant_id
-        
-        if status:
-            query += " AND status = :status"
-            params["status"] = status
-        
-        query += " ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
-        params["limit"] = limit
-        params["offset"] = offset
+        try:
+            after = decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # 执行查询
-        from db.database import database
-        orders = await database.fetch_all(query, params)
+        orders, has_more = await get_orders_page(
+            agent_id=context.agent_id,
+            merchant_id=merchant_id,
+            status=status,
+            limit=limit,
+            after=after,
+            offset=offset
+        )
+        # 总数只在第一页给出，且是查询计划的估计值（不做 COUNT(*)）
+        estimated_total = None
+        if after is None:
+            estimated_total = await estimate_order_count(
+                agent_id=context.agent_id, merchant_id=merchant_id, status=status
+            )
         
         # 记录请求
         background_tasks.add_task(
@@ -598,9 +598,16 @@ async def agent_list_orders(
             merchant_id=merchant_id
         )
         
+        last = orders[-1] if orders else None
+        next_cursor = encode_cursor(last["created_at"], last["order_id"]) if has_more else None
         return {
             "status": "success",
             "total": len(orders),
+            "estimated_total": estimated_total,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            # Shape read by the published SDK
+            "pagination": {"limit": limit, "offset": offset, "has_more": has_more, "next_cursor": next_cursor},
             "orders": [
                 {
                     "order_id": order["order_id"],
@@ -12,12 +12,11 @@ from datetime import datetime
 
 from db.agents import (
     get_agent_by_key,
-    check_rate_limit,
-    check_daily_quota,
     log_agent_usage,
-    update_agent_stats
+    queue_agent_stats
 )
 from utils.logger import logger
+from utils.quota_counter import consume_agent_request
 
 
 # API Key Header
@@ -101,28 +100,28 @@ async def get_agent_context(
             detail="Agent is deactivated"
         )
     
-    # 5. 检查速率限制
-    rate_ok, current, limit = await check_rate_limit(agent["agent_id"])
-    if not rate_ok:
+    # 5/6. 速率限制 + 每日配额（一次 O(1) 计数）
+    # RateLimitMiddleware 已为本请求计数时直接复用其结果，避免重复计数
+    decision = getattr(request.state, "quota_decision", None)
+    if decision is None:
+        decision = await consume_agent_request(agent)
+    if decision.reason == "rate_limit":
         raise HTTPException(
             status_code=429,
-            detail=f"Rate limit exceeded: {current}/{limit} requests per minute",
+            detail=f"Rate limit exceeded: {decision.minute_count}/{decision.rate_limit} requests per minute",
             headers={
-                "X-RateLimit-Limit": str(limit),
-                "X-RateLimit-Remaining": str(max(0, limit - current)),
-                "X-RateLimit-Reset": str(int(time.time()) + 60)
+                "X-RateLimit-Limit": str(decision.rate_limit),
+                "X-RateLimit-Remaining": str(decision.rate_remaining),
+                "X-RateLimit-Reset": str(decision.reset_at)
             }
         )
-    
-    # 6. 检查每日配额
-    quota_ok, used, quota = await check_daily_quota(agent["agent_id"])
-    if not quota_ok:
+    if decision.reason == "daily_quota":
         raise HTTPException(
             status_code=429,
-            detail=f"Daily quota exceeded: {used}/{quota} requests",
+            detail=f"Daily quota exceeded: {decision.day_count}/{decision.daily_quota} requests",
             headers={
-                "X-Quota-Limit": str(quota),
-                "X-Quota-Remaining": str(max(0, quota - used)),
+                "X-Quota-Limit": str(decision.daily_quota),
+                "X-Quota-Remaining": str(decision.quota_remaining),
                 "X-Quota-Reset": "00:00 UTC"
             }
         )
@@ -130,8 +129,8 @@ async def get_agent_context(
     # 7. 创建上下文
     context = AgentContext(agent, request)
     
-    # 8. 更新使用统计（异步，不阻塞）
-    await update_agent_stats(agent["agent_id"], increment_requests=1)
+    # 8. 更新使用统计（批量合并写入，不阻塞）
+    await queue_agent_stats(agent["agent_id"], increment_requests=1)
     
     logger.info(f"Agent {agent['agent_name']} authenticated for {request.url.path}")
     
@@ -195,7 +194,7 @@ async def log_agent_request(
     
     # 如果创建了订单，更新统计
     if order_id and status_code < 400:
-        await update_agent_stats(
+        await queue_agent_stats(
             context.agent_id,
             increment_orders=1,
             add_gmv=order_amount or 0
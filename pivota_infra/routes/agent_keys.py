@@ -11,6 +11,7 @@ from pydantic import BaseModel
 
 from db.database import database
 from utils.auth import get_current_user
+from utils.agent_cache import notify_agent_changed
 
 router = APIRouter(prefix="/agents", tags=["agent-keys"])
 
@@ -221,6 +222,8 @@ async def revoke_agent_api_key(
         
         if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="API key not found")
+
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -257,6 +260,7 @@ async def reset_agent_api_key(
             """,
             {"api_key": new_api_key, "agent_id": agent_id}
         )
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -17,6 +17,7 @@ from db.agents import (
 from db.database import database
 from utils.auth import require_admin, get_current_employee, get_current_user, verify_jwt_token
 from utils.logger import logger
+from utils.agent_cache import notify_agent_changed
 
 
 router = APIRouter(prefix="/agents", tags=["agent-management"])
@@ -144,6 +145,7 @@ async def update_agent(
         # 执行更新
         query = agents.update().where(agents.c.agent_id == agent_id).values(**update_data)
         await database.execute(query)
+        await notify_agent_changed(agent_id)
         
         logger.info(f"Agent {agent_id} updated by admin {admin_user['user_id']}")
         
@@ -177,6 +179,7 @@ async def deactivate_agent(
             updated_at=datetime.utcnow()
         )
         await database.execute(query)
+        await notify_agent_changed(agent_id)
         
         logger.info(f"Agent {agent_id} deactivated by admin {admin_user['user_id']}")
         
@@ -395,6 +398,7 @@ async def reset_agent_api_key(
             updated_at=datetime.utcnow()
         )
         await database.execute(query)
+        await notify_agent_changed(agent_id)
         
         logger.info(f"API Key reset for agent {agent_id} by admin {admin_user['user_id']}")
         
@@ -1,16 +1,30 @@
 """
 Agent API Metrics and Monitoring
-Real-time metrics from agent_usage_logs table
+Real-time metrics from the agent usage rollups (recent activity from agent_usage_logs)
 """
 from fastapi import APIRouter, Depends, Query, Request
 from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import time
 from db.database import database
+from db.usage_rollups import (
+    get_usage_by_agent, get_usage_by_endpoint, get_usage_by_status, get_usage_timeline, get_usage_totals
+)
 from utils.auth import require_admin, get_current_user
+from utils.latency_histogram import LatencyHistogram
+from utils.usage_latency import (
+    ALL_KEY, get_usage_latency_recorder, load_hourly_latency, load_latency_histograms
+)
 
 router = APIRouter(prefix="/agent/metrics", tags=["Agent Metrics"])
 
 
+def _latency_fields(histogram: Optional[LatencyHistogram]) -> Dict[str, float]:
+    """p50/p95/p99 response time from the merged latency histogram"""
+    percentiles = (histogram or LatencyHistogram()).percentiles()
+    return {f"{label}_response_time_ms": value for label, value in percentiles.items()}
+
+
 @router.get("/summary")
 async def get_metrics_summary(request: Request) -> Dict[str, Any]:
     """
@@ -24,72 +38,28 @@ async def get_metrics_summary(request: Request) -> Dict[str, Any]:
         last_24h = now - timedelta(hours=24)
         last_7d = now - timedelta(days=7)
         
-        # Total requests (all time)
-        total_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs"
-        ) or 0
-        
-        # Last hour requests
-        hour_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-            {"since": last_hour}
-        ) or 0
-        
-        # Last 24h requests
-        day_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-            {"since": last_24h}
-        ) or 0
+        # Request counts per window (minute / hour rollups)
+        all_time = await get_usage_totals(None)
+        hour = await get_usage_totals(last_hour)
+        day = await get_usage_totals(last_24h)
+        week = await get_usage_totals(last_7d)
         
         # Success rate (last 24h)
-        success_count = await database.fetch_val(
-            """SELECT COUNT(*) FROM agent_usage_logs 
-               WHERE timestamp >= :since AND status_code < 400""",
-            {"since": last_24h}
-        ) or 0
-        success_rate = (success_count / day_requests * 100) if day_requests > 0 else 100
+        day_requests = day["requests"]
+        success_rate = (day["successful"] / day_requests * 100) if day_requests > 0 else 100
         
-        # Average response time (last 24h)
-        avg_response_time = await database.fetch_val(
-            """SELECT AVG(response_time_ms) FROM agent_usage_logs 
-               WHERE timestamp >= :since AND response_time_ms IS NOT NULL""",
-            {"since": last_24h}
-        ) or 0
+        # Tail latency (last 24h) from the per-instance histograms
+        since_24h = time.time() - 24 * 3600
+        overall_latency = (await load_latency_histograms("all", since_24h, [ALL_KEY])).get(ALL_KEY)
         
         # Top endpoints (last 24h)
-        top_endpoints = await database.fetch_all(
-            """SELECT endpoint, COUNT(*) as count 
-               FROM agent_usage_logs 
-               WHERE timestamp >= :since 
-               GROUP BY endpoint 
-               ORDER BY count DESC 
-               LIMIT 10""",
-            {"since": last_24h}
+        top_endpoints = await get_usage_by_endpoint(last_24h, limit=10)
+        endpoint_latency = await load_latency_histograms(
+            "endpoint", since_24h, [row["endpoint"] for row in top_endpoints]
         )
         
-        # Active agents (last 24h)
-        active_agents = await database.fetch_val(
-            """SELECT COUNT(DISTINCT agent_id) FROM agent_usage_logs 
-               WHERE timestamp >= :since""",
-            {"since": last_24h}
-        ) or 0
-        
         # Error breakdown (last 24h)
-        errors = await database.fetch_all(
-            """SELECT status_code, COUNT(*) as count 
-               FROM agent_usage_logs 
-               WHERE timestamp >= :since AND status_code >= 400
-               GROUP BY status_code 
-               ORDER BY count DESC""",
-            {"since": last_24h}
-        )
-        
-        # Orders created (last 24h)
-        orders_count = await database.fetch_val(
-            """SELECT COUNT(*) FROM agent_usage_logs 
-               WHERE timestamp >= :since AND endpoint LIKE '%/orders%' AND status_code < 300""",
-            {"since": last_24h}
-        ) or 0
+        errors = await get_usage_by_status(last_24h, min_status=400)
         
         # Revenue (last 24h) - derive from orders table to avoid dependency on logs columns
         revenue = await database.fetch_val(
@@ -102,27 +72,29 @@ async def get_metrics_summary(request: Request) -> Dict[str, Any]:
             "status": "healthy",
             "timestamp": now.isoformat(),
             "overview": {
-                "total_requests": total_requests,
-                "requests_last_hour": hour_requests,
+                "total_requests": all_time["requests"],
+                "requests_last_hour": hour["requests"],
                 "requests_last_24h": day_requests,
-                "requests_last_7d": await database.fetch_val(
-                    "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-                    {"since": last_7d}
-                ) or 0,
+                "requests_last_7d": week["requests"],
             },
             "performance": {
                 "success_rate_24h": round(success_rate, 2),
-                "avg_response_time_ms": round(float(avg_response_time), 2) if avg_response_time else 0,
+                "avg_response_time_ms": round(day["avg_response_time_ms"], 2),
+                **_latency_fields(overall_latency),
             },
             "agents": {
-                "active_last_24h": active_agents,
+                "active_last_24h": day["active_agents"],
             },
             "orders": {
-                "count_last_24h": orders_count,
+                "count_last_24h": day["order_requests"],
                 "revenue_last_24h": float(revenue),
             },
             "top_endpoints": [
-                {"endpoint": row["endpoint"], "count": row["count"]} 
+                {
+                    "endpoint": row["endpoint"],
+                    "count": row["count"],
+                    **_latency_fields(endpoint_latency.get(row["endpoint"])),
+                }
                 for row in top_endpoints
             ],
             "errors": [
@@ -149,25 +121,29 @@ async def get_agent_metrics(current_user: dict = Depends(require_admin)) -> Dict
         
         agents = await database.fetch_all(
             """
-            SELECT 
-                a.agent_id,
-                a.name,
-                a.company,
-                a.status,
-                COUNT(l.id) as request_count,
-                AVG(l.response_time_ms) as avg_response_time,
-                SUM(CASE WHEN l.status_code < 400 THEN 1 ELSE 0 END)::float / 
-                    NULLIF(COUNT(l.id), 0) * 100 as success_rate,
-                MAX(l.timestamp) as last_active
-            FROM agents a
-            LEFT JOIN agent_usage_logs l ON a.agent_id = l.agent_id 
-                AND l.timestamp >= :since
-            WHERE a.status = 'active'
-            GROUP BY a.agent_id, a.name, a.company, a.status
-            ORDER BY request_count DESC
-            """,
-            {"since": last_24h}
+            SELECT agent_id, name, company, status
+            FROM agents
+            WHERE status = 'active'
+            """
+        )
+        usage = await get_usage_by_agent(last_24h)
+        agents = sorted(
+            agents, key=lambda row: (usage.get(row["agent_id"]) or {}).get("request_count") or 0, reverse=True
         )
+        agent_latency = await load_latency_histograms(
+            "agent", time.time() - 24 * 3600, [row["agent_id"] for row in agents]
+        )
+        
+        def _metrics(agent_id: str) -> Dict[str, Any]:
+            stats = usage.get(agent_id) or {}
+            requests = stats.get("request_count") or 0
+            return {
+                "request_count": requests,
+                "avg_response_time_ms": round(float(stats.get("avg_response_time") or 0), 2),
+                **_latency_fields(agent_latency.get(agent_id)),
+                "success_rate": round((stats.get("successful") or 0) / requests * 100, 2) if requests else 100.0,
+                "last_active": stats["last_active"].isoformat() if stats.get("last_active") else None,
+            }
         
         return {
             "agents": [
@@ -176,12 +152,7 @@ async def get_agent_metrics(current_user: dict = Depends(require_admin)) -> Dict
                     "name": row["name"],
                     "company": row["company"],
                     "status": row["status"],
-                    "metrics_24h": {
-                        "request_count": row["request_count"],
-                        "avg_response_time_ms": round(float(row["avg_response_time"] or 0), 2),
-                        "success_rate": round(float(row["success_rate"] or 100), 2),
-                        "last_active": row["last_active"].isoformat() if row["last_active"] else None,
-                    }
+                    "metrics_24h": _metrics(row["agent_id"]),
                 }
                 for row in agents
             ],
@@ -206,28 +177,17 @@ async def get_metrics_timeline(
     try:
         since = datetime.now() - timedelta(hours=hours)
         
-        timeline = await database.fetch_all(
-            """
-            SELECT 
-                DATE_TRUNC('hour', timestamp) as hour,
-                COUNT(*) as total_requests,
-                SUM(CASE WHEN status_code < 400 THEN 1 ELSE 0 END) as successful_requests,
-                AVG(response_time_ms) as avg_response_time
-            FROM agent_usage_logs
-            WHERE timestamp >= :since
-            GROUP BY DATE_TRUNC('hour', timestamp)
-            ORDER BY hour DESC
-            """,
-            {"since": since}
-        )
+        timeline = await get_usage_timeline(since, period="hour")
+        hourly_latency = await load_hourly_latency(time.time() - hours * 3600)
         
         return {
             "timeline": [
                 {
-                    "hour": row["hour"].isoformat(),
-                    "total_requests": row["total_requests"],
-                    "successful_requests": row["successful_requests"],
+                    "hour": row["bucket"].isoformat(),
+                    "total_requests": row["requests"],
+                    "successful_requests": row["successful"] or 0,
                     "avg_response_time_ms": round(float(row["avg_response_time"] or 0), 2),
+                    **_latency_fields(hourly_latency.get(_utc_hour(row["bucket"]))),
                 }
                 for row in timeline
             ],
@@ -242,6 +202,48 @@ async def get_metrics_timeline(
         }
 
 
+def _utc_hour(hour: datetime) -> datetime:
+    """DATE_TRUNC hour as a naive UTC datetime (the histogram hour key)"""
+    if hour.tzinfo is not None:
+        hour = hour.astimezone(timezone.utc).replace(tzinfo=None)
+    return hour
+
+
+@router.get("/latency")
+async def get_latency_percentiles(
+    scope: str = Query("endpoint", regex="^(all|agent|endpoint)$"),
+    hours: int = Query(24, ge=1, le=24),
+    include_histograms: bool = False,
+    current_user: dict = Depends(require_admin)
+) -> Dict[str, Any]:
+    """
+    Tail latency per agent / endpoint, merged across instances
+    include_histograms=true also returns the serialized histograms so they
+    can be merged with other deployments
+    """
+    try:
+        histograms = await load_latency_histograms(scope, time.time() - hours * 3600)
+        items = []
+        for key, histogram in sorted(histograms.items(), key=lambda item: -item[1].count):
+            item = {"key": key, **histogram.summary()}
+            if include_histograms:
+                item["histogram"] = histogram.to_dict()
+            items.append(item)
+        return {
+            "scope": scope,
+            "period_hours": hours,
+            "items": items,
+            "recorder": get_usage_latency_recorder().stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+
+
 @router.get("/health")
 async def get_system_health() -> Dict[str, Any]:
     """
@@ -255,16 +257,12 @@ async def get_system_health() -> Dict[str, Any]:
         
         # Get recent error rate
         last_hour = datetime.now() - timedelta(hours=1)
-        total = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-            {"since": last_hour}
-        ) or 1
-        errors = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since AND status_code >= 500",
-            {"since": last_hour}
-        ) or 0
+        hour = await get_usage_totals(last_hour)
+        total = hour["requests"] or 1
+        errors = hour["server_errors"]
         
         error_rate = (errors / total * 100) if total > 0 else 0
+        hour_latency = (await load_latency_histograms("all", time.time() - 3600, [ALL_KEY])).get(ALL_KEY)
         
         return {
             "status": "healthy" if error_rate < 5 else "degraded",
@@ -276,6 +274,7 @@ async def get_system_health() -> Dict[str, Any]:
             "metrics": {
                 "requests_last_hour": total,
                 "error_rate_last_hour": round(error_rate, 2),
+                "p99_response_time_ms_last_hour": _latency_fields(hour_latency)["p99_response_time_ms"],
             }
         }
         
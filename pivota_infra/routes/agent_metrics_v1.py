@@ -6,6 +6,7 @@ from fastapi import APIRouter, Query, Request
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from db.database import database
+from db.usage_rollups import get_usage_by_endpoint, get_usage_timeline, get_usage_totals
 
 router = APIRouter(prefix="/agent/v1/metrics", tags=["Agent Metrics V1"])
 
@@ -18,48 +19,15 @@ async def get_metrics_summary_v1(request: Request) -> Dict[str, Any]:
         last_24h = now - timedelta(hours=24)
         last_7d = now - timedelta(days=7)
 
-        total_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs"
-        ) or 0
-
-        hour_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-            {"since": last_hour}
-        ) or 0
-
-        day_requests = await database.fetch_val(
-            "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-            {"since": last_24h}
-        ) or 0
-
-        success_count = await database.fetch_val(
-            """SELECT COUNT(*) FROM agent_usage_logs 
-               WHERE timestamp >= :since AND status_code < 400""",
-            {"since": last_24h}
-        ) or 0
-        success_rate = (success_count / day_requests * 100) if day_requests > 0 else 100
-
-        avg_response_time = await database.fetch_val(
-            """SELECT AVG(response_time_ms) FROM agent_usage_logs 
-               WHERE timestamp >= :since AND response_time_ms IS NOT NULL""",
-            {"since": last_24h}
-        ) or 0
+        all_time = await get_usage_totals(None)
+        hour = await get_usage_totals(last_hour)
+        day = await get_usage_totals(last_24h)
+        week = await get_usage_totals(last_7d)
 
-        top_endpoints = await database.fetch_all(
-            """SELECT endpoint, COUNT(*) as count 
-               FROM agent_usage_logs 
-               WHERE timestamp >= :since 
-               GROUP BY endpoint 
-               ORDER BY count DESC 
-               LIMIT 10""",
-            {"since": last_24h}
-        )
+        day_requests = day["requests"]
+        success_rate = (day["successful"] / day_requests * 100) if day_requests > 0 else 100
 
-        active_agents = await database.fetch_val(
-            """SELECT COUNT(DISTINCT agent_id) FROM agent_usage_logs 
-               WHERE timestamp >= :since""",
-            {"since": last_24h}
-        ) or 0
+        top_endpoints = await get_usage_by_endpoint(last_24h, limit=10)
 
         # Revenue from orders table (last 24h)
         revenue = await database.fetch_val(
@@ -72,27 +40,20 @@ async def get_metrics_summary_v1(request: Request) -> Dict[str, Any]:
             "status": "healthy",
             "timestamp": now.isoformat(),
             "overview": {
-                "total_requests": total_requests,
-                "requests_last_hour": hour_requests,
+                "total_requests": all_time["requests"],
+                "requests_last_hour": hour["requests"],
                 "requests_last_24h": day_requests,
-                "requests_last_7d": await database.fetch_val(
-                    "SELECT COUNT(*) FROM agent_usage_logs WHERE timestamp >= :since",
-                    {"since": last_7d}
-                ) or 0,
+                "requests_last_7d": week["requests"],
             },
             "performance": {
                 "success_rate_24h": round(success_rate, 2),
-                "avg_response_time_ms": round(float(avg_response_time), 2) if avg_response_time else 0,
+                "avg_response_time_ms": round(day["avg_response_time_ms"], 2),
             },
             "agents": {
-                "active_last_24h": active_agents,
+                "active_last_24h": day["active_agents"],
             },
             "orders": {
-                "count_last_24h": await database.fetch_val(
-                    """SELECT COUNT(*) FROM agent_usage_logs 
-                       WHERE timestamp >= :since AND endpoint LIKE '%/orders%' AND status_code < 300""",
-                    {"since": last_24h}
-                ) or 0,
+                "count_last_24h": day["order_requests"],
                 "revenue_last_24h": float(revenue),
             },
             "top_endpoints": [
@@ -166,26 +127,13 @@ async def get_recent_activity_v1(
 async def get_metrics_timeline_v1(hours: int = 24) -> Dict[str, Any]:
     try:
         since = datetime.now() - timedelta(hours=hours)
-        timeline = await database.fetch_all(
-            """
-            SELECT 
-                DATE_TRUNC('hour', timestamp) as hour,
-                COUNT(*) as total_requests,
-                SUM(CASE WHEN status_code < 400 THEN 1 ELSE 0 END) as successful_requests,
-                AVG(response_time_ms) as avg_response_time
-            FROM agent_usage_logs
-            WHERE timestamp >= :since
-            GROUP BY DATE_TRUNC('hour', timestamp)
-            ORDER BY hour DESC
-            """,
-            {"since": since}
-        )
+        timeline = await get_usage_timeline(since, period="hour")
         return {
             "timeline": [
                 {
-                    "hour": row["hour"].isoformat(),
-                    "total_requests": row["total_requests"],
-                    "successful_requests": row["successful_requests"],
+                    "hour": row["bucket"].isoformat(),
+                    "total_requests": row["requests"],
+                    "successful_requests": row["successful"] or 0,
                     "avg_response_time_ms": round(float(row["avg_response_time"] or 0), 2),
                 }
                 for row in timeline
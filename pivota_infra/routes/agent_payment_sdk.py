@@ -2,7 +2,7 @@
 Unified Payment Endpoint for Agent SDK
 Provides production-ready payment processing with PSP integration
 """
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 from decimal import Decimal
@@ -13,6 +13,7 @@ from db.merchant_onboarding import get_merchant_onboarding
 from db.orders import get_order, update_payment_info
 from adapters.psp_adapter import get_psp_adapter
 from adapters.multi_psp_orchestrator import MultiPSPOrchestrator
+from utils.idempotency import psp_idempotency_key, run_idempotent
 from utils.logger import logger
 
 router = APIRouter(prefix="/agent/v1", tags=["agent-payments"])
@@ -63,7 +64,8 @@ class PaymentResponse(BaseModel):
 async def create_payment(
     request: PaymentRequest,
     context: AgentContext = Depends(get_agent_context),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Create payment for an order
@@ -78,9 +80,24 @@ async def create_payment(
     Features:
     - Automatic PSP failover
     - 3DS authentication support
-    - Idempotency protection
+    - Idempotency protection (Idempotency-Key header or body field; retries replay the first response)
     - Payment retry logic
     """
+    if idempotency_key and not request.idempotency_key:
+        request.idempotency_key = idempotency_key
+    return await run_idempotent(
+        f"agent_payments:{context.agent_id}",
+        request.idempotency_key,
+        request,
+        lambda: _create_payment(request, context, background_tasks)
+    )
+
+
+async def _create_payment(
+    request: PaymentRequest,
+    context: AgentContext,
+    background_tasks: BackgroundTasks
+) -> PaymentResponse:
     try:
         # 1. Get order and validate
         order = await get_order(request.order_id)
@@ -96,7 +113,7 @@ async def create_payment(
         if not context.can_access_merchant(merchant_id):
             raise HTTPException(status_code=403, detail="Not authorized for this merchant")
         
-        # 3. Check idempotency
+        # 3. Check idempotency (payments written before the replay cache, or after its TTL)
         if request.idempotency_key:
             # Check if payment with this key already exists
             from db.database import database
@@ -137,7 +154,11 @@ async def create_payment(
                 "agent_id": context.agent_id,
                 "payment_method_type": request.payment_method.type,
                 "idempotency_key": request.idempotency_key
-            }
+            },
+            idempotency_key=(
+                psp_idempotency_key(context.agent_id, request.idempotency_key)
+                if request.idempotency_key else None
+            )
         )
         
         if not success:
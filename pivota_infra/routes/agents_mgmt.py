@@ -7,6 +7,7 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 from utils.auth import get_current_user
 from db.database import database
+from utils.agent_cache import notify_agent_changed
 import uuid
 import secrets
 
@@ -213,6 +214,7 @@ async def reset_agent_api_key(
             "api_key": new_api_key,
             "agent_id": agent_id
         })
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -240,6 +242,7 @@ async def deactivate_agent(
         """
         
         await database.execute(update_query, {"agent_id": agent_id})
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -290,6 +293,7 @@ async def update_agent(
         """
         
         await database.execute(update_query, params)
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -9,53 +9,15 @@ import logging
 from typing import Optional, Dict, Any
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
 from realtime.metrics_store import snapshot
+from realtime.ws_manager import get_connection_manager
 from utils.auth import verify_jwt_token
 
 logger = logging.getLogger("auth_ws_routes")
 
 router = APIRouter(prefix="/api", tags=["authenticated-websocket"])
 
-# Simple connection manager for authenticated WebSockets
-class AuthConnectionManager:
-    def __init__(self):
-        self.active_connections = []
-        self.connection_metadata = {}
-    
-    async def connect(self, websocket: WebSocket, user_info: Dict[str, Any]):
-        await websocket.accept()
-        connection_id = f"auth_conn_{int(time.time() * 1000)}"
-        
-        self.active_connections.append(websocket)
-        self.connection_metadata[connection_id] = {
-            "websocket": websocket,
-            "user_info": user_info,
-            "connected_at": time.time()
-        }
-        
-        logger.info(f"Authenticated WebSocket connection {connection_id} established for user {user_info.get('user_id')} with role {user_info.get('role')}")
-        return connection_id
-    
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"Authenticated WebSocket disconnected. Total connections: {len(self.active_connections)}")
-    
-    async def send_json(self, websocket: WebSocket, data: Dict[str, Any]):
-        try:
-            await websocket.send_text(json.dumps(data))
-        except Exception as e:
-            logger.error(f"Failed to send message: {e}")
-            self.disconnect(websocket)
-    
-    async def broadcast(self, data: Dict[str, Any]):
-        for connection in self.active_connections.copy():
-            try:
-                await self.send_json(connection, data)
-            except:
-                self.disconnect(connection)
-
-# Global auth connection manager
-auth_manager = AuthConnectionManager()
+# Shared fan-out manager (per-connection send queues; see realtime.ws_manager)
+auth_manager = get_connection_manager()
 
 @router.websocket("/ws/auth")
 async def authenticated_websocket(websocket: WebSocket, token: Optional[str] = Query(None)):
@@ -88,7 +50,7 @@ async def authenticated_websocket(websocket: WebSocket, token: Optional[str] = Q
             logger.info("Anonymous WebSocket connection established")
         
         # Connect with user info
-        connection_id = await auth_manager.connect(websocket, user_info)
+        connection_id = await auth_manager.connect(websocket, user_info=user_info)
         
         # Send initial snapshot
         initial_snapshot = snapshot()
@@ -5,6 +5,7 @@ Create test agent account with API key
 from fastapi import APIRouter
 import secrets
 from db.database import database
+from utils.agent_cache import notify_agent_changed
 from utils.auth import hash_password
 
 router = APIRouter(prefix="/admin/create", tags=["admin-create"])
@@ -61,6 +62,7 @@ async def create_test_agent_account():
                     "status": "active"
                 }
             )
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, Depends
 from db.database import database
 from utils.auth import get_current_user
+from utils.merchant_context import notify_merchant_changed
 
 router = APIRouter()
 
@@ -66,6 +67,7 @@ async def test_insert(current_user: dict = Depends(get_current_user)):
             VALUES ('test_psp_001', 'merch_6b90dc9838d5fd9c', 'stripe', 'Test Stripe', 'sk_test_123', 'active')
             ON CONFLICT (psp_id) DO NOTHING
         """)
+        await notify_merchant_changed("merch_6b90dc9838d5fd9c")
         
         return {"status": "success", "message": "Test records inserted"}
     except Exception as e:
@@ -8,6 +8,7 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from utils.auth import get_current_user
 from db.database import database
+from utils.agent_cache import notify_agent_changed
 import uuid
 import secrets
 import random
@@ -269,6 +270,7 @@ async def reset_agent_api_key(
                 "agent_id": agent_id
             }
         )
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -313,6 +315,7 @@ async def deactivate_agent(
                 "agent_id": agent_id
             }
         )
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -355,6 +358,7 @@ async def activate_agent(
                 "agent_id": agent_id
             }
         )
+        await notify_agent_changed(agent_id)
         
         return {
             "status": "success",
@@ -7,6 +7,8 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from utils.auth import get_current_user
 from db.database import database
+from db.orders import estimate_order_count
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
 import random
 
 router = APIRouter()
@@ -226,27 +228,41 @@ async def get_system_status(
 @router.get("/transactions")
 async def get_all_transactions(
     limit: int = Query(default=50, ge=1, le=200),
-    offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    offset: int = Query(default=0, ge=0, description="Deprecated: use cursor"),
     status: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all transactions across all merchants"""
+    """Get all transactions across all merchants (newest first, paged by cursor)"""
     if current_user["role"] not in ["employee", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Build query with optional status filter
-        where_clause = ""
+        conditions = []
         params = {}
         
         if status:
-            where_clause = "WHERE status = :status"
+            conditions.append("o.status = :status")
             params["status"] = status
         
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM orders {where_clause}"
-        count_result = await database.fetch_one(count_query, params)
-        total = count_result["total"] if count_result else 0
+        # Planner estimate instead of COUNT(*): exact counts scan the whole orders table
+        total = await estimate_order_count(status=status)
+        
+        # Keyset page: rows strictly after the cursor in (created_at, order_id) order
+        if after:
+            conditions.append("(o.created_at, o.order_id) < (:after_created_at, :after_order_id)")
+            params["after_created_at"], params["after_order_id"] = after
+            page_clause = "LIMIT :limit"
+        else:
+            page_clause = "LIMIT :limit OFFSET :offset"
+            params["offset"] = offset
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         
         # Get transactions
         transactions_query = f"""
@@ -258,14 +274,15 @@ async def get_all_transactions(
             FROM orders o
             LEFT JOIN merchant_onboarding m ON o.merchant_id = m.merchant_id
             {where_clause}
-            ORDER BY o.created_at DESC
-            LIMIT :limit OFFSET :offset
+            ORDER BY o.created_at DESC, o.order_id DESC
+            {page_clause}
         """
         
-        params["limit"] = limit
-        params["offset"] = offset
+        params["limit"] = limit + 1
         
         rows = await database.fetch_all(transactions_query, params)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         transactions = []
         for row in rows:
@@ -285,13 +302,17 @@ async def get_all_transactions(
                 "created_at": row["created_at"].isoformat() if row["created_at"] else None
             })
         
+        last = rows[-1] if rows else None
         return {
             "status": "success",
             "data": {
                 "transactions": transactions,
                 "total": total,
+                "total_is_estimate": True,
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "has_more": has_more,
+                "next_cursor": encode_cursor(last["created_at"], last["order_id"]) if has_more else None
             }
         }
     except Exception as e:
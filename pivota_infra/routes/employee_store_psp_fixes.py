@@ -8,6 +8,7 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 from utils.auth import get_current_user
 from db.database import database
+from utils.merchant_context import notify_merchant_changed
 import uuid
 import json
 
@@ -167,6 +168,7 @@ async def connect_shopify_store(
                 "merchant_id": request.merchant_id
             }
         )
+        await notify_merchant_changed(request.merchant_id)
         
         return {
             "status": "success",
@@ -313,6 +315,7 @@ async def connect_wix_store(
                 "merchant_id": request.merchant_id
             }
         )
+        await notify_merchant_changed(request.merchant_id)
         
         return {
             "status": "success",
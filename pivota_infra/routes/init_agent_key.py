@@ -6,6 +6,7 @@ Temporary admin endpoint
 from fastapi import APIRouter
 import secrets
 from db.database import database
+from utils.agent_cache import notify_agent_changed
 
 router = APIRouter(prefix="/admin/init", tags=["admin-init"])
 
@@ -35,6 +36,7 @@ async def initialize_agent_test_key():
                 """,
                 {"api_key": api_key, "email": "agent@test.com"}
             )
+            await notify_agent_changed(agent["agent_id"])
             
             return {
                 "status": "success",
@@ -60,6 +62,7 @@ async def initialize_agent_test_key():
                     "status": "active"
                 }
             )
+            await notify_agent_changed("agent@test.com")
             
             return {
                 "status": "success",
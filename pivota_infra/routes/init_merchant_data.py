@@ -1,6 +1,7 @@
 """Initialize merchant data for production"""
 from fastapi import APIRouter
 from db.database import database
+from utils.merchant_context import notify_merchant_changed
 from datetime import datetime
 
 router = APIRouter()
@@ -86,6 +87,7 @@ async def init_merchant_data():
             "capabilities": "card,bank_transfer,alipay,wechat_pay",
             "status": "active"
         })
+        await notify_merchant_changed(merchant_id)
         
         # Verify
         verify_query = "SELECT store_url, mcp_connected, mcp_platform FROM merchant_onboarding WHERE merchant_id = :merchant_id"
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import Dict, Any
 from db.database import database
 from utils.auth import get_current_user
+from utils.merchant_context import notify_merchant_changed
 
 router = APIRouter()
 
@@ -48,6 +49,7 @@ async def delete_store(
         # Delete the store
         delete_query = "DELETE FROM merchant_stores WHERE store_id = :store_id AND merchant_id = :merchant_id"
         await database.execute(delete_query, {"store_id": store_id, "merchant_id": merchant_id})
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
@@ -103,6 +105,7 @@ async def update_store(
             WHERE store_id = :store_id AND merchant_id = :merchant_id
         """
         await database.execute(update_query, values)
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
@@ -139,6 +142,7 @@ async def delete_psp(
         # Delete the PSP
         delete_query = "DELETE FROM merchant_psps WHERE psp_id = :psp_id AND merchant_id = :merchant_id"
         await database.execute(delete_query, {"psp_id": psp_id, "merchant_id": merchant_id})
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
@@ -194,6 +198,7 @@ async def update_psp(
             WHERE psp_id = :psp_id AND merchant_id = :merchant_id
         """
         await database.execute(update_query, values)
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
@@ -228,6 +233,7 @@ async def cleanup_integrations(current_user: dict = Depends(get_current_user)):
             "DELETE FROM merchant_psps WHERE merchant_id = :merchant_id AND status = 'inactive'",
             {"merchant_id": merchant_id}
         )
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
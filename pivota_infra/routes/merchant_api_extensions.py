@@ -4,6 +4,7 @@ from typing import Dict, Any, Optional
 from utils.auth import get_current_user
 from datetime import datetime
 from db.database import database
+from utils.merchant_context import notify_merchant_changed
 import httpx
 import os
 import random
@@ -257,6 +258,7 @@ async def connect_psp(
         # Return error instead of success if save fails
         raise HTTPException(status_code=500, detail=f"Failed to save PSP: {str(e)}")
     
+    await notify_merchant_changed(merchant_id)
     return {
         "status": "success",
         "message": f"{provider.capitalize()} connected successfully",
@@ -8,6 +8,8 @@ import string
 import json
 from utils.auth import get_current_user
 from db.database import database
+from db.orders import estimate_order_count
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
 
 router = APIRouter()
 
@@ -325,14 +327,20 @@ async def get_merchant_psps(
 async def get_merchant_orders(
     merchant_id: str,
     limit: int = Query(default=10, ge=1, le=100),
-    offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    offset: int = Query(default=0, ge=0, description="Deprecated: use cursor"),
     status: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get merchant's orders from real database"""
+    """Get merchant's orders from real database (newest first, paged by cursor)"""
     if current_user["role"] not in ["merchant", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Build query with optional status filter
         where_clause = "WHERE merchant_id = :merchant_id"
@@ -342,12 +350,18 @@ async def get_merchant_orders(
             where_clause += " AND status = :status"
             params["status"] = status
         
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM orders {where_clause}"
-        count_result = await database.fetch_one(count_query, params)
-        total = count_result["total"] if count_result else 0
+        # Planner estimate instead of COUNT(*): exact counts scan every matching order
+        total = await estimate_order_count(merchant_id=merchant_id, status=status)
+        
+        # Keyset page: rows strictly after the cursor in (created_at, order_id) order
+        if after:
+            where_clause += " AND (created_at, order_id) < (:after_created_at, :after_order_id)"
+            params["after_created_at"], params["after_order_id"] = after
+            page_clause = "LIMIT :limit"
+        else:
+            page_clause = "LIMIT :limit OFFSET :offset"
+            params["offset"] = offset
         
-        # Get paginated orders
         orders_query = f"""
             SELECT 
                 order_id, merchant_id, store_id, psp_id,
@@ -356,14 +370,15 @@ async def get_merchant_orders(
                 created_at, updated_at
             FROM orders
             {where_clause}
-            ORDER BY created_at DESC
-            LIMIT :limit OFFSET :offset
+            ORDER BY created_at DESC, order_id DESC
+            {page_clause}
         """
         
-        params["limit"] = limit
-        params["offset"] = offset
+        params["limit"] = limit + 1
         
         rows = await database.fetch_all(orders_query, params)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         # Format orders
         orders = []
@@ -383,13 +398,17 @@ async def get_merchant_orders(
                 "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
             })
         
+        last = rows[-1] if rows else None
         return {
             "status": "success",
             "data": {
                 "orders": orders,
                 "total": total,
+                "total_is_estimate": True,
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "has_more": has_more,
+                "next_cursor": encode_cursor(last["created_at"], last["order_id"]) if has_more else None
             }
         }
     except Exception as e:
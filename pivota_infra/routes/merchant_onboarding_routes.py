@@ -8,7 +8,6 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 import asyncio
-import stripe
 import httpx
 
 from db.merchant_onboarding import (
@@ -25,6 +24,7 @@ from db.merchant_onboarding import (
 from db.payment_router import register_merchant_psp_route
 from db.database import database
 from utils.auth import get_current_user, require_admin
+from utils.merchant_context import notify_merchant_changed
 from urllib.parse import urlparse
 # from utils.r2_storage import upload_file_to_r2, get_presigned_url  # R2 存储功能推迟实现
 from fastapi.responses import StreamingResponse
@@ -310,6 +310,7 @@ async def register_merchant(
                 full_kyb_deadline=datetime.fromisoformat(validation_result["full_kyb_deadline"]) if validation_result.get("full_kyb_deadline") else None
             )
             await database.execute(query)
+            await notify_merchant_changed(merchant_id)
             print(f"✅ Merchant {merchant_id} auto-approved successfully")
         
         # Build response
@@ -997,6 +998,7 @@ async def restore_merchant(
         )
         
         await database.execute(update_query)
+        await notify_merchant_changed(merchant_id)
         
         return {
             "status": "success",
@@ -3,11 +3,10 @@
 Pivota 核心业务流程：Agent 下单 → 支付 → 履约
 """
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
 from typing import Optional, List, Dict, Any, Tuple
 from decimal import Decimal
 from datetime import datetime
-import httpx
 import os
 import json
 
@@ -16,17 +15,19 @@ from models.order import (
     OrderListResponse, OrderItem, OrderStatus
 )
 from db.orders import (
-    create_order, get_order, get_orders_by_merchant, get_orders_by_customer,
+    create_order, get_order, get_orders_page, get_orders_by_customer,
     update_order_status, update_payment_info, mark_order_paid, 
     update_fulfillment_info, mark_order_shipped, get_order_stats
 )
-from db.merchant_onboarding import get_merchant_onboarding
 from db.products import log_order_event
-from db.database import database
 from utils.auth import require_admin, get_current_user
 from config.settings import settings
 from adapters.psp_adapter import get_psp_adapter
 from utils.logger import logger
+from utils.http_client import get_http_client
+from utils.inventory_service import get_inventory_service
+from utils.merchant_context import get_merchant_context
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
@@ -45,79 +46,67 @@ async def check_inventory_availability(
     返回: (是否有库存, 库存详情)
     """
     try:
-        merchant = await get_merchant_onboarding(merchant_id)
-        if not merchant or not merchant.get("mcp_connected"):
+        ctx = await get_merchant_context(merchant_id)
+        if not ctx or not ctx.mcp_connected:
             # 如果未连接 MCP，默认允许订单
             return True, {"message": "MCP not connected, skipping inventory check"}
         
-        if merchant.get("mcp_platform") != "shopify":
+        if ctx.mcp_platform != "shopify":
             # 非 Shopify 平台，暂不检查库存
-            return True, {"message": f"Platform {merchant.get('mcp_platform')} inventory check not implemented"}
+            return True, {"message": f"Platform {ctx.mcp_platform} inventory check not implemented"}
         
-        shop_domain = merchant.get("mcp_shop_domain")
-        access_token = merchant.get("mcp_access_token")
+        shop_domain = ctx.shop_domain
+        access_token = ctx.access_token
         
         if not shop_domain or not access_token:
             return True, {"message": "Shop credentials missing, skipping inventory check"}
         
-        # 获取所有产品和变体
-        url = f"https://{shop_domain}/admin/api/2024-01/products.json"
-        headers = {
-            "X-Shopify-Access-Token": access_token,
-            "Content-Type": "application/json"
+        # 只查本订单涉及的 variant（内存 → variant_inventory → Shopify 定向批量查询）
+        variant_ids = [str(item.variant_id) for item in items if item.variant_id]
+        records = await get_inventory_service().get_variants(
+            merchant_id, variant_ids, shop_domain=shop_domain, access_token=access_token
+        )
+        inventory_map = {
+            variant_id: {
+                "available": record.get("available") or 0,
+                "tracked": bool(record.get("tracked")),
+                "sku": record.get("sku"),
+                "title": record.get("title")
+            }
+            for variant_id, record in records.items()
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, timeout=10.0)
-            
-            if response.status_code != 200:
-                return True, {"message": "Failed to fetch products, allowing order"}
-            
-            products = response.json().get("products", [])
-            
-            # 建立 variant_id -> inventory 的映射
-            inventory_map = {}
-            for product in products:
-                for variant in product.get("variants", []):
-                    variant_id = str(variant["id"])
-                    inventory_map[variant_id] = {
-                        "available": variant.get("inventory_quantity", 0),
-                        "tracked": variant.get("inventory_management") == "shopify",
-                        "sku": variant.get("sku"),
-                        "title": f"{product['title']} - {variant.get('title', '')}"
-                    }
-            
-            # 检查每个订单项的库存
-            insufficient_items = []
-            inventory_details = {}
+        # 检查每个订单项的库存
+        insufficient_items = []
+        inventory_details = {}
+        
+        for item in items:
+            if not item.variant_id:
+                # 如果没有 variant_id，跳过检查
+                continue
             
-            for item in items:
-                if not item.variant_id:
-                    # 如果没有 variant_id，跳过检查
-                    continue
+            variant_id = str(item.variant_id)
+            if variant_id in inventory_map:
+                inv = inventory_map[variant_id]
+                inventory_details[variant_id] = inv
                 
-                variant_id = str(item.variant_id)
-                if variant_id in inventory_map:
-                    inv = inventory_map[variant_id]
-                    inventory_details[variant_id] = inv
-                    
-                    if inv["tracked"] and inv["available"] < item.quantity:
-                        insufficient_items.append({
-                            "product": item.product_title,
-                            "requested": item.quantity,
-                            "available": inv["available"]
-                        })
-            
-            if insufficient_items:
-                return False, {
-                    "message": "Insufficient inventory",
-                    "items": insufficient_items
-                }
-            
-            return True, {
-                "message": "Inventory check passed",
-                "details": inventory_details
+                if inv["tracked"] and inv["available"] < item.quantity:
+                    insufficient_items.append({
+                        "product": item.product_title,
+                        "requested": item.quantity,
+                        "available": inv["available"]
+                    })
+        
+        if insufficient_items:
+            return False, {
+                "message": "Insufficient inventory",
+                "items": insufficient_items
             }
+        
+        return True, {
+            "message": "Inventory check passed",
+            "details": inventory_details
+        }
             
     except Exception as e:
         # 库存检查失败时，默认允许订单（fail-open）
@@ -151,33 +140,17 @@ async def create_new_order(
     - 支付信息与订单解耦，失败不影响订单创建
     """
     try:
-        # 1. 验证商户
-        merchant = await get_merchant_onboarding(order_request.merchant_id)
-        if not merchant:
+        # 1. 验证商户（商户、PSP 凭证、店铺连接来自进程内缓存）
+        ctx = await get_merchant_context(order_request.merchant_id)
+        if not ctx:
             raise HTTPException(status_code=404, detail="Merchant not found")
         
-        if not merchant.get("psp_connected"):
-            # 从 merchant_psps 回退推断 PSP 连接
-            try:
-                psp_row = await database.fetch_one(
-                    """
-                    SELECT provider FROM merchant_psps
-                    WHERE merchant_id = :merchant_id
-                    ORDER BY connected_at DESC
-                    LIMIT 1
-                    """,
-                {"merchant_id": order_request.merchant_id}
-                )
-            except Exception:
-                psp_row = None
-            if psp_row:
-                merchant["psp_connected"] = True
-                merchant["psp_type"] = psp_row["provider"]
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Merchant has not connected PSP. Cannot process payments."
-                )
+        if not ctx.psp_connected:
+            # psp_connected 已包含 merchant_psps 回退推断
+            raise HTTPException(
+                status_code=400,
+                detail="Merchant has not connected PSP. Cannot process payments."
+            )
 
         # 2. 检查库存（如果商户连接了 Shopify）
         has_inventory, inventory_info = await check_inventory_availability(
@@ -232,78 +205,25 @@ async def create_new_order(
         
         try:
             # PSP 类型选择：优先使用 preferred_psp，否则回退
-            psp_type = order_request.preferred_psp
-            if not psp_type:
-                psp_type = merchant.get("psp_type")
-            if not psp_type:
-                try:
-                    psp_row = await database.fetch_one(
-                        """
-                        SELECT provider FROM merchant_psps
-                        WHERE merchant_id = :merchant_id
-                        ORDER BY connected_at DESC
-                        LIMIT 1
-                        """,
-                        {"merchant_id": order_request.merchant_id}
-                    )
-                    if psp_row:
-                        psp_type = psp_row["provider"]
-                except Exception:
-                    psp_type = None
-            if not psp_type:
-                psp_type = "stripe"
-
-            # PSP 密钥查找：优先从 merchant_psps 表
+            psp_type = order_request.preferred_psp or ctx.psp_type or "stripe"
+
+            # PSP 密钥查找：merchant_psps → 商户表旧字段（Stripe）→ 环境变量（Stripe/Adyen）
+            # Note: Checkout MUST use DB key, no env var fallback
             psp_key = None
             psp_account_id = None
-            
-            # 1. 首先尝试从 merchant_psps 表获取对应 PSP 的 key 和 account_id
-            try:
-                psp_row = await database.fetch_one(
-                    """
-                    SELECT api_key, account_id FROM merchant_psps
-                    WHERE merchant_id = :merchant_id AND provider = :provider
-                    ORDER BY connected_at DESC
-                    LIMIT 1
-                    """,
-                    {"merchant_id": order_request.merchant_id, "provider": psp_type}
-                )
-                if psp_row and psp_row["api_key"]:
-                    psp_key = psp_row["api_key"]
-                    try:
-                        psp_account_id = psp_row["account_id"]
-                    except Exception:
-                        psp_account_id = None
-                    logger.info(f"Found {psp_type} key in DB for merchant {order_request.merchant_id}")
-                    logger.info(f"  API Key length: {len(psp_key)}, Account ID: {psp_account_id}")
-            except Exception as e:
-                logger.warning(f"DB PSP key lookup failed: {e}")
-            
-            # 2. 如果数据库没有，且是 Stripe，尝试从 merchant 表获取（兼容旧数据）
-            if not psp_key and psp_type == "stripe":
-                psp_key = merchant.get("psp_sandbox_key") or merchant.get("psp_key")
-                if psp_key:
-                    logger.info(f"Using legacy Stripe key from merchant table")
-            
-            # 3. 最后回退到环境变量（仅 Stripe 和 Adyen）
-            if not psp_key:
-                if psp_type == "stripe":
-                    psp_key = getattr(settings, "stripe_secret_key", None)
-                    if psp_key:
-                        logger.info(f"Using Stripe key from environment")
-                elif psp_type == "adyen":
-                    psp_key = getattr(settings, "adyen_api_key", None)
-                    if psp_key:
-                        logger.info(f"Using Adyen key from environment")
-                # Note: Checkout MUST use DB key, no env var fallback
+            credential = ctx.credential(psp_type)
+            if credential:
+                psp_key = credential.api_key
+                psp_account_id = credential.account_id
+                logger.info(f"Using {psp_type} key from {credential.source} for merchant {order_request.merchant_id}")
                 
             if not psp_key:
                 if psp_type == "checkout":
                     # Allow mock Checkout flow without a real key
-                    logger.warning(f"No Checkout API key for merchant {merchant['merchant_id']}, proceeding with mock checkout")
+                    logger.warning(f"No Checkout API key for merchant {ctx.merchant_id}, proceeding with mock checkout")
                     psp_key = "sk_mock_checkout"
                 else:
-                    logger.error(f"No {psp_type} API key found for merchant {merchant['merchant_id']}")
+                    logger.error(f"No {psp_type} API key found for merchant {ctx.merchant_id}")
                     # Don't fail order creation, just skip payment intent
             if psp_key:
                 # 创建支付意图（所有 PSP 统一处理）
@@ -420,60 +340,20 @@ async def confirm_payment(
     if order["payment_status"] == "paid":
         return {"status": "success", "message": "Order already paid"}
     
-    # 获取商户信息
-    merchant = await get_merchant_onboarding(order["merchant_id"])
-    # 如果标志未更新，尝试从 merchant_psps 推断
-    if not merchant.get("psp_connected") or not merchant.get("psp_type"):
-        try:
-            psp_row = await database.fetch_one(
-                """
-                SELECT provider FROM merchant_psps
-                WHERE merchant_id = :merchant_id
-                ORDER BY connected_at DESC
-                LIMIT 1
-                """,
-                {"merchant_id": order["merchant_id"]}
-            )
-            if psp_row:
-                merchant["psp_connected"] = True
-                merchant["psp_type"] = merchant.get("psp_type") or psp_row["provider"]
-        except Exception:
-            pass
-    if not merchant:
+    # 获取商户信息（与下单共用缓存的 MerchantContext）
+    ctx = await get_merchant_context(order["merchant_id"])
+    if not ctx:
         raise HTTPException(status_code=404, detail="Merchant not found")
+    merchant = ctx.merchant
     
     try:
-        # 获取商户的 PSP 类型和密钥（带 fallback）
-        psp_type = merchant.get("psp_type")
-        if not psp_type:
-            try:
-                psp_row = await database.fetch_one(
-                    """
-                    SELECT provider FROM merchant_psps
-                    WHERE merchant_id = :merchant_id
-                    ORDER BY connected_at DESC
-                    LIMIT 1
-                    """,
-                    {"merchant_id": order["merchant_id"]}
-                )
-                if psp_row:
-                    psp_type = psp_row["provider"]
-            except Exception:
-                psp_type = None
-        if not psp_type:
-            psp_type = "stripe"
-        # 尝试获取 psp_sandbox_key 或 psp_key (same logic as create_new_order)
-        psp_key = merchant.get("psp_sandbox_key") or merchant.get("psp_key")
+        # 获取商户的 PSP 类型和密钥（same resolution as create_new_order）
+        psp_type = ctx.psp_type or "stripe"
+        credential = ctx.credential(psp_type)
+        psp_key = credential.api_key if credential else None
         
-        # 如果商户没有配置密钥，使用系统默认（开发环境）
         if not psp_key:
-            if psp_type == "stripe":
-                psp_key = getattr(settings, "stripe_secret_key", None)
-            else:
-                psp_key = getattr(settings, "adyen_api_key", None)
-        
-        if not psp_key:
-            raise ValueError(f"No PSP key found for merchant {merchant['merchant_id']}")
+            raise ValueError(f"No PSP key found for merchant {ctx.merchant_id}")
         
         # 创建 PSP 适配器
         psp_adapter = get_psp_adapter(psp_type, psp_key)
@@ -584,16 +464,27 @@ async def get_order_details(
 async def get_merchant_orders(
     merchant_id: str,
     status: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+    offset: int = Query(default=0, ge=0, description="已废弃，请使用 cursor"),
     current_user: dict = Depends(get_current_user)  # Allow authenticated users
 ):
-    """获取商户的订单列表"""
-    orders_list = await get_orders_by_merchant(merchant_id, status, limit, offset)
+    """获取商户的订单列表（按创建时间倒序，cursor 翻页）"""
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    orders_list, has_more = await get_orders_page(
+        merchant_id=merchant_id, status=status, limit=limit, after=after, offset=offset, include_deleted=False
+    )
+    last = orders_list[-1] if orders_list else None
     
     return OrderListResponse(
         status="success",
         total=len(orders_list),
+        has_more=has_more,
+        next_cursor=encode_cursor(last["created_at"], last["order_id"]) if has_more else None,
         orders=[
             OrderResponse(
                 order_id=o["order_id"],
@@ -653,13 +544,13 @@ async def create_shopify_order(order_id: str) -> bool:
             logger.error(f"Order {order_id} not found")
             return False
         
-        merchant = await get_merchant_onboarding(order["merchant_id"])
-        if not merchant or not merchant.get("mcp_connected"):
+        ctx = await get_merchant_context(order["merchant_id"])
+        if not ctx or not ctx.mcp_connected:
             logger.error(f"Merchant not connected to Shopify: {order['merchant_id']}")
             return False
         
-        shop_domain = merchant.get("mcp_shop_domain")
-        access_token = merchant.get("mcp_access_token")
+        shop_domain = ctx.shop_domain
+        access_token = ctx.access_token
         
         if not shop_domain or not access_token:
             logger.error(f"Missing Shopify credentials for merchant {order['merchant_id']}")
@@ -708,49 +599,49 @@ async def create_shopify_order(order_id: str) -> bool:
         
         logger.info(f"Calling Shopify API: {url}")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=shopify_order_data, headers=headers, timeout=10.0)
+        client = get_http_client("shopify")
+        response = await client.post(url, json=shopify_order_data, headers=headers, timeout=10.0)
+        
+        logger.info(f"Shopify API response: {response.status_code}")
+        
+        if response.status_code == 201:
+            shopify_order = response.json()["order"]
+            shopify_order_id = str(shopify_order["id"])
             
-            logger.info(f"Shopify API response: {response.status_code}")
+            logger.info(f"Shopify order created: {shopify_order_id}")
             
-            if response.status_code == 201:
-                shopify_order = response.json()["order"]
-                shopify_order_id = str(shopify_order["id"])
-                
-                logger.info(f"Shopify order created: {shopify_order_id}")
-                
-                # 更新 Pivota 订单的 Shopify 订单 ID
-                await update_fulfillment_info(
-                    order_id=order_id,
-                    shopify_order_id=shopify_order_id,
-                    fulfillment_status="processing"
-                )
-                
-                # 记录事件
-                await log_order_event(
-                    event_type="shopify_order_created",
-                    order_id=order_id,
-                    merchant_id=order["merchant_id"],
-                    metadata={"shopify_order_id": shopify_order_id}
-                )
-                
-                logger.info(f"Successfully created Shopify order {shopify_order_id} for Pivota order {order_id}")
-                return True
-            else:
-                error_msg = response.text[:500]
-                logger.error(f"Shopify API error: {response.status_code} - {error_msg}")
-                
-                # 记录失败事件
-                await log_order_event(
-                    event_type="shopify_order_failed",
-                    order_id=order_id,
-                    merchant_id=order["merchant_id"],
-                    metadata={
-                        "status_code": response.status_code,
-                        "error": error_msg
-                    }
-                )
-                return False
+            # 更新 Pivota 订单的 Shopify 订单 ID
+            await update_fulfillment_info(
+                order_id=order_id,
+                shopify_order_id=shopify_order_id,
+                fulfillment_status="processing"
+            )
+            
+            # 记录事件
+            await log_order_event(
+                event_type="shopify_order_created",
+                order_id=order_id,
+                merchant_id=order["merchant_id"],
+                metadata={"shopify_order_id": shopify_order_id}
+            )
+            
+            logger.info(f"Successfully created Shopify order {shopify_order_id} for Pivota order {order_id}")
+            return True
+        else:
+            error_msg = response.text[:500]
+            logger.error(f"Shopify API error: {response.status_code} - {error_msg}")
+            
+            # 记录失败事件
+            await log_order_event(
+                event_type="shopify_order_failed",
+                order_id=order_id,
+                merchant_id=order["merchant_id"],
+                metadata={
+                    "status_code": response.status_code,
+                    "error": error_msg
+                }
+            )
+            return False
                 
     except Exception as e:
         logger.error(f"Exception in create_shopify_order: {str(e)}")
@@ -8,13 +8,15 @@ from pydantic import BaseModel
 from typing import Optional
 import logging
 from datetime import datetime
+import hashlib
 import secrets
 
 from db.merchant_onboarding import get_merchant_onboarding, get_merchant_by_api_key
 from db.payment_router import get_merchant_psp_route
 from config.settings import settings
-import stripe
-import httpx
+from utils.http_client import get_http_client
+from utils.stripe_client import AsyncStripeClient
+from utils.idempotency import run_idempotent
 
 logger = logging.getLogger("payment_execution")
 router = APIRouter(prefix="/payment", tags=["payment-execution"])
@@ -91,10 +93,8 @@ async def execute_stripe_payment(merchant: dict, payment_data: PaymentExecuteReq
                 detail="Stripe API key not found"
             )
         
-        # Create Stripe payment intent
-        stripe.api_key = stripe_key
-        
-        intent = stripe.PaymentIntent.create(
+        # Create Stripe payment intent (merchant key per request, non-blocking)
+        intent = await AsyncStripeClient(stripe_key).create_payment_intent(
             amount=int(payment_data.amount),  # Stripe expects amount in cents
             currency=payment_data.currency.lower(),
             description=payment_data.description or f"Payment for order {payment_data.order_id}",
@@ -149,52 +149,52 @@ async def execute_adyen_payment(merchant: dict, payment_data: PaymentExecuteRequ
             )
         
         # Adyen payment API call
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://checkout-test.adyen.com/v70/payments",
-                headers={
-                    "X-API-Key": adyen_key,
-                    "Content-Type": "application/json"
+        client = get_http_client("adyen")
+        response = await client.post(
+            "https://checkout-test.adyen.com/v70/payments",
+            headers={
+                "X-API-Key": adyen_key,
+                "Content-Type": "application/json"
+            },
+            json={
+                "amount": {
+                    "value": int(payment_data.amount),
+                    "currency": payment_data.currency.upper()
                 },
-                json={
-                    "amount": {
-                        "value": int(payment_data.amount),
-                        "currency": payment_data.currency.upper()
-                    },
-                    "reference": payment_data.order_id,
-                    "merchantAccount": settings.adyen_merchant_account or "WoopayECOM",
-                    "paymentMethod": {
-                        "type": "scheme",
-                        "number": "4111111111111111",  # Test card
-                        "expiryMonth": "03",
-                        "expiryYear": "2030",
-                        "holderName": "Test User",
-                        "cvc": "737"
-                    },
-                    "shopperEmail": payment_data.customer_email,
-                    "metadata": payment_data.metadata or {}
+                "reference": payment_data.order_id,
+                "merchantAccount": settings.adyen_merchant_account or "WoopayECOM",
+                "paymentMethod": {
+                    "type": "scheme",
+                    "number": "4111111111111111",  # Test card
+                    "expiryMonth": "03",
+                    "expiryYear": "2030",
+                    "holderName": "Test User",
+                    "cvc": "737"
                 },
-                timeout=30.0
-            )
-            
-            result = response.json()
-            
-            if response.status_code == 200:
-                return {
-                    "success": result.get("resultCode") == "Authorised",
-                    "payment_id": result.get("pspReference", f"adyen_{secrets.token_hex(8)}"),
-                    "status": "completed" if result.get("resultCode") == "Authorised" else "failed",
-                    "transaction_id": result.get("pspReference"),
-                    "error_message": result.get("refusalReason") if result.get("resultCode") != "Authorised" else None
-                }
-            else:
-                return {
-                    "success": False,
-                    "payment_id": f"failed_{secrets.token_hex(8)}",
-                    "status": "failed",
-                    "transaction_id": None,
-                    "error_message": result.get("message", "Adyen payment failed")
-                }
+                "shopperEmail": payment_data.customer_email,
+                "metadata": payment_data.metadata or {}
+            },
+            timeout=30.0
+        )
+        
+        result = response.json()
+        
+        if response.status_code == 200:
+            return {
+                "success": result.get("resultCode") == "Authorised",
+                "payment_id": result.get("pspReference", f"adyen_{secrets.token_hex(8)}"),
+                "status": "completed" if result.get("resultCode") == "Authorised" else "failed",
+                "transaction_id": result.get("pspReference"),
+                "error_message": result.get("refusalReason") if result.get("resultCode") != "Authorised" else None
+            }
+        else:
+            return {
+                "success": False,
+                "payment_id": f"failed_{secrets.token_hex(8)}",
+                "status": "failed",
+                "transaction_id": None,
+                "error_message": result.get("message", "Adyen payment failed")
+            }
     
     except Exception as e:
         logger.error(f"Adyen payment failed: {e}")
@@ -210,7 +210,8 @@ async def execute_adyen_payment(merchant: dict, payment_data: PaymentExecuteRequ
 @router.post("/execute", response_model=PaymentExecuteResponse)
 async def execute_payment(
     payment_request: PaymentExecuteRequest,
-    x_merchant_api_key: str = Header(None, alias="X-Merchant-API-Key")
+    x_merchant_api_key: str = Header(None, alias="X-Merchant-API-Key"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Unified payment execution endpoint for merchants.
@@ -219,6 +220,7 @@ async def execute_payment(
     
     Headers:
         X-Merchant-API-Key: Merchant's API key (issued after KYC approval)
+        Idempotency-Key: (optional) retries with the same key replay the first successful response
     
     Body:
         amount: Payment amount in cents (e.g., 1000 = $10.00)
@@ -231,6 +233,18 @@ async def execute_payment(
     Returns:
         PaymentExecuteResponse with payment status and details
     """
+    # Scoped by the API key (hashed), so a replay needs no merchant lookup
+    scope = f"payment_execute:{hashlib.sha256((x_merchant_api_key or '').encode()).hexdigest()[:32]}"
+    return await run_idempotent(
+        scope,
+        idempotency_key,
+        payment_request,
+        lambda: _execute_payment(payment_request, x_merchant_api_key),
+        cache_if=lambda response: response.success  # failed PSP calls can be retried with the same key
+    )
+
+
+async def _execute_payment(payment_request: PaymentExecuteRequest, x_merchant_api_key: str) -> PaymentExecuteResponse:
     try:
         # 1. Verify merchant API key
         merchant = await verify_merchant_api_key(x_merchant_api_key)
@@ -1,7 +1,7 @@
 """
 Performance optimization endpoints for debugging and improving API speed
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from db.database import database
 from utils.auth import get_current_user, require_admin
 import time
@@ -234,3 +234,164 @@ async def get_connection_pool_status(current_user: dict = Depends(require_admin)
         }
 
 
+
+@router.get("/agent-cache")
+async def get_agent_cache_stats(current_user: dict = Depends(require_admin)):
+    """Agent credential cache hit/miss counters"""
+    from utils.agent_cache import get_agent_cache
+    return {
+        "status": "success",
+        "agent_cache": get_agent_cache().stats()
+    }
+
+
+@router.get("/log-writer")
+async def get_log_writer_stats(current_user: dict = Depends(require_admin)):
+    """Batched usage-log writer queue depth and drop counters"""
+    from utils.log_writer import get_log_writer
+    return {
+        "status": "success",
+        "log_writer": get_log_writer().stats()
+    }
+
+@router.get("/product-index")
+async def get_product_index_stats(current_user: dict = Depends(require_admin)):
+    """In-memory product search index size and freshness"""
+    from utils.product_index import get_product_index
+    return {
+        "status": "success",
+        "product_index": get_product_index().stats()
+    }
+
+
+@router.get("/websockets")
+async def get_websocket_stats(current_user: dict = Depends(require_admin)):
+    """WebSocket fan-out: connections, queue depth, dropped messages, slow consumers"""
+    from realtime.ws_manager import get_connection_manager
+    return {
+        "status": "success",
+        "websockets": get_connection_manager().stats()
+    }
+
+
+@router.get("/merchant-context")
+async def get_merchant_context_stats(current_user: dict = Depends(require_admin)):
+    """Merchant context cache hit rate, loads and invalidations"""
+    from utils.merchant_context import get_merchant_context_cache
+    return {
+        "status": "success",
+        "merchant_context": get_merchant_context_cache().stats()
+    }
+
+
+@router.get("/inventory")
+async def get_inventory_stats(current_user: dict = Depends(require_admin)):
+    """Variant inventory lookups by tier (memory / Postgres / Shopify) and webhook updates"""
+    from utils.inventory_service import get_inventory_service
+    return {
+        "status": "success",
+        "inventory": get_inventory_service().stats()
+    }
+
+
+@router.get("/event-bus")
+async def get_event_bus_stats(current_user: dict = Depends(require_admin)):
+    """Dashboard event bus: backend, relay / receive counters, subscriber state"""
+    from utils.event_bus import get_event_bus
+    return {
+        "status": "success",
+        "event_bus": get_event_bus().stats()
+    }
+
+
+@router.get("/usage-rollups")
+async def get_usage_rollup_stats(current_user: dict = Depends(require_admin)):
+    """Usage rollup writer: pending cells, rows folded, write failures"""
+    from utils.usage_rollups import get_usage_rollup_writer
+    return {
+        "status": "success",
+        "usage_rollups": get_usage_rollup_writer().stats()
+    }
+
+
+@router.get("/partitions")
+async def get_partition_stats(current_user: dict = Depends(require_admin)):
+    """Event table partitions (bounds, estimated rows), last maintenance run, recent archives"""
+    from db.partitions import PARTITIONED_TABLES, get_partition_archives, list_partitions
+    from utils.partition_maintenance import get_last_maintenance, retention_days
+    tables = {}
+    for parent, (column, period) in PARTITIONED_TABLES.items():
+        partitions = await list_partitions(parent)
+        tables[parent] = {
+            "column": column,
+            "period": period,
+            "retention_days": retention_days(parent),
+            "partitions": [
+                {
+                    "name": p.name,
+                    "from": p.lower.isoformat() if p.lower else None,
+                    "to": p.upper.isoformat() if p.upper else None,
+                    "estimated_rows": p.estimated_rows,
+                }
+                for p in partitions
+            ],
+        }
+    return {
+        "status": "success",
+        "tables": tables,
+        "last_maintenance": get_last_maintenance(),
+        "archives": await get_partition_archives(limit=20)
+    }
+
+
+@router.get("/webhook-inbox")
+async def get_webhook_inbox_stats(current_user: dict = Depends(require_admin)):
+    """Webhook inbox: backlog per provider / status, worker counters, recent dead-lettered events"""
+    from db.webhook_inbox import get_failed_webhook_events, get_webhook_inbox_counts
+    from utils.webhook_inbox import get_webhook_inbox
+    return {
+        "status": "success",
+        "workers": get_webhook_inbox().stats(),
+        "backlog": await get_webhook_inbox_counts(),
+        "failed": await get_failed_webhook_events(limit=20)
+    }
+
+
+@router.get("/psp-routing")
+async def get_psp_routing_stats(current_user: dict = Depends(require_admin)):
+    """PSP routing: rolling success rate / p95 / score per PSP, circuit breakers that are open or have tripped"""
+    from utils.psp_health import get_psp_health
+    return {
+        "status": "success",
+        "psp_routing": get_psp_health().stats()
+    }
+
+
+@router.get("/idempotency")
+async def get_idempotency_stats(current_user: dict = Depends(require_admin)):
+    """Idempotency-Key replay: executions, replays, collapsed concurrent duplicates, body conflicts"""
+    from utils.idempotency import get_idempotency_cache
+    return {
+        "status": "success",
+        "idempotency": get_idempotency_cache().stats()
+    }
+
+
+@router.get("/routers")
+async def get_router_stats(request: Request, current_user: dict = Depends(require_admin)):
+    """Router registry: import time per included router, lazy routers not loaded yet"""
+    registry = getattr(request.app.state, "router_registry", None)
+    return {
+        "status": "success",
+        "routers": registry.stats() if registry is not None else None
+    }
+
+
+@router.get("/http-clients")
+async def get_http_client_stats(current_user: dict = Depends(require_admin)):
+    """Outbound HTTP pool usage per upstream (requests, retries, latency)"""
+    from utils.http_client import http_client_stats
+    return {
+        "status": "success",
+        "http_clients": http_client_stats()
+    }
@@ -5,7 +5,7 @@ Pivota 核心价值：实时代理 + 智能缓存 + 数据标准化
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
-from typing import Optional, Dict, Any
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 import os
 import time
@@ -15,15 +15,38 @@ from models.standard_product import ProductListResponse
 from adapters.product_adapters import fetch_merchant_products
 from db.merchant_onboarding import get_merchant_onboarding
 from db.products import (
-    get_cached_products, upsert_product_cache, mark_cache_accessed,
+    get_cached_product_payloads, bulk_upsert_product_cache, mark_cache_accessed,
     log_api_call, cleanup_expired_cache
 )
 from utils.auth import require_admin, get_current_user
+from utils.fast_json import RawJSONResponse, dumps_with_raw_list
 from config.settings import settings
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 
+def _product_list_body(
+    merchant_id: str,
+    platform: str,
+    payloads: List[str],
+    next_page_token: Optional[str] = None
+) -> bytes:
+    """ProductListResponse 的 JSON：payloads 是已序列化的 StandardProduct，原样拼接"""
+    return dumps_with_raw_list(
+        {
+            "status": "success",
+            "merchant_id": merchant_id,
+            "platform": platform,
+            "total": len(payloads),
+            "products": None,
+            "next_page_token": next_page_token,
+            "fetched_at": datetime.now().isoformat(),
+        },
+        "products",
+        payloads
+    )
+
+
 @router.get("/{merchant_id}", response_model=ProductListResponse)
 async def get_merchant_products_realtime(
     merchant_id: str,
@@ -45,7 +68,6 @@ async def get_merchant_products_realtime(
     """
     start_time = time.time()
     cache_hit = False
-    products = []
     
     # 1. 获取商户信息
     merchant = await get_merchant_onboarding(merchant_id)
@@ -64,16 +86,17 @@ async def get_merchant_products_realtime(
         raise HTTPException(status_code=400, detail="MCP platform not specified")
     
     # 3. 尝试从缓存读取（除非强制刷新）
+    # 缓存里存的就是 StandardProduct.json() 原文，直接拼进响应（不反序列化、不再校验）
     if not force_refresh:
-        cached = await get_cached_products(merchant_id, platform, include_expired=False)
+        cached = await get_cached_product_payloads(merchant_id, platform, limit)
         if cached:
             cache_hit = True
-            products = [c["product_data"] for c in cached[:limit]]
+            body = _product_list_body(merchant_id, platform, [c["payload"] for c in cached])
             response_time_ms = int((time.time() - start_time) * 1000)
             
             # 🚀 后台任务：更新访问统计和日志（不阻塞响应）
-            cache_ids = [c["id"] for c in cached[:limit]]
-            product_ids = [p["id"] for p in products]
+            cache_ids = [c["id"] for c in cached]
+            product_ids = [c["platform_product_id"] for c in cached]
             
             async def background_logging():
                 """后台任务：访问统计 + 日志记录"""
@@ -95,19 +118,7 @@ async def get_merchant_products_realtime(
             
             background_tasks.add_task(background_logging)
             
-            # 从缓存返回的是字典，需要转换为 StandardProduct 对象
-            from models.standard_product import StandardProduct
-            product_objects = [StandardProduct(**p) for p in products]
-            
-            return ProductListResponse(
-                status="success",
-                merchant_id=merchant_id,
-                platform=platform,
-                total=len(products),
-                products=product_objects,
-                next_page_token=None,
-                fetched_at=datetime.now()
-            )
+            return RawJSONResponse(content=body)
     
     # 4. Cache miss → 实时拉取
     credentials = {}
@@ -152,16 +163,15 @@ async def get_merchant_products_realtime(
         )
         raise HTTPException(status_code=500, detail=f"Failed to fetch products: {error}")
     
-    # 6. 更新缓存（后台任务，不阻塞响应）
-    for p in products_obj:
-        # 使用 p.json() + json.loads() 确保 datetime 被序列化为 ISO 字符串
-        await upsert_product_cache(
-            merchant_id=merchant_id,
-            platform=platform,
-            platform_product_id=p.id,
-            product_data=json.loads(p.json()),
-            ttl_seconds=3600  # 1小时
-        )
+    # 6. 批量更新缓存（每个 chunk 一次往返）
+    # p.json() 只序列化一次：同一份文本既写入缓存，也直接作为响应内容
+    payloads = [(p.id, p.json()) for p in products_obj]
+    await bulk_upsert_product_cache(
+        merchant_id=merchant_id,
+        platform=platform,
+        products=payloads,
+        ttl_seconds=3600  # 1小时
+    )
     
     # 7. 记录 API 调用事件（缓存未命中）
     response_time_ms = int((time.time() - start_time) * 1000)
@@ -177,14 +187,8 @@ async def get_merchant_products_realtime(
     )
     
     # 8. 返回标准化格式
-    return ProductListResponse(
-        status="success",
-        merchant_id=merchant_id,
-        platform=platform,
-        total=len(products_obj),
-        products=products_obj,
-        next_page_token=next_page_token,
-        fetched_at=datetime.now()
+    return RawJSONResponse(
+        content=_product_list_body(merchant_id, platform, [payload for _, payload in payloads], next_page_token)
     )
 
 
@@ -217,13 +221,13 @@ async def get_single_product_realtime(
             raise HTTPException(status_code=400, detail="Shopify credentials not found")
         
         # Shopify 单个产品 API
-        import httpx
+        from utils.http_client import get_http_client
         url = f"https://{shop_domain}/admin/api/2024-07/products/{product_id}.json"
         headers = {"X-Shopify-Access-Token": access_token}
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, headers=headers)
+            client = get_http_client("shopify")
+            response = await client.get(url, headers=headers, timeout=10.0)
             
             if response.status_code != 200:
                 raise HTTPException(status_code=404, detail="Product not found")
@@ -11,16 +11,19 @@ import json
 from utils.auth import get_current_user
 from db.database import database
 from db.merchant_onboarding import get_merchant_onboarding
-from db.products import upsert_product_cache
-from adapters.product_adapters import fetch_merchant_products
+from db.products import get_sync_state
+from utils.catalog_sync import sync_shopify_catalog, SyncInProgress
+from utils.merchant_context import notify_merchant_changed
 from utils.logger import logger
+from config.settings import settings
 
 router = APIRouter(prefix="/products/sync", tags=["product-sync"])
 
 class SyncRequest(BaseModel):
     merchant_id: str
-    force_refresh: bool = False
-    limit: int = 250
+    force_refresh: bool = False  # True: ignore the checkpoint and run a full sync from page 1
+    mode: str = "auto"  # auto (incremental once a full sync has completed) | full | incremental
+    limit: int = 250  # Page size (Shopify max 250); the whole catalog is synced
 
 class SyncResponse(BaseModel):
     status: str
@@ -96,18 +99,33 @@ async def sync_products(
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported platform: {platform}")
         
-        # 4. Fetch products from platform
-        products_obj, next_page_token, error = await fetch_merchant_products(
-            merchant_id=request.merchant_id,
-            platform=platform,
-            credentials=credentials,
-            limit=request.limit
-        )
+        if request.mode not in ("auto", "full", "incremental"):
+            raise HTTPException(status_code=400, detail=f"Unsupported sync mode: {request.mode}")
+        incremental = request.mode != "full" and not request.force_refresh
         
-        if error:
-            raise HTTPException(status_code=500, detail=f"Failed to fetch products: {error}")
+        # 4-5. Stream pages into products_cache (checkpointed, resumable)
+        # Incremental runs only fetch updated_at_min deltas; cache freshness is
+        # then driven by change events, so rows get the long event TTL.
+        try:
+            result = await sync_shopify_catalog(
+                merchant_id=request.merchant_id,
+                shop_domain=credentials["shop_domain"],
+                access_token=credentials["access_token"],
+                ttl_seconds=settings.product_cache_event_ttl_seconds if incremental else 86400,
+                page_size=request.limit,
+                resume=not request.force_refresh,
+                incremental=incremental
+            )
+        except SyncInProgress as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to fetch products: {e} (progress saved, retry to resume)"
+            )
+        synced_count = result["products_synced"]
         
-        if not products_obj:
+        if not synced_count and result["mode"] == "full":
             return SyncResponse(
                 status="success",
                 message="No products found on platform",
@@ -117,25 +135,6 @@ async def sync_products(
                 sync_time=datetime.now().isoformat()
             )
         
-        # 5. Upsert products into cache
-        synced_count = 0
-        for product in products_obj:
-            try:
-                # Convert StandardProduct to dict using json serialization
-                product_data = json.loads(product.json())
-                
-                await upsert_product_cache(
-                    merchant_id=request.merchant_id,
-                    platform=platform,
-                    platform_product_id=product.id,
-                    product_data=product_data,
-                    ttl_seconds=86400  # 24 hours cache
-                )
-                synced_count += 1
-            except Exception as e:
-                logger.error(f"Failed to cache product {product.id}: {e}")
-                continue
-        
         # 6. Update merchant sync status
         await database.execute(
             """UPDATE merchant_onboarding 
@@ -146,6 +145,7 @@ async def sync_products(
                 "merchant_id": request.merchant_id
             }
         )
+        await notify_merchant_changed(request.merchant_id)
         
         sync_duration = (datetime.now() - start_time).total_seconds()
         
@@ -156,7 +156,13 @@ async def sync_products(
         
         return SyncResponse(
             status="success",
-            message=f"Successfully synced {synced_count} products from {platform}",
+            message=(
+                f"Successfully synced {synced_count} products from {platform}"
+                f" ({result['mode']}"
+                + (", resumed from checkpoint" if result["resumed"] else "")
+                + (f", {result['pruned']} removed" if result["pruned"] else "")
+                + ")"
+            ),
             merchant_id=request.merchant_id,
             platform=platform,
             products_synced=synced_count,
@@ -172,6 +178,21 @@ async def sync_products(
             detail=f"Product sync failed: {str(e)}"
         )
 
+def _format_sync_state(state):
+    if not state:
+        return None
+    return {
+        "status": state.get("status"),
+        "mode": state.get("mode"),
+        "resumable": bool(state.get("cursor")) and state.get("status") != "completed",
+        "products_synced": state.get("products_synced"),
+        "pages_synced": state.get("pages_synced"),
+        "started_at": state["started_at"].isoformat() if state.get("started_at") else None,
+        "completed_at": state["completed_at"].isoformat() if state.get("completed_at") else None,
+        "last_error": state.get("last_error"),
+        "high_water_mark": state["high_water_mark"].isoformat() if state.get("high_water_mark") else None
+    }
+
 @router.get("/status/{merchant_id}")
 async def get_sync_status(
     merchant_id: str,
@@ -204,7 +225,10 @@ async def get_sync_status(
             "platform_connected": merchant.get("mcp_connected", False),
             "products_in_cache": count_result["count"] if count_result else 0,
             "last_sync": count_result["last_sync"].isoformat() if count_result and count_result["last_sync"] else None,
-            "merchant_updated_at": merchant.get("updated_at").isoformat() if merchant.get("updated_at") else None
+            "merchant_updated_at": merchant.get("updated_at").isoformat() if merchant.get("updated_at") else None,
+            "sync_state": _format_sync_state(
+                await get_sync_state(merchant_id, merchant.get("mcp_platform") or "shopify")
+            )
         }
     
     except HTTPException:
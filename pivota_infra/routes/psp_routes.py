@@ -2,16 +2,51 @@ from fastapi import APIRouter, Request, Header, HTTPException, Depends
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from adapters.stripe_adapter import verify_webhook_signature
 from orchestrator.callback_handler import handle_psp_webhook
+from utils.webhook_inbox import enqueue_webhook_events
 from config.settings import settings
 from utils.logger import logger
+import base64
 import hmac
 import hashlib
 import json
 import secrets
+from functools import lru_cache
+from typing import Optional
 
 router = APIRouter(prefix="/psp", tags=["psp"])
 security = HTTPBasic()
 
+@lru_cache(maxsize=1)
+def _adyen_hmac_key(secret: str) -> Optional[bytes]:
+    """Decode the hex HMAC key once; None (logged once) when the configured secret isn't hex"""
+    try:
+        return bytes.fromhex(secret)
+    except ValueError:
+        logger.error("❌ Configuration error: ADYEN_WEBHOOK_SECRET is not a hex HMAC key, Adyen webhooks are rejected")
+        return None
+
+def _verify_adyen_hmac(notification: dict, hmac_key: bytes) -> bool:
+    """HMAC-SHA256 over the colon-joined notification fields, keyed with the decoded HMAC key"""
+    signature = (notification.get("additionalData") or {}).get("hmacSignature")
+    if not signature:
+        return False
+    amount = notification.get("amount") or {}
+    fields = [
+        notification.get("pspReference"),
+        notification.get("originalReference"),
+        notification.get("merchantAccountCode"),
+        notification.get("merchantReference"),
+        amount.get("value"),
+        amount.get("currency"),
+        notification.get("eventCode"),
+        notification.get("success"),
+    ]
+    signing_string = ":".join("" if value is None else str(value) for value in fields)
+    expected = base64.b64encode(
+        hmac.new(hmac_key, signing_string.encode("utf-8"), hashlib.sha256).digest()
+    ).decode()
+    return hmac.compare_digest(expected, signature)
+
 @router.post("/webhook/stripe")
 async def stripe_webhook(request: Request, stripe_signature: str = Header(None)):
     payload = await request.body()
@@ -60,12 +95,14 @@ async def adyen_webhook(
     
     # Verify HMAC signature if configured
     if hasattr(settings, 'adyen_webhook_secret') and settings.adyen_webhook_secret:
+        hmac_key = _adyen_hmac_key(settings.adyen_webhook_secret)
+        if hmac_key is None:
+            # Our configuration, not the notification: 503 so Adyen retries once it is fixed
+            raise HTTPException(status_code=503, detail="Adyen webhook HMAC key misconfigured")
         try:
-            # Adyen sends HMAC signature in a specific format
             data = json.loads(payload)
-            notification_items = data.get("notificationItems", [])
-            
-            for item in notification_items:
+            rows = []
+            for item in data.get("notificationItems", []):
                 notification = item.get("NotificationRequestItem", {})
                 
                 # Extract event details
@@ -74,14 +111,22 @@ async def adyen_webhook(
                 psp_reference = notification.get("pspReference")
                 merchant_reference = notification.get("merchantReference")
                 
-                logger.info(f"Adyen webhook received: {event_code}, success={success}, ref={psp_reference}")
+                if not _verify_adyen_hmac(notification, hmac_key):
+                    logger.error(f"Invalid Adyen HMAC signature: {event_code}, ref={psp_reference}")
+                    continue
                 
-                # Handle different event types
-                if event_code == "AUTHORISATION" and success == "true":
-                    await handle_psp_webhook(merchant_reference, "succeeded", "adyen", psp_reference)
-                elif event_code == "AUTHORISATION" and success == "false":
-                    await handle_psp_webhook(merchant_reference, "failed", "adyen", psp_reference)
-                # Add more event types as needed
+                logger.info(f"Adyen webhook received: {event_code}, success={success}, ref={psp_reference}")
+                # Adyen retries until [accepted]; (pspReference, eventCode, success) identifies a notification
+                rows.append({
+                    "provider": "adyen",
+                    "event_id": f"{psp_reference}:{event_code}:{success}",
+                    "topic": event_code or "unknown",
+                    "ordering_key": f"order:{merchant_reference}" if merchant_reference else None,
+                    "payload": notification,
+                })
+            
+            # Processed by orchestrator/webhook_handlers.process_adyen_notification
+            await enqueue_webhook_events(rows)
                 
         except Exception as e:
             logger.error(f"Adyen webhook processing error: {e}")
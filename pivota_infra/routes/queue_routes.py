@@ -2,12 +2,14 @@ from fastapi import APIRouter
 from typing import List, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel
+from utils.event_bus import get_event_bus, get_instance_id
 from utils.logger import logger
 
 router = APIRouter(prefix="/queue", tags=["queue"])
 
-# In-memory payment queue for demo purposes
+# In-memory payment queue for demo purposes (kept in sync across workers via the event bus)
 payment_queue = []
+QUEUE_CHANNEL = "payment_queue"
 
 class QueueItem(BaseModel):
     order_id: str
@@ -52,8 +54,7 @@ async def clear_queue():
     """
     Clear the payment queue
     """
-    global payment_queue
-    payment_queue.clear()
+    await get_event_bus().publish(QUEUE_CHANNEL, {"action": "clear"})
     logger.info("Payment queue cleared")
     return {"message": "Queue cleared successfully"}
 
@@ -61,11 +62,22 @@ def add_to_queue(order_id: str, psp: str, status: str, attempts: int = 1):
     """
     Add a payment result to the queue
     """
-    payment_queue.append({
+    item = {
         "order_id": order_id,
         "psp": psp,
         "status": status,
         "timestamp": datetime.utcnow().isoformat(),
         "attempts": attempts
-    })
+    }
+    payment_queue.append(item)
+    # Other workers append it from the bus
+    get_event_bus().publish_nowait(QUEUE_CHANNEL, {"action": "add", "item": item, "origin": get_instance_id()})
     logger.info(f"Added payment to queue: {order_id} via {psp} - {status}")
+
+async def _apply_queue_message(message: Dict[str, Any]) -> None:
+    if message.get("action") == "clear":
+        payment_queue.clear()
+    elif message.get("action") == "add" and message.get("origin") != get_instance_id():
+        payment_queue.append(message["item"])
+
+get_event_bus().subscribe(QUEUE_CHANNEL, _apply_queue_message)
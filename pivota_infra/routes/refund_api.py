@@ -146,7 +146,7 @@ async def process_refund(
                     access_token = merchant.get("mcp_access_token")
                     
                     if shop_domain and access_token:
-                        import httpx
+                        from utils.http_client import get_http_client
                         
                         # Cancel the Shopify order
                         url = f"https://{shop_domain}/admin/api/2024-01/orders/{order['shopify_order_id']}/cancel.json"
@@ -163,18 +163,18 @@ async def process_refund(
                             "refund": True
                         }
                         
-                        async with httpx.AsyncClient() as client:
-                            response = await client.post(
-                                url,
-                                json=cancel_data,
-                                headers=headers_shopify,
-                                timeout=10.0
-                            )
-                            
-                            if response.status_code == 200:
-                                logger.info(f"Shopify order {order['shopify_order_id']} cancelled")
-                            else:
-                                logger.warning(f"Failed to cancel Shopify order: {response.status_code}")
+                        client = get_http_client("shopify")
+                        response = await client.post(
+                            url,
+                            json=cancel_data,
+                            headers=headers_shopify,
+                            timeout=10.0
+                        )
+                        
+                        if response.status_code == 200:
+                            logger.info(f"Shopify order {order['shopify_order_id']} cancelled")
+                        else:
+                            logger.warning(f"Failed to cancel Shopify order: {response.status_code}")
                                 
             except Exception as e:
                 logger.error(f"Error updating Shopify order after refund: {e}")
@@ -0,0 +1,192 @@
+"""
+Router registry
+Every router is declared by module path (in include order) instead of being
+imported by main.py at import time. Core routers are included at startup;
+one-off fix / cleanup / init / debug / demo routers declare the path
+prefixes they serve and are imported on the first request under one of
+them (or when the OpenAPI schema is requested), so workers boot without
+importing them or their dependencies.
+"""
+import importlib
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+# Requests that need every route registered
+_SCHEMA_PATHS = ("/openapi.json", "/docs", "/redoc")
+
+
+@dataclass(frozen=True)
+class RouterSpec:
+    module: str
+    lazy_prefixes: Tuple[str, ...] = ()  # non-empty: import on first request under these paths
+    debug_only: bool = False
+    optional: bool = False  # module may not ship with this deployment
+    attr: str = "router"
+
+
+ROUTERS: List[RouterSpec] = [
+    RouterSpec("routes.agent_routes"),
+    RouterSpec("routes.psp_routes"),
+    RouterSpec("routes.payment_routes"),
+    RouterSpec("routes.auth_routes"),  # New authentication system
+    RouterSpec("routes.auth"),  # API auth endpoints (/api/auth/*)
+    RouterSpec("routes.admin_api"),  # Admin API endpoints
+    RouterSpec("routes.merchant_routes"),  # Merchant management endpoints
+    RouterSpec("routes.merchant_onboarding_routes"),  # Merchant onboarding (Phase 2)
+    RouterSpec("routes.merchant_dashboard_routes"),  # Merchant dashboard API
+    RouterSpec("routes.merchant_api_extensions"),  # Extended merchant API features
+    RouterSpec("routes.payout_routes"),  # Payout management
+    RouterSpec("routes.debug_integrations", ("/debug/integrations",)),  # Debug integrations
+    RouterSpec("routes.direct_db_check", ("/version-check", "/direct-db-check")),  # Direct DB check
+    RouterSpec("routes.init_merchant_data", ("/init-merchant-data",)),  # Initialize merchant data
+    RouterSpec("routes.cleanup_test_data", ("/cleanup-test-data",)),  # Cleanup test data
+    RouterSpec("routes.manage_integrations"),  # Manage integrations (delete/update)
+    RouterSpec("routes.psp_metrics"),  # Real PSP metrics
+    RouterSpec("routes.wix_sync"),  # Wix product sync
+    RouterSpec("routes.fix_duplicate_stores", ("/fix-duplicate-stores",)),  # Fix duplicate stores
+    RouterSpec("routes.cleanup_all_duplicates", ("/cleanup-all-duplicates",)),  # Cleanup all duplicates
+    RouterSpec("routes.admin_cleanup", ("/admin/cleanup-duplicates",)),  # Admin cleanup (no auth)
+    RouterSpec("routes.init_orders_table", ("/reinit-orders-table", "/init-orders-table", "/orders-stats")),
+    RouterSpec("routes.employee_dashboard_routes"),  # Employee dashboard endpoints
+    RouterSpec("routes.agents_mgmt"),  # Agents management
+    RouterSpec("routes.employees_security"),  # Employees and security
+    RouterSpec("routes.mcp_mgmt"),  # MCP management
+    RouterSpec("routes.employee_missing_endpoints"),  # Missing employee endpoints
+    RouterSpec("routes.agent_sdk_fixed"),  # Fixed SDK-ready agent endpoints
+    RouterSpec("routes.employee_store_psp_fixes"),  # Employee store/PSP connection fixes
+    RouterSpec("routes.employee_agent_mgmt"),  # Employee agent management
+    RouterSpec("routes.fix_agents_table", ("/admin/fix",)),  # Fix agents table schema
+    RouterSpec("routes.agent_payment_sdk"),  # Agent payment SDK endpoints
+    RouterSpec("routes.agent_debug", ("/agent/debug",), debug_only=True),  # Agent debug endpoints (TEMP)
+    RouterSpec("routes.admin_debug_products", ("/debug",), debug_only=True),  # Debug products endpoints
+    RouterSpec("routes.admin_populate_products", ("/test",), debug_only=True),  # Test data population
+    RouterSpec("routes.shopify_routes"),  # Shopify MCP integration
+    RouterSpec("routes.payment_execution_routes"),  # Payment execution (Phase 3)
+    RouterSpec("routes.product_routes"),  # Product management
+    RouterSpec("routes.product_sync"),  # Product sync from platforms
+    RouterSpec("routes.order_routes"),  # Order processing
+    RouterSpec("routes.webhook_routes"),  # Webhook handlers
+    RouterSpec("routes.agent_api"),  # Agent API endpoints
+    RouterSpec("routes.agent_management"),  # Agent management
+    RouterSpec("routes.fulfillment_api"),  # Fulfillment tracking for agents
+    RouterSpec("routes.refund_api"),  # Refund processing
+    RouterSpec("routes.agent_docs", ("/agent/docs",)),  # Agent developer docs
+    RouterSpec("routes.fix_orders_table", ("/admin/fix",)),  # Fix orders table structure
+    RouterSpec("routes.agent_metrics"),  # Agent API metrics and monitoring
+    RouterSpec("routes.agent_keys"),  # Agent API key management
+    RouterSpec("routes.init_agent_key", ("/admin/init",)),  # Initialize test agent key
+    RouterSpec("routes.create_test_agent", ("/admin/create",), debug_only=True),  # Create test agent account
+    RouterSpec("routes.debug_agent_key", ("/admin/debug",), debug_only=True),  # Debug agent key
+    RouterSpec("routes.debug_agents_table", ("/admin/debug",), debug_only=True),  # Debug agents table
+    RouterSpec("routes.performance_optimization"),  # Performance optimization
+    RouterSpec("routes.quick_index_setup", ("/setup",)),  # Quick setup (no auth)
+    RouterSpec("routes.debug_usage_logs", ("/admin/debug",), debug_only=True),  # Debug usage logs
+    RouterSpec("routes.debug_query_analytics", ("/admin/debug",), debug_only=True),  # Debug query analytics
+    RouterSpec("routes.debug_orders_agent", ("/admin/debug",), debug_only=True),  # Debug orders by agent
+    RouterSpec("routes.simulate_payments", ("/admin/simulate",)),  # Simulate payments for testing
+    RouterSpec("routes.agent_metrics_v1"),  # Stable /agent/v1/metrics aliases
+    RouterSpec("routes.shopify_setup", ("/shopify-setup",)),  # Shopify setup endpoints
+    RouterSpec("routes.shopify_manual", ("/shopify-manual",)),  # Shopify manual trigger endpoints
+    RouterSpec("routes.dashboard_routes"),  # Dashboard API
+    RouterSpec("routes.dashboard_api"),  # New Dashboard API
+    RouterSpec("routes.demo_data_routes", ("/api/demo",)),  # Demo data management
+    RouterSpec("routes.test_data_routes", ("/api/test",)),  # Test data for Lovable
+    RouterSpec("routes.simple_ws_routes"),  # Simple WebSocket
+    RouterSpec("routes.simple_mapping_routes", optional=True),
+    RouterSpec("routes.end_to_end_routes", optional=True),
+    RouterSpec("routes.mcp_routes", optional=True),
+    RouterSpec("routes.operations_routes", optional=True),
+]
+
+
+def _matches(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+class RouterRegistry:
+    """Includes eager routers and loads lazy ones on first use"""
+
+    def __init__(self, app, specs: List[RouterSpec], lazy: bool = True, debug: bool = False):
+        self.app = app
+        self.specs = [spec for spec in specs if debug or not spec.debug_only]
+        self.lazy = lazy
+        self._pending: List[RouterSpec] = []
+        self._loaded: Dict[str, float] = {}  # module -> import + include ms
+        self._unavailable: Dict[str, str] = {}
+
+    def include_all(self) -> None:
+        for spec in self.specs:
+            if self.lazy and spec.lazy_prefixes:
+                self._pending.append(spec)
+            else:
+                self._include(spec)
+
+    def included(self, module: str) -> bool:
+        return module in self._loaded
+
+    def _include(self, spec: RouterSpec) -> bool:
+        started = time.perf_counter()
+        try:
+            router = getattr(importlib.import_module(spec.module), spec.attr)
+        except ImportError as e:
+            if not spec.optional:
+                raise
+            self._unavailable[spec.module] = str(e)
+            return False
+        self.app.include_router(router)
+        self._loaded[spec.module] = round((time.perf_counter() - started) * 1000, 2)
+        return True
+
+    def _load(self, specs: List[RouterSpec]) -> None:
+        for spec in specs:
+            self._pending.remove(spec)
+            try:
+                self._include(spec)
+                logger.info(f"📦 Loaded router {spec.module} on first use ({self._loaded[spec.module]}ms)")
+            except Exception as e:
+                self._unavailable[spec.module] = str(e)
+                logger.error(f"❌ Could not load router {spec.module}: {e}")
+        # Routes changed: rebuild the cached OpenAPI schema on next request
+        self.app.openapi_schema = None
+
+    def ensure_loaded(self, path: str) -> None:
+        """Import the lazy routers that serve this path (no-op once all are loaded)"""
+        if not self._pending:
+            return
+        if path in _SCHEMA_PATHS:
+            self._load(list(self._pending))
+            return
+        matched = [
+            spec for spec in self._pending
+            if any(_matches(path, prefix) for prefix in spec.lazy_prefixes)
+        ]
+        if matched:
+            self._load(matched)
+
+    def load_all(self) -> None:
+        if self._pending:
+            self._load(list(self._pending))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lazy": self.lazy,
+            "loaded": self._loaded,
+            "pending": [spec.module for spec in self._pending],
+            "unavailable": self._unavailable,
+        }
+
+
+class LazyRouterMiddleware:
+    """ASGI middleware: load lazy routers before routing reaches them"""
+
+    def __init__(self, app, registry: Optional[RouterRegistry] = None):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if self.registry is not None and scope["type"] in ("http", "websocket"):
+            self.registry.ensure_loaded(scope["path"])
+        await self.app(scope, receive, send)
@@ -18,6 +18,7 @@ import logging
 from db.merchant_onboarding import merchant_onboarding
 from db.database import database
 from config.settings import settings
+from utils.merchant_context import notify_merchant_changed
 
 logger = logging.getLogger(__name__)
 
@@ -85,6 +86,7 @@ async def connect_shopify(req: ShopifyConnectRequest) -> Dict[str, Any]:
         )
     )
     await database.execute(upd)
+    await notify_merchant_changed(req.merchant_id)
 
     return {
         "status": "success",
@@ -159,6 +161,7 @@ async def oauth_callback(request: Request) -> Dict[str, Any]:
         .values(mcp_connected=True, mcp_platform="shopify", mcp_shop_domain=shop, mcp_access_token=access_token)
     )
     await database.execute(upd)
+    await notify_merchant_changed(state)
 
     return {"status": "success", "merchant_id": state, "shop": shop}
 
@@ -10,6 +10,7 @@ from db.orders import orders
 from db.database import database
 from routes.order_routes import create_shopify_order
 from utils.auth import require_admin
+from utils.merchant_context import notify_merchant_changed
 from utils.logger import logger
 
 router = APIRouter(prefix="/shopify-setup", tags=["Shopify Setup"])
@@ -46,6 +47,7 @@ async def configure_shopify(
     
     if not result:
         raise HTTPException(status_code=404, detail="Merchant not found")
+    await notify_merchant_changed(merchant_id)
     
     logger.info(f"Configured Shopify for merchant {merchant_id}")
     
@@ -7,39 +7,12 @@ import json
 import time
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from realtime.metrics_store import snapshot
+from realtime.ws_manager import get_connection_manager
 
 router = APIRouter(prefix="/api", tags=["simple-websocket"])
 
-# Simple connection manager
-class SimpleConnectionManager:
-    def __init__(self):
-        self.active_connections = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"✅ WebSocket connected. Total connections: {len(self.active_connections)}")
-    
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        print(f"❌ WebSocket disconnected. Total connections: {len(self.active_connections)}")
-    
-    async def send_json(self, websocket: WebSocket, data: dict):
-        try:
-            await websocket.send_text(json.dumps(data))
-        except Exception as e:
-            print(f"❌ Failed to send message: {e}")
-    
-    async def broadcast(self, data: dict):
-        for connection in self.active_connections.copy():
-            try:
-                await self.send_json(connection, data)
-            except:
-                self.disconnect(connection)
-
-# Global simple manager
-simple_manager = SimpleConnectionManager()
+# Shared fan-out manager (per-connection send queues; see realtime.ws_manager)
+simple_manager = get_connection_manager()
 
 @router.websocket("/ws/simple")
 async def simple_websocket(websocket: WebSocket):
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import routes.agent_api
+from db import migrate
+from db.orders import get_orders_page, orders
+from utils.pagination import decode_cursor, encode_cursor
+
+BASE = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _order(n, created_at, agent_id="agent_test"):
+    return {
+        "order_id": f"ORD_{n:03d}",
+        "merchant_id": "merch_a",
+        "agent_id": agent_id,
+        "customer_email": "buyer@example.com",
+        "shipping_address": {},
+        "items": [],
+        "subtotal": 10,
+        "total": 10,
+        "status": "pending",
+        "payment_status": "unpaid",
+        "created_at": created_at,
+    }
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    calls = []
+    rows = [_order(n, BASE - timedelta(minutes=n)) for n in range(3)]
+
+    async def get_page(**kwargs):
+        calls.append(kwargs)
+        return rows[:2], True
+
+    async def estimate(**kwargs):
+        return 42
+
+    monkeypatch.setattr(routes.agent_api, "get_orders_page", get_page)
+    monkeypatch.setattr(routes.agent_api, "estimate_order_count", estimate)
+    return calls
+
+
+def test_orders_route_returns_signed_next_cursor(agent_client, pages):
+    body = agent_client.get("/agent/v1/orders", params={"limit": 2}).json()
+    assert [o["order_id"] for o in body["orders"]] == ["ORD_000", "ORD_001"]
+    assert body["has_more"] and body["pagination"]["has_more"]
+    assert body["estimated_total"] == 42
+    assert decode_cursor(body["next_cursor"]) == (BASE - timedelta(minutes=1), "ORD_001")
+    assert pages[0]["agent_id"] == "agent_test" and pages[0]["after"] is None
+
+
+def test_orders_route_passes_cursor_as_keyset(agent_client, pages):
+    cursor = encode_cursor(BASE, "ORD_000")
+    body = agent_client.get("/agent/v1/orders", params={"cursor": cursor}).json()
+    assert pages[0]["after"] == (BASE, "ORD_000")
+    assert body["estimated_total"] is None
+
+
+@pytest.mark.parametrize("cursor", ["garbage", encode_cursor(BASE, "ORD_000")[:-2] + "xx"])
+def test_orders_route_rejects_invalid_cursor(agent_client, pages, cursor):
+    response = agent_client.get("/agent/v1/orders", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert pages == []
+
+
+def test_keyset_pages_cover_every_row_once(scratch_database):
+    db = scratch_database
+    # Pairs share a created_at so the order_id tiebreak matters
+    rows = [_order(n, BASE - timedelta(minutes=n // 2)) for n in range(7)]
+    rows.append(_order(99, BASE, agent_id="agent_other"))
+
+    async def scenario():
+        async with db:
+            await migrate.run_migrations()
+            await db.execute_many(orders.insert(), rows)
+            seen, after = [], None
+            while True:
+                page, has_more = await get_orders_page(agent_id="agent_test", limit=3, after=after)
+                seen.append([row["order_id"] for row in page])
+                if not has_more:
+                    return seen
+                after = decode_cursor(encode_cursor(page[-1]["created_at"], page[-1]["order_id"]))
+
+    seen = asyncio.run(scenario())
+    assert seen == [
+        ["ORD_001", "ORD_000", "ORD_003"],
+        ["ORD_002", "ORD_005", "ORD_004"],
+        ["ORD_006"],
+    ]
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import routes.agent_api
+from utils.product_index import ProductSearchIndex
+
+
+@pytest.fixture
+def index(monkeypatch):
+    index = ProductSearchIndex()
+    index.upsert("merch_a", "shopify", "1", {"title": "Red cotton shirt", "price": 25})
+    index.upsert("merch_a", "shopify", "2", {"title": "Blue jeans", "price": 60, "description": "Goes with a shirt"})
+    index.upsert("merch_a", "shopify", "3", {"title": "Shirt press", "price": 90, "in_stock": False})
+    index.upsert("merch_b", "shopify", "9", {"title": "Shirt hanger", "price": 5})
+    index.built = True
+    monkeypatch.setattr(routes.agent_api, "get_product_index", lambda: index)
+
+    async def merchants_by_ids(ids):
+        names = {"merch_a": "Shop A", "merch_b": "Shop B"}
+        return {mid: {"merchant_id": mid, "business_name": names[mid], "status": "active"} for mid in ids}
+
+    monkeypatch.setattr(routes.agent_api, "get_merchant_onboardings_by_ids", merchants_by_ids)
+    return index
+
+
+def test_search_route_is_served_by_the_product_index(agent_client, index):
+    response = agent_client.get("/agent/v1/products/search", params={"merchant_id": "merch_a", "query": "shirts"})
+    assert response.status_code == 200
+    body = response.json()
+    assert [p["title"] for p in body["products"]] == ["Red cotton shirt", "Blue jeans"]
+    assert body["products"][0]["relevance_score"] == 1.0
+    assert body["products"][0]["merchant_name"] == "Shop A"
+    assert body["pagination"]["total"] == body["pagination"]["total_count"] == 2
+    assert body["search_context"]["merchants_timed_out"] == []
+
+
+def test_search_accepts_sdk_in_stock_param(agent_client, index):
+    params = {"merchant_id": "merch_a", "query": "shirt", "in_stock": "false"}
+    body = agent_client.get("/agent/v1/products/search", params=params).json()
+    assert "Shirt press" in [p["title"] for p in body["products"]]
+
+
+def test_search_across_listed_merchants(agent_client, index):
+    params = {"merchant_ids": ["merch_a", "merch_b"], "query": "hanger"}
+    body = agent_client.get("/agent/v1/products/search", params=params).json()
+    assert [(p["title"], p["merchant_id"]) for p in body["products"]] == [("Shirt hanger", "merch_b")]
+
+
+def test_cold_index_fans_out_per_merchant_and_reports_timeouts(agent_client, monkeypatch):
+    index = ProductSearchIndex()
+    loaded = []
+
+    async def load_merchant(merchant_id):
+        loaded.append(merchant_id)
+        if merchant_id == "merch_b":
+            await asyncio.sleep(1)  # past the per-merchant deadline
+        index.upsert(merchant_id, "shopify", "1", {"title": f"Shirt from {merchant_id}"})
+        index._loaded_merchants.add(merchant_id)
+        return 1
+
+    monkeypatch.setattr(index, "load_merchant", load_merchant)
+    monkeypatch.setattr(index, "schedule_build", lambda: None)
+    monkeypatch.setattr(routes.agent_api, "get_product_index", lambda: index)
+    monkeypatch.setattr(routes.agent_api.settings, "search_merchant_timeout_ms", 50)
+
+    async def merchants_by_ids(ids):
+        return {mid: {"merchant_id": mid, "business_name": mid, "status": "active"} for mid in ids}
+
+    monkeypatch.setattr(routes.agent_api, "get_merchant_onboardings_by_ids", merchants_by_ids)
+
+    params = {"merchant_ids": ["merch_a", "merch_b"], "query": "shirt"}
+    body = agent_client.get("/agent/v1/products/search", params=params).json()
+
+    assert sorted(loaded) == ["merch_a", "merch_b"]
+    assert body["search_context"]["merchants_timed_out"] == ["merch_b"]
+    assert [p["merchant_id"] for p in body["products"]] == ["merch_a"]
@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils import http_client
+from utils.http_client import UpstreamClient, UpstreamConfig, _RetryBudget
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(_):
+        return None
+
+    monkeypatch.setattr(http_client.asyncio, "sleep", sleep)
+
+
+def make_client(handler, **config):
+    client = UpstreamClient("test", UpstreamConfig(**config))
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def status_sequence(*codes):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(codes[min(len(calls), len(codes)) - 1])
+
+    return handler, calls
+
+
+def test_budget_deposits_up_to_cap_and_spends_whole_tokens():
+    budget = _RetryBudget(ratio=0.5, min_tokens=1.0)
+    assert budget.max_tokens == 50.0
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(500):
+        budget.deposit()
+    assert budget.tokens == budget.max_tokens
+
+
+def test_idempotent_request_retried_on_503():
+    handler, calls = status_sequence(503, 503, 200)
+    client = make_client(handler, max_retries=2)
+    response = run(client.get("https://upstream.test/a"))
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert client.retries == 2
+
+
+def test_post_without_idempotency_key_not_retried_on_503():
+    handler, calls = status_sequence(503, 200)
+    client = make_client(handler)
+    assert run(client.post("https://upstream.test/a")).status_code == 503
+    assert len(calls) == 1
+
+
+def test_post_with_idempotency_key_retried_on_503():
+    handler, calls = status_sequence(503, 200)
+    client = make_client(handler)
+    response = run(client.post("https://upstream.test/a", headers={"Idempotency-Key": "k1"}))
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+
+def test_connect_error_retried_for_any_method_then_raised():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("refused", request=request)
+
+    client = make_client(handler, max_retries=2)
+    with pytest.raises(httpx.ConnectError):
+        run(client.post("https://upstream.test/a"))
+    assert len(calls) == 3
+    assert client.errors == 1
+
+
+def test_empty_budget_stops_retries():
+    handler, calls = status_sequence(503)
+    client = make_client(handler, max_retries=5, retry_ratio=0.1)
+    client._budget.tokens = 1.0
+    assert run(client.get("https://upstream.test/a")).status_code == 503
+    # One retry paid for by the single token (plus the 0.1 deposit); then the budget is dry
+    assert len(calls) == 2
+    calls.clear()
+    assert run(client.get("https://upstream.test/a")).status_code == 503
+    assert len(calls) == 1
+
+
+def test_budget_bounds_retry_amplification_under_outage():
+    handler, calls = status_sequence(503)
+    client = make_client(handler, max_retries=2, retry_ratio=0.1)
+    client._budget.tokens = 0.0
+    for _ in range(100):
+        run(client.get("https://upstream.test/a"))
+    # 100 requests deposit 10 tokens: at most ~10% extra load, not 3x
+    assert client.retries <= 10
+    assert len(calls) == 100 + client.retries
@@ -0,0 +1,111 @@
+import json
+import math
+import random
+
+import pytest
+
+from utils.latency_histogram import (
+    BUCKET_COUNT, LAYOUT_VERSION, HistogramWindow, LatencyHistogram, bucket_bounds, bucket_index
+)
+
+
+def _exact_percentile(values, quantile):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(quantile / 100.0 * len(ordered))) - 1]
+
+
+def test_bucket_index_lies_within_bucket_bounds():
+    for value in [0.07, 0.5, 1, 1.5, 3, 17.2, 250, 999.9, 12345, 4_000_000]:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value < high
+
+
+def test_bucket_index_clamps_out_of_range_values():
+    assert bucket_index(0) == 0
+    assert bucket_index(-5) == 0
+    assert bucket_index(1e-9) == 0
+    assert bucket_index(1e12) == BUCKET_COUNT - 1
+
+
+def test_percentiles_within_relative_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(4, 1) for _ in range(5000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for quantile in (50, 90, 95, 99):
+        exact = _exact_percentile(values, quantile)
+        assert histogram.percentile(quantile) == pytest.approx(exact, rel=0.035)
+    assert histogram.count == len(values)
+    assert histogram.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_percentiles_clamped_to_observed_range():
+    histogram = LatencyHistogram()
+    histogram.record(100)
+    assert histogram.percentiles() == {"p50": 100, "p95": 100, "p99": 100}
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentiles() == {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    assert histogram.summary()["count"] == 0
+    assert histogram.to_dict() == {"v": LAYOUT_VERSION, "n": 0}
+
+
+def test_merge_equals_recording_everything_in_one():
+    rng = random.Random(11)
+    parts = [[rng.uniform(1, 2000) for _ in range(300)] for _ in range(3)]
+    combined = LatencyHistogram()
+    histograms = []
+    for values in parts:
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+            combined.record(value)
+        histograms.append(histogram)
+
+    merged = LatencyHistogram.merged(histograms)
+    assert merged.counts == combined.counts
+    assert merged.count == combined.count
+    assert merged.total == pytest.approx(combined.total)
+    assert (merged.min, merged.max) == (combined.min, combined.max)
+    assert merged.percentiles() == combined.percentiles()
+
+
+def test_merge_with_empty_is_identity():
+    histogram = LatencyHistogram()
+    histogram.record(42)
+    histogram.merge(LatencyHistogram())
+    assert histogram.count == 1
+    assert LatencyHistogram().merge(histogram).counts == histogram.counts
+
+
+def test_to_dict_from_dict_round_trip_through_json():
+    histogram = LatencyHistogram()
+    for value in [0.3, 12, 12.1, 480, 480, 9000]:
+        histogram.record(value)
+
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+    assert restored.counts == histogram.counts
+    assert restored.count == histogram.count
+    assert restored.total == pytest.approx(histogram.total)
+    assert (restored.min, restored.max) == (histogram.min, histogram.max)
+    assert restored.percentiles() == histogram.percentiles()
+
+
+def test_from_dict_rejects_other_layouts():
+    with pytest.raises(ValueError):
+        LatencyHistogram.from_dict({"v": "log2/4/0/20", "n": 1, "o": 0, "c": [1]})
+
+
+def test_histogram_window_drops_expired_slots():
+    window = HistogramWindow(slot_seconds=60, slots=3)
+    assert window.record(10, ts=0) == 0
+    window.record(20, ts=61)
+    window.record(30, ts=200)  # reuses slot 0's position
+    assert window.get(0) is None
+    assert window.record(5, ts=1) == -1  # older than the window
+    assert [start for start, _ in window.items()] == [60, 180]
+    assert window.merged(since=180).count == 1
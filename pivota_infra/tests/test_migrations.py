@@ -0,0 +1,82 @@
+import asyncio
+import shutil
+from datetime import datetime, timedelta, timezone
+
+from db import migrate
+from db.partitions import PARTITIONED_TABLES, is_partitioned, list_partitions
+from utils.partition_maintenance import ensure_partitions
+
+
+def test_migration_chain_applies_to_create_all_schema(scratch_database):
+    db = scratch_database
+    head = migrate.list_migrations()[-1][0]
+    logged_at = datetime.now(timezone.utc) - timedelta(days=3)
+
+    async def scenario():
+        async with db:
+            # Production tables were built by create_all before the runner existed
+            await migrate._create_all()
+            await db.execute(
+                "INSERT INTO agent_usage_logs (agent_id, endpoint, method, request_id, timestamp) "
+                "VALUES ('agent_1', '/agent/v1/orders', 'GET', 'req_1', :ts)",
+                {"ts": logged_at}
+            )
+
+            first = await migrate.run_migrations()
+            second = await migrate.run_migrations()
+
+            partitioned = {parent: await is_partitioned(parent) for parent in PARTITIONED_TABLES}
+            parent = "agent_usage_logs"
+            column, period = PARTITIONED_TABLES[parent]
+            created = await ensure_partitions(parent, column, period, datetime.utcnow())
+            await db.execute(
+                "INSERT INTO agent_usage_logs (agent_id, endpoint, method, request_id) "
+                "VALUES ('agent_1', '/agent/v1/orders', 'GET', 'req_2')"
+            )
+            rows = await db.fetch_all("SELECT request_id FROM agent_usage_logs ORDER BY id")
+            statuses = await db.fetch_all("SELECT version, status FROM schema_version ORDER BY version")
+            indexes = await db.fetch_all(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'orders'"
+            )
+            partitions = await list_partitions(parent)
+            return first, second, partitioned, created, rows, statuses, indexes, partitions
+
+    first, second, partitioned, created, rows, statuses, indexes, partitions = asyncio.run(scenario())
+
+    assert first["status"] == "migrated"
+    assert first["version"] == head
+    assert second == {"status": "up_to_date", "version": head}
+    assert all(partitioned.values()), partitioned
+    assert created and len(partitions) == len(created) + 1
+    assert [row["request_id"] for row in rows] == ["req_1", "req_2"]
+    assert {row["status"] for row in statuses if row["version"] > migrate.LEGACY_VERSION} == {"applied"}
+    assert "idx_orders_merchant_created" in {row["indexname"] for row in indexes}
+
+
+def test_failing_migration_is_reported_not_swallowed(scratch_database, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    db = scratch_database
+    for _, name, path in migrate.list_migrations():
+        shutil.copy(path, tmp_path / name)
+    (tmp_path / "900_broken.sql").write_text("ALTER TABLE no_such_table ADD COLUMN x INTEGER;\n")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    monkeypatch.setattr(migrate, "_last_result", {})
+
+    async def scenario():
+        async with db:
+            return await migrate.run_migrations(), await migrate.run_migrations()
+
+    first, second = asyncio.run(scenario())
+
+    for result in (first, second):
+        assert result["status"] == "failed"
+        assert result["failed_migration"] == "900_broken.sql"
+        assert "no_such_table" in result["error"]
+    assert first["version"] == second["version"] < first["head"] == 900
+
+    health = TestClient(main.app).get("/health").json()
+    assert health["status"] == "degraded"
+    assert health["schema"]["failed_migration"] == "900_broken.sql"
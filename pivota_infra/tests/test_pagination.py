@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import pagination
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_round_trip_preserves_timestamp_and_id():
+    created_at = datetime(2024, 5, 17, 9, 30, 12, 345678)
+    assert decode_cursor(encode_cursor(created_at, "ORD_1")) == (created_at, "ORD_1")
+
+
+def test_round_trip_keeps_timezone():
+    created_at = datetime(2024, 5, 17, 9, 30, tzinfo=timezone.utc)
+    decoded, _ = decode_cursor(encode_cursor(created_at, "ORD_1"))
+    assert decoded == created_at
+    assert decoded.tzinfo is not None
+
+
+def test_cursor_is_url_safe_without_padding():
+    for n in range(1, 8):
+        cursor = encode_cursor(datetime(2024, 1, 1), "x" * n)
+        assert "=" not in cursor
+        assert all(c.isalnum() or c in "-_." for c in cursor)
+        assert decode_cursor(cursor)[1] == "x" * n
+
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_missing_cursor_means_first_page(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "a.b", "!!!.???", "e30.", "..."])
+def test_garbage_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_tampered_payload_rejected():
+    cursor = encode_cursor(datetime(2024, 1, 1), "ORD_1")
+    _, signature = cursor.split(".")
+    forged = base64.urlsafe_b64encode(json.dumps(["2030-01-01T00:00:00", "ORD_1"]).encode()).decode().rstrip("=")
+    with pytest.raises(InvalidCursor):
+        decode_cursor(f"{forged}.{signature}")
+
+
+def test_cursor_from_another_key_rejected(monkeypatch):
+    cursor = encode_cursor(datetime(2024, 1, 1), "ORD_1")
+    monkeypatch.setattr(pagination.settings, "jwt_secret_key", "rotated", raising=False)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_invalid_cursor_is_a_value_error():
+    assert issubclass(InvalidCursor, ValueError)
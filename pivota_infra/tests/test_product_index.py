@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from utils.product_index import ProductSearchIndex, tokenize
+
+
+def make_index():
+    index = ProductSearchIndex()
+    index.upsert("m1", "shopify", "1", {"title": "Red cotton shirt", "category": "Apparel", "price": 25})
+    index.upsert("m1", "shopify", "2", {"title": "Blue denim jeans", "category": "Apparel", "price": 60,
+                                        "description": "Pairs well with a shirt"})
+    index.upsert("m1", "shopify", "3", {"title": "Ceramic mug", "category": "Kitchen", "price": 12,
+                                        "in_stock": False})
+    index.upsert("m2", "wix", "9", {"title": "Shirt hanger", "category": "Home", "price": 5})
+    return index
+
+
+def ids(results):
+    return [product["title"] for _, product, _ in results]
+
+
+def test_tokenize_strips_html_and_folds_plurals():
+    assert tokenize("<p>Red Shirts</p> & glass") == ["red", "shirt", "glass"]
+    assert tokenize(None) == []
+
+
+def test_title_match_outranks_description_match():
+    results, total = make_index().search(["m1"], query="shirts")
+    assert ids(results) == ["Red cotton shirt", "Blue denim jeans"]
+    assert total == 2
+    assert results[0][0] == 1.0
+    assert 0 < results[1][0] < 1.0
+
+
+def test_search_is_scoped_to_merchants():
+    results, _ = make_index().search(["m2"], query="shirt")
+    assert ids(results) == ["Shirt hanger"]
+    assert results[0][2] == "m2"
+
+
+def test_filters_apply_to_scored_results():
+    index = make_index()
+    assert ids(index.search(["m1"], query="shirt", max_price=30)[0]) == ["Red cotton shirt"]
+    assert ids(index.search(["m1"], query="shirt", category="kitchen")[0]) == []
+    assert ids(index.search(["m1"], query="mug")[0]) == []
+    assert ids(index.search(["m1"], query="mug", in_stock_only=False)[0]) == ["Ceramic mug"]
+
+
+def test_empty_query_lists_newest_first_with_paging():
+    index = ProductSearchIndex()
+    base = datetime(2024, 1, 1)
+    for i in range(5):
+        index.upsert("m1", "shopify", str(i), {"title": f"Item {i}"}, cached_at=base + timedelta(minutes=i))
+    results, total = index.search(["m1"], limit=2, offset=1)
+    assert total == 5
+    assert ids(results) == ["Item 3", "Item 2"]
+
+
+def test_upsert_replaces_postings_and_remove_unindexes():
+    index = make_index()
+    index.upsert("m1", "shopify", "1", {"title": "Green wool sweater", "price": 80})
+    assert ids(index.search(["m1"], query="cotton")[0]) == []
+    assert ids(index.search(["m1"], query="sweater")[0]) == ["Green wool sweater"]
+
+    assert index.remove("m1", "shopify", "1")
+    assert not index.remove("m1", "shopify", "1")
+    assert ids(index.search(["m1"], query="sweater")[0]) == []
+    assert "sweater" not in index._postings
+
+
+def test_remove_merchant_and_expiry():
+    index = make_index()
+    assert index.remove_merchant("m1") == 3
+    assert ids(index.search(["m1"], query="shirt")[0]) == []
+    assert index.stats()["products"] == 1
+
+    index.upsert("m3", "shopify", "1", {"title": "Old shirt"}, expires_at=datetime.now() - timedelta(seconds=1))
+    assert ids(index.search(["m3"], query="shirt")[0]) == []
+    index.extend_merchant("m3", "shopify", datetime.now() + timedelta(hours=1))
+    assert ids(index.search(["m3"], query="shirt")[0]) == ["Old shirt"]
+
+
+def test_total_length_tracks_incremental_updates():
+    index = make_index()
+    rebuilt = ProductSearchIndex()
+    index.upsert("m1", "shopify", "2", {"title": "Blue jeans"})
+    index.remove("m2", "wix", "9")
+    for doc in index._docs.values():
+        rebuilt.upsert(doc.merchant_id, doc.key[1], doc.key[2], doc.product)
+    assert abs(index._total_length - rebuilt._total_length) < 1e-9
+    assert sorted(index._bm25(["jean"]).values()) == sorted(rebuilt._bm25(["jean"]).values())
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from utils import quota_counter
+from utils.quota_counter import (
+    InMemoryQuotaCounter, _FallbackQuotaCounter, _sliding_count
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pin time.time() / time.monotonic() inside utils.quota_counter"""
+    now = {"t": 1_700_000_040.0}
+
+    class FakeTime:
+        @staticmethod
+        def time():
+            return now["t"]
+
+        @staticmethod
+        def monotonic():
+            return now["t"]
+
+    monkeypatch.setattr(quota_counter, "time", FakeTime)
+    return now
+
+
+def test_sliding_count_weights_previous_window():
+    assert _sliding_count(100, 10, now=60.0, window=60) == 110  # window just started
+    assert _sliding_count(100, 10, now=90.0, window=60) == 60  # halfway through
+    assert _sliding_count(100, 10, now=119.999, window=60) == 10
+
+
+def test_rate_limit_rejections_are_not_counted(clock):
+    counter = InMemoryQuotaCounter(window_seconds=60)
+    decisions = [run(counter.consume("agent", rate_limit=3)) for _ in range(5)]
+
+    assert [d.allowed for d in decisions] == [True, True, True, False, False]
+    assert decisions[3].reason == "rate_limit"
+    assert decisions[2].rate_remaining == 0
+    assert run(counter.peek("agent")) == (3, 3)
+
+
+def test_window_rolls_over(clock):
+    counter = InMemoryQuotaCounter(window_seconds=60)
+    for _ in range(3):
+        run(counter.consume("agent", rate_limit=3))
+    assert not run(counter.consume("agent", rate_limit=3)).allowed
+
+    clock["t"] += 120  # previous window no longer overlaps
+    decision = run(counter.consume("agent", rate_limit=3))
+    assert decision.allowed
+    assert decision.minute_count == 1
+
+
+def test_daily_quota(clock):
+    counter = InMemoryQuotaCounter(window_seconds=60)
+    for _ in range(2):
+        assert run(counter.consume("agent", rate_limit=100, daily_quota=2)).allowed
+    decision = run(counter.consume("agent", rate_limit=100, daily_quota=2))
+
+    assert not decision.allowed
+    assert decision.reason == "daily_quota"
+    assert decision.quota_remaining == 0
+
+
+def test_reconcile_only_raises_daily_counts(clock):
+    counter = InMemoryQuotaCounter(window_seconds=60)
+    run(counter.consume("a", rate_limit=100))
+    run(counter.consume("b", rate_limit=100))
+    run(counter.consume("b", rate_limit=100))
+    run(counter.reconcile_daily({"a": 5, "b": 1}))
+
+    assert run(counter.peek("a"))[1] == 5
+    assert run(counter.peek("b"))[1] == 2
+
+
+def test_subjects_are_independent(clock):
+    counter = InMemoryQuotaCounter(window_seconds=60)
+    run(counter.consume("a", rate_limit=1))
+    assert not run(counter.consume("a", rate_limit=1)).allowed
+    assert run(counter.consume("b", rate_limit=1)).allowed
+
+
+class FlakyCounter(InMemoryQuotaCounter):
+    name = "redis"
+
+    def __init__(self):
+        super().__init__(window_seconds=60)
+        self.down = False
+        self.calls = 0
+
+    async def consume(self, subject, rate_limit, daily_quota=None):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("redis down")
+        return await super().consume(subject, rate_limit, daily_quota)
+
+
+def test_fallback_degrades_and_recovers(clock):
+    primary = FlakyCounter()
+    counter = _FallbackQuotaCounter(primary, InMemoryQuotaCounter(window_seconds=60), retry_seconds=30)
+
+    assert run(counter.consume("agent", rate_limit=100)).allowed
+    assert counter.name == "redis"
+
+    primary.down = True
+    assert run(counter.consume("agent", rate_limit=100)).allowed  # served by memory
+    assert counter.degraded and counter.name == "memory"
+
+    # No Redis retry until retry_seconds have passed
+    calls = primary.calls
+    run(counter.consume("agent", rate_limit=100))
+    assert primary.calls == calls
+
+    primary.down = False
+    clock["t"] += 31
+    run(counter.consume("agent", rate_limit=100))
+    assert primary.calls == calls + 1
+    assert not counter.degraded and counter.name == "redis"
+
+
+def test_quota_counter_is_abstract():
+    with pytest.raises(TypeError):
+        quota_counter.QuotaCounter()
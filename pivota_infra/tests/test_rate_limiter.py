@@ -0,0 +1,28 @@
+import secrets
+
+import pytest
+
+from middleware.rate_limiter import AGENT_KEY_PATTERN
+
+
+@pytest.mark.parametrize("api_key", [
+    f"ak_{secrets.token_hex(32)}",  # db.agents
+    f"ak_live_{secrets.token_hex(32)}",  # employee / sdk routes
+    f"ak_test_{secrets.token_hex(32)}",  # routes/agent_keys
+    f"ak_{secrets.token_urlsafe(32)}",  # routes/agents_mgmt
+    f"ak_demo_{secrets.token_hex(16)}",
+])
+def test_issued_agent_keys_take_the_agent_path(api_key):
+    assert AGENT_KEY_PATTERN.match(api_key)
+
+
+@pytest.mark.parametrize("api_key", [
+    "",
+    "ak_",
+    "ak_short",
+    "sk_live_" + "a" * 64,
+    "ak_" + "a" * 40 + " OR 1=1",
+    "ak_" + "a" * 200,
+])
+def test_other_keys_skip_the_agent_lookup(api_key):
+    assert not AGENT_KEY_PATTERN.match(api_key)
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+from utils.latency_histogram import (
+    BUCKET_COUNT, MAX_EXPONENT, MIN_EXPONENT, SUB_BUCKETS, bucket_index
+)
+
+MIGRATION = Path(__file__).resolve().parent.parent / "db" / "migrations" / "007_usage_rollups.sql"
+
+
+def _bucket_function_sql():
+    match = re.search(
+        r"CREATE OR REPLACE FUNCTION usage_rollup_bucket\(.*?\$\$.*?\$\$;",
+        MIGRATION.read_text(),
+        re.S,
+    )
+    assert match, "usage_rollup_bucket missing from 007_usage_rollups.sql"
+    return match.group(0)
+
+
+def _sql_bucket(ms):
+    """The SQL expression step for step: 33 - position('1' in ms::bit(32)::text) is the bit length"""
+    if ms is None:
+        return None
+    if ms <= 0:
+        return 0
+    bits = 33 - (format(ms, "032b").find("1") + 1)
+    if bits > 23:
+        return 863
+    return (bits + 3) * 32 + ((ms * 64) >> bits) - 32
+
+
+def _sample_ms():
+    values = set(range(0, 5000))
+    for exponent in range(MAX_EXPONENT + 3):
+        for offset in (-1, 0, 1):
+            values.add(max(0, (1 << exponent) + offset))
+    values.update([123_456, 1_000_000, 8_388_607, 8_388_608, 2_000_000_000])
+    return sorted(values)
+
+
+def test_sql_constants_follow_the_python_layout():
+    sql = _bucket_function_sql()
+    assert f"> {MAX_EXPONENT} THEN {BUCKET_COUNT - 1}" in sql
+    assert f"+ {-MIN_EXPONENT}) * {SUB_BUCKETS}" in sql
+    assert f"* {2 * SUB_BUCKETS}) >>" in sql
+    assert f"- {SUB_BUCKETS}" in sql
+
+
+def test_sql_expression_matches_bucket_index():
+    for ms in _sample_ms():
+        assert _sql_bucket(ms) == bucket_index(ms), ms
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_postgres_function_matches_bucket_index():
+    asyncpg = pytest.importorskip("asyncpg")
+    values = _sample_ms()
+
+    async def fetch():
+        conn = await asyncpg.connect(os.environ["TEST_DATABASE_URL"])
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            await conn.execute(_bucket_function_sql())
+            return await conn.fetch(
+                "SELECT ms, usage_rollup_bucket(ms) AS bucket FROM unnest($1::int[]) AS ms", values
+            )
+        finally:
+            # Leave the test database as it was
+            await transaction.rollback()
+            await conn.close()
+
+    for row in asyncio.run(fetch()):
+        assert row["bucket"] == bucket_index(row["ms"]), row["ms"]
+
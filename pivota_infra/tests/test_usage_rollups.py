@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from db import migrate
+from db.agents import get_agent_analytics
+from db.usage_rollups import (
+    get_usage_by_agent, get_usage_by_endpoint, get_usage_latency_histogram, get_usage_timeline,
+    get_usage_totals, upsert_usage_rollups, usage_rollup_hour, usage_rollup_minute
+)
+from utils.latency_histogram import LatencyHistogram
+
+
+def _row(bucket_start, status_code, requests, latencies, gmv="0", orders=0, endpoint="/agent/v1/orders"):
+    histogram = LatencyHistogram()
+    for value in latencies:
+        histogram.record(value)
+    return {
+        "bucket_start": bucket_start,
+        "agent_id": "agent_1",
+        "endpoint": endpoint,
+        "status_code": status_code,
+        "request_count": requests,
+        "error_count": requests if status_code >= 400 else 0,
+        "latency_count": len(latencies),
+        "latency_sum_ms": sum(latencies),
+        "latency_min_ms": min(latencies),
+        "latency_max_ms": max(latencies),
+        "histogram": {str(k): v for k, v in histogram.counts.items()},
+        "order_count": orders,
+        "gmv": Decimal(gmv),
+    }
+
+
+def test_totals_and_breakdowns_return_plain_numbers(scratch_database):
+    db = scratch_database
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+    since = hour - timedelta(hours=1)
+
+    async def scenario():
+        async with db:
+            await migrate.run_migrations()
+            await upsert_usage_rollups(usage_rollup_hour, [
+                _row(hour, 200, 3, [10, 20, 30], gmv="99.50", orders=2),
+                _row(hour, 500, 1, [40], endpoint="/agent/v1/payments"),
+            ])
+            # Accumulates into the same cell
+            await upsert_usage_rollups(usage_rollup_hour, [_row(hour, 200, 1, [40], gmv="0.50", orders=1)])
+            await upsert_usage_rollups(usage_rollup_minute, [_row(hour, 200, 1, [10])])
+            return (
+                await get_usage_totals(since),
+                await get_usage_timeline(since, period="day"),
+                await get_usage_by_agent(since),
+                await get_usage_by_endpoint(since),
+                await get_usage_latency_histogram(since),
+                await get_agent_analytics("agent_1", since.replace(tzinfo=None)),
+            )
+
+    totals, timeline, by_agent, by_endpoint, latency, analytics = asyncio.run(scenario())
+
+    assert totals["requests"] == 5
+    assert totals["successful"] == 4
+    assert totals["errors"] == 1 and totals["server_errors"] == 1
+    assert totals["orders"] == 3
+    assert totals["gmv"] == 100.0
+    assert totals["avg_response_time_ms"] == 28.0
+    for key in ("requests", "successful", "errors", "latency_count", "latency_sum_ms", "orders", "gmv"):
+        assert not isinstance(totals[key], Decimal), key
+
+    assert timeline[0]["requests"] == 5 and timeline[0]["gmv"] == 100.0
+    assert not isinstance(timeline[0]["requests"], Decimal)
+    assert by_agent["agent_1"]["request_count"] == 5
+    assert by_endpoint[0] == {"endpoint": "/agent/v1/orders", "count": 4, "avg_time": 25.0}
+    assert latency.count == 5
+
+    summary = analytics["summary"]
+    assert summary["total_requests"] == 5
+    assert summary["avg_response_time"] == 28.0
+    assert analytics["success_rate"] == 80.0
@@ -0,0 +1,170 @@
+"""
+Agent credential cache
+In-process TTL + LRU cache of resolved agents keyed by SHA-256 of the API key,
+invalidated across workers through Postgres LISTEN/NOTIFY
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from config.settings import settings
+from utils.pg_listener import PgNotifyListener, pg_notify
+
+AGENT_CACHE_CHANNEL = "agent_cache_invalidate"
+
+
+def hash_api_key(api_key: str) -> str:
+    """SHA-256 hex digest used as the cache key (never store raw keys)"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class AgentCredentialCache:
+    """Bounded TTL + LRU cache of agent rows resolved from API keys"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key_hash -> (expires_at, agent)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # agent_id -> key hashes currently cached for that agent
+        self._by_agent: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key_hash: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached agent, or None on miss/expiry"""
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, agent = entry
+        if expires_at < time.monotonic():
+            self._remove(key_hash)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key_hash)
+        self.hits += 1
+        return dict(agent)
+
+    def put(self, key_hash: str, agent: Dict[str, Any]) -> None:
+        """Cache an agent row, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            return
+        if key_hash in self._entries:
+            self._remove(key_hash)
+        self._entries[key_hash] = (time.monotonic() + self.ttl_seconds, dict(agent))
+        agent_id = agent.get("agent_id")
+        if agent_id:
+            self._by_agent.setdefault(agent_id, set()).add(key_hash)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_agent(self, agent_id: str) -> int:
+        """Drop every cached key belonging to an agent"""
+        hashes = self._by_agent.pop(agent_id, set())
+        for key_hash in hashes:
+            self._entries.pop(key_hash, None)
+        self.invalidations += len(hashes)
+        return len(hashes)
+
+    def invalidate_key(self, key_hash: str) -> bool:
+        """Drop a single cached key"""
+        if key_hash not in self._entries:
+            return False
+        self._remove(key_hash)
+        self.invalidations += 1
+        return True
+
+    def clear(self) -> None:
+        """Drop everything (e.g. after the invalidation listener reconnects)"""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._by_agent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "listener_connected": _listener.connected,
+        }
+
+    def _remove(self, key_hash: str) -> None:
+        entry = self._entries.pop(key_hash, None)
+        if entry is None:
+            return
+        agent_id = entry[1].get("agent_id")
+        hashes = self._by_agent.get(agent_id)
+        if hashes is not None:
+            hashes.discard(key_hash)
+            if not hashes:
+                self._by_agent.pop(agent_id, None)
+
+
+def _apply_invalidation(payload: str) -> None:
+    """Apply a NOTIFY payload ({"agent_id": ...} / {"key_hash": ...} / {"all": true})"""
+    try:
+        message = json.loads(payload) if payload else {}
+    except ValueError:
+        message = {"agent_id": payload}
+    if message.get("all"):
+        _cache.clear()
+        return
+    if message.get("agent_id"):
+        _cache.invalidate_agent(message["agent_id"])
+    if message.get("key_hash"):
+        _cache.invalidate_key(message["key_hash"])
+
+
+_cache = AgentCredentialCache(
+    max_entries=settings.agent_cache_max_entries,
+    ttl_seconds=settings.agent_cache_ttl_seconds,
+)
+_listener = PgNotifyListener(
+    AGENT_CACHE_CHANNEL, _apply_invalidation, on_connect=_cache.clear, label="Agent cache"
+)
+
+
+def get_agent_cache() -> AgentCredentialCache:
+    """Get the process-wide agent credential cache"""
+    return _cache
+
+
+async def start_agent_cache_listener() -> None:
+    """Start the LISTEN task (call from app startup)"""
+    _listener.start()
+
+
+async def stop_agent_cache_listener() -> None:
+    """Stop the LISTEN task (call from app shutdown)"""
+    await _listener.stop()
+
+
+async def notify_agent_changed(agent_id: Optional[str] = None, key_hash: Optional[str] = None) -> None:
+    """
+    Invalidate locally and broadcast to every worker via NOTIFY.
+    Call after any write to agents / api_keys that affects authentication.
+    """
+    message: Dict[str, Any] = {}
+    if agent_id:
+        message["agent_id"] = agent_id
+    if key_hash:
+        message["key_hash"] = key_hash
+    if not message:
+        message["all"] = True
+    payload = json.dumps(message)
+    _apply_invalidation(payload)
+    await pg_notify(AGENT_CACHE_CHANNEL, payload)
@@ -8,6 +8,8 @@ import re
 from typing import Dict, Tuple
 from urllib.parse import urlparse
 
+from utils.http_client import get_http_client
+
 async def validate_store_url(store_url: str) -> Tuple[bool, str]:
     """
     验证 Store URL 是否可访问
@@ -39,15 +41,15 @@ async def validate_store_url(store_url: str) -> Tuple[bool, str]:
         
         # 3. 尝试访问 URL（设置较短的超时）
         try:
-            async with httpx.AsyncClient(timeout=5.0, follow_redirects=True) as client:
-                response = await client.head(store_url)
-                if response.status_code < 400:
-                    return True, f"Store URL accessible (Status: {response.status_code})"
-                else:
-                    # 即使返回 4xx，如果是已知平台也接受
-                    if is_known_platform:
-                        return True, f"Known e-commerce platform detected: {parsed.netloc}"
-                    return False, f"Store URL returned error: {response.status_code}"
+            client = get_http_client("web")
+            response = await client.head(store_url, follow_redirects=True)
+            if response.status_code < 400:
+                return True, f"Store URL accessible (Status: {response.status_code})"
+            else:
+                # 即使返回 4xx，如果是已知平台也接受
+                if is_known_platform:
+                    return True, f"Known e-commerce platform detected: {parsed.netloc}"
+                return False, f"Store URL returned error: {response.status_code}"
         except httpx.TimeoutException:
             # 超时但如果是已知平台，仍然接受
             if is_known_platform:
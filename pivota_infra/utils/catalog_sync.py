@@ -0,0 +1,227 @@
+"""
+Streaming catalog sync
+Walks every Shopify product page (page_info cursors, leaky-bucket limited),
+converts pages to StandardProduct off the event loop while the next page is
+being fetched, writes each page to products_cache in one bulk upsert and
+records a per-merchant checkpoint so an interrupted sync resumes where it stopped.
+
+Incremental mode only fetches products with updated_at >= the stored
+high-water mark; combined with products/* webhooks this keeps the cache
+current without re-pulling the whole catalog.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from adapters.product_adapters import (
+    SHOPIFY_MAX_PAGE_SIZE, ShopifyLeakyBucket, ShopifyProductAdapter,
+)
+from db.products import (
+    bulk_upsert_product_cache, extend_product_cache, get_sync_state,
+    prune_product_cache, save_sync_state,
+)
+from utils.inventory_service import get_inventory_service
+from utils.logger import logger
+
+PLATFORM = "shopify"
+PREFETCH_PAGES = 2  # pages buffered between fetch and write: bounds memory
+STALE_RUN_SECONDS = 300  # a "running" checkpoint older than this belongs to a dead worker
+HWM_OVERLAP_SECONDS = 60  # re-fetch a little before the high-water mark (clock skew, same-second writes)
+
+_running: Set[str] = set()
+_DONE = object()
+
+
+class SyncInProgress(Exception):
+    """Another sync for the same merchant is still running"""
+
+
+def _to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _convert_page(
+    raw_products: List[Dict[str, Any]], merchant_id: str
+) -> Tuple[List[Tuple[str, str]], Optional[datetime]]:
+    """
+    CPU stage: Shopify JSON -> StandardProduct -> serialized payload (runs in a thread).
+    Also returns the newest updated_at on the page (UTC) for the high-water mark.
+    """
+    rows = []
+    newest = None
+    for raw in raw_products:
+        try:
+            product = ShopifyProductAdapter.convert_to_standard(raw, merchant_id)
+        except Exception as e:
+            logger.error(f"Failed to convert Shopify product {raw.get('id')}: {e}")
+            continue
+        rows.append((product.id, product.json()))
+        updated_at = _to_utc_naive(product.updated_at)
+        if updated_at and (newest is None or updated_at > newest):
+            newest = updated_at
+    return rows, newest
+
+
+async def _fetch_stage(
+    queue: "asyncio.Queue",
+    shop_domain: str,
+    access_token: str,
+    page_size: int,
+    cursor: Optional[str],
+    extra_params: Optional[Dict[str, Any]],
+) -> None:
+    try:
+        async for raw_products, next_cursor in ShopifyProductAdapter.iter_product_pages(
+            shop_domain,
+            access_token,
+            page_size=page_size,
+            page_info=cursor,
+            limiter=ShopifyLeakyBucket(),
+            extra_params=extra_params,
+        ):
+            await queue.put((raw_products, next_cursor))
+        await queue.put(_DONE)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+
+
+async def sync_shopify_catalog(
+    merchant_id: str,
+    shop_domain: str,
+    access_token: str,
+    ttl_seconds: int = 86400,
+    page_size: int = SHOPIFY_MAX_PAGE_SIZE,
+    resume: bool = True,
+    incremental: bool = False,
+) -> Dict[str, Any]:
+    """
+    Sync a merchant's Shopify catalog into products_cache.
+
+    Full mode walks every product and afterwards drops cached products that
+    no longer exist. Incremental mode fetches only products updated since the
+    high-water mark (falls back to full when there is none yet) and then
+    extends the TTL of the merchant's cached rows, since they are confirmed
+    current.
+
+    Returns {"mode", "products_synced", "pages_synced", "pruned", "resumed", "started_at"}.
+    Raises SyncInProgress if a live sync for this merchant exists; any other
+    error leaves the checkpoint at the last committed page for resume=True.
+    """
+    if merchant_id in _running:
+        raise SyncInProgress(f"Product sync already running for merchant {merchant_id}")
+
+    state = await get_sync_state(merchant_id, PLATFORM)
+    if (
+        state
+        and state.get("status") == "running"
+        and state.get("updated_at")
+        and datetime.now() - state["updated_at"] < timedelta(seconds=STALE_RUN_SECONDS)
+    ):
+        raise SyncInProgress(f"Product sync already running for merchant {merchant_id}")
+
+    high_water_mark = state.get("high_water_mark") if state else None
+    extra_params: Optional[Dict[str, Any]] = None
+    resumed = bool(resume and state and state.get("status") in ("running", "failed") and state.get("cursor"))
+    if resumed:
+        # The cursor already encodes the original run's filters
+        mode = state.get("mode") or "full"
+        cursor = state["cursor"]
+        products_synced = state.get("products_synced") or 0
+        pages_synced = state.get("pages_synced") or 0
+        started_at = state.get("started_at") or datetime.now()
+        logger.info(f"↩️ Resuming {mode} product sync for {merchant_id} after {pages_synced} pages")
+    else:
+        mode = "incremental" if incremental and high_water_mark else "full"
+        cursor, products_synced, pages_synced, started_at = None, 0, 0, datetime.now()
+        if mode == "incremental":
+            since = high_water_mark - timedelta(seconds=HWM_OVERLAP_SECONDS)
+            extra_params = {"updated_at_min": since.replace(tzinfo=timezone.utc).isoformat()}
+
+    _running.add(merchant_id)
+    queue: "asyncio.Queue" = asyncio.Queue(maxsize=PREFETCH_PAGES)
+    fetcher: Optional[asyncio.Task] = None
+    try:
+        await save_sync_state(
+            merchant_id, PLATFORM,
+            status="running", mode=mode, cursor=cursor, started_at=started_at,
+            products_synced=products_synced, pages_synced=pages_synced,
+            completed_at=None, last_error=None,
+        )
+        fetcher = asyncio.create_task(
+            _fetch_stage(queue, shop_domain, access_token, page_size, cursor, extra_params)
+        )
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            raw_products, next_cursor = item
+
+            rows, newest = await loop.run_in_executor(None, _convert_page, raw_products, merchant_id)
+            if newest and (high_water_mark is None or newest > high_water_mark):
+                high_water_mark = newest
+            products_synced += await bulk_upsert_product_cache(
+                merchant_id=merchant_id,
+                platform=PLATFORM,
+                products=rows,
+                ttl_seconds=ttl_seconds,
+            )
+            # Variant quantities ride along, so order checks start warm
+            await get_inventory_service().record_products(merchant_id, raw_products)
+            pages_synced += 1
+            # Checkpoint only after the page is committed
+            await save_sync_state(
+                merchant_id, PLATFORM,
+                status="running", cursor=next_cursor,
+                products_synced=products_synced, pages_synced=pages_synced,
+            )
+
+        pruned = 0
+        if mode == "full":
+            # Anything not rewritten during this run was deleted on Shopify
+            pruned = await prune_product_cache(merchant_id, PLATFORM, started_at)
+        else:
+            await extend_product_cache(merchant_id, PLATFORM, ttl_seconds)
+
+        # The high-water mark only moves once the whole run has committed
+        await save_sync_state(
+            merchant_id, PLATFORM,
+            status="completed", cursor=None, completed_at=datetime.now(),
+            products_synced=products_synced, pages_synced=pages_synced,
+            high_water_mark=high_water_mark,
+        )
+        logger.info(
+            f"✅ {mode.capitalize()} catalog sync for {merchant_id}: "
+            f"{products_synced} products in {pages_synced} pages, {pruned} pruned"
+        )
+        return {
+            "mode": mode,
+            "pruned": pruned,
+            "products_synced": products_synced,
+            "pages_synced": pages_synced,
+            "resumed": resumed,
+            "started_at": started_at,
+        }
+    except Exception as e:
+        try:
+            await save_sync_state(merchant_id, PLATFORM, status="failed", last_error=str(e)[:1000])
+        except Exception as state_err:
+            logger.warning(f"⚠️ Could not record sync failure for {merchant_id}: {state_err}")
+        raise
+    finally:
+        _running.discard(merchant_id)
+        if fetcher is not None and not fetcher.done():
+            fetcher.cancel()
+            try:
+                await fetcher
+            except (asyncio.CancelledError, Exception):
+                pass
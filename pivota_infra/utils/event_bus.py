@@ -0,0 +1,217 @@
+"""
+Cross-worker event bus
+publish() delivers a message to every subscriber of a channel in every
+worker exactly once: handlers in this worker run immediately, and the Redis
+backend relays the message to the other workers/replicas over pub/sub
+(skipping its own messages when they come back). The in-memory backend
+covers single-process deployments.
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from config.settings import settings
+from utils.logger import logger
+from utils.redis_client import get_redis_client
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_instance_id: Optional[str] = None
+_instance_pid: Optional[int] = None
+
+
+def get_instance_id() -> str:
+    """
+    host:pid:boot of this worker (computed after fork, so preloaded workers
+    differ). The random boot part keeps a restarted container - same hostname,
+    often pid 1 again - from taking over the previous process's identity
+    and its persisted per-instance rows.
+    """
+    global _instance_id, _instance_pid
+    pid = os.getpid()
+    if _instance_id is None or _instance_pid != pid:
+        _instance_id = f"{socket.gethostname()[:63]}:{pid}:{uuid.uuid4().hex[:12]}"
+        _instance_pid = pid
+    return _instance_id
+
+
+class EventBus:
+    """In-memory backend: delivers to this process's subscribers only"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._pending: Set[asyncio.Task] = set()
+        self.published = 0
+        self.delivered = 0
+        self.handler_errors = 0
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self.published += 1
+        await self._dispatch(channel, message)
+
+    def publish_nowait(self, channel: str, message: Dict[str, Any]) -> None:
+        """publish() from sync code; a no-op outside a running event loop"""
+        try:
+            task = asyncio.get_running_loop().create_task(self.publish(channel, message))
+        except RuntimeError:
+            return
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _dispatch(self, channel: str, message: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                await handler(message)
+                self.delivered += 1
+            except Exception as e:
+                self.handler_errors += 1
+                logger.warning(f"⚠️ Event bus handler failed on '{channel}': {e}")
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "instance_id": get_instance_id(),
+            "channels": {channel: len(handlers) for channel, handlers in self._handlers.items()},
+            "published": self.published,
+            "delivered": self.delivered,
+            "handler_errors": self.handler_errors,
+        }
+
+
+class RedisEventBus(EventBus):
+    """Local delivery plus Redis pub/sub relay to the other workers"""
+
+    name = "redis"
+
+    def __init__(self, redis, prefix: str = "pivota:events:"):
+        super().__init__()
+        self.redis = redis
+        self.prefix = prefix
+        self.connected = False
+        self.relayed = 0
+        self.received = 0
+        self.publish_failures = 0
+        self._degraded = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        await super().publish(channel, message)
+        envelope = json.dumps({"origin": get_instance_id(), "message": message}, default=str)
+        try:
+            await self.redis.publish(self.prefix + channel, envelope)
+            self.relayed += 1
+            if self._degraded:
+                self._degraded = False
+                logger.info("✅ Event bus relay to Redis recovered")
+        except Exception as e:
+            self.publish_failures += 1
+            if not self._degraded:
+                # Other workers miss events until Redis is back; log once per outage
+                self._degraded = True
+                logger.warning(f"⚠️ Event bus relay to Redis failed, delivering locally only: {e}")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        self.connected = False
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(self.prefix + "*")
+                self.connected = True
+                backoff = 1.0
+                logger.info(f"✅ Event bus subscribed to '{self.prefix}*'")
+                while True:
+                    item = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5.0)
+                    if item is not None:
+                        await self._on_message(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Event bus subscriber error: {e}")
+            finally:
+                self.connected = False
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    async def _on_message(self, item: Dict[str, Any]) -> None:
+        try:
+            envelope = json.loads(item["data"])
+        except (TypeError, ValueError):
+            return
+        if envelope.get("origin") == get_instance_id():
+            return  # already delivered locally on publish
+        channel = item["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        self.received += 1
+        await self._dispatch(channel[len(self.prefix):], envelope.get("message") or {})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "connected": self.connected,
+            "relayed": self.relayed,
+            "received": self.received,
+            "publish_failures": self.publish_failures,
+        }
+
+
+_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Return the process-wide event bus (EVENT_BUS_BACKEND=auto|memory|redis)"""
+    global _bus
+    if _bus is not None:
+        return _bus
+    backend = settings.event_bus_backend.lower()
+    redis = get_redis_client() if backend in ("auto", "redis") else None
+    if redis is not None:
+        _bus = RedisEventBus(redis)
+    else:
+        if backend == "redis":
+            logger.warning("⚠️ EVENT_BUS_BACKEND=redis but Redis is unavailable; using the in-memory event bus")
+        _bus = EventBus()
+    return _bus
+
+
+async def start_event_bus() -> None:
+    """Start relaying events from other workers (call from app startup)"""
+    await get_event_bus().start()
+
+
+async def stop_event_bus() -> None:
+    """Stop the subscriber (call from app shutdown)"""
+    if _bus is not None:
+        await _bus.stop()
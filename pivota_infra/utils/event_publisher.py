@@ -63,10 +63,11 @@ class EventPublisher:
             event.update(additional_data)
         
         # Record in metrics store and broadcast
-        if record_event:
-            record_event(event)
         if publish_event_to_ws:
+            # Via the event bus: every worker records it and notifies its sockets
             await publish_event_to_ws(event)
+        elif record_event:
+            record_event(event)
         
         logger.info(f"Published payment result: {order_id} -> {status} via {psp} ({latency_ms}ms)")
     
@@ -102,10 +103,11 @@ class EventPublisher:
             event.update(additional_data)
         
         # Record in metrics store and broadcast
-        if record_event:
-            record_event(event)
         if publish_event_to_ws:
+            # Via the event bus: every worker records it and notifies its sockets
             await publish_event_to_ws(event)
+        elif record_event:
+            record_event(event)
         
         logger.info(f"Published order event: {order_id} -> {event_type} ({status})")
     
@@ -135,10 +137,11 @@ class EventPublisher:
             event.update(additional_data)
         
         # Record in metrics store and broadcast
-        if record_event:
-            record_event(event)
         if publish_event_to_ws:
+            # Via the event bus: every worker records it and notifies its sockets
             await publish_event_to_ws(event)
+        elif record_event:
+            record_event(event)
         
         logger.info(f"Published PSP event: {psp} -> {event_type} for {order_id}")
     
@@ -172,10 +175,11 @@ class EventPublisher:
             event.update(additional_data)
         
         # Record in metrics store and broadcast
-        if record_event:
-            record_event(event)
         if publish_event_to_ws:
+            # Via the event bus: every worker records it and notifies its sockets
             await publish_event_to_ws(event)
+        elif record_event:
+            record_event(event)
         
         logger.info(f"Published inventory event: {merchant} -> {event_type} for {sku}")
 
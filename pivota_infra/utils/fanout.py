@@ -0,0 +1,70 @@
+"""
+Concurrent fan-out with per-key deadlines
+Runs one coroutine per key under a bounded semaphore; keys that miss their
+deadline or fail are reported instead of failing the whole call
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from utils.logger import logger
+
+DEFAULT_POOL_SIZE = 10  # asyncpg pool default when DATABASE_URL sets no max_size
+
+
+class FanOutResult:
+    """Partial results of a fan-out call"""
+
+    __slots__ = ("results", "timed_out", "failed")
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.timed_out: List[str] = []
+        self.failed: Dict[str, str] = {}
+
+
+def db_pool_concurrency() -> int:
+    """
+    Fan-out width for DB-bound work: half the `databases` pool, so one
+    request can't starve every other request of connections
+    """
+    try:
+        from db.database import database
+        size = int(database.url.options.get("max_size", DEFAULT_POOL_SIZE))
+    except Exception:
+        size = DEFAULT_POOL_SIZE
+    return max(1, size // 2)
+
+
+async def fan_out(
+    keys: Iterable[str],
+    fn: Callable[[str], Awaitable[Any]],
+    timeout: float,
+    concurrency: Optional[int] = None,
+) -> FanOutResult:
+    """
+    Call fn(key) for every key concurrently (at most `concurrency` at once).
+    Each key gets `timeout` seconds including time spent waiting for a slot,
+    so the whole call is bounded by roughly `timeout` regardless of key count.
+    """
+    keys = list(dict.fromkeys(keys))
+    result = FanOutResult()
+    if not keys:
+        return result
+
+    semaphore = asyncio.Semaphore(concurrency or db_pool_concurrency())
+
+    async def run(key: str) -> Any:
+        async with semaphore:
+            return await fn(key)
+
+    async def guarded(key: str) -> None:
+        try:
+            result.results[key] = await asyncio.wait_for(run(key), timeout=timeout)
+        except asyncio.TimeoutError:
+            result.timed_out.append(key)
+        except Exception as e:
+            logger.warning(f"Fan-out call failed for {key}: {e}")
+            result.failed[key] = str(e)
+
+    await asyncio.gather(*(guarded(key) for key in keys))
+    return result
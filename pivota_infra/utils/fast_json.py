@@ -0,0 +1,44 @@
+"""
+Fast JSON encoding for hot read paths
+Uses orjson when installed (stdlib json otherwise) and can embed documents
+that are already serialized - e.g. product_data straight from products_cache -
+into a response body without decoding and re-encoding them.
+"""
+import json
+from typing import Any, Dict, Iterable
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore
+
+from fastapi.responses import Response
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+def dumps_with_raw_list(envelope: Dict[str, Any], field: str, raw_items: Iterable[str]) -> bytes:
+    """
+    Serialize envelope with envelope[field] replaced by a JSON array of the
+    raw_items, which must each be a valid JSON document already
+    """
+    keys = list(envelope)
+    position = keys.index(field)
+    head = dumps({k: envelope[k] for k in keys[:position]})
+    tail = dumps({k: envelope[k] for k in keys[position + 1:]})
+
+    parts = [head[:-1]]
+    if len(head) > 2:
+        parts.append(b",")
+    parts += [dumps(field), b":[", b",".join(item.encode() for item in raw_items), b"]"]
+    parts.append(b"," + tail[1:] if len(tail) > 2 else b"}")
+    return b"".join(parts)
+
+
+class RawJSONResponse(Response):
+    """Response for a body that is already encoded JSON (skips FastAPI's serializer)"""
+    media_type = "application/json"
@@ -0,0 +1,218 @@
+"""
+Shared outbound HTTP clients
+One pooled httpx.AsyncClient per upstream (keep-alive, HTTP/2 when the h2
+package is installed) with per-host connection caps, per-upstream timeouts
+and a retry budget. Opened lazily, closed on app shutdown.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from utils.logger import logger
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS = {502, 503, 504}
+
+
+class UpstreamConfig:
+    """Connection and retry policy for one upstream"""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        per_host_limit: int = 20,
+        max_retries: int = 2,
+        retry_ratio: float = 0.1,
+        http2: bool = True,
+    ):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.retry_ratio = retry_ratio  # retries allowed per request, on average
+        self.http2 = http2
+
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    # Many shops behind one client; Shopify REST allows ~2 req/s per shop anyway
+    "shopify": UpstreamConfig(timeout=30.0, max_connections=200, max_keepalive=50, per_host_limit=4),
+    "adyen": UpstreamConfig(timeout=10.0, per_host_limit=50),
+    "checkout": UpstreamConfig(timeout=10.0, per_host_limit=50),
+    "stripe": UpstreamConfig(timeout=10.0, per_host_limit=50),
+    "wix": UpstreamConfig(timeout=15.0, per_host_limit=10),
+    # Arbitrary merchant websites (KYB checks): short timeouts, no retries, HTTP/1.1
+    "web": UpstreamConfig(timeout=5.0, connect_timeout=3.0, max_keepalive=10, per_host_limit=2,
+                          max_retries=0, http2=False),
+    "default": UpstreamConfig(),
+}
+
+
+class _RetryBudget:
+    """
+    Token bucket: every request deposits retry_ratio tokens, every retry
+    spends one, so retries can't multiply load when an upstream is down
+    """
+
+    def __init__(self, ratio: float, min_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max(min_tokens, 100 * ratio)
+        self.tokens = min_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class UpstreamClient:
+    """httpx.AsyncClient-like facade (request/get/post/put/patch/delete) for one upstream"""
+
+    def __init__(self, name: str, config: UpstreamConfig):
+        self.name = name
+        self.config = config
+        self.client = httpx.AsyncClient(
+            http2=config.http2 and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive,
+                keepalive_expiry=30.0,
+            ),
+        )
+        self._budget = _RetryBudget(config.retry_ratio)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(str(url)).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.config.per_host_limit)
+        return slot
+
+    def _can_retry_status(self, method: str, kwargs: Dict[str, Any]) -> bool:
+        headers = kwargs.get("headers") or {}
+        has_key = any(str(k).lower() == "idempotency-key" for k in headers)
+        return method.upper() in IDEMPOTENT_METHODS or has_key
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request. Connection failures (nothing reached the upstream) are
+        retried for any method; 502/503/504 only for idempotent methods or
+        requests carrying an Idempotency-Key. Retries draw on the budget.
+        """
+        self.requests += 1
+        self._budget.deposit()
+        attempt = 0
+        start = time.monotonic()
+        try:
+            while True:
+                try:
+                    async with self._slot(url):
+                        response = await self.client.request(method, url, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                    if attempt < self.config.max_retries and self._budget.withdraw():
+                        attempt += 1
+                        self.retries += 1
+                        await asyncio.sleep(0.05 * 2 ** attempt)
+                        continue
+                    self.errors += 1
+                    raise
+                if (
+                    response.status_code in RETRY_STATUS
+                    and attempt < self.config.max_retries
+                    and self._can_retry_status(method, kwargs)
+                    and self._budget.withdraw()
+                ):
+                    attempt += 1
+                    self.retries += 1
+                    await response.aclose()
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+                    continue
+                return response
+        finally:
+            self.total_ms += (time.monotonic() - start) * 1000
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("HEAD", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.config.http2 and HTTP2_AVAILABLE,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+            "retry_tokens": round(self._budget.tokens, 2),
+            "hosts": len(self._host_slots),
+        }
+
+
+_clients: Dict[str, UpstreamClient] = {}
+
+
+def get_http_client(upstream: str = "default") -> UpstreamClient:
+    """Get the shared client for an upstream (created on first use)"""
+    client = _clients.get(upstream)
+    if client is None or client.client.is_closed:
+        config = UPSTREAMS.get(upstream) or UPSTREAMS["default"]
+        client = _clients[upstream] = UpstreamClient(upstream, config)
+    return client
+
+
+def http_client_stats() -> Dict[str, Any]:
+    return {name: client.stats() for name, client in _clients.items()}
+
+
+async def start_http_clients() -> None:
+    """Open the pools for the checkout-path upstreams (call from app startup)"""
+    for upstream in ("shopify", "stripe", "adyen", "checkout"):
+        get_http_client(upstream)
+    if not HTTP2_AVAILABLE:
+        logger.info("ℹ️ h2 not installed; outbound HTTP clients use HTTP/1.1 keep-alive")
+
+
+async def stop_http_clients() -> None:
+    """Close every pooled connection (call from app shutdown)"""
+    for name, client in list(_clients.items()):
+        try:
+            await client.client.aclose()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing HTTP client {name}: {e}")
+    _clients.clear()
@@ -0,0 +1,216 @@
+"""
+Idempotency-Key replay
+run_idempotent(scope, key, payload, execute) runs execute() once per
+(scope, key): the first request claims the key in idempotency_keys, stores
+its JSON response and later duplicates replay it. Concurrent duplicates in
+the same process await the first execution; duplicates on other replicas
+poll the row until it completes. Only successful responses are stored
+(and only when cache_if accepts them); errors release the key so a retry
+runs the request again.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from config.settings import settings
+from db.idempotency import (
+    claim_idempotency_key, complete_idempotency_key, delete_expired_idempotency_keys,
+    get_idempotency_key, release_idempotency_key
+)
+from utils.logger import logger
+
+POLL_INTERVAL = 0.1  # seconds between checks on a key another replica is executing
+PRUNE_INTERVAL = 600  # seconds between expired-key deletes
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(payload: Any) -> str:
+    """sha256 of the canonical JSON request body"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def psp_idempotency_key(scope: str, key: str) -> str:
+    """
+    Key forwarded to the PSP for a client Idempotency-Key: scoped so two
+    agents reusing the same key never collide, hashed to a fixed length
+    """
+    return "pvt_" + hashlib.sha256(f"{scope}:{key}".encode()).hexdigest()
+
+
+class IdempotencyCache:
+    def __init__(self, ttl_seconds: float = 86400, lock_seconds: float = 60,
+                 wait_seconds: float = 30, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.max_entries = max_entries
+        # Completed responses already seen by this process: (fingerprint, body, expires_at)
+        self._completed: "OrderedDict[Tuple[str, str], Tuple[str, Any, float]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        self._last_prune = 0.0
+        self.executed = 0
+        self.replayed = 0
+        self.collapsed = 0
+        self.conflicts = 0
+
+    def _remember(self, cache_key: Tuple[str, str], fingerprint: str, body: Any) -> None:
+        self._completed[cache_key] = (fingerprint, body, time.monotonic() + self.ttl_seconds)
+        self._completed.move_to_end(cache_key)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    def _replay(self, cache_key: Tuple[str, str], fingerprint: str, stored_fingerprint: str, body: Any) -> Any:
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+        self.replayed += 1
+        logger.info(f"Replaying idempotent response for {cache_key[0]} key {cache_key[1]}")
+        return body
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        payload: Any,
+        execute: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        if not key:
+            return await execute()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+        cache_key = (scope, key)
+        fingerprint = request_fingerprint(payload)
+
+        hit = self._completed.get(cache_key)
+        if hit is not None and hit[2] > time.monotonic():
+            return self._replay(cache_key, fingerprint, hit[0], hit[1])
+
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            if in_flight[0] != fingerprint:
+                return self._replay(cache_key, fingerprint, in_flight[0], None)
+            self.collapsed += 1
+            return await asyncio.shield(in_flight[1])
+
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            existing = await claim_idempotency_key(scope, key, fingerprint, self.lock_seconds, self.ttl_seconds)
+            if existing is None:
+                return await self._execute(cache_key, fingerprint, execute, cache_if)
+            if existing["fingerprint"] != fingerprint:
+                return self._replay(cache_key, fingerprint, existing["fingerprint"], None)
+            if existing["status"] == "completed":
+                self._remember(cache_key, fingerprint, existing["response_body"])
+                return self._replay(cache_key, fingerprint, fingerprint, existing["response_body"])
+            # In progress on another replica: wait for it to complete or release the key
+            while time.monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                existing = await get_idempotency_key(scope, key)
+                if existing is None or existing["status"] == "completed":
+                    break
+            else:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress; retry later"
+                )
+            if existing is not None:
+                self.collapsed += 1
+                self._remember(cache_key, existing["fingerprint"], existing["response_body"])
+                return self._replay(cache_key, fingerprint, existing["fingerprint"], existing["response_body"])
+            # Released after a failure: claim it and run the request here
+
+    async def _execute(
+        self,
+        cache_key: Tuple[str, str],
+        fingerprint: str,
+        execute: Callable[[], Awaitable[Any]],
+        cache_if: Optional[Callable[[Any], bool]]
+    ) -> Any:
+        scope, key = cache_key
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = (fingerprint, future)
+        try:
+            result = await execute()
+            body = jsonable_encoder(result)
+            self.executed += 1
+            if cache_if is None or cache_if(result):
+                await complete_idempotency_key(scope, key, 200, body)
+                self._remember(cache_key, fingerprint, body)
+            else:
+                await release_idempotency_key(scope, key)
+            future.set_result(body)
+            return body
+        except BaseException as e:
+            try:
+                await asyncio.shield(release_idempotency_key(scope, key))
+            except Exception as release_error:
+                logger.warning(f"⚠️ Could not release idempotency key {key}: {release_error}")
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # retrieved: no "never retrieved" warning when nobody was waiting
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+            self._maybe_prune()
+
+    def _maybe_prune(self) -> None:
+        if time.monotonic() - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = time.monotonic()
+        asyncio.ensure_future(self._prune())
+
+    async def _prune(self) -> None:
+        try:
+            await delete_expired_idempotency_keys()
+        except Exception as e:
+            logger.warning(f"⚠️ Idempotency key cleanup failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_responses": len(self._completed),
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "collapsed": self.collapsed,
+            "conflicts": self.conflicts,
+        }
+
+
+_cache: Optional[IdempotencyCache] = None
+
+
+def get_idempotency_cache() -> IdempotencyCache:
+    """Get the process-wide idempotency cache"""
+    global _cache
+    if _cache is None:
+        _cache = IdempotencyCache(
+            ttl_seconds=settings.idempotency_ttl_hours * 3600,
+            lock_seconds=settings.idempotency_lock_seconds,
+            wait_seconds=settings.idempotency_wait_seconds,
+            max_entries=settings.idempotency_memory_max_entries,
+        )
+    return _cache
+
+
+async def run_idempotent(
+    scope: str,
+    key: Optional[str],
+    payload: Any,
+    execute: Callable[[], Awaitable[Any]],
+    cache_if: Optional[Callable[[Any], bool]] = None
+) -> Any:
+    """Run execute() at most once per (scope, Idempotency-Key) and replay its response"""
+    return await get_idempotency_cache().run(scope, key, payload, execute, cache_if)
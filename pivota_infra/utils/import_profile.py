@@ -0,0 +1,105 @@
+"""
+Startup import profile
+Imports the app in a fresh interpreter under `python -X importtime` and
+reports the slowest modules (self and cumulative time) plus totals per
+top-level package, so heavy dependencies on the boot path are easy to spot.
+
+    python -m utils.import_profile [--top 25] [--sort cumulative|self] [--eager]
+    python main.py --profile-imports [same options]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:       412 |       1530 |     routes.agent_metrics"
+_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # nesting level in the importtime tree (0 = imported by the target directly)
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Parse `-X importtime` stderr (other lines are ignored)"""
+    timings = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(ImportTiming(module, int(self_us), int(cumulative_us), max(len(indent) - 1, 0) // 2))
+    return timings
+
+
+def run_importtime(module: str = "main", eager: bool = False) -> List[ImportTiming]:
+    """Import `module` in a child interpreter and return its per-module timings"""
+    env = dict(os.environ)
+    if eager:
+        env["LAZY_ROUTERS"] = "false"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    timings = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(errors[-10:]))
+    return timings
+
+
+def package_totals(timings: List[ImportTiming]) -> Dict[str, int]:
+    """Self time summed per top-level package, slowest first"""
+    totals: Dict[str, int] = {}
+    for timing in timings:
+        package = timing.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + timing.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def format_report(timings: List[ImportTiming], top: int = 25, sort: str = "cumulative",
+                  module: str = "main") -> str:
+    total_us = sum(timing.self_us for timing in timings)
+    target: Optional[ImportTiming] = next((t for t in reversed(timings) if t.module == module), None)
+    key = (lambda t: t.self_us) if sort == "self" else (lambda t: t.cumulative_us)
+    lines = [
+        f"Import profile for '{module}': {len(timings)} modules, {total_us / 1000:.1f}ms total"
+        + (f" ({target.cumulative_us / 1000:.1f}ms cumulative for {module})" if target else ""),
+        "",
+        f"Top {top} modules by {sort} time:",
+        f"{'self ms':>9} {'cum ms':>9}  module",
+    ]
+    for timing in sorted(timings, key=key, reverse=True)[:top]:
+        lines.append(f"{timing.self_us / 1000:9.1f} {timing.cumulative_us / 1000:9.1f}  {timing.module}")
+    lines += ["", f"Top {top} packages by self time:", f"{'self ms':>9}  package"]
+    for package, self_us in list(package_totals(timings).items())[:top]:
+        lines.append(f"{self_us / 1000:9.1f}  {package}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-module import times for app startup")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="rows per table")
+    parser.add_argument("--sort", choices=("cumulative", "self"), default="cumulative")
+    parser.add_argument("--eager", action="store_true", help="import every router at boot (LAZY_ROUTERS=false)")
+    args = parser.parse_args(argv)
+    try:
+        timings = run_importtime(args.module, eager=args.eager)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(format_report(timings, top=args.top, sort=args.sort, module=args.module))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Variant inventory service
+Answers "how many of variant X can merchant M sell" from a short-lived
+in-memory map, then the variant_inventory table, and only for the variants
+still missing asks Shopify directly in one batched GraphQL nodes() query.
+Results are written through to Postgres and memory. Catalog syncs, products/*
+webhooks and inventory_levels/update webhooks keep the table current.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from adapters.product_adapters import SHOPIFY_API_VERSION
+from config.settings import settings
+from db.inventory import (
+    delete_product_inventory, get_variant_by_inventory_item,
+    get_variant_inventory, upsert_variant_inventory,
+)
+from utils.http_client import get_http_client
+from utils.logger import logger
+
+PLATFORM = "shopify"
+GRAPHQL_BATCH_SIZE = 250  # nodes(ids:) accepts at most 250 ids
+
+_VARIANT_FIELDS = """
+    legacyResourceId
+    sku
+    title
+    price
+    inventoryQuantity
+    inventoryPolicy
+    product { legacyResourceId title }
+    inventoryItem { legacyResourceId tracked }
+"""
+
+VARIANTS_BY_ID_QUERY = """
+query VariantInventory($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on ProductVariant {%s}
+  }
+}
+""" % _VARIANT_FIELDS
+
+VARIANTS_BY_SKU_QUERY = """
+query VariantInventoryBySku($query: String!, $first: Int!) {
+  productVariants(first: $first, query: $query) {
+    nodes {%s}
+  }
+}
+""" % _VARIANT_FIELDS
+
+
+def _variant_title(product_title: Optional[str], variant_title: Optional[str]) -> str:
+    # Same format order creation has always reported
+    return f"{product_title or ''} - {variant_title or ''}"
+
+
+def record_from_rest(product: Dict[str, Any], variant: Dict[str, Any]) -> Dict[str, Any]:
+    """variant_inventory record from a REST products.json variant"""
+    return {
+        "variant_id": str(variant["id"]),
+        "product_id": str(product.get("id")) if product.get("id") is not None else None,
+        "inventory_item_id": (
+            str(variant["inventory_item_id"]) if variant.get("inventory_item_id") is not None else None
+        ),
+        "sku": variant.get("sku"),
+        "title": _variant_title(product.get("title"), variant.get("title")),
+        "available": variant.get("inventory_quantity") or 0,
+        "tracked": variant.get("inventory_management") == "shopify",
+        "inventory_policy": variant.get("inventory_policy") or "deny",
+        "levels": None,
+        "price": variant.get("price"),
+    }
+
+
+def _record_from_graphql(node: Dict[str, Any]) -> Dict[str, Any]:
+    product = node.get("product") or {}
+    item = node.get("inventoryItem") or {}
+    return {
+        "variant_id": str(node["legacyResourceId"]),
+        "product_id": product.get("legacyResourceId"),
+        "inventory_item_id": item.get("legacyResourceId"),
+        "sku": node.get("sku"),
+        "title": _variant_title(product.get("title"), node.get("title")),
+        "available": node.get("inventoryQuantity") or 0,
+        "tracked": bool(item.get("tracked")),
+        "inventory_policy": (node.get("inventoryPolicy") or "DENY").lower(),
+        "levels": None,
+        "price": node.get("price"),
+    }
+
+
+async def _shopify_graphql(
+    shop_domain: str, access_token: str, query: str, variables: Dict[str, Any]
+) -> Dict[str, Any]:
+    url = f"https://{shop_domain}/admin/api/{SHOPIFY_API_VERSION}/graphql.json"
+    response = await get_http_client("shopify").post(
+        url,
+        json={"query": query, "variables": variables},
+        headers={"X-Shopify-Access-Token": access_token, "Content-Type": "application/json"},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Shopify GraphQL error: HTTP {response.status_code}")
+    body = response.json()
+    if body.get("errors"):
+        raise RuntimeError(f"Shopify GraphQL error: {body['errors']}")
+    return body.get("data") or {}
+
+
+async def fetch_variants_by_id(
+    shop_domain: str, access_token: str, variant_ids: Iterable[str]
+) -> List[Dict[str, Any]]:
+    """Targeted lookup: one GraphQL request per 250 variants (unknown ids are skipped)"""
+    ids = [str(v) for v in variant_ids]
+    records: List[Dict[str, Any]] = []
+    for i in range(0, len(ids), GRAPHQL_BATCH_SIZE):
+        gids = [f"gid://shopify/ProductVariant/{v}" for v in ids[i:i + GRAPHQL_BATCH_SIZE]]
+        data = await _shopify_graphql(shop_domain, access_token, VARIANTS_BY_ID_QUERY, {"ids": gids})
+        records.extend(_record_from_graphql(node) for node in data.get("nodes") or [] if node)
+    return records
+
+
+async def fetch_variants_by_sku(
+    shop_domain: str, access_token: str, skus: Iterable[str]
+) -> List[Dict[str, Any]]:
+    """Targeted lookup by SKU (productVariants search, 250 SKUs per request)"""
+    wanted = [str(s) for s in skus if s]
+    records: List[Dict[str, Any]] = []
+    for i in range(0, len(wanted), GRAPHQL_BATCH_SIZE):
+        batch = wanted[i:i + GRAPHQL_BATCH_SIZE]
+        search = " OR ".join('sku:"%s"' % s.replace('"', '\\"') for s in batch)
+        data = await _shopify_graphql(
+            shop_domain, access_token, VARIANTS_BY_SKU_QUERY, {"query": search, "first": GRAPHQL_BATCH_SIZE}
+        )
+        nodes = (data.get("productVariants") or {}).get("nodes") or []
+        # The search is fuzzy; keep exact SKU matches only
+        records.extend(_record_from_graphql(node) for node in nodes if node.get("sku") in batch)
+    return records
+
+
+async def fetch_inventory_levels(
+    shop_domain: str, access_token: str, inventory_item_id: str
+) -> Dict[str, int]:
+    """Per-location quantities for one inventory item: {location_id: available}"""
+    url = f"https://{shop_domain}/admin/api/{SHOPIFY_API_VERSION}/inventory_levels.json"
+    response = await get_http_client("shopify").get(
+        url,
+        params={"inventory_item_ids": str(inventory_item_id), "limit": 250},
+        headers={"X-Shopify-Access-Token": access_token},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Shopify inventory_levels error: HTTP {response.status_code}")
+    return {
+        str(level["location_id"]): level.get("available") or 0
+        for level in response.json().get("inventory_levels", [])
+    }
+
+
+class InventoryService:
+    """Per-merchant variant → quantity lookups (memory → Postgres → Shopify)"""
+
+    def __init__(self):
+        # merchant_id -> {variant_id: (record, cached_at)}
+        self._memory: Dict[str, Dict[str, Tuple[Dict[str, Any], float]]] = {}
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.remote_lookups = 0
+        self.remote_variants = 0
+        self.webhook_updates = 0
+
+    def _remember(self, merchant_id: str, records: Iterable[Dict[str, Any]]) -> None:
+        cache = self._memory.setdefault(merchant_id, {})
+        if len(cache) >= settings.inventory_memory_max_variants:
+            cache.clear()
+        now = time.time()
+        for record in records:
+            cache[str(record["variant_id"])] = (record, now)
+
+    def _forget_product(self, merchant_id: str, product_id: str) -> None:
+        cache = self._memory.get(merchant_id)
+        if not cache:
+            return
+        for variant_id in [v for v, (r, _) in cache.items() if r.get("product_id") == product_id]:
+            del cache[variant_id]
+
+    async def get_variants(
+        self,
+        merchant_id: str,
+        variant_ids: Iterable[str],
+        shop_domain: Optional[str] = None,
+        access_token: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Inventory records for the given variants. Variants that are neither in
+        memory nor fresh in Postgres are fetched from Shopify in one batched
+        request when credentials are given; unknown variants are left out.
+        """
+        wanted = {str(v) for v in variant_ids if v}
+        found: Dict[str, Dict[str, Any]] = {}
+        now = time.time()
+
+        cache = self._memory.get(merchant_id, {})
+        for variant_id in wanted:
+            entry = cache.get(variant_id)
+            if entry and now - entry[1] < settings.inventory_memory_ttl_seconds:
+                found[variant_id] = entry[0]
+        self.memory_hits += len(found)
+
+        missing = wanted - found.keys()
+        if missing:
+            rows = await get_variant_inventory(merchant_id, list(missing), PLATFORM)
+            fresh = []
+            for variant_id, row in rows.items():
+                updated_at = row.get("updated_at")
+                if updated_at and now - updated_at.timestamp() < settings.inventory_cache_ttl_seconds:
+                    fresh.append(row)
+            self.db_hits += len(fresh)
+            self._remember(merchant_id, fresh)
+            found.update((row["variant_id"], row) for row in fresh)
+            missing -= found.keys()
+
+        if missing and shop_domain and access_token:
+            self.remote_lookups += 1
+            records = await fetch_variants_by_id(shop_domain, access_token, missing)
+            self.remote_variants += len(records)
+            await self.record(merchant_id, records)
+            found.update((r["variant_id"], r) for r in records)
+
+        return found
+
+    async def record(self, merchant_id: str, records: List[Dict[str, Any]]) -> None:
+        """Write records through to Postgres and memory"""
+        if not records:
+            return
+        await upsert_variant_inventory(merchant_id, records, PLATFORM)
+        self._remember(merchant_id, records)
+
+    async def record_products(self, merchant_id: str, raw_products: Iterable[Dict[str, Any]]) -> int:
+        """Seed from raw Shopify REST products (catalog sync pages, products/* webhooks)"""
+        records = [
+            record_from_rest(product, variant)
+            for product in raw_products
+            for variant in product.get("variants") or []
+            if variant.get("id") is not None
+        ]
+        await self.record(merchant_id, records)
+        return len(records)
+
+    async def remove_product(self, merchant_id: str, product_id: str) -> None:
+        await delete_product_inventory(merchant_id, product_id, PLATFORM)
+        self._forget_product(merchant_id, str(product_id))
+
+    async def apply_level_update(
+        self,
+        merchant_id: str,
+        inventory_item_id: str,
+        location_id: str,
+        available: Optional[int],
+        shop_domain: Optional[str] = None,
+        access_token: Optional[str] = None,
+    ) -> bool:
+        """
+        Apply an inventory_levels/update event. The variant total is the sum
+        over locations; the first event for an item without known levels pulls
+        that item's levels once so other locations aren't dropped from the sum.
+        Returns False for items we have never seen (they load on demand).
+        """
+        row = await get_variant_by_inventory_item(merchant_id, str(inventory_item_id), PLATFORM)
+        if not row:
+            return False
+        levels = dict(row.get("levels") or {})
+        if not levels and shop_domain and access_token:
+            try:
+                levels = await fetch_inventory_levels(shop_domain, access_token, str(inventory_item_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Could not fetch inventory levels for item {inventory_item_id}: {e}")
+        levels[str(location_id)] = available or 0
+        row.update(levels=levels, available=sum(levels.values()))
+        await self.record(merchant_id, [row])
+        self.webhook_updates += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "merchants": len(self._memory),
+            "variants_in_memory": sum(len(c) for c in self._memory.values()),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "remote_lookups": self.remote_lookups,
+            "remote_variants": self.remote_variants,
+            "webhook_updates": self.webhook_updates,
+        }
+
+
+_service = InventoryService()
+
+
+def get_inventory_service() -> InventoryService:
+    """Get the process-wide inventory service"""
+    return _service
@@ -0,0 +1,218 @@
+"""
+Log-bucketed latency histograms (HDR-style)
+Each power of two is split into SUB_BUCKETS linear buckets, so any value
+is reported within ~1.6% using a fixed, bounded number of counters.
+Recording is O(1); histograms with the same layout merge by adding counts,
+which is how per-instance histograms are combined.
+"""
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # linear buckets per power of two
+MIN_EXPONENT = -3  # values below 2**-4 ms share the first bucket
+MAX_EXPONENT = 23  # values from 2**23 ms (~2.3h) share the last bucket
+BUCKET_COUNT = (MAX_EXPONENT - MIN_EXPONENT + 1) * SUB_BUCKETS
+LAYOUT_VERSION = f"log2/{SUB_BUCKET_BITS}/{MIN_EXPONENT}/{MAX_EXPONENT}"
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+def bucket_index(value: float) -> int:
+    """Bucket for a latency in milliseconds"""
+    if value <= 0:
+        return 0
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    if exponent < MIN_EXPONENT:
+        return 0
+    if exponent > MAX_EXPONENT:
+        return BUCKET_COUNT - 1
+    return (exponent - MIN_EXPONENT) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_bounds(index: int) -> Tuple[float, float]:
+    """[low, high) of a bucket in milliseconds"""
+    exponent = index // SUB_BUCKETS + MIN_EXPONENT
+    sub = index % SUB_BUCKETS
+    return (
+        math.ldexp(0.5 + sub / (2 * SUB_BUCKETS), exponent),
+        math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent),
+    )
+
+
+class LatencyHistogram:
+    """Sparse bucket counts plus exact count / sum / min / max"""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, value: float, times: int = 1) -> None:
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + times
+        self.count += times
+        self.total += value * times
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """Add another histogram's counts into this one (in place)"""
+        if not other.count:
+            return self
+        counts = self.counts
+        for index, n in other.counts.items():
+            counts[index] = counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if self.min is None or (other.min is not None and other.min < self.min):
+            self.min = other.min
+        if self.max is None or (other.max is not None and other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentiles(self, quantiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+        """{"p50": ms, ...} in one pass over the occupied buckets"""
+        quantiles = sorted(quantiles)
+        result = {_label(q): 0.0 for q in quantiles}
+        if not self.count:
+            return result
+        ranks = [max(1, math.ceil(q / 100.0 * self.count)) for q in quantiles]
+        i = 0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while i < len(ranks) and seen >= ranks[i]:
+                result[_label(quantiles[i])] = self._value_at(index)
+                i += 1
+            if i == len(ranks):
+                break
+        return result
+
+    def percentile(self, quantile: float) -> float:
+        return self.percentiles((quantile,))[_label(quantile)]
+
+    def _value_at(self, index: int) -> float:
+        # Bucket midpoint, clamped to what was actually observed
+        low, high = bucket_bounds(index)
+        value = (low + high) / 2
+        return round(min(max(value, self.min), self.max), 3)
+
+    def summary(self, quantiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "min": round(self.min, 3) if self.min is not None else None,
+            "max": round(self.max, 3) if self.max is not None else None,
+            **self.percentiles(quantiles),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Compact JSON form: counts as a dense run starting at bucket "o"
+        (latencies cluster, so the run is short and mostly non-zero)
+        """
+        if not self.counts:
+            return {"v": LAYOUT_VERSION, "n": 0}
+        first = min(self.counts)
+        last = max(self.counts)
+        counts = self.counts
+        return {
+            "v": LAYOUT_VERSION,
+            "n": self.count,
+            "sum": round(self.total, 3),
+            "min": self.min,
+            "max": self.max,
+            "o": first,
+            "c": [counts.get(i, 0) for i in range(first, last + 1)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        if data.get("v") != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported histogram layout: {data.get('v')}")
+        histogram = cls()
+        if not data.get("n"):
+            return histogram
+        offset = int(data["o"])
+        histogram.counts = {offset + i: n for i, n in enumerate(data["c"]) if n}
+        histogram.count = int(data["n"])
+        histogram.total = float(data.get("sum", 0.0))
+        histogram.min = data.get("min")
+        histogram.max = data.get("max")
+        return histogram
+
+    @classmethod
+    def from_counts(cls, counts: Dict[int, int], total: float = 0.0,
+                    minimum: Optional[float] = None, maximum: Optional[float] = None) -> "LatencyHistogram":
+        """Rebuild from bucket counts aggregated elsewhere (e.g. summed in SQL)"""
+        histogram = cls()
+        histogram.counts = {index: n for index, n in counts.items() if n}
+        histogram.count = sum(histogram.counts.values())
+        histogram.total = total
+        histogram.min = minimum
+        histogram.max = maximum
+        return histogram
+
+    @classmethod
+    def merged(cls, histograms: Iterable["LatencyHistogram"]) -> "LatencyHistogram":
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+
+class HistogramWindow:
+    """Ring of per-slot histograms (e.g. 25 hourly slots for a 24h window)"""
+
+    __slots__ = ("slot_seconds", "slots", "_starts", "_histograms")
+
+    def __init__(self, slot_seconds: int = 3600, slots: int = 25):
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self._starts: List[int] = [-1] * slots
+        self._histograms: List[Optional[LatencyHistogram]] = [None] * slots
+
+    def slot_start(self, ts: float) -> int:
+        return int(ts // self.slot_seconds) * self.slot_seconds
+
+    def record(self, value: float, ts: float) -> int:
+        """Record into the slot covering ts; returns that slot's start (epoch seconds)"""
+        start = self.slot_start(ts)
+        pos = (start // self.slot_seconds) % self.slots
+        if self._starts[pos] != start:
+            if self._starts[pos] > start:
+                return -1  # older than the window
+            self._starts[pos] = start
+            self._histograms[pos] = LatencyHistogram()
+        self._histograms[pos].record(value)
+        return start
+
+    def get(self, start: int) -> Optional[LatencyHistogram]:
+        pos = (start // self.slot_seconds) % self.slots
+        return self._histograms[pos] if self._starts[pos] == start else None
+
+    def items(self, since: float = 0) -> List[Tuple[int, LatencyHistogram]]:
+        """(slot_start, histogram) for slots that end after `since`, oldest first"""
+        return sorted((
+            (start, histogram)
+            for start, histogram in zip(self._starts, self._histograms)
+            if histogram is not None and start + self.slot_seconds > since
+        ), key=lambda item: item[0])
+
+    def merged(self, since: float = 0) -> LatencyHistogram:
+        return LatencyHistogram.merged(histogram for _, histogram in self.items(since))
+
+
+def _label(quantile: float) -> str:
+    return f"p{quantile:g}".replace(".", "_")
@@ -0,0 +1,225 @@
+"""
+Batched usage-log writer
+Request paths enqueue rows for agent_usage_logs / api_call_events and
+return immediately; a background flusher coalesces them into multi-row
+INSERTs, flushing by batch size or deadline
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Table
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config.settings import settings
+from utils.logger import logger
+
+FlushHook = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+STOP_TIMEOUT = 15.0  # seconds stop() waits for the final drain before giving up
+
+
+class BatchedLogWriter:
+    """Bounded in-process queue drained by a single background flusher"""
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 50000,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue[Tuple[Table, Dict[str, Any]]]" = asyncio.Queue(maxsize=max_queue)
+        # agent_id -> [requests, orders, gmv] coalesced between flushes
+        self._agent_stats: Dict[str, List[float]] = defaultdict(lambda: [0, 0, 0.0])
+        self._hooks: List[FlushHook] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_flush_hook(self, hook: FlushHook) -> None:
+        """Register a coroutine called with (table_name, rows) after each written batch"""
+        self._hooks.append(hook)
+
+    def enqueue(self, table: Table, row: Dict[str, Any]) -> bool:
+        """Queue one row; drops (and counts) it when the queue is full"""
+        try:
+            self._queue.put_nowait((table, row))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def add_agent_stats(
+        self, agent_id: str, requests: int = 0, orders: int = 0, gmv: float = 0
+    ) -> None:
+        """Coalesce agents.total_* increments into one UPDATE per agent per flush"""
+        stats = self._agent_stats[agent_id]
+        stats[0] += requests
+        stats[1] += orders
+        stats[2] += gmv
+
+    def start(self) -> None:
+        if not self.running:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """
+        Stop the flusher and write out everything still queued. The flusher
+        finishes the batch it holds and drains the queue itself; it is only
+        cancelled if that takes longer than timeout.
+        """
+        if self._task is None:
+            await self._drain_all()
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Log writer did not drain within {timeout}s, {self._queue.qsize()} rows lost")
+            self._task.cancel()
+        except Exception as e:
+            logger.warning(f"⚠️ Log writer stopped with error: {e}")
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+    def _drain(self, limit: int) -> List[Tuple[Table, Dict[str, Any]]]:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            items = []
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval))
+            except asyncio.TimeoutError:
+                pass
+            # Keep collecting until the batch is full or the deadline passes
+            deadline = time.monotonic() + self.flush_interval
+            while items and len(items) < self.batch_size:
+                items.extend(self._drain(self.batch_size - len(items)))
+                remaining = deadline - time.monotonic()
+                if len(items) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush_batch(items)
+        # Shutdown requested: write out everything enqueued before it
+        await self._drain_all()
+
+    async def _drain_all(self) -> None:
+        while not self._queue.empty():
+            await self._flush_batch(self._drain(self.batch_size))
+        await self._flush_batch([])
+
+    async def _flush_batch(self, items: List[Tuple[Table, Dict[str, Any]]]) -> None:
+        try:
+            await self._flush(items)
+            await self._flush_agent_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Log writer flush error: {e}")
+
+    async def _flush(self, items: List[Tuple[Table, Dict[str, Any]]]) -> None:
+        if not items:
+            return
+        from db.database import database
+
+        by_table: Dict[str, Tuple[Table, List[Dict[str, Any]]]] = {}
+        for table, row in items:
+            by_table.setdefault(table.name, (table, []))[1].append(row)
+
+        for name, (table, rows) in by_table.items():
+            try:
+                await database.execute(
+                    pg_insert(table).values(rows).on_conflict_do_nothing()
+                )
+                self.written += len(rows)
+            except Exception as e:
+                # One bad row must not lose the batch: retry individually
+                logger.warning(f"⚠️ Batch insert into {name} failed ({len(rows)} rows), retrying per row: {e}")
+                for row in rows:
+                    try:
+                        await database.execute(pg_insert(table).values(**row).on_conflict_do_nothing())
+                        self.written += 1
+                    except Exception:
+                        self.failed += 1
+            self.batches += 1
+            for hook in self._hooks:
+                try:
+                    await hook(name, rows)
+                except Exception as e:
+                    logger.warning(f"⚠️ Log writer hook failed for {name}: {e}")
+
+    async def _flush_agent_stats(self) -> None:
+        if not self._agent_stats:
+            return
+        from db.agents import update_agent_stats
+
+        pending, self._agent_stats = self._agent_stats, defaultdict(lambda: [0, 0, 0.0])
+        for agent_id, (requests, orders, gmv) in pending.items():
+            await update_agent_stats(
+                agent_id,
+                increment_requests=int(requests),
+                increment_orders=int(orders),
+                add_gmv=gmv,
+            )
+
+
+_writer: Optional[BatchedLogWriter] = None
+
+
+def get_log_writer() -> BatchedLogWriter:
+    """Get the process-wide log writer"""
+    global _writer
+    if _writer is None:
+        _writer = BatchedLogWriter(
+            batch_size=settings.log_writer_batch_size,
+            flush_interval=settings.log_writer_flush_interval_ms / 1000.0,
+            max_queue=settings.log_writer_queue_size,
+        )
+    return _writer
+
+
+async def start_log_writer() -> None:
+    """Start the background flusher (call from app startup)"""
+    get_log_writer().start()
+
+
+async def stop_log_writer() -> None:
+    """Flush remaining rows (call from app shutdown, before disconnecting the DB)"""
+    if _writer is not None:
+        await _writer.stop()
@@ -0,0 +1,268 @@
+"""
+Merchant context cache
+Everything checkout needs to know about a merchant — onboarding row, the
+resolved PSP chain with credentials, and the store connection — loaded in
+two queries and cached per process with a TTL. Concurrent misses share one
+load; writes invalidate across workers through Postgres LISTEN/NOTIFY.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+from db.database import database
+from db.merchant_onboarding import get_merchant_onboarding
+from utils.logger import logger
+from utils.pg_listener import PgNotifyListener, pg_notify
+
+MERCHANT_CONTEXT_CHANNEL = "merchant_context_invalidate"
+
+
+@dataclass
+class PSPCredential:
+    """One usable PSP account; source is merchant_psps / legacy / env"""
+    provider: str
+    api_key: str
+    account_id: Optional[str] = None
+    psp_id: Optional[str] = None
+    source: str = "merchant_psps"
+
+
+@dataclass
+class MerchantContext:
+    """Resolved merchant configuration (treat as read-only: it is shared)"""
+    merchant_id: str
+    merchant: Dict[str, Any]
+    psp_rows: List[Dict[str, Any]] = field(default_factory=list)  # merchant_psps, newest first
+
+    @property
+    def psp_connected(self) -> bool:
+        # merchant_psps rows count even if the onboarding flag was never set
+        return bool(self.merchant.get("psp_connected") or self.psp_rows)
+
+    @property
+    def psp_type(self) -> Optional[str]:
+        if self.merchant.get("psp_type"):
+            return self.merchant["psp_type"]
+        return self.psp_rows[0]["provider"] if self.psp_rows else None
+
+    @property
+    def mcp_connected(self) -> bool:
+        return bool(self.merchant.get("mcp_connected"))
+
+    @property
+    def mcp_platform(self) -> Optional[str]:
+        return self.merchant.get("mcp_platform")
+
+    @property
+    def shop_domain(self) -> Optional[str]:
+        return self.merchant.get("mcp_shop_domain")
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self.merchant.get("mcp_access_token")
+
+    def credential(self, provider: str) -> Optional[PSPCredential]:
+        """
+        Key for a provider: newest merchant_psps row, then the legacy key on
+        the onboarding row (Stripe only), then the environment (Stripe/Adyen)
+        """
+        for row in self.psp_rows:
+            if row["provider"] == provider and row.get("api_key"):
+                return PSPCredential(
+                    provider=provider,
+                    api_key=row["api_key"],
+                    account_id=row.get("account_id"),
+                    psp_id=row.get("psp_id"),
+                )
+        if provider == "stripe":
+            legacy = self.merchant.get("psp_sandbox_key") or self.merchant.get("psp_key")
+            if legacy:
+                return PSPCredential(provider=provider, api_key=legacy, source="legacy")
+            if settings.stripe_secret_key:
+                return PSPCredential(provider=provider, api_key=settings.stripe_secret_key, source="env")
+        elif provider == "adyen" and settings.adyen_api_key:
+            return PSPCredential(
+                provider=provider,
+                api_key=settings.adyen_api_key,
+                account_id=settings.adyen_merchant_account,
+                source="env",
+            )
+        return None
+
+    def psp_chain(self) -> List[PSPCredential]:
+        """Primary PSP first, then every other connected provider (failover order)"""
+        providers: List[str] = []
+        if self.psp_connected and self.psp_type:
+            providers.append(self.psp_type)
+        for row in self.psp_rows:
+            if row.get("status") == "inactive":
+                continue
+            if row["provider"] not in providers:
+                providers.append(row["provider"])
+        chain = []
+        for provider in providers:
+            cred = self.credential(provider)
+            if cred:
+                chain.append(cred)
+        return chain
+
+
+async def _load_context(merchant_id: str) -> Optional[MerchantContext]:
+    merchant = await get_merchant_onboarding(merchant_id)
+    if not merchant:
+        return None
+    try:
+        rows = await database.fetch_all(
+            """
+            SELECT psp_id, provider, api_key, account_id, status
+            FROM merchant_psps
+            WHERE merchant_id = :merchant_id
+            ORDER BY connected_at DESC
+            """,
+            {"merchant_id": merchant_id}
+        )
+        psp_rows = [dict(row) for row in rows]
+    except Exception as e:
+        logger.warning(f"merchant_psps lookup failed for {merchant_id}: {e}")
+        psp_rows = []
+    return MerchantContext(merchant_id=merchant_id, merchant=merchant, psp_rows=psp_rows)
+
+
+class MerchantContextCache:
+    """Bounded TTL + LRU cache of MerchantContext with single-flight loads"""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # merchant_id -> (expires_at, context or None for unknown merchants)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loading: Dict[str, "asyncio.Future"] = {}
+        # Bumped by every invalidation so a load that raced it isn't cached
+        self._generation: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    async def get(self, merchant_id: str) -> Optional[MerchantContext]:
+        entry = self._entries.get(merchant_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._entries.move_to_end(merchant_id)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(merchant_id, None)
+        self.misses += 1
+
+        pending = self._loading.get(merchant_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[merchant_id] = future
+        generation = self._generation.get(merchant_id, 0)
+        try:
+            self.loads += 1
+            context = await _load_context(merchant_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be awaiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(merchant_id, None)
+        if self._generation.get(merchant_id, 0) == generation:
+            self._put(merchant_id, context)
+        future.set_result(context)
+        return context
+
+    def _put(self, merchant_id: str, context: Optional[MerchantContext]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[merchant_id] = (time.monotonic() + self.ttl_seconds, context)
+        self._entries.move_to_end(merchant_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, merchant_id: str) -> None:
+        self._generation[merchant_id] = self._generation.get(merchant_id, 0) + 1
+        if self._entries.pop(merchant_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        for merchant_id in list(self._generation):
+            self._generation[merchant_id] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+            "listener_connected": _listener.connected,
+        }
+
+
+def _apply_invalidation(payload: str) -> None:
+    """Apply a NOTIFY payload ({"merchant_id": ...} / {"all": true})"""
+    try:
+        message = json.loads(payload) if payload else {}
+    except ValueError:
+        message = {"merchant_id": payload}
+    if message.get("all"):
+        _cache.clear()
+    elif message.get("merchant_id"):
+        _cache.invalidate(message["merchant_id"])
+
+
+_cache = MerchantContextCache(
+    max_entries=settings.merchant_context_max_entries,
+    ttl_seconds=settings.merchant_context_ttl_seconds,
+)
+_listener = PgNotifyListener(
+    MERCHANT_CONTEXT_CHANNEL, _apply_invalidation, on_connect=_cache.clear, label="Merchant context cache"
+)
+
+
+async def get_merchant_context(merchant_id: str) -> Optional[MerchantContext]:
+    """Resolved merchant configuration, or None if the merchant doesn't exist"""
+    return await _cache.get(merchant_id)
+
+
+def get_merchant_context_cache() -> MerchantContextCache:
+    """Get the process-wide merchant context cache"""
+    return _cache
+
+
+async def start_merchant_context_listener() -> None:
+    """Start the LISTEN task (call from app startup)"""
+    _listener.start()
+
+
+async def stop_merchant_context_listener() -> None:
+    """Stop the LISTEN task (call from app shutdown)"""
+    await _listener.stop()
+
+
+async def notify_merchant_changed(merchant_id: Optional[str] = None) -> None:
+    """
+    Invalidate locally and broadcast to every worker via NOTIFY.
+    Call after any write to merchant_onboarding / merchant_psps / store connections.
+    """
+    payload = json.dumps({"merchant_id": merchant_id} if merchant_id else {"all": True})
+    _apply_invalidation(payload)
+    await pg_notify(MERCHANT_CONTEXT_CHANNEL, payload)
@@ -0,0 +1,55 @@
+"""
+Opaque keyset cursors
+A cursor is the (created_at, id) of the last row of a page, base64url
+encoded; the next page is everything strictly after it in
+(created_at DESC, id DESC) order, so every page costs one index range scan
+no matter how deep it is. Cursors carry a truncated HMAC so clients can't
+hand-craft positions.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from config.settings import settings
+
+SIGNATURE_BYTES = 12
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    key = (settings.jwt_secret_key or "").encode()
+    return hmac.new(key, b"cursor:" + payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return f"{_b64encode(raw)}.{_b64encode(_sign(raw))}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """None for no cursor; raises InvalidCursor for anything this module did not produce"""
+    if not cursor:
+        return None
+    try:
+        payload, signature = cursor.split(".")
+        raw = _b64decode(payload)
+        if not hmac.compare_digest(_b64decode(signature), _sign(raw)):
+            raise InvalidCursor("Cursor signature mismatch")
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
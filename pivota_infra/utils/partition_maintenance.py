@@ -0,0 +1,219 @@
+"""
+Event table partition maintenance
+Keeps PARTITION_PREMAKE_DAYS of partitions ahead of now for each
+partitioned event table and, past the retention window, detaches old
+partitions, exports them to gzip JSONL (local disk, then S3-compatible
+storage when a bucket is configured), records the archive and drops them.
+A partition is only dropped once its export reached durable storage: S3,
+or an absolute PARTITION_ARCHIVE_DIR (a mounted volume). Otherwise expired
+partitions are detached and kept. One replica runs it at a time (Postgres
+advisory lock).
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from db.database import database
+from db.partitions import (
+    PARTITIONED_TABLES, create_partition, detach_partition, drop_table, is_partitioned,
+    list_detached, list_partitions, next_period, partition_name, period_start, record_archive
+)
+from utils.logger import logger
+
+_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtext('partition_maintenance'))"
+_UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext('partition_maintenance'))"
+EXPORT_BATCH = 5000
+
+
+def retention_days(parent: str) -> int:
+    """0 = keep forever"""
+    if parent == "order_events":
+        return settings.order_event_retention_days
+    return settings.event_log_retention_days
+
+
+async def ensure_partitions(parent: str, column: str, period: str, now: datetime) -> List[str]:
+    """Create partitions from the last existing bound through now + premake"""
+    partitions = await list_partitions(parent)
+    uppers = [p.upper for p in partitions if p.upper is not None]
+    start = max(uppers) if uppers else period_start(now, period)
+    target = next_period(period_start(now + timedelta(days=settings.partition_premake_days), period), period)
+    created = []
+    while start < target:
+        end = next_period(start, period)
+        name = partition_name(parent, start, period)
+        await create_partition(parent, name, start, end)
+        created.append(name)
+        start = end
+    return created
+
+
+def archive_is_durable() -> bool:
+    """A relative archive dir lives on the container's (ephemeral) disk"""
+    return bool(settings.partition_archive_s3_bucket) or os.path.isabs(settings.partition_archive_dir)
+
+
+def _s3_client():
+    import boto3  # only needed when archives go to S3
+    return boto3.client("s3", endpoint_url=settings.partition_archive_s3_endpoint_url or None)
+
+
+def _write_lines(handle, lines: List[str]) -> None:
+    handle.write("".join(lines).encode())
+
+
+async def export_table(parent: str, name: str, column: str) -> Tuple[str, int, int, Optional[datetime], Optional[datetime]]:
+    """Stream a (detached) partition to gzip JSONL; returns (location, rows, bytes, first, last)"""
+    directory = os.path.join(settings.partition_archive_dir, parent)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.jsonl.gz")
+    rows = 0
+    first = last = None
+    handle = await asyncio.to_thread(gzip.open, path + ".partial", "wb")
+    try:
+        lines: List[str] = []
+        async for row in database.iterate(f'SELECT * FROM "{name}"'):
+            record = dict(row)
+            ts = record.get(column)
+            if ts is not None:
+                first = ts if first is None or ts < first else first
+                last = ts if last is None or ts > last else last
+            lines.append(json.dumps(record, default=str) + "\n")
+            rows += 1
+            if len(lines) >= EXPORT_BATCH:
+                await asyncio.to_thread(_write_lines, handle, lines)
+                lines = []
+        if lines:
+            await asyncio.to_thread(_write_lines, handle, lines)
+    finally:
+        await asyncio.to_thread(handle.close)
+    os.replace(path + ".partial", path)
+    size = os.path.getsize(path)
+
+    location = path
+    bucket = settings.partition_archive_s3_bucket
+    if bucket:
+        key = f"{settings.partition_archive_s3_prefix}{parent}/{name}.jsonl.gz"
+        await asyncio.to_thread(_s3_client().upload_file, path, bucket, key)
+        os.remove(path)
+        location = f"s3://{bucket}/{key}"
+    return location, rows, size, _naive_utc(first), _naive_utc(last)
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value
+
+
+async def archive_table(parent: str, name: str, column: str) -> Dict[str, Any]:
+    """Export, record and drop a detached partition"""
+    started = time.monotonic()
+    location, rows, size, first, last = await export_table(parent, name, column)
+    await record_archive(parent, name, rows, size, location, first, last)
+    await drop_table(name)
+    elapsed = round(time.monotonic() - started, 1)
+    logger.info(f"📦 Archived {name}: {rows} rows, {size} bytes -> {location} ({elapsed}s)")
+    return {"partition": name, "rows": rows, "bytes": size, "location": location}
+
+
+async def _maintain(now: datetime) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for parent, (column, period) in PARTITIONED_TABLES.items():
+        if not await is_partitioned(parent):
+            result[parent] = {"status": "not_partitioned"}
+            continue
+        created = await ensure_partitions(parent, column, period, now)
+
+        days = retention_days(parent)
+        if days > 0:
+            cutoff = period_start(now - timedelta(days=days), period)
+            for partition in await list_partitions(parent):
+                if partition.upper is not None and partition.upper <= cutoff:
+                    await detach_partition(parent, partition.name)
+                    logger.info(f"🗄️ Detached {partition.name} (older than {days} days)")
+        # Includes partitions detached by an earlier run that failed to archive
+        archived = []
+        kept = []
+        detached = await list_detached(parent)
+        if detached and not archive_is_durable():
+            logger.warning(
+                f"⚠️ Keeping {len(detached)} detached {parent} partitions: set PARTITION_ARCHIVE_S3_BUCKET "
+                f"or an absolute PARTITION_ARCHIVE_DIR before they are archived and dropped"
+            )
+            kept, detached = detached, []
+        for name in detached:
+            try:
+                archived.append(await archive_table(parent, name, column))
+            except Exception as e:
+                logger.warning(f"⚠️ Archiving {name} failed, will retry: {e}")
+        result[parent] = {"status": "ok", "created": created, "archived": archived, "kept_detached": kept}
+    return result
+
+
+_last_run: Dict[str, Any] = {}
+
+
+async def run_partition_maintenance() -> Dict[str, Any]:
+    """Create upcoming partitions and archive expired ones (skipped if another replica holds the lock)"""
+    global _last_run
+    started = time.monotonic()
+    async with database.connection() as connection:
+        raw = connection.raw_connection
+        if not await raw.fetchval(_LOCK_SQL):
+            return {"status": "skipped", "reason": "running on another replica"}
+        try:
+            tables = await _maintain(datetime.utcnow())
+        finally:
+            await raw.execute(_UNLOCK_SQL)
+    _last_run = {
+        "status": "ok",
+        "tables": tables,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "finished_at": datetime.utcnow().isoformat(),
+    }
+    return _last_run
+
+
+def get_last_maintenance() -> Dict[str, Any]:
+    return _last_run
+
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+async def _maintenance_loop(interval: int) -> None:
+    while True:
+        try:
+            await run_partition_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Partition maintenance failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def start_partition_maintenance() -> None:
+    """Run maintenance now and then periodically (call from app startup)"""
+    global _maintenance_task
+    if _maintenance_task is None and settings.partition_maintenance_interval_seconds > 0:
+        _maintenance_task = asyncio.create_task(
+            _maintenance_loop(settings.partition_maintenance_interval_seconds)
+        )
+
+
+async def stop_partition_maintenance() -> None:
+    """Stop the periodic task (call from app shutdown)"""
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _maintenance_task = None
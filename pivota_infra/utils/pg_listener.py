@@ -0,0 +1,103 @@
+"""
+Postgres LISTEN/NOTIFY helpers
+Cross-worker cache invalidation: each cache owns a channel, a listener task
+applies incoming payloads, and writers publish with pg_notify()
+"""
+import asyncio
+from typing import Callable, Optional
+
+from config.settings import settings
+from utils.logger import logger
+
+try:
+    import asyncpg  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    asyncpg = None  # type: ignore
+
+
+class PgNotifyListener:
+    """Dedicated asyncpg connection LISTENing on one channel"""
+
+    def __init__(
+        self,
+        channel: str,
+        on_payload: Callable[[str], None],
+        on_connect: Optional[Callable[[], None]] = None,
+        label: str = "Cache",
+    ):
+        self.channel = channel
+        self.on_payload = on_payload
+        self.on_connect = on_connect
+        self.label = label
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+        self._conn = None
+
+    def start(self) -> None:
+        if asyncpg is None or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self._close()
+
+    async def _close(self) -> None:
+        self.connected = False
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self.on_payload(payload)
+
+    async def _run(self) -> None:
+        # LISTEN needs a session-level connection; pgbouncer in transaction
+        # mode drops notifications, so allow a direct URL override
+        from db.database import DATABASE_URL
+        dsn = settings.database_listen_url or str(DATABASE_URL)
+        backoff = 1.0
+        while True:
+            try:
+                self._conn = await asyncpg.connect(dsn)
+                await self._conn.add_listener(self.channel, self._on_notify)
+                # Anything cached before (re)connecting may have missed a NOTIFY
+                if self.on_connect is not None:
+                    self.on_connect()
+                self.connected = True
+                backoff = 1.0
+                logger.info(f"✅ {self.label} listening on '{self.channel}'")
+                while not self._conn.is_closed():
+                    await asyncio.sleep(5)
+                logger.warning(f"⚠️ {self.label} listener connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ {self.label} listener error: {e}")
+            await self._close()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+async def pg_notify(channel: str, payload: str) -> bool:
+    """Broadcast a payload to every worker; False if the NOTIFY could not be sent"""
+    try:
+        from db.database import database
+        await database.execute(
+            "SELECT pg_notify(:channel, :payload)",
+            {"channel": channel, "payload": payload}
+        )
+        return True
+    except Exception as e:
+        # Other workers fall back to TTL expiry
+        logger.warning(f"⚠️ Failed to publish on '{channel}': {e}")
+        return False
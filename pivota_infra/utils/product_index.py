@@ -0,0 +1,443 @@
+"""
+In-memory product search index
+Inverted index over products_cache (title / category / description postings)
+with price and in-stock columns, BM25 ranking and top-k heap selection.
+Kept current incrementally by db.products cache upserts.
+"""
+import asyncio
+import heapq
+import math
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config.settings import settings
+from utils.logger import logger
+
+# Field weights folded into a single weighted term frequency (BM25F-style)
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "category": 2.0,
+    "tags": 2.0,
+    "vendor": 1.5,
+    "description": 1.0,
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize(token: str) -> str:
+    # Light plural folding so "shirts" matches "shirt"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    text = _TAG_RE.sub(" ", str(text)).lower()
+    return [_normalize(t) for t in _TOKEN_RE.findall(text)]
+
+
+class _Doc:
+    __slots__ = (
+        "key", "merchant_id", "product", "price", "in_stock",
+        "category", "length", "terms", "cached_at", "expires_at",
+    )
+
+
+def _product_columns(product: Dict[str, Any]) -> Tuple[float, bool, str]:
+    try:
+        price = float(product.get("price") or 0)
+    except (TypeError, ValueError):
+        price = 0.0
+    # Same rule as the previous linear scan: missing flag means in stock
+    in_stock = bool(product.get("in_stock", True))
+    category = (product.get("category") or product.get("product_type") or "").lower()
+    return price, in_stock, category
+
+
+def _to_epoch(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return 0.0
+
+
+class ProductSearchIndex:
+    """Inverted index of cached products across all merchants"""
+
+    def __init__(self):
+        self._docs: Dict[int, _Doc] = {}
+        self._ids: Dict[Tuple[str, str, str], int] = {}
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._by_merchant: Dict[str, Set[int]] = defaultdict(set)
+        self._next_id = 0
+        self._total_length = 0.0
+        self._watermark: Optional[datetime] = None
+        self._build_lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._build_task: Optional[asyncio.Task] = None
+        # Merchants loaded one at a time while the full build is pending
+        self._loaded_merchants: Set[str] = set()
+        self.built = False
+        self.last_full_build = 0.0
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def upsert(
+        self,
+        merchant_id: str,
+        platform: str,
+        platform_product_id: str,
+        product: Dict[str, Any],
+        expires_at: Optional[datetime] = None,
+        cached_at: Optional[datetime] = None,
+    ) -> None:
+        key = (merchant_id, platform, str(platform_product_id))
+        doc_id = self._ids.get(key)
+        if doc_id is not None:
+            self._unindex(doc_id)
+        else:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._ids[key] = doc_id
+
+        weighted: Dict[str, float] = defaultdict(float)
+        fields = {
+            "title": product.get("title"),
+            "category": product.get("category") or product.get("product_type"),
+            "tags": " ".join(product.get("tags") or []) if isinstance(product.get("tags"), list) else product.get("tags"),
+            "vendor": product.get("vendor"),
+            "description": product.get("description"),
+        }
+        length = 0.0
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                weighted[token] += weight
+                length += weight
+
+        doc = _Doc()
+        doc.key = key
+        doc.merchant_id = merchant_id
+        doc.product = product
+        doc.price, doc.in_stock, doc.category = _product_columns(product)
+        doc.length = length
+        doc.terms = tuple(weighted)
+        doc.cached_at = _to_epoch(cached_at) or time.time()
+        doc.expires_at = _to_epoch(expires_at) or None
+
+        for token, tf in weighted.items():
+            self._postings[token][doc_id] = tf
+        self._docs[doc_id] = doc
+        self._by_merchant[merchant_id].add(doc_id)
+        self._total_length += length
+
+    def remove(self, merchant_id: str, platform: str, platform_product_id: str) -> bool:
+        doc_id = self._ids.pop((merchant_id, platform, str(platform_product_id)), None)
+        if doc_id is None:
+            return False
+        self._unindex(doc_id)
+        return True
+
+    def remove_merchant(self, merchant_id: str) -> int:
+        doc_ids = list(self._by_merchant.get(merchant_id, ()))
+        for doc_id in doc_ids:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                self._ids.pop(doc.key, None)
+            self._unindex(doc_id)
+        self._by_merchant.pop(merchant_id, None)
+        return len(doc_ids)
+
+    def extend_merchant(self, merchant_id: str, platform: str, expires_at: datetime) -> None:
+        """Push expires_at forward for all of a merchant's products on one platform"""
+        epoch = _to_epoch(expires_at)
+        for doc_id in self._by_merchant.get(merchant_id, ()):
+            doc = self._docs[doc_id]
+            if doc.key[1] == platform:
+                doc.expires_at = epoch
+
+    def _unindex(self, doc_id: int) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for token in doc.terms:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[token]
+        merchant_docs = self._by_merchant.get(doc.merchant_id)
+        if merchant_docs is not None:
+            merchant_docs.discard(doc_id)
+        self._total_length -= doc.length
+
+    def clear(self) -> None:
+        self._docs.clear()
+        self._ids.clear()
+        self._postings.clear()
+        self._by_merchant.clear()
+        self._total_length = 0.0
+        self._watermark = None
+        self._loaded_merchants.clear()
+
+    # ------------------------------------------------------------------
+    # Loading from products_cache
+    # ------------------------------------------------------------------
+
+    def _lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the running loop
+        if self._build_lock is None:
+            self._build_lock = asyncio.Lock()
+        return self._build_lock
+
+    async def build(self) -> int:
+        """Full (re)build from products_cache"""
+        async with self._lock():
+            rows = await self._fetch_rows(None)
+            self.clear()
+            self._load(rows)
+            self.built = True
+            self.last_full_build = time.time()
+            logger.info(f"🔎 Product index built: {len(self._docs)} products, {len(self._postings)} terms")
+            return len(self._docs)
+
+    async def ensure_built(self) -> None:
+        if not self.built:
+            await self.build()
+
+    def schedule_build(self) -> None:
+        """Start a full build in the background unless one is already running"""
+        if self.built or (self._build_task is not None and not self._build_task.done()):
+            return
+        self._build_task = asyncio.create_task(self._background_build())
+
+    async def _background_build(self) -> None:
+        try:
+            await self.build()
+            # Startup build failed if we got here, so refresh was never started
+            self.start_refresh(
+                settings.product_index_refresh_seconds,
+                settings.product_index_rebuild_seconds,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Background product index build failed: {e}")
+
+    def has_merchant(self, merchant_id: str) -> bool:
+        """True when searches for merchant_id can be answered from memory"""
+        return self.built or merchant_id in self._loaded_merchants
+
+    async def load_merchant(self, merchant_id: str) -> int:
+        """Load one merchant's cached products (cold path before the full build)"""
+        rows = await self._fetch_rows(None, merchant_id=merchant_id)
+        if not self.built:
+            # Watermark stays owned by full builds so refresh() misses nothing
+            self.remove_merchant(merchant_id)
+            self._load(rows, track_watermark=False)
+            self._loaded_merchants.add(merchant_id)
+        return len(rows)
+
+    async def refresh(self) -> int:
+        """Pick up rows written by other workers since the last load"""
+        async with self._lock():
+            rows = await self._fetch_rows(self._watermark)
+            self._load(rows)
+            return len(rows)
+
+    async def _fetch_rows(self, since: Optional[datetime], merchant_id: Optional[str] = None):
+        from db.database import database
+
+        query = """
+            SELECT merchant_id, platform, platform_product_id, product_data,
+                   cached_at, expires_at
+            FROM products_cache
+            WHERE expires_at > :now
+        """
+        params: Dict[str, Any] = {"now": datetime.now()}
+        if since is not None:
+            query += " AND cached_at > :since"
+            params["since"] = since
+        if merchant_id is not None:
+            query += " AND merchant_id = :merchant_id"
+            params["merchant_id"] = merchant_id
+        return await database.fetch_all(query, params)
+
+    def _load(self, rows: Iterable[Any], track_watermark: bool = True) -> None:
+        import json
+
+        for row in rows:
+            product = row["product_data"]
+            if isinstance(product, str):
+                try:
+                    product = json.loads(product)
+                except ValueError:
+                    continue
+            if not isinstance(product, dict):
+                continue
+            self.upsert(
+                row["merchant_id"],
+                row["platform"],
+                row["platform_product_id"],
+                product,
+                expires_at=row["expires_at"],
+                cached_at=row["cached_at"],
+            )
+            if track_watermark and row["cached_at"] and (self._watermark is None or row["cached_at"] > self._watermark):
+                self._watermark = row["cached_at"]
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def search(
+        self,
+        merchant_ids: Iterable[str],
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock_only: bool = True,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[Tuple[float, Dict[str, Any], str]], int]:
+        """
+        Return ([(relevance_score, product, merchant_id), ...], total_matches)
+        for the requested page; relevance_score is normalised to 0..1
+        """
+        allowed = set(merchant_ids)
+        now = time.time()
+        category = category.lower() if category else None
+
+        def passes(doc: _Doc) -> bool:
+            if doc.merchant_id not in allowed:
+                return False
+            if doc.expires_at is not None and doc.expires_at <= now:
+                return False
+            if in_stock_only and not doc.in_stock:
+                return False
+            if min_price and doc.price < min_price:
+                return False
+            if max_price and doc.price > max_price:
+                return False
+            if category and category not in doc.category:
+                return False
+            return True
+
+        k = offset + limit
+        terms = list(dict.fromkeys(tokenize(query))) if query else []
+
+        if not terms:
+            # No query: newest first, like the cached_at DESC listing
+            candidates = []
+            for mid in allowed:
+                for doc_id in self._by_merchant.get(mid, ()):
+                    doc = self._docs[doc_id]
+                    if passes(doc):
+                        candidates.append((doc.cached_at, doc_id))
+            top = heapq.nlargest(k, candidates)
+            page = top[offset:offset + limit]
+            return [(1.0, self._docs[d].product, self._docs[d].merchant_id) for _, d in page], len(candidates)
+
+        scores = self._bm25(terms)
+        candidates = [(score, doc_id) for doc_id, score in scores.items() if passes(self._docs[doc_id])]
+        top = heapq.nlargest(k, candidates)
+        best = top[0][0] if top else 1.0
+        page = top[offset:offset + limit]
+        return [
+            (round(score / best, 4) if best else 0.0, self._docs[d].product, self._docs[d].merchant_id)
+            for score, d in page
+        ], len(candidates)
+
+    def _bm25(self, terms: List[str]) -> Dict[int, float]:
+        n_docs = len(self._docs) or 1
+        avg_len = (self._total_length / n_docs) or 1.0
+        docs = self._docs
+        base = BM25_K1 * (1 - BM25_B)
+        per_len = BM25_K1 * BM25_B / avg_len
+        scores: Dict[int, float] = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            boost = idf * (BM25_K1 + 1)
+            for doc_id, tf in posting.items():
+                score = boost * tf / (tf + base + per_len * docs[doc_id].length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return scores
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "built": self.built,
+            "products": len(self._docs),
+            "merchants": sum(1 for docs in self._by_merchant.values() if docs),
+            "cold_loaded_merchants": len(self._loaded_merchants),
+            "terms": len(self._postings),
+            "last_full_build": self.last_full_build,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+        }
+
+    # ------------------------------------------------------------------
+    # Background refresh
+    # ------------------------------------------------------------------
+
+    def start_refresh(self, interval: float, rebuild_every: float) -> None:
+        if self._refresh_task is None and interval > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval, rebuild_every))
+
+    async def stop_refresh(self) -> None:
+        if self._build_task is not None and not self._build_task.done():
+            self._build_task.cancel()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self, interval: float, rebuild_every: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Periodic full rebuild also drops rows deleted elsewhere
+                if time.time() - self.last_full_build >= rebuild_every:
+                    await self.build()
+                else:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Product index refresh failed: {e}")
+
+
+_index = ProductSearchIndex()
+
+
+def get_product_index() -> ProductSearchIndex:
+    """Get the process-wide product search index"""
+    return _index
+
+
+async def start_product_index() -> None:
+    """Build the index and start background refresh (call from app startup)"""
+    await _index.build()
+    _index.start_refresh(
+        settings.product_index_refresh_seconds,
+        settings.product_index_rebuild_seconds,
+    )
+
+
+async def stop_product_index() -> None:
+    await _index.stop_refresh()
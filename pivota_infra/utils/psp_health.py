@@ -0,0 +1,393 @@
+"""
+PSP health: rolling success / latency windows and circuit breakers
+Every PSP call is recorded here (and queued for psp_attempts through the
+batched log writer). Windows are kept per PSP, per PSP + currency and per
+PSP + merchant; the failover chain is ranked by the smoothed success rate
+of the most specific window with enough samples, with latency as a small
+penalty. Breakers (per PSP and per PSP + merchant) open on consecutive
+failures or a high failure rate and skip the PSP for a cool-down, then let
+a single probe through. Only transport, timeout and 5xx failures count
+against the PSP-wide breaker; auth, validation and decline errors stay on
+the merchant's own breaker, so one misconfigured merchant can't route
+everyone away from a PSP. State is per process, warmed from psp_attempts.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from config.settings import settings
+from utils.latency_histogram import LatencyHistogram
+from utils.logger import logger
+
+SLICES = 30  # time slices per rolling window
+PRIOR_ATTEMPTS = 10  # smoothing: an unseen PSP scores as if it had 10 attempts at PRIOR_SUCCESS_RATE
+PRIOR_SUCCESS_RATE = 0.95
+LATENCY_WEIGHT = 0.1  # at most 10% of the score
+LATENCY_CEILING_MS = 10000.0
+SCORE_TOLERANCE = 0.02  # a PSP only moves ahead of an earlier one when it scores this much higher
+
+# Error classes (psp_attempts.error_code); the first three mean the PSP itself is unhealthy
+PSP_WIDE_ERRORS = {"timeout", "network", "server_error"}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def classify_psp_error(error: Optional[BaseException] = None, http_status: Optional[int] = None) -> str:
+    """
+    Error class for a failed PSP call: timeout / network / server_error (the
+    PSP is unhealthy), rate_limited / auth / declined / invalid_request (this
+    merchant's account or request), unknown otherwise
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return "network"
+    if http_status is None:
+        http_status = getattr(error, "http_status", None)
+    if http_status is None:
+        return "unknown"
+    if http_status >= 500:
+        return "server_error"
+    if http_status == 429:
+        return "rate_limited"
+    if http_status in (401, 403):
+        return "auth"
+    if http_status == 402 or getattr(error, "error_type", None) == "card_error":
+        return "declined"
+    return "invalid_request"
+
+
+class RollingWindow:
+    """Attempts / successes / latency over the last window_seconds, in SLICES time slices"""
+
+    __slots__ = ("slice_seconds", "_slices")
+
+    def __init__(self, window_seconds: float):
+        self.slice_seconds = max(window_seconds / SLICES, 0.001)
+        self._slices: List[List[Any]] = []  # [slice_id, attempts, successes, LatencyHistogram]
+
+    def record(self, now: float, success: bool, latency_ms: Optional[float]) -> None:
+        slice_id = int(now // self.slice_seconds)
+        if not self._slices or self._slices[-1][0] != slice_id:
+            self._slices.append([slice_id, 0, 0, LatencyHistogram()])
+            self._trim(slice_id)
+        current = self._slices[-1]
+        current[1] += 1
+        if success:
+            current[2] += 1
+        if latency_ms is not None:
+            current[3].record(latency_ms)
+
+    def _trim(self, slice_id: int) -> None:
+        oldest = slice_id - SLICES + 1
+        while self._slices and self._slices[0][0] < oldest:
+            self._slices.pop(0)
+
+    def snapshot(self, now: float) -> Tuple[int, int, LatencyHistogram]:
+        self._trim(int(now // self.slice_seconds))
+        attempts = successes = 0
+        latency = LatencyHistogram()
+        for _, n, ok, histogram in self._slices:
+            attempts += n
+            successes += ok
+            latency.merge(histogram)
+        return attempts, successes, latency
+
+    def reset(self) -> None:
+        self._slices = []
+
+
+class CircuitBreaker:
+    """closed -> open (skip) -> half_open (one probe) -> closed | open"""
+
+    __slots__ = ("state", "opened_at", "probe_started_at", "consecutive_failures", "window", "trips")
+
+    def __init__(self, window_seconds: float):
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+        self.consecutive_failures = 0
+        self.window = RollingWindow(window_seconds)  # failures since the breaker last closed
+        self.trips = 0
+
+    def available(self, now: float, cooldown: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= cooldown
+        # half_open: one probe at a time; a probe that never reported back expires
+        return self.probe_started_at is None or now - self.probe_started_at >= cooldown
+
+    def acquire(self, now: float, cooldown: float) -> bool:
+        if not self.available(now, cooldown):
+            return False
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probe_started_at = now
+        return True
+
+    def on_result(self, now: float, success: bool) -> Optional[str]:
+        """Returns the new state when it changed"""
+        if self.state == HALF_OPEN:
+            self.probe_started_at = None
+            if success:
+                self._close()
+                return CLOSED
+            self._open(now)
+            return OPEN
+        if self.state == OPEN:
+            return None  # started before the breaker opened
+        self.window.record(now, success, None)
+        if success:
+            self.consecutive_failures = 0
+            return None
+        self.consecutive_failures += 1
+        attempts, successes, _ = self.window.snapshot(now)
+        failure_rate = (attempts - successes) / attempts if attempts else 0.0
+        if (self.consecutive_failures >= settings.psp_breaker_consecutive_failures
+                or (attempts >= settings.psp_breaker_min_requests
+                    and failure_rate >= settings.psp_breaker_failure_threshold)):
+            self._open(now)
+            return OPEN
+        return None
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.window.reset()
+
+
+class PSPHealth:
+    def __init__(self, window_seconds: float = 300, breaker_window_seconds: float = 60,
+                 cooldown_seconds: float = 30, min_samples: int = 20):
+        self.window_seconds = window_seconds
+        self.breaker_window_seconds = breaker_window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.min_samples = min_samples
+        self._windows: Dict[Tuple[str, str, str], RollingWindow] = {}  # (psp, scope, value)
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}  # (psp, merchant_id or "")
+        self.recorded = 0
+        self.skipped = 0
+
+    def _window(self, key: Tuple[str, str, str]) -> RollingWindow:
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = RollingWindow(self.window_seconds)
+        return window
+
+    def _breaker(self, psp: str, merchant_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get((psp, merchant_id))
+        if breaker is None:
+            breaker = self._breakers[(psp, merchant_id)] = CircuitBreaker(self.breaker_window_seconds)
+        return breaker
+
+    def _breakers_for(self, psp: str, merchant_id: Optional[str]) -> List[CircuitBreaker]:
+        # PSP-wide outage, or one merchant's account / credentials failing
+        breakers = [self._breaker(psp, "")]
+        if merchant_id:
+            breakers.append(self._breaker(psp, merchant_id))
+        return breakers
+
+    # ------------------------------------------------------------------
+    # Scoring / ranking
+    # ------------------------------------------------------------------
+
+    def score(self, psp: str, merchant_id: Optional[str], currency: Optional[str]) -> float:
+        now = time.monotonic()
+        scopes = []
+        if merchant_id:
+            scopes.append(("merchant", merchant_id))
+        if currency:
+            scopes.append(("currency", currency.upper()))
+        scopes.append(("all", ""))
+        attempts = successes = 0
+        latency = None
+        for scope, value in scopes:
+            window = self._windows.get((psp, scope, value))
+            if window is None:
+                continue
+            attempts, successes, latency = window.snapshot(now)
+            if attempts >= self.min_samples:
+                break
+        rate = (successes + PRIOR_ATTEMPTS * PRIOR_SUCCESS_RATE) / (attempts + PRIOR_ATTEMPTS)
+        if latency is not None and latency.count:
+            rate *= 1 - LATENCY_WEIGHT * min(latency.percentile(95) / LATENCY_CEILING_MS, 1.0)
+        return rate
+
+    def available(self, psp: str, merchant_id: Optional[str]) -> bool:
+        now = time.monotonic()
+        return all(b.available(now, self.cooldown_seconds) for b in self._breakers_for(psp, merchant_id))
+
+    def rank_psps(self, psps: List[str], merchant_id: Optional[str], currency: Optional[str]) -> List[str]:
+        """
+        Order a failover chain (given in configured order) by current health.
+        PSPs behind an open breaker are dropped, unless every PSP is, in which
+        case all are returned by score so the payment still gets a try.
+        """
+        remaining = [(psp, self.score(psp, merchant_id, currency)) for psp in psps]
+        # Take the first PSP (in configured order) within SCORE_TOLERANCE of the best remaining
+        scored = []
+        while remaining:
+            best = max(score for _, score in remaining)
+            pick = next(item for item in remaining if item[1] >= best - SCORE_TOLERANCE)
+            scored.append(pick)
+            remaining.remove(pick)
+        healthy = [psp for psp, _ in scored if self.available(psp, merchant_id)]
+        if len(healthy) < len(scored):
+            self.skipped += len(scored) - len(healthy)
+            logger.info(f"PSP breakers open, skipping: {[p for p, _ in scored if p not in healthy]}")
+        return healthy or [psp for psp, _ in scored]
+
+    def acquire(self, psp: str, merchant_id: Optional[str], force: bool = False) -> bool:
+        """
+        Call right before an attempt: claims the half-open probe slot if the
+        breaker is recovering. force=True (every PSP in the chain is open) always allows it.
+        """
+        now = time.monotonic()
+        breakers = self._breakers_for(psp, merchant_id)
+        if not all(b.available(now, self.cooldown_seconds) for b in breakers):
+            return force
+        for breaker in breakers:
+            breaker.acquire(now, self.cooldown_seconds)
+        return True
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def _observe(self, now: float, psp: str, merchant_id: Optional[str], currency: Optional[str],
+                 success: bool, latency_ms: Optional[float]) -> None:
+        self._window((psp, "all", "")).record(now, success, latency_ms)
+        if currency:
+            self._window((psp, "currency", currency.upper())).record(now, success, latency_ms)
+        if merchant_id:
+            self._window((psp, "merchant", merchant_id)).record(now, success, latency_ms)
+
+    def record(
+        self,
+        psp: str,
+        merchant_id: Optional[str],
+        currency: Optional[str],
+        success: bool,
+        latency_ms: Optional[float],
+        priority: int = 1,
+        amount: Optional[Decimal] = None,
+        order_id: Optional[str] = None,
+        error_code: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """
+        Update windows and breakers, and queue the psp_attempts row.
+        error_code is the classify_psp_error() class of a failure.
+        """
+        now = time.monotonic()
+        self.recorded += 1
+        self._observe(now, psp, merchant_id, currency, success, latency_ms)
+        for breaker in self._breakers_for(psp, merchant_id):
+            psp_wide = breaker is self._breakers[(psp, "")]
+            # For the PSP-wide breaker a merchant-level error still means the PSP answered
+            outcome = success or (psp_wide and error_code not in PSP_WIDE_ERRORS)
+            changed = breaker.on_result(now, outcome)
+            scope = psp if psp_wide else f"{psp} / merchant {merchant_id}"
+            if changed == OPEN:
+                logger.warning(f"⚠️ PSP breaker opened: {scope}, skipping for {self.cooldown_seconds}s")
+            elif changed == CLOSED:
+                logger.info(f"✅ PSP breaker closed: {scope}")
+
+        from db.psp_attempts import psp_attempts
+        from utils.log_writer import get_log_writer
+        get_log_writer().enqueue(psp_attempts, {
+            "merchant_id": merchant_id or "",
+            "order_id": order_id,
+            "psp_type": psp,
+            "priority": priority,
+            "amount": amount,
+            "currency": (currency or "").upper()[:3],
+            "success": success,
+            "response_time_ms": int(latency_ms) if latency_ms is not None else None,
+            "error_code": error_code,
+            "error_message": error[:1000] if error else None,
+            "created_at": datetime.utcnow(),
+        })
+
+    async def warm_up(self) -> int:
+        """Seed the windows (not the breakers) from recent psp_attempts rows"""
+        from db.psp_attempts import get_recent_psp_attempts
+        rows = await get_recent_psp_attempts(datetime.utcnow() - timedelta(seconds=self.window_seconds))
+        wall_now = datetime.utcnow()
+        mono_now = time.monotonic()
+        for row in rows:
+            age = (wall_now - row["created_at"]).total_seconds()
+            self._observe(
+                mono_now - max(age, 0.0), row["psp_type"], row["merchant_id"] or None,
+                row["currency"] or None, row["success"], row["response_time_ms"]
+            )
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        psps: Dict[str, Any] = {}
+        for (psp, scope, _), window in self._windows.items():
+            if scope != "all":
+                continue
+            attempts, successes, latency = window.snapshot(now)
+            psps[psp] = {
+                "attempts": attempts,
+                "success_rate": round(successes / attempts, 4) if attempts else None,
+                "p95_ms": round(latency.percentile(95), 1) if latency.count else None,
+                "score": round(self.score(psp, None, None), 4),
+            }
+        breakers = [
+            {
+                "psp": psp,
+                "merchant_id": merchant_id or None,
+                "state": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "trips": breaker.trips,
+                "open_for_seconds": round(now - breaker.opened_at, 1) if breaker.state != CLOSED else None,
+            }
+            for (psp, merchant_id), breaker in self._breakers.items()
+            if breaker.state != CLOSED or breaker.trips
+        ]
+        return {
+            "window_seconds": self.window_seconds,
+            "cooldown_seconds": self.cooldown_seconds,
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "psps": psps,
+            "breakers": breakers,
+        }
+
+
+_health: Optional[PSPHealth] = None
+
+
+def get_psp_health() -> PSPHealth:
+    """Get the process-wide PSP health tracker"""
+    global _health
+    if _health is None:
+        _health = PSPHealth(
+            window_seconds=settings.psp_health_window_seconds,
+            breaker_window_seconds=settings.psp_breaker_window_seconds,
+            cooldown_seconds=settings.psp_breaker_cooldown_seconds,
+            min_samples=settings.psp_routing_min_samples,
+        )
+    return _health
+
+
+async def start_psp_health() -> None:
+    """Warm the rolling windows from psp_attempts (call from app startup)"""
+    loaded = await get_psp_health().warm_up()
+    if loaded:
+        logger.info(f"✅ PSP health warmed from {loaded} recent attempts")
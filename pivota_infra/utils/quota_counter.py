@@ -0,0 +1,380 @@
+"""
+Agent quota counters
+O(1) per-minute (sliding window) and per-day request counting with an
+in-memory backend and a Redis backend, reconciled against agent_usage_logs
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config.settings import settings
+from utils.logger import logger
+from utils.redis_client import get_redis_client
+
+DAY_SECONDS = 86400
+
+
+class QuotaDecision:
+    """Result of consuming one request against an agent's limits"""
+
+    __slots__ = (
+        "allowed", "reason", "minute_count", "rate_limit",
+        "day_count", "daily_quota", "reset_at",
+    )
+
+    def __init__(
+        self,
+        allowed: bool,
+        reason: Optional[str],
+        minute_count: int,
+        rate_limit: int,
+        day_count: int,
+        daily_quota: Optional[int],
+        reset_at: int,
+    ):
+        self.allowed = allowed
+        self.reason = reason  # None | "rate_limit" | "daily_quota"
+        self.minute_count = minute_count
+        self.rate_limit = rate_limit
+        self.day_count = day_count
+        self.daily_quota = daily_quota
+        self.reset_at = reset_at
+
+    @property
+    def rate_remaining(self) -> int:
+        return max(0, self.rate_limit - self.minute_count)
+
+    @property
+    def quota_remaining(self) -> Optional[int]:
+        if self.daily_quota is None:
+            return None
+        return max(0, self.daily_quota - self.day_count)
+
+
+def _sliding_count(prev: int, cur: int, now: float, window: int) -> int:
+    """Sliding-window estimate: weight the previous window by its remaining overlap"""
+    elapsed = (now % window) / window
+    return int(prev * (1.0 - elapsed)) + cur
+
+
+def _decide(
+    minute_count: int,
+    rate_limit: int,
+    day_count: int,
+    daily_quota: Optional[int],
+    now: float,
+    window: int,
+) -> QuotaDecision:
+    reset_at = int((int(now // window) + 1) * window)
+    if minute_count > rate_limit:
+        reason = "rate_limit"
+    elif daily_quota is not None and day_count > daily_quota:
+        reason = "daily_quota"
+    else:
+        reason = None
+    return QuotaDecision(
+        allowed=reason is None,
+        reason=reason,
+        minute_count=minute_count,
+        rate_limit=rate_limit,
+        day_count=day_count,
+        daily_quota=daily_quota,
+        reset_at=reset_at,
+    )
+
+
+class QuotaCounter(ABC):
+    """Backend interface"""
+
+    name = "base"
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+
+    @abstractmethod
+    async def consume(
+        self, subject: str, rate_limit: int, daily_quota: Optional[int] = None
+    ) -> QuotaDecision:
+        """Count one request for subject; rejected requests are not counted"""
+        pass
+
+    @abstractmethod
+    async def peek(self, subject: str) -> Tuple[int, int]:
+        """Return (current window count, today's count) without counting"""
+        pass
+
+    @abstractmethod
+    async def reconcile_daily(self, counts: Dict[str, int]) -> None:
+        """Raise today's counters to at least the persisted counts"""
+        pass
+
+
+class _Slot:
+    __slots__ = ("window", "cur", "prev", "day", "day_count")
+
+    def __init__(self):
+        self.window = 0
+        self.cur = 0
+        self.prev = 0
+        self.day = 0
+        self.day_count = 0
+
+
+class InMemoryQuotaCounter(QuotaCounter):
+    """Per-process counters (exact per worker, reconciled cluster-wide per day)"""
+
+    name = "memory"
+
+    def __init__(self, window_seconds: int = 60, max_subjects: int = 100000):
+        super().__init__(window_seconds)
+        self.max_subjects = max_subjects
+        self._slots: Dict[str, _Slot] = {}
+
+    def _slot(self, subject: str, now: float) -> _Slot:
+        slot = self._slots.get(subject)
+        if slot is None:
+            if len(self._slots) >= self.max_subjects:
+                self._evict_idle(now)
+            slot = _Slot()
+            self._slots[subject] = slot
+        window = int(now // self.window_seconds)
+        if slot.window != window:
+            slot.prev = slot.cur if slot.window == window - 1 else 0
+            slot.cur = 0
+            slot.window = window
+        day = int(now // DAY_SECONDS)
+        if slot.day != day:
+            slot.day = day
+            slot.day_count = 0
+        return slot
+
+    def _evict_idle(self, now: float) -> None:
+        window = int(now // self.window_seconds)
+        day = int(now // DAY_SECONDS)
+        for subject in [s for s, slot in self._slots.items() if slot.window < window - 1 and slot.day < day]:
+            del self._slots[subject]
+
+    async def consume(self, subject, rate_limit, daily_quota=None):
+        now = time.time()
+        slot = self._slot(subject, now)
+        decision = _decide(
+            _sliding_count(slot.prev, slot.cur + 1, now, self.window_seconds),
+            rate_limit,
+            slot.day_count + 1,
+            daily_quota,
+            now,
+            self.window_seconds,
+        )
+        if decision.allowed:
+            slot.cur += 1
+            slot.day_count += 1
+        else:
+            decision.minute_count -= 1
+            decision.day_count -= 1
+        return decision
+
+    async def peek(self, subject):
+        now = time.time()
+        slot = self._slot(subject, now)
+        return _sliding_count(slot.prev, slot.cur, now, self.window_seconds), slot.day_count
+
+    async def reconcile_daily(self, counts):
+        now = time.time()
+        for subject, count in counts.items():
+            slot = self._slot(subject, now)
+            if count > slot.day_count:
+                slot.day_count = count
+
+
+class RedisQuotaCounter(QuotaCounter):
+    """Counters shared by every worker/replica; one pipelined round trip per request"""
+
+    name = "redis"
+
+    def __init__(self, redis, window_seconds: int = 60):
+        super().__init__(window_seconds)
+        self.redis = redis
+
+    def _keys(self, subject: str, now: float) -> Tuple[str, str, str]:
+        window = int(now // self.window_seconds)
+        day = datetime.utcfromtimestamp(now).strftime("%Y%m%d")
+        return (
+            f"quota:win:{subject}:{window}",
+            f"quota:win:{subject}:{window - 1}",
+            f"quota:day:{subject}:{day}",
+        )
+
+    async def consume(self, subject, rate_limit, daily_quota=None):
+        now = time.time()
+        cur_key, prev_key, day_key = self._keys(subject, now)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.incr(cur_key)
+        pipe.expire(cur_key, self.window_seconds * 2)
+        pipe.get(prev_key)
+        pipe.incr(day_key)
+        pipe.expire(day_key, DAY_SECONDS + 3600)
+        cur, _, prev, day_count, _ = await pipe.execute()
+        decision = _decide(
+            _sliding_count(int(prev or 0), int(cur), now, self.window_seconds),
+            rate_limit,
+            int(day_count),
+            daily_quota,
+            now,
+            self.window_seconds,
+        )
+        if not decision.allowed:
+            # Rejected requests don't consume quota
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.decr(cur_key)
+            pipe.decr(day_key)
+            await pipe.execute()
+            decision.minute_count -= 1
+            decision.day_count -= 1
+        return decision
+
+    async def peek(self, subject):
+        now = time.time()
+        cur_key, prev_key, day_key = self._keys(subject, now)
+        cur, prev, day_count = await self.redis.mget(cur_key, prev_key, day_key)
+        return (
+            _sliding_count(int(prev or 0), int(cur or 0), now, self.window_seconds),
+            int(day_count or 0),
+        )
+
+    async def reconcile_daily(self, counts):
+        now = time.time()
+        for subject, count in counts.items():
+            day_key = self._keys(subject, now)[2]
+            current = await self.redis.get(day_key)
+            if count > int(current or 0):
+                await self.redis.set(day_key, count, ex=DAY_SECONDS + 3600)
+
+
+class _FallbackQuotaCounter(QuotaCounter):
+    """
+    Redis with graceful degradation to in-memory counting on errors; while
+    degraded, Redis is retried every retry_seconds and used again once it answers
+    """
+
+    def __init__(self, primary: QuotaCounter, fallback: QuotaCounter, retry_seconds: float = 30):
+        super().__init__(primary.window_seconds)
+        self.primary = primary
+        self.fallback = fallback
+        self.retry_seconds = retry_seconds
+        self.degraded = False
+        self._retry_at = 0.0
+
+    @property
+    def name(self):  # type: ignore[override]
+        return self.fallback.name if self.degraded else self.primary.name
+
+    async def _call(self, method: str, *args):
+        now = time.monotonic()
+        if not self.degraded or now >= self._retry_at:
+            try:
+                result = await getattr(self.primary, method)(*args)
+            except Exception as e:
+                if not self.degraded:
+                    logger.warning(f"⚠️ Redis quota counter failed, using in-memory counters: {e}")
+                self.degraded = True
+                self._retry_at = now + self.retry_seconds
+            else:
+                if self.degraded:
+                    logger.info("✅ Redis quota counter recovered")
+                    self.degraded = False
+                return result
+        return await getattr(self.fallback, method)(*args)
+
+    async def consume(self, subject, rate_limit, daily_quota=None):
+        return await self._call("consume", subject, rate_limit, daily_quota)
+
+    async def peek(self, subject):
+        return await self._call("peek", subject)
+
+    async def reconcile_daily(self, counts):
+        return await self._call("reconcile_daily", counts)
+
+
+_counter: Optional[QuotaCounter] = None
+_reconcile_task: Optional[asyncio.Task] = None
+
+
+def get_quota_counter() -> QuotaCounter:
+    """Return the process-wide quota counter (QUOTA_COUNTER_BACKEND=auto|memory|redis)"""
+    global _counter
+    if _counter is not None:
+        return _counter
+    window = settings.rate_limit_window_seconds
+    backend = settings.quota_counter_backend.lower()
+    memory = InMemoryQuotaCounter(window_seconds=window)
+    redis = get_redis_client() if backend in ("auto", "redis") else None
+    if redis is not None:
+        _counter = _FallbackQuotaCounter(RedisQuotaCounter(redis, window_seconds=window), memory)
+    else:
+        if backend == "redis":
+            logger.warning("⚠️ QUOTA_COUNTER_BACKEND=redis but Redis is unavailable; using in-memory counters")
+        _counter = memory
+    return _counter
+
+
+async def consume_agent_request(agent: Dict) -> QuotaDecision:
+    """
+    Count one authenticated request against an agent's per-minute limit
+    (capped by the global RATE_LIMIT_RPM ceiling) and daily quota
+    """
+    rate_limit = min(agent.get("rate_limit") or 100, settings.rate_limit_rpm)
+    daily_quota = agent.get("daily_quota") or 10000
+    return await get_quota_counter().consume(agent["agent_id"], rate_limit, daily_quota)
+
+
+async def reconcile_quota_counters() -> int:
+    """Pull today's per-agent totals from agent_usage_logs into the counters"""
+    from db.database import database
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = await database.fetch_all(
+        """
+        SELECT agent_id, COUNT(*) AS count
+        FROM agent_usage_logs
+        WHERE timestamp >= :today
+        GROUP BY agent_id
+        """,
+        {"today": today}
+    )
+    counts = {row["agent_id"]: int(row["count"]) for row in rows if row["agent_id"]}
+    await get_quota_counter().reconcile_daily(counts)
+    return len(counts)
+
+
+async def _reconcile_loop(interval: float) -> None:
+    while True:
+        try:
+            await reconcile_quota_counters()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Quota reconciliation failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def start_quota_reconciler() -> None:
+    """Start periodic reconciliation (call from app startup)"""
+    global _reconcile_task
+    if _reconcile_task is None and settings.quota_reconcile_interval_seconds > 0:
+        _reconcile_task = asyncio.create_task(
+            _reconcile_loop(settings.quota_reconcile_interval_seconds)
+        )
+
+
+async def stop_quota_reconciler() -> None:
+    """Stop periodic reconciliation (call from app shutdown)"""
+    global _reconcile_task
+    if _reconcile_task is not None:
+        _reconcile_task.cancel()
+        try:
+            await _reconcile_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _reconcile_task = None
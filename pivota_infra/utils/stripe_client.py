@@ -0,0 +1,132 @@
+"""
+Async Stripe client
+Calls the Stripe REST API through the shared "stripe" HTTP pool instead of
+the blocking stripe-python SDK, and takes the API key per client instance
+(never the process-global stripe.api_key, which races across merchants)
+"""
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.http_client import get_http_client
+
+STRIPE_API_BASE = "https://api.stripe.com/v1"
+
+
+class StripeError(Exception):
+    """Error returned by the Stripe API (message mirrors stripe-python's)"""
+
+    def __init__(
+        self,
+        message: str,
+        http_status: Optional[int] = None,
+        code: Optional[str] = None,
+        error_type: Optional[str] = None,
+    ):
+        super().__init__(message)
+        self.http_status = http_status
+        self.code = code
+        self.error_type = error_type
+
+
+class StripeObject(dict):
+    """Response dict with attribute access (intent.id, intent.status, ...)"""
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def wrap(cls, value: Any) -> Any:
+        if isinstance(value, dict):
+            return cls({k: cls.wrap(v) for k, v in value.items()})
+        if isinstance(value, list):
+            return [cls.wrap(v) for v in value]
+        return value
+
+
+def _encode(params: Dict[str, Any], prefix: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Flatten params into Stripe's form encoding (metadata[key]=..., items[0][x]=...)"""
+    pairs: List[Tuple[str, str]] = []
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            pairs.extend(_encode(value, name))
+        elif isinstance(value, (list, tuple)):
+            for i, item in enumerate(value):
+                if isinstance(item, dict):
+                    pairs.extend(_encode(item, f"{name}[{i}]"))
+                else:
+                    pairs.append((f"{name}[{i}]", _scalar(item)))
+        else:
+            pairs.append((name, _scalar(value)))
+    return pairs
+
+
+def _scalar(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class AsyncStripeClient:
+    """Minimal async Stripe API client for the payment paths"""
+
+    def __init__(self, api_key: str, stripe_account: Optional[str] = None):
+        self.api_key = api_key
+        self.stripe_account = stripe_account
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> StripeObject:
+        if not self.api_key:
+            raise StripeError("No Stripe API key provided")
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if settings.stripe_api_version:
+            headers["Stripe-Version"] = settings.stripe_api_version
+        if self.stripe_account:
+            headers["Stripe-Account"] = self.stripe_account
+        kwargs: Dict[str, Any] = {"headers": headers}
+        if method == "GET":
+            kwargs["params"] = _encode(params or {})
+        else:
+            # Like stripe-python: always send a key so retried POSTs can't double-charge
+            headers["Idempotency-Key"] = idempotency_key or str(uuid.uuid4())
+            kwargs["data"] = dict(_encode(params or {})) if params else {}
+
+        response = await get_http_client("stripe").request(method, f"{STRIPE_API_BASE}{path}", **kwargs)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code >= 400:
+            error = body.get("error") or {}
+            raise StripeError(
+                error.get("message") or f"Stripe API error: {response.status_code}",
+                http_status=response.status_code,
+                code=error.get("code"),
+                error_type=error.get("type"),
+            )
+        return StripeObject.wrap(body)
+
+    async def create_payment_intent(self, idempotency_key: Optional[str] = None, **params) -> StripeObject:
+        return await self._request("POST", "/payment_intents", params, idempotency_key)
+
+    async def retrieve_payment_intent(self, payment_intent_id: str) -> StripeObject:
+        return await self._request("GET", f"/payment_intents/{payment_intent_id}")
+
+    async def confirm_payment_intent(
+        self, payment_intent_id: str, idempotency_key: Optional[str] = None, **params
+    ) -> StripeObject:
+        return await self._request("POST", f"/payment_intents/{payment_intent_id}/confirm", params, idempotency_key)
+
+    async def create_refund(self, idempotency_key: Optional[str] = None, **params) -> StripeObject:
+        return await self._request("POST", "/refunds", params, idempotency_key)
@@ -0,0 +1,209 @@
+"""
+Agent API latency histograms
+Fed from the batched log writer (every agent_usage_logs row it writes),
+kept in hourly slots per agent and per endpoint, and persisted per instance
+so /agent/metrics can merge every worker's histograms into one set of
+percentiles without scanning agent_usage_logs.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+from db.latency_histograms import (
+    delete_latency_histograms_before, get_latency_histograms, upsert_latency_histograms
+)
+from utils.event_bus import get_instance_id
+from utils.latency_histogram import HistogramWindow, LatencyHistogram
+from utils.logger import logger
+
+ALL_KEY = "*"
+OTHER_KEY = "_other"  # keys beyond latency_histogram_max_keys
+HOUR = 3600
+WINDOW_HOURS = 24
+
+
+def _to_utc(ts: float) -> datetime:
+    return datetime.utcfromtimestamp(ts)
+
+
+class UsageLatencyRecorder:
+    """Hourly histograms for scope "all" / "agent" / "endpoint" (bounded key count)"""
+
+    def __init__(self, max_keys: int = 2000, persist_interval: float = 30):
+        self.max_keys = max_keys
+        self.persist_interval = persist_interval
+        self._windows: Dict[Tuple[str, str], HistogramWindow] = {}
+        self._key_counts: Dict[str, int] = {}
+        self._dirty: Set[Tuple[str, str, int]] = set()
+        self._last_persist = 0.0
+        self._persist_lock: Optional[asyncio.Lock] = None
+        self.recorded = 0
+        self.persisted = 0
+        self.persist_failures = 0
+
+    def _window(self, scope: str, key: str) -> Tuple[str, HistogramWindow]:
+        window = self._windows.get((scope, key))
+        if window is None:
+            if self._key_counts.get(scope, 0) >= self.max_keys:
+                key = OTHER_KEY
+                window = self._windows.get((scope, key))
+            if window is None:
+                window = self._windows[(scope, key)] = HistogramWindow(HOUR, WINDOW_HOURS + 1)
+                self._key_counts[scope] = self._key_counts.get(scope, 0) + 1
+        return key, window
+
+    def record(self, agent_id: Optional[str], endpoint: Optional[str], latency_ms: float, ts: float) -> None:
+        for scope, key in (("all", ALL_KEY), ("agent", agent_id), ("endpoint", endpoint)):
+            if not key:
+                continue
+            key, window = self._window(scope, key)
+            start = window.record(latency_ms, ts)
+            if start >= 0:
+                self._dirty.add((scope, key, start))
+        self.recorded += 1
+
+    async def on_flush(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        """Log writer flush hook"""
+        if table_name != "agent_usage_logs":
+            return
+        now = time.time()
+        for row in rows:
+            latency = row.get("response_time_ms")
+            if latency is None:
+                continue
+            ts = row.get("timestamp")
+            self.record(row.get("agent_id"), row.get("endpoint"), latency, ts.timestamp() if ts else now)
+        if now - self._last_persist >= self.persist_interval:
+            await self.persist()
+
+    def local(self, scope: str, since: float, keys: Optional[List[str]] = None) -> Dict[str, LatencyHistogram]:
+        result = {}
+        for (window_scope, key), window in self._windows.items():
+            if window_scope == scope and (keys is None or key in keys):
+                histogram = window.merged(since)
+                if histogram.count:
+                    result[key] = histogram
+        return result
+
+    def local_hourly(self, scope: str, key: str, since: float) -> Dict[int, LatencyHistogram]:
+        window = self._windows.get((scope, key))
+        return dict(window.items(since)) if window else {}
+
+    async def persist(self) -> None:
+        """Upsert this instance's changed hours"""
+        if self._persist_lock is None:
+            self._persist_lock = asyncio.Lock()
+        async with self._persist_lock:
+            self._last_persist = time.time()
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for scope, key, start in dirty:
+                histogram = self._windows[(scope, key)].get(start)
+                if histogram is not None:
+                    rows.append({
+                        "scope": scope,
+                        "key": key,
+                        "hour_start": _to_utc(start),
+                        "histogram": histogram.to_dict(),
+                    })
+            if not rows:
+                return
+            try:
+                for i in range(0, len(rows), 500):
+                    await upsert_latency_histograms(get_instance_id(), rows[i:i + 500])
+                self.persisted += len(rows)
+                # Cheap enough to piggyback: one indexed DELETE per persist
+                cutoff = _to_utc(self._last_persist) - timedelta(hours=settings.latency_histogram_retention_hours)
+                await delete_latency_histograms_before(cutoff)
+            except Exception as e:
+                # Keep the hours dirty and retry on the next flush
+                self._dirty |= dirty
+                self.persist_failures += 1
+                logger.warning(f"⚠️ Failed to persist latency histograms: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instance_id": get_instance_id(),
+            "keys": dict(self._key_counts),
+            "max_keys": self.max_keys,
+            "recorded": self.recorded,
+            "dirty_hours": len(self._dirty),
+            "persisted": self.persisted,
+            "persist_failures": self.persist_failures,
+        }
+
+
+_recorder = UsageLatencyRecorder(
+    max_keys=settings.latency_histogram_max_keys,
+    persist_interval=settings.latency_histogram_persist_seconds,
+)
+_hook_installed = False
+
+
+def get_usage_latency_recorder() -> UsageLatencyRecorder:
+    """Get the process-wide recorder"""
+    return _recorder
+
+
+def _decode(value: Any) -> Optional[LatencyHistogram]:
+    try:
+        return LatencyHistogram.from_dict(json.loads(value) if isinstance(value, str) else value)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+async def _load_rows(scope: str, since: float, keys: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Other instances' persisted hours (this instance is served from memory)"""
+    try:
+        rows = await get_latency_histograms(scope, _to_utc(since - since % HOUR), keys)
+    except Exception as e:
+        logger.warning(f"⚠️ Latency histogram lookup failed, using this instance only: {e}")
+        return []
+    return [row for row in rows if row["instance_id"] != get_instance_id()]
+
+
+async def load_latency_histograms(
+    scope: str,
+    since: float,
+    keys: Optional[List[str]] = None
+) -> Dict[str, LatencyHistogram]:
+    """Histograms per key for hours overlapping [since, now], merged across instances"""
+    merged = _recorder.local(scope, since, keys)
+    for row in await _load_rows(scope, since, keys):
+        histogram = _decode(row["histogram"])
+        if histogram is not None:
+            merged.setdefault(row["key"], LatencyHistogram()).merge(histogram)
+    return merged
+
+
+async def load_hourly_latency(
+    since: float,
+    scope: str = "all",
+    key: str = ALL_KEY
+) -> Dict[datetime, LatencyHistogram]:
+    """One merged histogram per UTC hour (for timelines)"""
+    hourly = {_to_utc(start): LatencyHistogram().merge(histogram)
+              for start, histogram in _recorder.local_hourly(scope, key, since).items()}
+    for row in await _load_rows(scope, since, [key]):
+        histogram = _decode(row["histogram"])
+        if histogram is not None:
+            hourly.setdefault(row["hour_start"], LatencyHistogram()).merge(histogram)
+    return hourly
+
+
+async def start_usage_latency() -> None:
+    """Subscribe to log writer flushes (call from app startup)"""
+    global _hook_installed
+    if _hook_installed:
+        return
+    from utils.log_writer import get_log_writer
+    get_log_writer().add_flush_hook(_recorder.on_flush)
+    _hook_installed = True
+
+
+async def stop_usage_latency() -> None:
+    """Persist unsaved hours (call from app shutdown, after the log writer's final flush)"""
+    await _recorder.persist()
@@ -0,0 +1,213 @@
+"""
+Agent usage rollups
+Fed from the batched log writer (every agent_usage_logs row it writes):
+rows are folded into per-(minute|hour, agent, endpoint, status) cells in
+memory and added to the rollup tables every few seconds, so analytics read
+a few thousand rollup rows instead of scanning agent_usage_logs.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from db.usage_rollups import (
+    delete_minute_rollups_before, upsert_usage_rollups, usage_rollup_hour, usage_rollup_minute
+)
+from utils.latency_histogram import bucket_index
+from utils.logger import logger
+
+GRANULARITIES = (("minute", usage_rollup_minute), ("hour", usage_rollup_hour))
+PRUNE_INTERVAL = 300  # seconds between minute-table retention deletes
+
+CellKey = Tuple[str, datetime, str, str, int]  # granularity, bucket_start, agent_id, endpoint, status_code
+
+
+class _Cell:
+    __slots__ = ("requests", "errors", "latency_count", "latency_sum", "latency_min", "latency_max",
+                 "histogram", "orders", "gmv")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_count = 0
+        self.latency_sum = 0
+        self.latency_min: Optional[int] = None
+        self.latency_max: Optional[int] = None
+        self.histogram: Dict[int, int] = {}
+        self.orders = 0
+        self.gmv = Decimal(0)
+
+    def add(self, status_code: int, latency: Optional[int], has_order: bool, amount: Any) -> None:
+        self.requests += 1
+        if status_code >= 400:
+            self.errors += 1
+        if latency is not None:
+            self.latency_count += 1
+            self.latency_sum += latency
+            if self.latency_min is None or latency < self.latency_min:
+                self.latency_min = latency
+            if self.latency_max is None or latency > self.latency_max:
+                self.latency_max = latency
+            index = bucket_index(latency)
+            self.histogram[index] = self.histogram.get(index, 0) + 1
+        if has_order:
+            self.orders += 1
+        if amount:
+            self.gmv += Decimal(str(amount))
+
+    def merge(self, other: "_Cell") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.latency_count += other.latency_count
+        self.latency_sum += other.latency_sum
+        if other.latency_min is not None and (self.latency_min is None or other.latency_min < self.latency_min):
+            self.latency_min = other.latency_min
+        if other.latency_max is not None and (self.latency_max is None or other.latency_max > self.latency_max):
+            self.latency_max = other.latency_max
+        for index, n in other.histogram.items():
+            self.histogram[index] = self.histogram.get(index, 0) + n
+        self.orders += other.orders
+        self.gmv += other.gmv
+
+    def to_row(self, bucket_start: datetime, agent_id: str, endpoint: str, status_code: int) -> Dict[str, Any]:
+        return {
+            "bucket_start": bucket_start,
+            "agent_id": agent_id,
+            "endpoint": endpoint,
+            "status_code": status_code,
+            "request_count": self.requests,
+            "error_count": self.errors,
+            "latency_count": self.latency_count,
+            "latency_sum_ms": self.latency_sum,
+            "latency_min_ms": self.latency_min,
+            "latency_max_ms": self.latency_max,
+            "histogram": {str(index): n for index, n in self.histogram.items()},
+            "order_count": self.orders,
+            "gmv": self.gmv,
+        }
+
+
+def _buckets(ts: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """(minute, hour) bucket starts in UTC"""
+    if ts is None:
+        ts = datetime.now(timezone.utc)
+    elif ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    else:
+        ts = ts.astimezone(timezone.utc)
+    minute = ts.replace(second=0, microsecond=0)
+    return minute, minute.replace(minute=0)
+
+
+class UsageRollupWriter:
+    """Accumulates usage rows into rollup cells and adds them to Postgres"""
+
+    def __init__(self, flush_interval: float = 10):
+        self.flush_interval = flush_interval
+        self._cells: Dict[CellKey, _Cell] = {}
+        self._last_flush = 0.0
+        self._last_prune = 0.0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.rows_seen = 0
+        self.cells_written = 0
+        self.flush_failures = 0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        agent_id = row.get("agent_id")
+        endpoint = row.get("endpoint")
+        if not agent_id or not endpoint:
+            return
+        status_code = row.get("status_code") or 0
+        latency = row.get("response_time_ms")
+        minute, hour = _buckets(row.get("timestamp"))
+        for granularity, bucket_start in (("minute", minute), ("hour", hour)):
+            key = (granularity, bucket_start, agent_id, endpoint, status_code)
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = _Cell()
+            cell.add(status_code, latency, bool(row.get("order_id")), row.get("order_amount"))
+        self.rows_seen += 1
+
+    async def on_flush(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        """Log writer flush hook"""
+        if table_name != "agent_usage_logs":
+            return
+        for row in rows:
+            self.add(row)
+        if time.time() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Add the accumulated cells to the rollup tables"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            self._last_flush = time.time()
+            cells, self._cells = self._cells, {}
+            if not cells:
+                return
+            by_table: Dict[str, List[Dict[str, Any]]] = {name: [] for name, _ in GRANULARITIES}
+            for (granularity, bucket_start, agent_id, endpoint, status_code), cell in cells.items():
+                by_table[granularity].append(cell.to_row(bucket_start, agent_id, endpoint, status_code))
+            try:
+                for granularity, table in GRANULARITIES:
+                    rows = by_table[granularity]
+                    for i in range(0, len(rows), 500):
+                        await upsert_usage_rollups(table, rows[i:i + 500])
+                        # Written cells must not be added again if a later chunk fails
+                        for row in rows[i:i + 500]:
+                            cells.pop((granularity, row["bucket_start"], row["agent_id"],
+                                       row["endpoint"], row["status_code"]), None)
+                        self.cells_written += len(rows[i:i + 500])
+            except Exception as e:
+                # Keep the unwritten deltas and retry on the next flush
+                for key, cell in cells.items():
+                    current = self._cells.get(key)
+                    if current is None:
+                        self._cells[key] = cell
+                    else:
+                        current.merge(cell)
+                self.flush_failures += 1
+                logger.warning(f"⚠️ Failed to write usage rollups ({len(cells)} cells kept): {e}")
+                return
+            if self._last_flush - self._last_prune >= PRUNE_INTERVAL:
+                self._last_prune = self._last_flush
+                cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.usage_rollup_minute_retention_hours)
+                try:
+                    await delete_minute_rollups_before(cutoff)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to prune minute rollups: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_cells": len(self._cells),
+            "rows_seen": self.rows_seen,
+            "cells_written": self.cells_written,
+            "flush_failures": self.flush_failures,
+        }
+
+
+_writer = UsageRollupWriter(flush_interval=settings.usage_rollup_flush_seconds)
+_hook_installed = False
+
+
+def get_usage_rollup_writer() -> UsageRollupWriter:
+    """Get the process-wide rollup writer"""
+    return _writer
+
+
+async def start_usage_rollups() -> None:
+    """Subscribe to log writer flushes (call from app startup)"""
+    global _hook_installed
+    if _hook_installed:
+        return
+    from utils.log_writer import get_log_writer
+    get_log_writer().add_flush_hook(_writer.on_flush)
+    _hook_installed = True
+
+
+async def stop_usage_rollups() -> None:
+    """Write pending cells (call from app shutdown, after the log writer's final flush)"""
+    await _writer.flush()
@@ -0,0 +1,197 @@
+"""
+Webhook inbox workers
+Webhook routes only verify the signature and insert into webhook_inbox
+(ON CONFLICT (provider, event_id) DO NOTHING), then return 200. A pool of
+workers claims pending events in batches (FOR UPDATE SKIP LOCKED, so every
+replica can run workers) and hands them to the per-provider handler.
+Events sharing an ordering key (order / product / inventory item) are
+processed one at a time in arrival order; failures back off and retry.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config.settings import settings
+from db.webhook_inbox import (
+    claim_webhook_batch, delete_processed_webhook_events, insert_webhook_events,
+    mark_webhook_events_done, release_stale_webhook_events, retry_webhook_event
+)
+from utils.logger import logger
+
+WebhookHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+HOUSEKEEPING_INTERVAL = 60  # seconds between stale-claim / retention sweeps
+MAX_BACKOFF = 600
+
+
+class WebhookInbox:
+    def __init__(
+        self,
+        workers: int = 4,
+        batch_size: int = 20,
+        poll_seconds: float = 1.0,
+        max_attempts: int = 8,
+        processing_timeout: float = 60,
+        retention_days: int = 7
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.processing_timeout = processing_timeout
+        self.retention_days = retention_days
+        self._handlers: Dict[str, WebhookHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None  # created lazily inside the running loop
+        self._last_housekeeping = 0.0
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _event(self) -> asyncio.Event:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        return self._wake
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert events (duplicates ignored) and wake local workers; returns the number inserted"""
+        inserted = await insert_webhook_events(rows)
+        self.received += len(inserted)
+        self.duplicates += len(rows) - len(inserted)
+        if inserted:
+            self._event().set()
+        return len(inserted)
+
+    async def _handle(self, event: Dict[str, Any]) -> bool:
+        handler = self._handlers.get(event["provider"])
+        if isinstance(event["payload"], str):
+            event["payload"] = json.loads(event["payload"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler for provider {event['provider']}")
+            await asyncio.wait_for(handler(event), self.processing_timeout)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            give_up = event["attempts"] >= self.max_attempts
+            delay = min(2 ** event["attempts"], MAX_BACKOFF)
+            if give_up:
+                self.failed += 1
+                logger.error(
+                    f"❌ Webhook {event['provider']}/{event['event_id']} ({event['topic']}) "
+                    f"failed after {event['attempts']} attempts: {error}"
+                )
+            else:
+                self.retried += 1
+                logger.warning(
+                    f"⚠️ Webhook {event['provider']}/{event['event_id']} ({event['topic']}) "
+                    f"failed, retry in {delay}s: {error}"
+                )
+            await retry_webhook_event(event["id"], error, delay, give_up)
+            return False
+
+    async def process_batch(self, worker_id: str) -> int:
+        """Claim and process one batch; returns the number of events claimed"""
+        batch = await claim_webhook_batch(worker_id, self.batch_size)
+        if not batch:
+            return 0
+        # A batch never holds two events with the same ordering key, so it can run concurrently
+        results = await asyncio.gather(*(self._handle(event) for event in batch))
+        done = [event["id"] for event, ok in zip(batch, results) if ok]
+        await mark_webhook_events_done(done)
+        self.processed += len(done)
+        return len(batch)
+
+    async def _housekeeping(self) -> None:
+        now = datetime.utcnow()
+        released = await release_stale_webhook_events(now - timedelta(seconds=self.processing_timeout * 2))
+        if released:
+            logger.warning(f"⚠️ Released {released} stale webhook claims")
+        if self.retention_days > 0:
+            await delete_processed_webhook_events(now - timedelta(days=self.retention_days))
+
+    async def _worker(self, worker_id: str, leader: bool) -> None:
+        wake = self._event()
+        while True:
+            try:
+                if leader and time.monotonic() - self._last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                    self._last_housekeeping = time.monotonic()
+                    await self._housekeeping()
+                if await self.process_batch(worker_id):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Webhook worker {worker_id} error: {e}")
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+    async def start(self, handlers: Dict[str, WebhookHandler]) -> None:
+        self._handlers = dict(handlers)
+        if self._tasks or self.workers <= 0:
+            return
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{prefix}:{n}", leader=(n == 0)))
+            for n in range(self.workers)
+        ]
+        logger.info(f"✅ Webhook inbox started ({self.workers} workers)")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "batch_size": self.batch_size,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+_inbox = WebhookInbox(
+    workers=settings.webhook_workers,
+    batch_size=settings.webhook_batch_size,
+    poll_seconds=settings.webhook_poll_seconds,
+    max_attempts=settings.webhook_max_attempts,
+    processing_timeout=settings.webhook_processing_timeout_seconds,
+    retention_days=settings.webhook_inbox_retention_days,
+)
+
+
+def get_webhook_inbox() -> WebhookInbox:
+    return _inbox
+
+
+async def enqueue_webhook_events(rows: List[Dict[str, Any]]) -> int:
+    return await _inbox.enqueue(rows)
+
+
+async def start_webhook_workers(handlers: Dict[str, WebhookHandler]) -> None:
+    """Start the worker pool (call from app startup)"""
+    await _inbox.start(handlers)
+
+
+async def stop_webhook_workers() -> None:
+    """Cancel workers; claimed events are released by the next housekeeping sweep"""
+    await _inbox.stop()